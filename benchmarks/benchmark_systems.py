@@ -0,0 +1,89 @@
+from openfermion.chem import MolecularData
+from openfermion.chem.molecular_data import spinorb_from_spatial
+from openfermion.ops import InteractionOperator
+from openfermion import get_fermion_operator
+
+from src.q_systems import ElectronicSystem
+from src.eigensolvers import SectorEigensolver
+from src.basis_indices import BasisIndices
+
+import openfermion
+import logging
+import numpy
+import zlib
+import os
+
+
+class BenchmarkSystems:
+    # The systems of the benchmarks, built without running a quantum chemistry package where possible:
+    # - H2 and LiH from the molecular data files bundled with openfermion;
+    # - H4 and H6 chains from the cached integrals of src.molecules (calculated once with psi4), or, if they can not be
+    #   loaded, synthetic Hamiltonians with the same numbers of orbitals and electrons and seeded random integrals.
+    # The source of each system is recorded with the results, since timings of different sources are not comparable.
+
+    openfermion_data = {'H2': 'H2_sto-3g_singlet_0.7414', 'LiH': 'H1-Li1_sto-3g_singlet_1.45'}
+
+    # numbers of spin orbitals and electrons of the H chains
+    chains = {'H4': [8, 4], 'H6': [12, 6]}
+
+    names = ['H2', 'H4', 'LiH', 'H6']
+
+    @staticmethod
+    def get_system(name):
+        if name in BenchmarkSystems.openfermion_data:
+            return BenchmarkSystems.openfermion_system(name)
+        n_orbitals, n_electrons = BenchmarkSystems.chains[name]
+        try:
+            from src.molecules import molecules
+            q_system = getattr(molecules, name)()
+            q_system.source = 'cached integrals'
+        except Exception as exception:
+            logging.info('Could not load the integrals of {} ({}), using a synthetic Hamiltonian'.format(name, exception))
+            q_system = BenchmarkSystems.synthetic_system(name, n_orbitals, n_electrons)
+        return q_system
+
+    @staticmethod
+    def openfermion_system(name):
+        data_directory = os.path.join(os.path.dirname(openfermion.__file__), 'testing', 'data')
+        molecule_data = MolecularData(filename=os.path.join(data_directory, BenchmarkSystems.openfermion_data[name]))
+        molecule_data.load()
+
+        q_system = ElectronicSystem(get_fermion_operator(molecule_data.get_molecular_hamiltonian()),
+                                    molecule_data.n_qubits, molecule_data.n_electrons)
+        q_system.name = name
+        q_system.hf_energy = float(molecule_data.hf_energy)
+        q_system.fci_energy = float(molecule_data.fci_energy)
+        q_system.source = 'openfermion data'
+        return q_system
+
+    # a closed shell system with random spatial integrals: the one body integrals are orbital energies plus small
+    # random couplings, and the two body integrals (pq|rs) = sum_l B^l_pq B^l_rs have the symmetries and the positive
+    # definiteness of electron repulsion integrals
+    @staticmethod
+    def synthetic_system(name, n_orbitals, n_electrons, seed=None):
+        if seed is None:
+            seed = zlib.crc32(name.encode())
+        rng = numpy.random.default_rng(seed)
+        n_spatial = n_orbitals // 2
+
+        one_body = numpy.diag(numpy.linspace(-1.5, 0.5, n_spatial)) + 0.1 * rng.normal(size=(n_spatial, n_spatial))
+        one_body = (one_body + one_body.T) / 2
+
+        factors = rng.normal(size=(n_spatial, n_spatial, n_spatial)) * 0.3
+        factors = (factors + factors.transpose(0, 2, 1)) / 2
+        eri = numpy.einsum('lpq,lrs->pqrs', factors, factors)
+        # openfermion orders the two body integrals as <pq|rs> = (ps|qr)
+        two_body = numpy.einsum('psqr->pqrs', eri)
+
+        one_body_coefficients, two_body_coefficients = spinorb_from_spatial(one_body, two_body)
+        fermion_ham = get_fermion_operator(InteractionOperator(0, one_body_coefficients, two_body_coefficients / 2))
+
+        q_system = ElectronicSystem(fermion_ham, n_orbitals, n_electrons)
+        q_system.name = name
+        H_sparse_matrix = q_system.get_h_sparse_matrix()
+        hf_index = BasisIndices.hf_index(n_orbitals, n_electrons)
+        q_system.hf_energy = float(H_sparse_matrix[hf_index, hf_index].real)
+        eigenvalues, _ = SectorEigensolver.lowest_eigenpairs(H_sparse_matrix, n_orbitals, n_electrons, 1, sz=0)
+        q_system.fci_energy = float(eigenvalues[0].real)
+        q_system.source = 'synthetic'
+        return q_system
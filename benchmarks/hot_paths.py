@@ -0,0 +1,240 @@
+import argparse
+import datetime
+import platform
+import subprocess
+import tracemalloc
+import resource
+import logging
+import scipy
+import numpy
+import json
+import time
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import config
+from src import backends
+from src.vqe_runner import VQERunner
+from src.cache import GlobalCache
+from src.ansatz_element_sets import GSDExcitations
+from src.adapt_session import AdaptSession, FullEnergySelection, GradientSelection
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+
+class HotPathBenchmarks:
+    # Benchmarks of the simulation hot paths of the MatrixCacheBackend, for each benchmark system (see
+    # BenchmarkSystems). Each benchmark is a setup function returning the arguments of a timed function. The setup is not
+    # timed. The timed function is run once to warm up the memoized operators, then timed repeat times, then run once
+    # more under tracemalloc to record its peak memory (the peak of the python and numpy allocations made during the
+    # run). The fixtures (pool, precomputed cache, ansatz) of a system are built once and shared by its benchmarks.
+
+    names = ['global_cache_precompute', 'get_statevector', 'ham_expectation_value', 'ansatz_gradient', 'pool_gradients',
+             'iqeb_iteration']
+
+    def __init__(self, q_system, ansatz_size=8, n_candidates=5, seed=0):
+        self.q_system = q_system
+        self.rng = numpy.random.default_rng(seed)
+        self.n_candidates = n_candidates
+
+        self.pool = list(GSDExcitations(q_system.n_orbitals, q_system.n_electrons,
+                                        ansatz_element_type='q_exc').get_all_elements())
+        self.global_cache = GlobalCache(q_system)
+        self.global_cache.calculate_exc_gen_sparse_matrices_dict(self.pool)
+
+        self.ansatz = [self.pool[i] for i in
+                       sorted(self.rng.choice(len(self.pool), min(ansatz_size, len(self.pool)), replace=False))]
+        self.vqe_runner = VQERunner(q_system, backend=backends.MatrixCacheBackend, optimizer='BFGS',
+                                    optimizer_options={'gtol': 1e-08}, use_ansatz_gradient=True)
+
+    # new parameters for each run, so that the statevector memoized by the cache is not reused
+    def random_parameters(self):
+        return list(self.rng.normal(size=len(self.ansatz)) * 0.1)
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< benchmarks >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    # each returns [setup, function]
+    def global_cache_precompute(self):
+        def setup():
+            return [GlobalCache(self.q_system)]
+
+        def function(global_cache):
+            global_cache.calculate_exc_gen_sparse_matrices_dict(self.pool)
+        return setup, function
+
+    def get_statevector(self):
+        def setup():
+            return [self.random_parameters()]
+
+        def function(var_parameters):
+            self.global_cache.get_statevector(self.ansatz, var_parameters)
+        return setup, function
+
+    def ham_expectation_value(self):
+        def setup():
+            return [self.random_parameters()]
+
+        def function(var_parameters):
+            backends.MatrixCacheBackend.ham_expectation_value(var_parameters, self.ansatz, self.q_system,
+                                                              cache=self.global_cache)
+        return setup, function
+
+    def ansatz_gradient(self):
+        def setup():
+            return [self.random_parameters()]
+
+        def function(var_parameters):
+            backends.MatrixCacheBackend.ansatz_gradient(var_parameters, self.ansatz, self.q_system,
+                                                        cache=self.global_cache)
+        return setup, function
+
+    # the gradients of the full (unscreened) pool at a new state, as in a gradient selection step
+    def pool_gradients(self):
+        def setup():
+            session = AdaptSession(self.q_system, self.pool, self.vqe_runner, GradientSelection(), 1e-12,
+                                   ansatz=self.ansatz, ansatz_parameters=self.random_parameters(),
+                                   global_cache=self.global_cache, pool_screening=False)
+            return [session]
+
+        def function(session):
+            session.largest_gradient_elements(self.n_candidates)
+        return setup, function
+
+    # a complete QEB-ADAPT-VQE iteration: the gradient ranking, the VQEs of the candidates and the iteration VQE
+    def iqeb_iteration(self):
+        def setup():
+            session = AdaptSession(self.q_system, self.pool, self.vqe_runner, FullEnergySelection(self.n_candidates),
+                                   1e-12, ansatz=self.ansatz, ansatz_parameters=self.random_parameters(),
+                                   global_cache=self.global_cache, pool_screening=False)
+            return [session]
+
+        def function(session):
+            session.step()
+        return setup, function
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< running >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    @staticmethod
+    def measure(setup, function, repeat):
+        function(*setup())
+
+        times = []
+        for i in range(repeat):
+            args = setup()
+            t0 = time.perf_counter()
+            function(*args)
+            times.append(time.perf_counter() - t0)
+
+        args = setup()
+        tracemalloc.start()
+        function(*args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {'times': times, 'min_time': min(times), 'median_time': float(numpy.median(times)),
+                'peak_memory': peak_memory}
+
+    def run(self, benchmark_names=None, repeat=5):
+        if benchmark_names is None:
+            benchmark_names = HotPathBenchmarks.names
+        results = []
+        for name in benchmark_names:
+            setup, function = getattr(self, name)()
+            result = {'benchmark': name, 'system': self.q_system.name, 'source': self.q_system.source,
+                      'n_qubits': self.q_system.n_qubits, 'pool_size': len(self.pool),
+                      **HotPathBenchmarks.measure(setup, function, repeat)}
+            logging.info('{} {}: median {:.6f} s, peak memory {} B'
+                         .format(self.q_system.name, name, result['median_time'], result['peak_memory']))
+            print('{:>4} {:<24} median {:10.6f} s   min {:10.6f} s   peak memory {:12d} B'
+                  .format(self.q_system.name, name, result['median_time'], result['min_time'], result['peak_memory']))
+            results.append(result)
+        return results
+
+
+# <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< saved results >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+class BenchmarkResults:
+    # The results of a benchmark run are saved as JSON with the commit and the environment, to compare runs across
+    # commits (see compare)
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    @staticmethod
+    def metadata():
+        return {'commit': BenchmarkResults.git_commit(),
+                'time': datetime.datetime.now().isoformat(),
+                'platform': platform.platform(), 'python': platform.python_version(), 'numpy': numpy.__version__,
+                'scipy': scipy.__version__, 'multithread': config.multithread,
+                'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+    @staticmethod
+    def save(results, directory=None, name='hot_paths'):
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'results', 'benchmarks')
+        os.makedirs(directory, exist_ok=True)
+        data = {**BenchmarkResults.metadata(), 'results': results}
+        filename = os.path.join(directory, '{}_{}_{}.json'
+                                .format(name, data['commit'], datetime.datetime.now().strftime('%d-%b-%Y_%H-%M-%S')))
+        with open(filename, 'w') as results_file:
+            json.dump(data, results_file, indent=1)
+        return filename
+
+    @staticmethod
+    def load(filename):
+        with open(filename) as results_file:
+            return json.load(results_file)
+
+    # the ratios of the median times and the peak memories of the benchmarks in both runs (on systems from the same
+    # source). A ratio above threshold is a regression
+    @staticmethod
+    def compare(baseline, results, threshold=1.2):
+        baseline_results = {(result['system'], result['source'], result['benchmark']): result
+                            for result in baseline['results']}
+        regressions = []
+        print('Comparison with {} ({})'.format(baseline['commit'], baseline['time']))
+        for result in results:
+            key = (result['system'], result['source'], result['benchmark'])
+            if key not in baseline_results:
+                continue
+            time_ratio = result['median_time'] / baseline_results[key]['median_time']
+            memory_ratio = result['peak_memory'] / max(baseline_results[key]['peak_memory'], 1)
+            regression = time_ratio > threshold or memory_ratio > threshold
+            if regression:
+                regressions.append([key, time_ratio, memory_ratio])
+            print('{:>4} {:<24} time x{:6.2f}   memory x{:6.2f}   {}'
+                  .format(result['system'], result['benchmark'], time_ratio, memory_ratio,
+                          'REGRESSION' if regression else ''))
+        return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks of the simulation hot paths')
+    parser.add_argument('--systems', nargs='+', default=BenchmarkSystems.names, choices=BenchmarkSystems.names)
+    parser.add_argument('--benchmarks', nargs='+', default=HotPathBenchmarks.names, choices=HotPathBenchmarks.names)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--multithread', action='store_true', help='use ray for the precompute (default: off)')
+    parser.add_argument('--output', default=None, help='directory of the saved results')
+    parser.add_argument('--compare', default=None, help='saved results to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2, help='time or memory ratio of a regression')
+    args = parser.parse_args()
+
+    # the logging of the hot paths is not configured (the default level drops the info messages)
+    config.multithread = args.multithread
+
+    results = []
+    for system_name in args.systems:
+        q_system = BenchmarkSystems.get_system(system_name)
+        results += HotPathBenchmarks(q_system).run(args.benchmarks, repeat=args.repeat)
+
+    filename = BenchmarkResults.save(results, directory=args.output)
+    print('Saved results to {}'.format(filename))
+
+    if args.compare is not None:
+        regressions = BenchmarkResults.compare(BenchmarkResults.load(args.compare), results, threshold=args.threshold)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,105 @@
+import argparse
+import subprocess
+import logging
+import numpy
+import json
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.hot_paths import BenchmarkResults
+
+
+class ImportTimeBenchmarks:
+    # Import times of the src modules, each measured in a new interpreter (as paid by a script or a ray worker on
+    # start). The time of a module is its cumulative time reported by python -X importtime. The heavy dependencies
+    # (qiskit, ray, psi4) are imported only by the features that need them (see LazyModule), so the modules that
+    # import them on import are recorded as well.
+
+    modules = ['src.config', 'src.q_systems', 'src.backends', 'src.cache', 'src.vqe_runner', 'src.iter_vqe_utils',
+               'src.adapt_session', 'src.molecules.molecules']
+
+    heavy_modules = ['qiskit', 'ray', 'openfermionpsi4', 'psi4']
+
+    root_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+    @staticmethod
+    def measure(module):
+        code = 'import sys, json\nimport {}\nprint(json.dumps([name for name in {} if name in sys.modules]))'\
+            .format(module, ImportTimeBenchmarks.heavy_modules)
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                 cwd=ImportTimeBenchmarks.root_directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        if process.returncode != 0:
+            raise Exception('Could not import {}: {}'.format(module, process.stderr.strip().splitlines()[-1]))
+
+        # the lines are "import time: self [us] | cumulative | imported package"
+        cumulative_time = None
+        for line in process.stderr.splitlines():
+            fields = line.split('|')
+            if line.startswith('import time:') and len(fields) == 3 and fields[2].strip() == module:
+                cumulative_time = int(fields[1]) * 1e-6
+        return cumulative_time, json.loads(process.stdout.strip().splitlines()[-1])
+
+    @staticmethod
+    def run(modules=None, repeat=5):
+        if modules is None:
+            modules = ImportTimeBenchmarks.modules
+        results = []
+        for module in modules:
+            times = []
+            for i in range(repeat):
+                import_time, heavy_modules = ImportTimeBenchmarks.measure(module)
+                times.append(import_time)
+            result = {'benchmark': 'import', 'module': module, 'times': times, 'min_time': min(times),
+                      'median_time': float(numpy.median(times)), 'heavy_modules': heavy_modules}
+            logging.info('Import {}: median {:.3f} s'.format(module, result['median_time']))
+            print('{:<26} median {:8.3f} s   min {:8.3f} s   heavy modules: {}'
+                  .format(module, result['median_time'], result['min_time'], ', '.join(heavy_modules) or '-'))
+            results.append(result)
+        return results
+
+    # the ratios of the median import times in both runs. A ratio above threshold (with a time increase above
+    # min_difference seconds, to ignore the noise of the small modules), or a heavy module imported that was not
+    # imported in the baseline, is a regression
+    @staticmethod
+    def compare(baseline, results, threshold=1.2, min_difference=0.05):
+        baseline_results = {result['module']: result for result in baseline['results']}
+        regressions = []
+        print('Comparison with {} ({})'.format(baseline['commit'], baseline['time']))
+        for result in results:
+            if result['module'] not in baseline_results:
+                continue
+            baseline_result = baseline_results[result['module']]
+            time_ratio = result['median_time'] / max(baseline_result['median_time'], 1e-6)
+            new_heavy_modules = [name for name in result['heavy_modules'] if name not in baseline_result['heavy_modules']]
+            time_regression = time_ratio > threshold and \
+                result['median_time'] - baseline_result['median_time'] > min_difference
+            regression = time_regression or len(new_heavy_modules) > 0
+            if regression:
+                regressions.append([result['module'], time_ratio, new_heavy_modules])
+            print('{:<26} time x{:6.2f}   {}'.format(result['module'], time_ratio,
+                                                   'REGRESSION ' + ', '.join(new_heavy_modules) if regression else ''))
+        return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import times of the src modules')
+    parser.add_argument('--modules', nargs='+', default=ImportTimeBenchmarks.modules)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='directory of the saved results')
+    parser.add_argument('--compare', default=None, help='saved results to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2, help='time ratio of a regression')
+    args = parser.parse_args()
+
+    results = ImportTimeBenchmarks.run(args.modules, repeat=args.repeat)
+
+    filename = BenchmarkResults.save(results, directory=args.output, name='import_time')
+    print('Saved results to {}'.format(filename))
+
+    if args.compare is not None:
+        regressions = ImportTimeBenchmarks.compare(BenchmarkResults.load(args.compare), results,
+                                                   threshold=args.threshold)
+        if regressions:
+            sys.exit(1)
@@ -8,33 +8,14 @@ from src.backends import *
 from src.utils import LogUtils
 from src.cache import *
 from src.molecules.molecules import *
+from src.eigensolvers import SectorEigensolver
+from src.entanglement import EntanglementUtils
 
 
+# entanglement entropy of the qubits_A subsystem (openfermion qubit ordering), and its reduced density matrix
 def vn_entropy(statevector, qubits_A):
-    qubits_A = set(qubits_A)
-    n_qubits = numpy.log2(len(statevector))
-    n_qubits_A = len(qubits_A)
-    assert n_qubits % 1 == 0
-    assert n_qubits_A < n_qubits
-
-    qubits_B = set(numpy.arange(n_qubits)).difference(qubits_A)
-    k_s = [0]
-    for qubit in qubits_B:
-        new_k_s = numpy.array(k_s.copy())
-        new_k_s = new_k_s + int(2 ** qubit)
-        k_s += list(new_k_s)
-
-    # density matrix for the state of qubits A
-    rho_A = numpy.zeros([2**n_qubits_A, 2**n_qubits_A])
-
-    for i in range(2**n_qubits_A):
-        for j in range(2**n_qubits_A):
-            # MAGIC
-            for k in k_s:
-                rho_A[i, j] += statevector[i + k]*statevector[j + k].conjugate()
-
-    entropy = - rho_A.dot(scipy.linalg.logm(rho_A)).trace()
-
+    entropy = EntanglementUtils.entanglement_entropies(statevector, qubits_A)[0]
+    rho_A = EntanglementUtils.reduced_density_matrices(statevector, qubits_A)[0]
     return entropy, rho_A
 
 
@@ -53,10 +34,10 @@ if __name__ == "__main__":
 
         H = ham_14_qubits(U)
         system = ElectronicSystem(H, n_orbitals, n_electrons)
-        H_sparse_matrix = get_sparse_operator(system.qubit_ham)
-        eigvv = scipy.sparse.linalg.eigs(H_sparse_matrix.todense(), k=10, which='SR')
-        eigvectors = eigvv[1].T
-        entropy = vn_entropy(eigvectors[0], system_A)[0]
+        # the ground state of the n_electrons sector. The solver is warm started from the previous U
+        eigenvalues, eigenvectors = SectorEigensolver.lowest_eigenpairs(system.get_h_sparse_matrix(), n_orbitals,
+                                                                        n_electrons, k=1)
+        entropy = EntanglementUtils.entanglement_entropies(eigenvectors.T, system_A)[0]
 
         Us.append(U)
         entropies.append(entropy)
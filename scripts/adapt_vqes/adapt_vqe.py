@@ -6,6 +6,7 @@ import pandas
 import pandas
 import datetime
 
+import argparse
 import sys
 import ast
 sys.path.append('../../')
@@ -17,10 +18,16 @@ from src.backends import QiskitSimBackend
 from src.utils import LogUtils
 from src.iter_vqe_utils import *
 from src.cache import *
+from src.adapt_session import *
+from src.run_log import RunLog
 from src.molecules.molecules import *
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ADAPT-VQE')
+    parser.add_argument('--resume', default=None, help='records file (.jsonl) of a paused run to resume')
+    args = parser.parse_args()
+
     # <<<<<<<<<ITER VQE PARAMETERS>>>>>>>>>>>>>>>>>>>>
 
     # <<<<<<<<<<< MOLECULE PARAMETERS >>>>>>>>>>>>>
@@ -70,103 +77,39 @@ if __name__ == "__main__":
         ansatz_element_pool = GSDExcitations(molecule.n_orbitals, molecule.n_electrons,
                                             ansatz_element_type=ansatz_element_type).get_all_elements()
 
-    # create simulation cache
-    if backend == backends.MatrixCacheBackend:
-        # precompute commutator matrices, that are use in excitation gradient calculation
-        global_cache = GlobalCache(molecule)
-        global_cache.calculate_exc_gen_sparse_matrices_dict(ansatz_element_pool)
-        global_cache.calculate_commutators_sparse_matrices_dict(ansatz_element_pool)
-    else:
-        global_cache = None
-
-    message = 'Length of new pool', len(ansatz_element_pool)
-    logging.info(message)
-
-    # initialize a dataFrame to collect the simulation data
-    results_data_frame = pandas.DataFrame(columns=['n', 'E', 'dE', 'error', 'n_iters', 'cnot_count', 'u1_count',
-                                                   'cnot_depth', 'u1_depth', 'element', 'element_qubits',
-                                                   'var_parameters'])
     # <<<<<<<<<<<< LOAD PAUSED SIMULATION >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-    init_db = pandas.read_csv("../../results/iter_vqe_results/H6_iqeb_q_exc_n=1_r=15_no_comps_02-June-2021.csv")
+    init_db = None
+    # init_db = pandas.read_csv("../../results/iter_vqe_results/H6_iqeb_q_exc_n=1_r=15_no_comps_02-June-2021.csv")
 
     if init_db is None:
         ansatz_elements = []
         ansatz_parameters = []
     else:
-        state = DataUtils.ansatz_from_data_frame(init_db, molecule)
+        state = DataUtils.ansatz_from_data_frame(init_db, molecule, pool=ansatz_element_pool)
         ansatz_elements = state.ansatz_elements
         ansatz_parameters = state.parameters
 
-    # <<<<<<<<<<<<<< INITIALIZE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-
-    # ansatz_elements = []
-    # ansatz_parameters = []
-
-    iter_count = 0
-    df_count = 0
-    exact_energy = molecule.fci_energy
-    print('Exact energy ', exact_energy)
-    current_energy = vqe_runner.backend.ham_expectation_value([], [], molecule, global_cache)
-
-    print(current_energy)
-    previous_energy = current_energy + max(delta_e_threshold, 1e-5)
-    init_ansatz_length = len(ansatz_elements)
-
-    while previous_energy - current_energy >= delta_e_threshold and iter_count <= max_ansatz_elements:
-        iter_count += 1
-
-        print('New iteration ', iter_count)
-
-        previous_energy = current_energy
-
-        element_to_add, grad = GradientUtils.\
-            get_largest_gradient_elements(ansatz_element_pool, molecule, backend=vqe_runner.backend,
-                                          ansatz_parameters=ansatz_parameters, ansatz=ansatz_elements,
-                                          global_cache=global_cache)[0]
-        print(element_to_add.element)
-
-        result = vqe_runner.vqe_run(ansatz=ansatz_elements + [element_to_add], init_guess_parameters=ansatz_parameters + [0],
-                                    cache=global_cache)
-
-        current_energy = result.fun
-        delta_e = previous_energy - current_energy
-
-        # get initial guess for the var. params. for the next iteration
-        ansatz_parameters = list(result.x)
-
-        if delta_e > 0:
-
-            ansatz_elements.append(element_to_add)
-
-            # save iteration data
-            element_qubits = element_to_add.qubits
-
-            gate_count = IterVQEQasmUtils.gate_count_from_ansatz(ansatz_elements, molecule.n_orbitals)
-            results_data_frame.loc[iter_count] = {'n': iter_count, 'E': current_energy, 'dE': delta_e,
-                                                  'error': current_energy - exact_energy, 'n_iters': result['n_iters'],
-                                                  'cnot_count': gate_count['cnot_count'], 'u1_count': gate_count['u1_count'],
-                                                  'cnot_depth': gate_count['cnot_depth'], 'u1_depth': gate_count['u1_depth'],
-                                                  'element': element_to_add.element, 'element_qubits': element_qubits,
-                                                  'var_parameters': 0}
-            results_data_frame['var_parameters'] = list(result.x)[init_ansatz_length:]
-            # df_data['var_parameters'] = var_parameters
-            # save data
-            DataUtils.save_data(results_data_frame, molecule, time_stamp, frozen_els=frozen_els,
-                                ansatz_element_type=ansatz_element_type, iter_vqe_type='adapt')
-
-            message = 'Add new element to final ansatz {}. Energy {}. Energy change {}, Grad{}, var. parameters: {}' \
-                .format(element_to_add.element, current_energy, delta_e, grad, ansatz_parameters)
-            logging.info(message)
-        else:
-            message = 'No contribution to energy decrease. Stop adding elements to the final ansatz'
-            logging.info(message)
-            break
-
-        print('Added element ', ansatz_elements[-1].element)
+    # <<<<<<<<<<<<<< RUN THE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    # the iterations are recorded in a run log. A paused run is resumed with --resume, if its config matches these
+    # parameters
+    run_config = {'molecule': molecule.name, 'r': r, 'frozen_els': frozen_els,
+                  'pool': 'SpinCompGSD' if spin_complement else 'GSD', 'ansatz_element_type': ansatz_element_type,
+                  'q_encoding': q_encoding, 'strategy': 'gradient', 'delta_e_threshold': delta_e_threshold,
+                  'max_ansatz_size': max_ansatz_elements, 'init_ansatz_size': len(ansatz_elements),
+                  'backend': backend.__name__, 'optimizer': 'BFGS'}
+    run_log = RunLog.open('{}_adapt_{}'.format(molecule.name, ansatz_element_type),
+                          run_config, resume_path=args.resume)
+    session = AdaptSession(molecule, ansatz_element_pool, vqe_runner, GradientSelection(), delta_e_threshold,
+                           ansatz=ansatz_elements, ansatz_parameters=ansatz_parameters, run_log=run_log)
+    print('Exact energy ', session.exact_energy)
+    session.run(max_ansatz_elements)
 
     # calculate the VQE for the final ansatz
-    final_result = vqe_runner.vqe_run(ansatz=ansatz_elements, cache=global_cache)
-    t = time.time()
+    final_result = session.final_vqe()
+    session.close()
+
+    DataUtils.save_data(session.results_data_frame(), molecule, time_stamp, frozen_els=frozen_els,
+                        ansatz_element_type=ansatz_element_type, iter_vqe_type='adapt')
 
     print(final_result)
     print('Ciao')
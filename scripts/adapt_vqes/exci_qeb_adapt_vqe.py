@@ -2,8 +2,8 @@ import logging
 import time
 import numpy
 import pandas
-import ray
 import datetime
+import argparse
 import sys
 import ast
 sys.path.append('../../')
@@ -15,9 +15,15 @@ from src.backends import QiskitSimBackend
 from src.utils import LogUtils
 from src.iter_vqe_utils import *
 from src.cache import *
+from src.adapt_session import *
+from src.run_log import RunLog
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='QEB-ADAPT-VQE for excited states, with energy screening')
+    parser.add_argument('--resume', default=None, help='records file (.jsonl) of a paused run to resume')
+    args = parser.parse_args()
+
     # <<<<<<<<<ITER VQE PARAMETERS>>>>>>>>>>>>>>>>>>>>
 
     # <<<<<<<<<<< MOLECULE PARAMETERS >>>>>>>>>>>>>
@@ -96,109 +102,34 @@ if __name__ == "__main__":
     message = 'Length of new pool', len(ansatz_element_pool)
     logging.info(message)
 
-    # create simulation cache
-    if backend == backends.MatrixCacheBackend:
-        # precompute commutator matrices, that are use in excitation gradient calculation
-        global_cache = GlobalCache(molecule, excited_state=excited_state)
-        global_cache.calculate_exc_gen_sparse_matrices_dict(ansatz_element_pool)
-
-    else:
-        global_cache = None
-
-    # initialize a dataFrame to collect the simulation data
-    results_data_frame = pandas.DataFrame(columns=['n', 'E', 'dE', 'rank', 'error', 'n_iters', 'cnot_count', 'u1_count',
-                                          'cnot_depth', 'u1_depth', 'element', 'element_qubits', 'var_parameters'])
-
-    # <<<<<<<<<<<<<< INITIALIZE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-
-    ansatz = []
-    ansatz_parameters = []
-
-    iter_count = 0
-    df_count = 0
+    # <<<<<<<<<<<<<< RUN THE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
     exact_energy = molecule.calculate_energy_eigenvalues(excited_state+1)[excited_state]
     print('Exact energy ', exact_energy)
-    current_energy = vqe_runner.backend.ham_expectation_value([], [], molecule, cache=global_cache, excited_state=excited_state)
-
-    print(current_energy)
-    previous_energy = current_energy + max(delta_e_threshold, 1e-5)
-    init_ansatz_length = len(ansatz)
-
-    while previous_energy - current_energy >= delta_e_threshold and iter_count <= max_ansatz_elements:
-        iter_count += 1
-
-        print('New iteration ', iter_count)
-
-        previous_energy = current_energy
-
-        # TODO: check
-        # NEW: init random guess for the parameters... better search of good ansatz elements... (exc. states)
-        init_elements_parameters = list((0.5 - numpy.random.rand(len(ansatz_element_pool)))*numpy.pi)
-
-        elements_energies = EnergyUtils.\
-            largest_individual_vqe_energy_reduction_elements(vqe_runner_2, ansatz_element_pool, ansatz=ansatz,
-                                                             elements_parameters=init_elements_parameters,
-                                                             ansatz_parameters=ansatz_parameters, excited_state=excited_state,
-                                                             n=n_largest_grads, global_cache=global_cache)
-
-        elements = [e_g[0] for e_g in elements_energies]
-        elements_keys = [str(el.excitations_generators) for el in elements]
-        elements_parameters = [e_g[1].x[0] for e_g in elements_energies]
-        dEs = [e_g[1].fun - current_energy for e_g in elements_energies]
-
-        message = 'Elements with largest individual energy reductions {}. dEs {}'.format([el.element for el in elements], dEs)
-        logging.info(message)
-
-        element_to_add, intermediate_result = \
-            EnergyUtils.largest_full_vqe_energy_reduction_element(vqe_runner, elements, elements_parameters=elements_parameters,
-                                                                  ansatz=ansatz, ansatz_parameters=ansatz_parameters,
-                                                                  global_cache=global_cache,
-                                                                  excited_state=excited_state)
-
-        el_to_add_rank = elements_keys.index(str(element_to_add.excitations_generators))
-
-        ansatz.append(element_to_add)
-        new_ansatz_elements = [element_to_add]
-        ansatz_parameters = list(intermediate_result.x)
-        result = intermediate_result
-        current_energy = intermediate_result.fun
-        delta_e = previous_energy - current_energy
-
-        if delta_e > 0:
-            for new_ansatz_element in new_ansatz_elements:
-                # save iteration data
-                element_qubits = new_ansatz_element.qubits
-
-                gate_count = IterVQEQasmUtils.gate_count_from_ansatz(ansatz, molecule.n_orbitals)
-                results_data_frame.loc[df_count] = {'n': iter_count, 'E': current_energy, 'dE': delta_e,
-                                                    'error': current_energy - exact_energy,
-                                                    'rank': el_to_add_rank, 'n_iters': result['n_iters'],
-                                                    'cnot_count': gate_count['cnot_count'],
-                                                    'u1_count': gate_count['u1_count'],
-                                                    'cnot_depth': gate_count['cnot_depth'],
-                                                    'u1_depth': gate_count['u1_depth'],
-                                                    'element': new_ansatz_element.element,
-                                                    'element_qubits': element_qubits, 'var_parameters': 0}
-                df_count += 1
-                results_data_frame['var_parameters'] = list(result.x)[:df_count]
-
-                # save data
-                DataUtils.save_data(results_data_frame, molecule, time_stamp, ansatz_element_type=ansatz_element_type,
-                                    frozen_els=frozen_els, iter_vqe_type='exc_iqeb')
-
-                message = 'Add new element to final ansatz {}. Energy {}. Energy change {}, var. parameters: {}' \
-                    .format(element_to_add.element, current_energy, delta_e, ansatz_parameters)
-                logging.info(message)
-        else:
-            message = 'No contribution to energy decrease. Stop adding elements to the final ansatz'
-            logging.info(message)
-            break
-
-        print('Added element ', ansatz[-1].element)
+
+    # the element with the largest full energy reduction among the n_largest_grads elements with the largest
+    # individual energy reductions (calculated with vqe_runner_2, from random initial parameters)
+    candidate_strategy = IndividualEnergySelection(vqe_runner=vqe_runner_2, random_init_parameters=True)
+    strategy = FullEnergySelection(n_candidates=n_largest_grads, candidate_strategy=candidate_strategy,
+                                   screening_precision=False)
+    # the iterations are recorded in a run log. A paused run is resumed with --resume, if its config matches these
+    # parameters
+    run_config = {'molecule': molecule.name, 'r': r, 'frozen_els': frozen_els,
+                  'excited_state': excited_state, 'pool': 'SpinCompGSD' if spin_complement else 'GSD',
+                  'ansatz_element_type': ansatz_element_type, 'strategy': 'full_energy_individual_energy_candidates',
+                  'n_largest_grads': n_largest_grads, 'delta_e_threshold': delta_e_threshold,
+                  'max_ansatz_size': max_ansatz_elements, 'backend': backend.__name__, 'optimizer': 'BFGS'}
+    run_log = RunLog.open('{}_exc_{}_iqeb_{}'.format(molecule.name, excited_state, ansatz_element_type),
+                          run_config, resume_path=args.resume)
+    session = AdaptSession(molecule, ansatz_element_pool, vqe_runner, strategy, delta_e_threshold,
+                           excited_state=excited_state, exact_energy=exact_energy, run_log=run_log)
+    session.run(max_ansatz_elements)
 
     # calculate the VQE for the final ansatz
-    final_result = vqe_runner.vqe_run(ansatz=ansatz, cache=global_cache, excited_state=excited_state)
-    t = time.time()
+    final_result = session.final_vqe()
+    session.close()
+
+    DataUtils.save_data(session.results_data_frame(), molecule, time_stamp, ansatz_element_type=ansatz_element_type,
+                        frozen_els=frozen_els, iter_vqe_type='exc_iqeb')
 
     print(final_result)
     print('Ciao')
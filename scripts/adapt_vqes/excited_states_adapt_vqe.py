@@ -2,8 +2,8 @@ import logging
 import time
 import numpy
 import pandas
-import ray
 import datetime
+import argparse
 import sys
 import ast
 sys.path.append('../../')
@@ -15,9 +15,15 @@ from src.backends import QiskitSimBackend
 from src.utils import LogUtils
 from src.iter_vqe_utils import *
 from src.cache import *
+from src.adapt_session import *
+from src.run_log import RunLog
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ADAPT-VQE for excited states')
+    parser.add_argument('--resume', default=None, help='records file (.jsonl) of a paused run to resume')
+    args = parser.parse_args()
+
     # <<<<<<<<<ITER VQE PARAMETERS>>>>>>>>>>>>>>>>>>>>
 
     # <<<<<<<<<<< MOLECULE PARAMETERS >>>>>>>>>>>>>
@@ -72,87 +78,31 @@ if __name__ == "__main__":
     message = 'Length of new pool', len(ansatz_element_pool)
     logging.info(message)
 
-    # create simulation cache
-    if backend == backends.MatrixCacheBackend:
-        # precompute commutator matrices, that are use in excitation gradient calculation
-        global_cache = GlobalCache(molecule, excited_state=excited_state)
-        global_cache.calculate_exc_gen_sparse_matrices_dict(ansatz_element_pool)
-        # global_cache.calculate_commutators_sparse_matrices_dict(ansatz_element_pool)
-    else:
-        global_cache = None
-
-    # initialize a dataFrame to collect the simulation data
-    results_data_frame = pandas.DataFrame(columns=['n', 'E', 'dE', 'error', 'n_iters', 'cnot_count', 'u1_count',
-                                          'cnot_depth', 'u1_depth', 'element', 'element_qubits', 'var_parameters'])
-
-    # <<<<<<<<<<<<<< INITIALIZE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-
-    ansatz = []
-    var_parameters = []
-
-    iter_count = 0
+    # <<<<<<<<<<<<<< RUN THE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
     exact_energy = molecule.calculate_energy_eigenvalues(excited_state+1)[excited_state]
     print('Exact energy ', exact_energy)
-    current_energy = vqe_runner.backend.ham_expectation_value([], [], molecule, cache=global_cache, excited_state=excited_state)
-
-    print(current_energy)
-    previous_energy = current_energy + max(delta_e_threshold, 1e-5)
-    init_ansatz_length = len(ansatz)
-
-    while previous_energy - current_energy >= delta_e_threshold and iter_count <= max_ansatz_elements:
-        iter_count += 1
-
-        print('New iteration ', iter_count)
-
-        previous_energy = current_energy
-
-        element_to_add, element_result = EnergyUtils.\
-            largest_individual_vqe_energy_reduction_elements(vqe_runner_2, ansatz_element_pool, ansatz=ansatz,
-                                                             ansatz_parameters=var_parameters, excited_state=excited_state,
-                                                             global_cache=global_cache)
-        element_energy_reduction = element_result.fun
-        print(element_to_add.element)
-
-        result = vqe_runner.vqe_run(ansatz=ansatz + [element_to_add],
-                                    init_guess_parameters=var_parameters + list(element_result.x),
-                                    excited_state=excited_state, cache=global_cache)
-
-        current_energy = result.fun
-        delta_e = previous_energy - current_energy
-        var_parameters = list(result.x)
-
-        if delta_e > 0:
-            ansatz.append(element_to_add)
-
-            # save iteration data
-            try:
-                element_qubits = element_to_add.qubits
-            except AttributeError:
-                element_qubits = []
-
-            gate_count = IterVQEQasmUtils.gate_count_from_ansatz(ansatz, molecule.n_orbitals)
-
-            results_data_frame.loc[iter_count] = {'n': iter_count, 'E': current_energy, 'dE': delta_e,
-                                                  'error': current_energy - exact_energy, 'n_iters': result['n_iters'],
-                                                  'cnot_count': gate_count['cnot_count'], 'u1_count': gate_count['u1_count'],
-                                                  'cnot_depth': gate_count['cnot_depth'], 'u1_depth': gate_count['u1_depth'],
-                                                  'element': element_to_add.element, 'element_qubits': element_qubits,
-                                                  'var_parameters': 0}
-            results_data_frame['var_parameters'] = var_parameters
-            DataUtils.save_data(results_data_frame, molecule, time_stamp, frozen_els=frozen_els,
-                                ansatz_element_type=ansatz_element_type, iter_vqe_type='exc_{}_iter_vqe'.format(excited_state))
-
-            message = 'Add new element to the ansatz {}. Energy {}. dE {}, Individual dE{}, var. parameters: {}' \
-                .format(element_to_add.element, current_energy, delta_e, element_energy_reduction, var_parameters)
-            logging.info(message)
-        else:
-            message = 'No contribution to energy decrease. Stop adding elements to the final ansatz'
-            logging.info(message)
-            break
+
+    # the element with the largest individual energy reduction, calculated with vqe_runner_2
+    strategy = IndividualEnergySelection(vqe_runner=vqe_runner_2)
+    # the iterations are recorded in a run log. A paused run is resumed with --resume, if its config matches these
+    # parameters
+    run_config = {'molecule': molecule.name, 'r': r, 'frozen_els': frozen_els,
+                  'excited_state': excited_state, 'pool': 'SpinCompGSD' if spin_complement else 'GSD',
+                  'ansatz_element_type': ansatz_element_type, 'strategy': 'individual_energy',
+                  'delta_e_threshold': delta_e_threshold, 'max_ansatz_size': max_ansatz_elements,
+                  'backend': backend.__name__, 'optimizer': 'BFGS'}
+    run_log = RunLog.open('{}_exc_{}_iter_vqe_{}'.format(molecule.name, excited_state, ansatz_element_type),
+                          run_config, resume_path=args.resume)
+    session = AdaptSession(molecule, ansatz_element_pool, vqe_runner, strategy, delta_e_threshold,
+                           excited_state=excited_state, exact_energy=exact_energy, run_log=run_log)
+    session.run(max_ansatz_elements)
 
     # calculate the VQE for the final ansatz
-    final_result = vqe_runner_2.vqe_run(ansatz=ansatz, cache=global_cache, excited_state=excited_state)
-    t = time.time()
+    final_result = session.final_vqe(vqe_runner=vqe_runner_2)
+    session.close()
+
+    DataUtils.save_data(session.results_data_frame(), molecule, time_stamp, frozen_els=frozen_els,
+                        ansatz_element_type=ansatz_element_type, iter_vqe_type='exc_{}_iter_vqe'.format(excited_state))
 
     print(final_result)
     print('Ciao')
@@ -1,8 +1,8 @@
-import pandas
-
 import sys
 sys.path.append('../../')
 
+import argparse
+
 from src.vqe_runner import VQERunner
 from src.q_systems import *
 from src.ansatz_element_sets import *
@@ -10,10 +10,16 @@ from src.backends import QiskitSimBackend
 from src.utils import *
 from src.iter_vqe_utils import *
 from src.cache import *
+from src.run_log import RunLog
+from src.adapt_session import *
 from src.molecules.molecules import *
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='QEB-ADAPT-VQE')
+    parser.add_argument('--resume', default=None, help='records file (.jsonl) of a paused run to resume')
+    args = parser.parse_args()
+
     # <<<<<<<<<ITER VQE PARAMETERS>>>>>>>>>>>>>>>>>>>>
 
     # <<<<<<<<<<< MOLECULE PARAMETERS >>>>>>>>>>>>>
@@ -57,134 +63,28 @@ if __name__ == "__main__":
     ansatz_element_pool = GSDExcitations(molecule.n_orbitals, molecule.n_electrons,
                                          ansatz_element_type=ansatz_element_type).get_all_elements()
 
-    # create simulation cache
-    if backend == backends.MatrixCacheBackend:
-        # precompute commutator matrices, that are use in excitation gradient calculation
-        global_cache = GlobalCache(molecule)
-        global_cache.calculate_exc_gen_sparse_matrices_dict(ansatz_element_pool)
-        global_cache.calculate_commutators_sparse_matrices_dict(ansatz_element_pool)
-    else:
-        global_cache = None
-
-    message = 'Length of new pool', len(ansatz_element_pool)
-    logging.info(message)
-
-    # initialize a dataFrame to collect the simulation data
-    results_data_frame = pandas.DataFrame(columns=['n', 'E', 'dE', 'error', 'n_iters', 'cnot_count', 'u1_count',
-                                                   'cnot_depth', 'u1_depth', 'element', 'element_qubits',
-                                                   'var_parameters'])
-
-    # <<<<<<<<<<<< LOAD PAUSED SIMULATION >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-    init_db = pandas.read_csv("../../results/iter_vqe_results/H6_iqeb_q_exc_n=10_r=075_27-May-2021.csv")
-    # init_db = pandas.read_csv("../../results/iter_vqe_results/H6_iqeb_q_exc_n=10_r=1_27-May-2021.csv")
-
-    if init_db is None:
-        ansatz = []
-        ansatz_parameters = []
-    else:
-        state = DataUtils.ansatz_from_data_frame(init_db, molecule)
-        ansatz = state.ansatz_elements
-        ansatz_parameters = state.parameters
-
-    # <<<<<<<<<<<<<< INITIALIZE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-
-    # ansatz = []
-    # ansatz_parameters = []
-
-    hf_energy = molecule.hf_energy
-    fci_energy = molecule.fci_energy
-    iter_count = 0
-    df_count = 0
-    current_energy = hf_energy
-    previous_energy = 0
-    init_ansatz_length = len(ansatz)
-
-    while previous_energy - current_energy >= delta_e_threshold and iter_count <= max_ansatz_size:
-        iter_count += 1
-
-        print('New cycle ', iter_count)
-
-        previous_energy = current_energy
-
-        # get the n elements with largest gradients
-        elements_grads = GradientUtils.\
-            get_largest_gradient_elements(ansatz_element_pool, molecule, backend=backend, n=n_largest_grads,
-                                          ansatz_parameters=ansatz_parameters, ansatz=ansatz, global_cache=global_cache)
-
-        elements = [e_g[0] for e_g in elements_grads]
-        grads = [e_g[1] for e_g in elements_grads]
-
-        message = 'Elements with largest grads {}. Grads {}'.format([el.element for el in elements], grads)
-        logging.info(message)
-
-        element_to_add, result =\
-            EnergyUtils.largest_full_vqe_energy_reduction_element(vqe_runner, elements, ansatz_parameters=ansatz_parameters,
-                                                                  ansatz=ansatz, global_cache=global_cache)
-        print('!!!!', element_to_add.element, element_to_add.qubits)
-
-        compl_element_to_add = element_to_add.get_spin_comp_exc()
-        print('!!!!' , compl_element_to_add.element, compl_element_to_add.qubits)
-        print(compl_element_to_add.excitations_generators)
-
-        # TODO check the if condition
-        comp_qubits = compl_element_to_add.qubits
-        qubits = element_to_add.qubits
-        if [set(qubits[0]), set(qubits[1])] == [set(comp_qubits[0]), set(comp_qubits[1])] or \
-           [set(qubits[0]), set(qubits[1])] == [set(comp_qubits[1]), set(comp_qubits[0])]:
-            result = vqe_runner.vqe_run(ansatz=ansatz + [element_to_add],
-                                        init_guess_parameters=ansatz_parameters + [0], cache=global_cache)
-            current_energy = result.fun
-            delta_e = previous_energy - current_energy
-            if delta_e > 0:
-                ansatz.append(element_to_add)
-                new_ansatz_elements = [element_to_add]
-        else:
-            result = vqe_runner.vqe_run(ansatz=ansatz + [element_to_add, compl_element_to_add],
-                                        init_guess_parameters=ansatz_parameters + [0, 0], cache=global_cache)
-            current_energy = result.fun
-            delta_e = previous_energy - current_energy
-            if delta_e > 0:
-                ansatz.append(element_to_add)
-                ansatz.append(compl_element_to_add)
-                print('Add complement element: ', compl_element_to_add.element)
-                new_ansatz_elements = [element_to_add, compl_element_to_add]
-
-        # get initial guess for the var. params. for the next iteration
-        ansatz_parameters = list(result.x)
-
-        if delta_e > 0:
-            for new_ansatz_element in new_ansatz_elements:
-                # save iteration data
-                element_qubits = new_ansatz_element.qubits
-
-                gate_count = IterVQEQasmUtils.gate_count_from_ansatz(ansatz, molecule.n_orbitals)
-                results_data_frame.loc[df_count] = {'n': iter_count, 'E': current_energy, 'dE': delta_e,
-                                         'error': current_energy - fci_energy,
-                                         'n_iters': result['n_iters'], 'cnot_count': gate_count['cnot_count'],
-                                         'u1_count': gate_count['u1_count'], 'cnot_depth': gate_count['cnot_depth'],
-                                         'u1_depth': gate_count['u1_depth'], 'element': new_ansatz_element.element,
-                                         'element_qubits': element_qubits, 'var_parameters': 0}
-                df_count += 1
-                results_data_frame['var_parameters'] = list(result.x)[:df_count]
-                # df_data['var_parameters'] = var_parameters
-
-                # save data
-                DataUtils.save_data(results_data_frame, molecule, time_stamp, ansatz_element_type=ansatz_element_type,
-                                    frozen_els=frozen_els, iter_vqe_type='iqeb')
-
-                message = 'Add new element to final ansatz {}. Energy {}. Energy change {}, var. parameters: {}' \
-                    .format(element_to_add.element, current_energy, delta_e, ansatz_parameters)
-                logging.info(message)
-        else:
-            message = 'No contribution to energy decrease. Stop adding elements to the final ansatz'
-            logging.info(message)
-            break
-
-        print('Added element ', ansatz[-1].element)
+    # <<<<<<<<<<<<<< RUN THE ITERATIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    # the iterations are recorded in a run log. A paused run is resumed from its last checkpoint and the records
+    # appended after it, if its config matches these parameters
+    run_config = {'molecule': molecule.name, 'r': r, 'frozen_els': frozen_els, 'pool': 'GSD',
+                  'ansatz_element_type': ansatz_element_type, 'strategy': 'spin_comp_pairs_full_energy',
+                  'n_largest_grads': n_largest_grads, 'delta_e_threshold': delta_e_threshold,
+                  'max_ansatz_size': max_ansatz_size, 'backend': backend.__name__, 'optimizer': 'BFGS'}
+    run_log = RunLog.open('{}_iqeb_{}'.format(molecule.name, ansatz_element_type), run_config,
+                          resume_path=args.resume)
+
+    # the element with the largest full energy reduction among the n_largest_grads elements with the largest
+    # gradients, together with its spin complement
+    strategy = SpinComplementPairSelection(FullEnergySelection(n_candidates=n_largest_grads))
+    session = AdaptSession(molecule, ansatz_element_pool, vqe_runner, strategy, delta_e_threshold, run_log=run_log)
+    session.run(max_ansatz_size)
 
     # calculate the VQE for the final ansatz
-    final_result = vqe_runner.vqe_run(ansatz=ansatz, cache=global_cache)
-    t = time.time()
+    final_result = session.final_vqe()
+    session.close()
+
+    DataUtils.save_data(session.results_data_frame(), molecule, time_stamp, ansatz_element_type=ansatz_element_type,
+                        frozen_els=frozen_els, iter_vqe_type='iqeb')
 
     print(final_result)
     print('Ciao')
\ No newline at end of file
@@ -12,7 +12,6 @@ import time
 import numpy
 import pandas
 import datetime
-import qiskit
 
 
 if __name__ == "__main__":
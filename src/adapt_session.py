@@ -0,0 +1,457 @@
+from src import config
+from src import backends
+from src.ansatz_elements import AnsatzElement
+from src.cache import GlobalCache
+from src.iter_vqe_utils import GradientUtils, EnergyUtils, IterVQEQasmUtils, PrecisionSchedule
+from src.instrumentation import Instrumentation
+from src.pool_screening import PoolScreening
+from src.ray_tasks import RayTasks
+from src.run_log import RunLog
+from src.utils import RayUtils
+
+import collections
+import logging
+import pandas
+import numpy
+import json
+import time
+
+
+# the elements selected by a selection strategy, with the initial guess of the parameters of the iteration VQE (None
+# for the current parameters and zeros for the new elements), or the iteration VQE result if already calculated by the
+# strategy, and information on the selection saved with the iteration record
+Selection = collections.namedtuple('Selection', ['elements', 'init_guess_parameters', 'result', 'info'])
+
+
+class AdaptSession:
+    # An iterative VQE run (ADAPT-VQE, QEB-ADAPT-VQE and their variants). The session owns the element pool, the
+    # simulation cache (for the MatrixCacheBackend), the ray runtime (if config.multithread) and the state of the run:
+    # the ansatz, its parameters and energy. Each step selects new elements with a selection strategy (see
+    # SelectionStrategy), runs the iteration VQE of the extended ansatz and adds the elements if the energy decreases.
+    # The statevector psi of the current ansatz and H psi are calculated once per step, and the gradients of all the
+    # pool elements are evaluated from them as 2Re<H psi|A|psi>, without the commutator matrices. For ground states, the
+    # pool is screened against the Hamiltonian before the precompute (see PoolScreening), and only the screened
+    # elements are evaluated. The iterations are recorded in a run log if given, and a run with an existing run log is
+    # resumed from it.
+
+    def __init__(self, q_system, pool, vqe_runner, strategy, delta_e_threshold, excited_state=0, exact_energy=None,
+                 ansatz=None, ansatz_parameters=None, global_cache=None, run_log=None, pool_screening=None):
+        self.q_system = q_system
+        self.pool = pool
+        self.vqe_runner = vqe_runner
+        self.strategy = strategy
+        self.delta_e_threshold = delta_e_threshold
+        self.excited_state = excited_state
+        if exact_energy is None:
+            exact_energy = q_system.fci_energy
+        self.exact_energy = exact_energy
+        self.run_log = run_log
+
+        self.ansatz = [] if ansatz is None else list(ansatz)
+        self.ansatz_parameters = [] if ansatz_parameters is None else list(ansatz_parameters)
+
+        # the task records of the previous sessions are dropped
+        if config.task_telemetry:
+            RayTasks.reset()
+        if config.multithread:
+            RayUtils.hold()
+
+        new_global_cache = global_cache is None and vqe_runner.backend == backends.MatrixCacheBackend
+        if new_global_cache:
+            global_cache = GlobalCache(q_system, excited_state=excited_state)
+        self.global_cache = global_cache
+
+        # the screening is skipped for excited states, which can be outside of the symmetry sector of the reference
+        if pool_screening is None:
+            pool_screening = config.pool_screening and excited_state == 0
+        self.screening = None
+        self.active_pool = pool
+        if pool_screening:
+            if global_cache is None:
+                H_sparse_matrix = q_system.get_h_sparse_matrix()
+            else:
+                H_sparse_matrix = global_cache.H_sparse_matrix
+            adds_spin_complements = getattr(strategy, 'adds_spin_complements', False)
+            self.screening = PoolScreening(pool, H_sparse_matrix, q_system.n_qubits, q_system.n_electrons,
+                                           ansatz=self.ansatz, spin_complements=adds_spin_complements,
+                                           group_spin_complements=adds_spin_complements and
+                                           config.group_spin_complements)
+            self.active_pool = self.screening.elements
+
+        if new_global_cache:
+            global_cache.calculate_exc_gen_sparse_matrices_dict(self.active_pool)
+
+        # loose optimizer tolerances for the candidate VQEs, tightened as delta_e approaches delta_e_threshold
+        self.precision_schedule = PrecisionSchedule(delta_e_threshold)
+
+        self.init_ansatz_length = len(self.ansatz)
+        self.iter_count = 0
+        self.delta_e = None
+        self.records = []
+
+        # psi and H psi of the ansatz and parameters of statevectors_key
+        self.statevectors_key = None
+        self.psi = None
+        self.h_psi = None
+        # the sums of the excitation generators matrices of the elements
+        self.generator_matrices = {}
+
+        self.current_energy = self.energy()
+        if self.run_log is not None:
+            self.resume()
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< state of the current ansatz >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    # psi and H psi (including the excited state penalty terms) of the current ansatz, as dense arrays
+    def statevectors(self):
+        key = (len(self.ansatz), tuple(self.ansatz_parameters))
+        if self.statevectors_key != key:
+            sparse_statevector = self.global_cache.get_statevector(self.ansatz, list(self.ansatz_parameters))
+            phi = sparse_statevector.conj().transpose()
+            h_phi = self.global_cache.H_sparse_matrix.dot(phi) + self.global_cache.penalty_dot(phi)
+            if config.instrumentation:
+                Instrumentation.count('spmv')
+            self.psi = numpy.asarray(phi.todense()).ravel()
+            self.h_psi = numpy.asarray(h_phi.todense()).ravel()
+            self.statevectors_key = key
+        return self.psi, self.h_psi
+
+    def energy(self):
+        if self.global_cache is None:
+            return self.vqe_runner.backend.ham_expectation_value(self.ansatz_parameters, self.ansatz, self.q_system,
+                                                                 excited_state=self.excited_state)
+        psi, h_psi = self.statevectors()
+        return numpy.vdot(psi, h_psi).real
+
+    def generator_matrix(self, element):
+        if element not in self.generator_matrices:
+            # calculates the matrices of the elements outside the pool (e.g. spin complements)
+            self.global_cache.get_ansatz_element_excitations_matrices(element, 0)
+            self.generator_matrices[element] = sum(self.global_cache.get_excitations_generators_matrices(element))
+        return self.generator_matrices[element]
+
+    # the energy gradients of elements appended to the current ansatz, at zero parameters
+    def gradients(self, elements):
+        if self.global_cache is None:
+            elements_gradients = GradientUtils.\
+                get_ansatz_elements_gradients(elements, self.q_system, ansatz_parameters=self.ansatz_parameters,
+                                              ansatz=self.ansatz, backend=self.vqe_runner.backend,
+                                              excited_state=self.excited_state)
+            return [gradient for element, gradient in elements_gradients]
+
+        psi, h_psi = self.statevectors()
+        if config.instrumentation:
+            Instrumentation.count('spmv', len(elements))
+        return [2 * numpy.vdot(h_psi, self.generator_matrix(element).dot(psi)).real for element in elements]
+
+    # the n (screened) pool elements with the largest absolute gradients, as [element, gradient] lists in decreasing
+    # order
+    def largest_gradient_elements(self, n=1):
+        elements = list(self.active_pool)
+        with Instrumentation.phase('gradient_screening'):
+            gradients = self.gradients(elements)
+        order = numpy.argsort(-numpy.abs(gradients), kind='stable')[:n]
+        elements_gradients = [[elements[i], gradients[i]] for i in order]
+        logging.info('Elements with largest grads {}. Grads {}'
+                     .format([element.element for element, gradient in elements_gradients],
+                             [gradient for element, gradient in elements_gradients]))
+        return elements_gradients
+
+    # a copy of the VQE runner with the optimizer tolerances of a precision schedule stage
+    def stage_vqe_runner(self, stage):
+        return self.precision_schedule.get_vqe_runner(self.vqe_runner, stage, delta_e=self.delta_e)
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< iterations >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    def converged(self):
+        return self.delta_e is not None and self.delta_e < self.delta_e_threshold
+
+    # add the elements selected by the strategy. Returns False if they do not decrease the energy (then the ansatz is
+    # not changed)
+    def step(self):
+        t0 = time.time()
+        instrumentation_snapshot = Instrumentation.snapshot()
+        first_task_record = len(RayTasks.records)
+        self.iter_count += 1
+        logging.info('New iteration {}'.format(self.iter_count))
+
+        previous_energy = self.current_energy
+        selection = self.strategy.select(self)
+
+        result = selection.result
+        if result is None:
+            init_guess_parameters = selection.init_guess_parameters
+            if init_guess_parameters is None:
+                init_guess_parameters = self.ansatz_parameters + \
+                                        [0] * sum([element.n_var_parameters for element in selection.elements])
+            with Instrumentation.phase('iteration_vqe'):
+                result = self.stage_vqe_runner('iteration').\
+                    vqe_run(ansatz=self.ansatz + selection.elements, init_guess_parameters=list(init_guess_parameters),
+                            excited_state=self.excited_state, cache=self.global_cache)
+            self.precision_schedule.record('iteration', result)
+
+        self.delta_e = previous_energy - result.fun
+        if self.delta_e <= 0:
+            logging.info('No contribution to energy decrease. Stop adding elements to the final ansatz')
+            return False
+
+        self.ansatz += selection.elements
+        self.ansatz_parameters = list(result.x)
+        self.current_energy = result.fun
+
+        record = {'n': self.iter_count, 'E': self.current_energy, 'dE': self.delta_e,
+                  'error': self.current_energy - self.exact_energy, 'n_iters': result['n_iters'],
+                  **IterVQEQasmUtils.gate_count_from_ansatz(self.ansatz, self.q_system.n_qubits),
+                  'element': selection.elements[0].element, 'element_qubits': selection.elements[0].qubits,
+                  'element_data': [element.serialize() for element in selection.elements],
+                  'var_parameters': self.ansatz_parameters, **selection.info, 'iteration_time': time.time() - t0}
+        if self.strategy.uses_random_numbers():
+            record['rng_state'] = numpy.random.get_state()
+        if config.instrumentation:
+            record['instrumentation'] = Instrumentation.summary(instrumentation_snapshot)
+        if self.global_cache is not None:
+            record['cache_bytes'] = self.global_cache.log_memory_report()['total']
+        if config.task_telemetry:
+            record['ray_tasks'] = RayTasks.stage_summary(first_task_record)
+            RayTasks.log_summary(first_task_record)
+            # the records are only kept for the trace exported by close
+            if config.task_telemetry_trace is None:
+                RayTasks.reset()
+        self.records.append(record)
+        if self.run_log is not None:
+            self.run_log.append(record)
+            self.run_log.checkpoint(self.checkpoint_state())
+
+        logging.info('Add new elements to the ansatz {}. Energy {}. Energy change {}, var. parameters: {}'
+                     .format([element.element for element in selection.elements], self.current_energy, self.delta_e,
+                             self.ansatz_parameters))
+        return True
+
+    # iterate until the energy change is below delta_e_threshold, or the number of iterations exceeds max_iterations
+    # (the bound of the original drivers, which run up to max_iterations + 1 iterations)
+    def run(self, max_iterations):
+        while not self.converged() and self.iter_count <= max_iterations:
+            if not self.step():
+                break
+        return self.ansatz, self.ansatz_parameters
+
+    # the VQE of the final ansatz, with the full precision. The run is then marked completed in the run log
+    def final_vqe(self, vqe_runner=None):
+        if vqe_runner is None:
+            vqe_runner = self.vqe_runner
+        with Instrumentation.phase('final_vqe'):
+            result = vqe_runner.vqe_run(ansatz=self.ansatz, init_guess_parameters=self.ansatz_parameters,
+                                        excited_state=self.excited_state, cache=self.global_cache)
+        self.precision_schedule.record('final', result)
+        self.precision_schedule.log_summary()
+        if self.run_log is not None:
+            self.run_log.mark_completed({'n': self.iter_count, 'ansatz_size': len(self.ansatz), 'E': result.fun,
+                                         'error': result.fun - self.exact_energy})
+        return result
+
+    def close(self):
+        if self.run_log is not None:
+            self.run_log.close()
+        if config.task_telemetry and config.task_telemetry_trace is not None:
+            RayTasks.export_chrome_trace(config.task_telemetry_trace)
+        if config.multithread:
+            RayUtils.release()
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< data >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    def deserialize_elements(self, data_list):
+        if hasattr(self.pool, 'deserialize_all'):
+            return self.pool.deserialize_all(data_list, system_n_qubits=self.q_system.n_qubits)
+        return AnsatzElement.deserialize_all(data_list, system_n_qubits=self.q_system.n_qubits)
+
+    # the state of the run that is not recorded by the iteration records. The cache is not included (it is recalculated
+    # from the pool). The checkpoints are taken every checkpoint_interval records, so if the strategy draws random
+    # numbers (e.g. random initial parameters), the random state after each iteration is also saved with its record,
+    # and restored when the record is replayed (otherwise a run resumed between checkpoints would repeat the random
+    # numbers of the replayed iterations)
+    def checkpoint_state(self):
+        return {'ansatz': self.ansatz, 'ansatz_parameters': self.ansatz_parameters, 'iter_count': self.iter_count,
+                'current_energy': self.current_energy, 'delta_e': self.delta_e,
+                'precision_schedule': self.precision_schedule, 'rng_state': numpy.random.get_state()}
+
+    # restore the state of the run from the last checkpoint of the run log, and replay the records appended after it
+    def resume(self):
+        state, new_records = self.run_log.load()
+        self.records = RunLog.read_records(self.run_log.records_path)
+        if state is not None:
+            self.ansatz = state['ansatz']
+            self.ansatz_parameters = state['ansatz_parameters']
+            self.iter_count = state['iter_count']
+            self.current_energy = state['current_energy']
+            self.delta_e = state['delta_e']
+            self.precision_schedule = state['precision_schedule']
+            numpy.random.set_state(state['rng_state'])
+
+        for record in new_records:
+            self.ansatz += self.deserialize_elements(record['element_data'])
+            self.ansatz_parameters = record['var_parameters']
+            self.iter_count = record['n']
+            self.current_energy = record['E']
+            self.delta_e = record['dE']
+            if 'rng_state' in record:
+                numpy.random.set_state(tuple(record['rng_state']))
+
+        if self.iter_count > 0:
+            logging.info('Resumed run {} at iteration {}'.format(self.run_log.name, self.iter_count))
+
+    # the results table of the run, with a row for each added element
+    def results_data_frame(self):
+        columns = ['n', 'E', 'dE', 'error', 'n_iters', 'cnot_count', 'u1_count', 'cnot_depth', 'u1_depth', 'element',
+                   'element_qubits', 'element_data', 'var_parameters']
+        rows = []
+        for record in self.records:
+            for element, element_data in zip(self.deserialize_elements(record['element_data']), record['element_data']):
+                row = {key: value for key, value in record.items()
+                       if key not in ['element_data', 'var_parameters', 'rng_state']}
+                row.update({'element': element.element, 'element_qubits': element.qubits,
+                            'element_data': json.dumps(element_data)})
+                rows.append(row)
+
+        # the final parameters of the added elements
+        added_parameters = self.ansatz_parameters[len(self.ansatz_parameters) - len(rows):]
+        for row, parameter in zip(rows, added_parameters):
+            row['var_parameters'] = parameter
+
+        extra_columns = []
+        for row in rows:
+            extra_columns += [key for key in row if key not in columns and key not in extra_columns]
+        return pandas.DataFrame(rows, columns=columns + extra_columns)
+
+
+# <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< selection strategies >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# A selection strategy selects the elements added by a step of an AdaptSession. The strategies that rank the pool
+# elements also provide the n best candidates, as [element, score, parameter] lists, where parameter is the initial
+# guess for the parameter of the element.
+class SelectionStrategy:
+    # whether the spin complements of the selected elements are added with them (see PoolScreening)
+    adds_spin_complements = False
+
+    def candidates(self, session, n):
+        raise NotImplementedError
+
+    # whether the selections draw random numbers (then the random state is saved with the iteration records)
+    def uses_random_numbers(self):
+        return False
+
+    def select(self, session):
+        element, score, parameter = self.candidates(session, 1)[0]
+        return Selection([element], None, None, {})
+
+
+class GradientSelection(SelectionStrategy):
+    # ADAPT-VQE: the elements with the largest energy gradients
+    def candidates(self, session, n):
+        return [[element, gradient, 0] for element, gradient in session.largest_gradient_elements(n)]
+
+    def select(self, session):
+        element, gradient, parameter = self.candidates(session, 1)[0]
+        return Selection([element], None, None, {'grad': gradient})
+
+
+class IndividualEnergySelection(SelectionStrategy):
+    # The elements with the largest individual energy reductions (optimizing only the parameter of the element, on top
+    # of the current ansatz), among the whole pool or the n_screened elements with the largest gradients. The VQEs use
+    # vqe_runner if given (e.g. a gradient free optimizer for excited states), otherwise the screening precision. Random
+    # initial parameters help to find minima away from zero (excited states).
+    def __init__(self, vqe_runner=None, n_screened=None, random_init_parameters=False):
+        self.vqe_runner = vqe_runner
+        self.n_screened = n_screened
+        self.random_init_parameters = random_init_parameters
+
+    def uses_random_numbers(self):
+        return self.random_init_parameters
+
+    def candidates(self, session, n):
+        if self.n_screened is None:
+            elements = list(session.active_pool)
+        else:
+            elements = [element for element, gradient in session.largest_gradient_elements(self.n_screened)]
+
+        elements_parameters = None
+        if self.random_init_parameters:
+            elements_parameters = list((0.5 - numpy.random.rand(len(elements))) * numpy.pi)
+
+        vqe_runner = self.vqe_runner
+        if vqe_runner is None:
+            vqe_runner = session.stage_vqe_runner('screening')
+
+        elements_results = EnergyUtils.\
+            largest_individual_vqe_energy_reduction_elements(vqe_runner, elements, elements_parameters=elements_parameters,
+                                                             ansatz=session.ansatz,
+                                                             ansatz_parameters=session.ansatz_parameters,
+                                                             global_cache=session.global_cache, n=n,
+                                                             excited_state=session.excited_state)
+        logging.info('Elements with largest individual energy reductions {}. dEs {}'
+                     .format([element.element for element, result in elements_results],
+                             [result.fun - session.current_energy for element, result in elements_results]))
+        return [[element, result.fun, result.x[0]] for element, result in elements_results]
+
+    def select(self, session):
+        element, energy, parameter = self.candidates(session, 1)[0]
+        return Selection([element], session.ansatz_parameters + [parameter], None,
+                         {'individual_dE': session.current_energy - energy})
+
+
+class FullEnergySelection(SelectionStrategy):
+    # QEB-ADAPT-VQE: the element with the largest full energy reduction (optimizing all the parameters), among the
+    # n_candidates best candidates of another strategy (by default the largest gradients). The candidate VQEs use the
+    # screening precision, and the iteration VQE is warm started from the result of the selected element. Without
+    # screening_precision, the candidate VQEs use the iteration precision and the result of the selected element is
+    # the iteration result.
+    def __init__(self, n_candidates=10, candidate_strategy=None, screening_precision=True):
+        self.n_candidates = n_candidates
+        if candidate_strategy is None:
+            candidate_strategy = GradientSelection()
+        self.candidate_strategy = candidate_strategy
+        self.screening_precision = screening_precision
+
+    def uses_random_numbers(self):
+        return self.candidate_strategy.uses_random_numbers()
+
+    def select(self, session):
+        candidates = self.candidate_strategy.candidates(session, self.n_candidates)
+        elements = [element for element, score, parameter in candidates]
+        elements_parameters = [parameter for element, score, parameter in candidates]
+
+        stage = 'screening' if self.screening_precision else 'iteration'
+        elements_results = EnergyUtils.\
+            elements_full_vqe_energy_reductions(session.stage_vqe_runner(stage), elements,
+                                                elements_parameters=elements_parameters, ansatz=session.ansatz,
+                                                ansatz_parameters=session.ansatz_parameters,
+                                                global_cache=session.global_cache, excited_state=session.excited_state)
+        session.precision_schedule.record(stage, [result for element, result in elements_results])
+
+        rank, (element, result) = min(enumerate(elements_results), key=lambda x: x[1][1].fun)
+        if self.screening_precision:
+            return Selection([element], list(result.x), None, {'rank': rank})
+        return Selection([element], None, result, {'rank': rank})
+
+
+class SpinComplementPairSelection(SelectionStrategy):
+    # Adds the element selected by another strategy together with its spin complement, if the complement acts on
+    # different qubits (both new parameters start from zero). Otherwise the selection of the other strategy is kept.
+    adds_spin_complements = True
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+
+    def uses_random_numbers(self):
+        return self.strategy.uses_random_numbers()
+
+    @staticmethod
+    def same_qubits(element, complement_element):
+        qubits = [set(element.qubits[0]), set(element.qubits[1])]
+        complement_qubits = [set(complement_element.qubits[0]), set(complement_element.qubits[1])]
+        return qubits == complement_qubits or qubits == complement_qubits[::-1]
+
+    def select(self, session):
+        selection = self.strategy.select(session)
+        element = selection.elements[0]
+        complement_element = element.get_spin_comp_exc()
+        if self.same_qubits(element, complement_element):
+            return selection
+
+        logging.info('Add complement element {}'.format(complement_element.element))
+        return Selection([element, complement_element], None, None, selection.info)
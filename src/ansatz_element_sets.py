@@ -1,35 +1,128 @@
 from src.ansatz_elements import*
+from src.utils import RayUtils
+from src.ray_tasks import RayTasks
+from src import config
+
+import collections.abc
 import itertools
+import operator
+import logging
+
+
+# <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<Lazy sequence of ansatz elements>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+class ElementPool(collections.abc.Sequence):
+    # A pool of ansatz elements stored as compact descriptors (element class, arguments, keyword arguments). The
+    # tuple arguments are passed to the element classes as lists. An element is constructed on its first access and
+    # kept, and its excitation generators are calculated only when needed (see AnsatzElement). Slices return lists.
+    __slots__ = ('descriptors', 'elements', 'registry_dict')
+
+    def __init__(self, descriptors):
+        self.descriptors = list(descriptors)
+        self.elements = [None] * len(self.descriptors)
+        self.registry_dict = None
+
+    def __len__(self):
+        return len(self.descriptors)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        index = operator.index(index)
+        if index < 0:
+            index += len(self)
+        if self.elements[index] is None:
+            element_class, args, kwargs = self.descriptors[index]
+            args = [list(arg) if type(arg) == tuple else arg for arg in args]
+            self.elements[index] = element_class(*args, **kwargs)
+        return self.elements[index]
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    # the elements of the pool by their serialized keys (see AnsatzElement.serialize), built on first use
+    def registry(self):
+        if self.registry_dict is None:
+            self.registry_dict = {AnsatzElement.serialized_key(element.serialize()): element for element in self}
+        return self.registry_dict
+
+    # deserialize a list of elements, reusing the elements of the pool
+    def deserialize_all(self, data_list, system_n_qubits=None):
+        return AnsatzElement.deserialize_all(data_list, system_n_qubits=system_n_qubits, registry=self.registry())
+
+    # calculate the memoized excitation generators of all elements of the pool, with ray if config.multithread
+    def build_excitations_generators(self):
+        generator_keys = set()
+        for element in self:
+            generator_keys.update(element.generator_keys())
+        generator_keys = [key for key in generator_keys if key not in AnsatzElement.excitation_generators_dict]
+        logging.info('Calculating {} excitation generators'.format(len(generator_keys)))
+
+        if config.multithread and len(generator_keys) > 0:
+            chunk_size = config.multithread_chunk_size
+            if chunk_size is None:
+                chunk_size = len(generator_keys)
+            chunks = [generator_keys[i:i + chunk_size] for i in range(0, len(generator_keys), chunk_size)]
+
+            RayUtils.init()
+            chunks_ray_ids = [[chunk, RayTasks.submit('excitation_generators',
+                                                      ElementPool.calculate_excitation_generators_multithread, chunk)]
+                              for chunk in chunks]
+            for chunk, ray_id in chunks_ray_ids:
+                for key, excitation_generator in zip(chunk, RayTasks.get(ray_id)):
+                    AnsatzElement.excitation_generators_dict[key] = excitation_generator
+            del chunks_ray_ids
+            RayUtils.shutdown()
+        else:
+            for key in generator_keys:
+                AnsatzElement.excitation_generator(key)
+
+        return self
+
+    @staticmethod
+    def calculate_excitation_generators_multithread(generator_keys):
+        return [AnsatzElement.calculate_excitation_generator(key) for key in generator_keys]
+
+    # descriptors of the PauliStringExc elements of the terms of a qubit excitation
+    @staticmethod
+    def pauli_string_descriptors(qubits_1, qubits_2, system_n_qubits):
+        qubit_excitation = AnsatzElement.excitation_generator(('q_exc', tuple(qubits_1), tuple(qubits_2)))
+        return [(PauliStringExc, (1j * QubitOperator(term),), {'system_n_qubits': system_n_qubits})
+                for term in qubit_excitation.terms]
 
 
 # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<Lists of ansatz elements>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# The element sets enumerate the descriptors of their elements. get_all_elements returns a lazy ElementPool.
 class UCCSDExcitations:
     def __init__(self, n_orbitals, n_electrons, ansatz_element_type='f_exc'):
         self.n_orbitals = n_orbitals
         self.n_electrons = n_electrons
         self.element_type = ansatz_element_type
 
-    def get_single_excitation_elements(self):
+    def get_single_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
         single_excitations = []
         for i in range(self.n_electrons):
             for j in range(self.n_electrons, self.n_orbitals):
                 # if i % 2 == j % 2:
                 if self.element_type == 'f_exc':
-                    single_excitations.append(SFExc(i, j, system_n_qubits=self.n_orbitals))
+                    single_excitations.append((SFExc, (i, j), kwargs))
                 elif self.element_type == 'q_exc':
-                    single_excitations.append(SQExc(i, j, system_n_qubits=self.n_orbitals))
+                    single_excitations.append((SQExc, (i, j), kwargs))
                 elif self.element_type == 'eff_f_exc':
-                    single_excitations.append(EffSFExc(i, j, system_n_qubits=self.n_orbitals))
+                    single_excitations.append((EffSFExc, (i, j), kwargs))
                 elif self.element_type == 'pauli_str_exc':
-                    qubit_excitation = SQExc(i, j).excitations_generators
-                    single_excitations += [PauliStringExc(1j * QubitOperator(term), system_n_qubits=self.n_orbitals)
-                                           for term in qubit_excitation.terms]
+                    single_excitations += ElementPool.pauli_string_descriptors([i], [j], self.n_orbitals)
                 else:
                     raise Exception('Invalid single excitation type.')
 
         return single_excitations
 
-    def get_double_excitation_elements(self):
+    def get_double_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
         double_excitations = []
         for i in range(self.n_electrons - 1):
             for j in range(i + 1, self.n_electrons):
@@ -37,24 +130,26 @@ class UCCSDExcitations:
                     for l in range(k + 1, self.n_orbitals):
                         # if i % 2 + j % 2 == k % 2 + l % 2:
                         if self.element_type == 'f_exc':
-                            double_excitations.append(DFExc([i, j], [k, l],
-                                                            system_n_qubits=self.n_orbitals))
+                            double_excitations.append((DFExc, ((i, j), (k, l)), kwargs))
                         elif self.element_type == 'q_exc':
-                            double_excitations.append(DQExc([i, j], [k, l],
-                                                            system_n_qubits=self.n_orbitals))
+                            double_excitations.append((DQExc, ((i, j), (k, l)), kwargs))
                         elif self.element_type == 'eff_f_exc':
-                            double_excitations.append(EffDFExc([i, j], [k, l]))
+                            double_excitations.append((EffDFExc, ((i, j), (k, l)), {}))
                         elif self.element_type == 'pauli_str_exc':
-                            qubit_excitation = DQExc([i, j], [k, l]).excitations_generators
-                            double_excitations += [PauliStringExc(1j * QubitOperator(term), system_n_qubits=self.n_orbitals) for term in
-                                                   qubit_excitation.terms]
+                            double_excitations += ElementPool.pauli_string_descriptors([i, j], [k, l], self.n_orbitals)
                         else:
                             raise Exception('invalid double excitation type.')
 
         return double_excitations
 
+    def get_single_excitation_elements(self):
+        return list(ElementPool(self.get_single_excitation_descriptors()))
+
+    def get_double_excitation_elements(self):
+        return list(ElementPool(self.get_double_excitation_descriptors()))
+
     def get_all_elements(self):
-        return self.get_single_excitation_elements() + self.get_double_excitation_elements()
+        return ElementPool(self.get_single_excitation_descriptors() + self.get_double_excitation_descriptors())
 
 
 class SDExcitations:
@@ -68,67 +163,57 @@ class SDExcitations:
             assert encoding == 'bk'
             assert ansatz_element_type == 'f_exc'
 
-    def get_single_excitation_elements(self):
+    def get_single_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
+        f_exc_kwargs = {'system_n_qubits': self.n_orbitals, 'encoding': self.encoding}
         single_excitations = []
         for i, j in itertools.combinations(range(self.n_orbitals), 2):
             # # test
             # if i % 2 == j % 2:
             if self.ansatz_element_type == 'f_exc':
-                single_excitations.append(SFExc(i, j, system_n_qubits=self.n_orbitals, encoding=self.encoding))
+                single_excitations.append((SFExc, (i, j), f_exc_kwargs))
             elif self.ansatz_element_type == 'q_exc':
-                single_excitations.append(SQExc(i, j, system_n_qubits=self.n_orbitals))
+                single_excitations.append((SQExc, (i, j), kwargs))
             elif self.ansatz_element_type == 'eff_f_exc':
-                single_excitations.append(EffSFExc(i, j, system_n_qubits=self.n_orbitals))
+                single_excitations.append((EffSFExc, (i, j), kwargs))
             elif self.ansatz_element_type == 'pauli_str_exc':
-                excitations_generators = SQExc(i, j).excitations_generators
-                for excitation_generator in excitations_generators:
-                    single_excitations += [PauliStringExc(1j * QubitOperator(term), system_n_qubits=self.n_orbitals)
-                                           for term in excitation_generator.terms]
+                single_excitations += ElementPool.pauli_string_descriptors([i], [j], self.n_orbitals)
             else:
                 raise Exception('Invalid single excitation type.')
 
         return single_excitations
 
-    def get_double_excitation_elements(self):
+    def get_double_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
+        f_exc_kwargs = {'system_n_qubits': self.n_orbitals, 'encoding': self.encoding}
+        element_classes = {'f_exc': DFExc, 'q_exc': DQExc, 'eff_f_exc': EffDFExc}
         double_excitations = []
         for i, j, k, l in itertools.combinations(range(self.n_orbitals), 4):
-            if self.ansatz_element_type == 'f_exc':
+            if self.ansatz_element_type in element_classes:
+                element_class = element_classes[self.ansatz_element_type]
+                element_kwargs = f_exc_kwargs if self.ansatz_element_type == 'f_exc' else kwargs
                 if i % 2 + j % 2 == k % 2 + l % 2:
-                    double_excitations.append(DFExc([i, j], [k, l], system_n_qubits=self.n_orbitals,
-                                                    encoding=self.encoding))
+                    double_excitations.append((element_class, ((i, j), (k, l)), element_kwargs))
                 if i % 2 + k % 2 == j % 2 + l % 2:
-                    double_excitations.append(DFExc([i, k], [j, l], system_n_qubits=self.n_orbitals,
-                                                    encoding=self.encoding))
+                    double_excitations.append((element_class, ((i, k), (j, l)), element_kwargs))
                 if i % 2 + l % 2 == k % 2 + j % 2:
-                    double_excitations.append(DFExc([i, l], [k, j], system_n_qubits=self.n_orbitals,
-                                                    encoding=self.encoding))
-            elif self.ansatz_element_type == 'q_exc':
-                if i % 2 + j % 2 == k % 2 + l % 2:
-                    double_excitations.append(DQExc([i, j], [k, l], system_n_qubits=self.n_orbitals))
-                if i % 2 + k % 2 == j % 2 + l % 2:
-                    double_excitations.append(DQExc([i, k], [j, l], system_n_qubits=self.n_orbitals))
-                if i % 2 + l % 2 == k % 2 + j % 2:
-                    double_excitations.append(DQExc([i, l], [k, j], system_n_qubits=self.n_orbitals))
-            elif self.ansatz_element_type == 'eff_f_exc':
-                if i % 2 + j % 2 == k % 2 + l % 2:
-                    double_excitations.append(EffDFExc([i, j], [k, l], system_n_qubits=self.n_orbitals))
-                if i % 2 + k % 2 == j % 2 + l % 2:
-                    double_excitations.append(EffDFExc([i, k], [j, l], system_n_qubits=self.n_orbitals))
-                if i % 2 + l % 2 == k % 2 + j % 2:
-                    double_excitations.append(EffDFExc([i, l], [k, j], system_n_qubits=self.n_orbitals))
+                    double_excitations.append((element_class, ((i, l), (k, j)), element_kwargs))
             elif self.ansatz_element_type == 'pauli_str_exc':
                 if (i + j) % 2 == (k + l) % 2:
-                    qubit_excitations = DQExc([i, j], [k, l]).excitations_generators
-                    for excitation_generator in qubit_excitations:
-                        double_excitations += [PauliStringExc(1j * QubitOperator(term), system_n_qubits=self.n_orbitals)
-                                           for term in excitation_generator.terms]
+                    double_excitations += ElementPool.pauli_string_descriptors([i, j], [k, l], self.n_orbitals)
             else:
                 raise Exception('invalid double excitation type.')
 
         return double_excitations
 
+    def get_single_excitation_elements(self):
+        return list(ElementPool(self.get_single_excitation_descriptors()))
+
+    def get_double_excitation_elements(self):
+        return list(ElementPool(self.get_double_excitation_descriptors()))
+
     def get_all_elements(self):
-        return self.get_single_excitation_elements() + self.get_double_excitation_elements()
+        return ElementPool(self.get_single_excitation_descriptors() + self.get_double_excitation_descriptors())
 
 
 class GSDExcitations:
@@ -137,54 +222,50 @@ class GSDExcitations:
         self.n_electrons = n_electrons
         self.ansatz_element_type = ansatz_element_type
 
-    def get_single_excitation_elements(self):
+    def get_single_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
         single_excitations = []
         for i, j in itertools.combinations(range(self.n_orbitals), 2):
             # # test
             # if i % 2 == j % 2:
             if self.ansatz_element_type == 'f_exc':
-                single_excitations.append(SFExc(i, j, system_n_qubits=self.n_orbitals))
+                single_excitations.append((SFExc, (i, j), kwargs))
             elif self.ansatz_element_type == 'q_exc':
-                single_excitations.append(SQExc(i, j, system_n_qubits=self.n_orbitals))
+                single_excitations.append((SQExc, (i, j), kwargs))
             elif self.ansatz_element_type == 'eff_f_exc':
-                single_excitations.append(EffSFExc(i, j, system_n_qubits=self.n_orbitals))
+                single_excitations.append((EffSFExc, (i, j), kwargs))
             elif self.ansatz_element_type == 'pauli_str_exc':
-                excitations_generators = SQExc(i, j).excitations_generators
-                for excitation_generator in excitations_generators:
-                    single_excitations += [PauliStringExc(1j * QubitOperator(term), system_n_qubits=self.n_orbitals)
-                                           for term in excitation_generator.terms]
+                single_excitations += ElementPool.pauli_string_descriptors([i], [j], self.n_orbitals)
             else:
                 raise Exception('Invalid single excitation type.')
 
         return single_excitations
 
-    def get_double_excitation_elements(self):
+    def get_double_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
+        element_classes = {'f_exc': DFExc, 'q_exc': DQExc, 'eff_f_exc': EffDFExc}
         double_excitations = []
         for i, j, k, l in itertools.combinations(range(self.n_orbitals), 4):
-            if self.ansatz_element_type == 'f_exc':
-                double_excitations.append(DFExc([i, j], [k, l], system_n_qubits=self.n_orbitals))
-                double_excitations.append(DFExc([i, k], [j, l], system_n_qubits=self.n_orbitals))
-                double_excitations.append(DFExc([i, l], [k, j], system_n_qubits=self.n_orbitals))
-            elif self.ansatz_element_type == 'q_exc':
-                double_excitations.append(DQExc([i, j], [k, l], system_n_qubits=self.n_orbitals))
-                double_excitations.append(DQExc([i, k], [j, l], system_n_qubits=self.n_orbitals))
-                double_excitations.append(DQExc([i, l], [k, j], system_n_qubits=self.n_orbitals))
-            elif self.ansatz_element_type == 'eff_f_exc':
-                double_excitations.append(EffDFExc([i, j], [k, l], system_n_qubits=self.n_orbitals))
-                double_excitations.append(EffDFExc([i, k], [j, l], system_n_qubits=self.n_orbitals))
-                double_excitations.append(EffDFExc([i, l], [k, j], system_n_qubits=self.n_orbitals))
+            if self.ansatz_element_type in element_classes:
+                element_class = element_classes[self.ansatz_element_type]
+                double_excitations.append((element_class, ((i, j), (k, l)), kwargs))
+                double_excitations.append((element_class, ((i, k), (j, l)), kwargs))
+                double_excitations.append((element_class, ((i, l), (k, j)), kwargs))
             elif self.ansatz_element_type == 'pauli_str_exc':
-                qubit_excitations = DQExc([i, j], [k, l]).excitations_generators
-                for excitation_generator in qubit_excitations:
-                    double_excitations += [PauliStringExc(1j * QubitOperator(term), system_n_qubits=self.n_orbitals)
-                                       for term in excitation_generator.terms]
+                double_excitations += ElementPool.pauli_string_descriptors([i, j], [k, l], self.n_orbitals)
             else:
                 raise Exception('invalid double excitation type.')
 
         return double_excitations
 
+    def get_single_excitation_elements(self):
+        return list(ElementPool(self.get_single_excitation_descriptors()))
+
+    def get_double_excitation_elements(self):
+        return list(ElementPool(self.get_double_excitation_descriptors()))
+
     def get_all_elements(self):
-        return self.get_single_excitation_elements() + self.get_double_excitation_elements()
+        return ElementPool(self.get_single_excitation_descriptors() + self.get_double_excitation_descriptors())
 
 
 # Only for fermionic and qubit excitations, use for spin zero systems only
@@ -201,102 +282,55 @@ class SpinCompGSDExcitations:
         self.n_electrons = n_electrons
         self.element_type = element_type
 
-    def get_single_excitation_elements(self):
+    # the elements are selected by their qubits only, so that no element is constructed just to be discarded
+    def get_single_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
         single_excitations = []
         for i, j in itertools.combinations(range(int(self.n_orbitals)), 2):
             if self.element_type == 'eff_f_exc':
-                new_s_excitation = SpinCompEffSFExc(i, j, system_n_qubits=self.n_orbitals)
-                if new_s_excitation.excitations_generators != 0 * openfermion.QubitOperator():
-                    single_excitations.append(new_s_excitation)
+                single_excitations.append((SpinCompEffSFExc, (i, j), kwargs))
             elif self.element_type == 'f_exc':
-                new_s_excitation = SpinCompSFExc(i, j, system_n_qubits=self.n_orbitals, encoding=self.encoding)
-                if new_s_excitation.excitations_generators != 0 * openfermion.QubitOperator():
-                    single_excitations.append(new_s_excitation)
+                single_excitations.append((SpinCompSFExc, (i, j), {'system_n_qubits': self.n_orbitals,
+                                                                    'encoding': self.encoding}))
             # qubit excitation does not work well
             elif self.element_type == 'q_exc':
-                new_s_excitation = SpinCompSQExc(i, j, sign=+1, system_n_qubits=self.n_orbitals)
-                if new_s_excitation.excitations_generators != 0 * openfermion.QubitOperator():
-                    single_excitations.append(new_s_excitation)
-                new_s_excitation = SpinCompSQExc(i, j, sign=-1, system_n_qubits=self.n_orbitals)
-                if new_s_excitation.excitations_generators != 0 * openfermion.QubitOperator():
-                    single_excitations.append(new_s_excitation)
+                single_excitations.append((SpinCompSQExc, (i, j, +1), kwargs))
+                single_excitations.append((SpinCompSQExc, (i, j, -1), kwargs))
             else:
                 raise Exception('invalid single spin complement excitation type.')
 
         return single_excitations
 
-    def get_double_excitation_elements(self):
+    def get_double_excitation_descriptors(self):
+        kwargs = {'system_n_qubits': self.n_orbitals}
+        f_exc_kwargs = {'system_n_qubits': self.n_orbitals, 'encoding': self.encoding}
         double_excitations = []
 
         for i, j, k, l in itertools.combinations(range(self.n_orbitals), 4):
+            for qubit_pair_1, qubit_pair_2 in [[(i, j), (k, l)], [(i, k), (j, l)], [(i, l), (k, j)]]:
+                if sum(qubit % 2 for qubit in qubit_pair_1) != sum(qubit % 2 for qubit in qubit_pair_2):
+                    continue
+
+                if self.element_type == 'eff_f_exc':
+                    double_excitations.append((SpinCompEffDFExc, (qubit_pair_1, qubit_pair_2), kwargs))
+                elif self.element_type == 'f_exc':
+                    double_excitations.append((SpinCompDFExc, (qubit_pair_1, qubit_pair_2), f_exc_kwargs))
+                elif self.element_type == 'q_exc':
+                    double_excitations.append((SpinCompDQExc, (qubit_pair_1, qubit_pair_2, -1), kwargs))
+                    double_excitations.append((SpinCompDQExc, (qubit_pair_1, qubit_pair_2, +1), kwargs))
+                else:
+                    raise Exception('invalid single spin complement excitation type.')
 
-            if self.element_type == 'eff_f_exc':
-                new_d_excitation = SpinCompEffDFExc([i, j], [k, l], system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + j % 2 == k % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-
-                new_d_excitation = SpinCompEffDFExc([i, k], [j, l], system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + k % 2 == j % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-
-                new_d_excitation = SpinCompEffDFExc([i, l], [k, j], system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + l % 2 == k % 2 + j % 2):
-                    double_excitations.append(new_d_excitation)
-
-            elif self.element_type == 'f_exc':
-                new_d_excitation = SpinCompDFExc([i, j], [k, l], system_n_qubits=self.n_orbitals, encoding=self.encoding)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + j % 2 == k % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-
-                new_d_excitation = SpinCompDFExc([i, k], [j, l], system_n_qubits=self.n_orbitals, encoding=self.encoding)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + k % 2 == j % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-
-                new_d_excitation = SpinCompDFExc([i, l], [k, j], system_n_qubits=self.n_orbitals, encoding=self.encoding)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + l % 2 == k % 2 + j % 2):
-                    double_excitations.append(new_d_excitation)
-
-            elif self.element_type == 'q_exc':
+        return double_excitations
 
-                new_d_excitation = SpinCompDQExc([i, j], [k, l], sign=-1, system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + j % 2 == k % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-                new_d_excitation = SpinCompDQExc([i, j], [k, l], sign=+1, system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + j % 2 == k % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-
-                new_d_excitation = SpinCompDQExc([i, k], [j, l], sign=-1, system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + k % 2 == j % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-                new_d_excitation = SpinCompDQExc([i, k], [j, l], sign=+1, system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + k % 2 == j % 2 + l % 2):
-                    double_excitations.append(new_d_excitation)
-
-                new_d_excitation = SpinCompDQExc([i, l], [k, j], sign=-1, system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + l % 2 == k % 2 + j % 2):
-                    double_excitations.append(new_d_excitation)
-                new_d_excitation = SpinCompDQExc([i, l], [k, j], sign=+1, system_n_qubits=self.n_orbitals)
-                if new_d_excitation.excitations_generators != 0 * openfermion.QubitOperator() and (
-                        i % 2 + l % 2 == k % 2 + j % 2):
-                    double_excitations.append(new_d_excitation)
-            else:
-                raise Exception('invalid single spin complement excitation type.')
+    def get_single_excitation_elements(self):
+        return list(ElementPool(self.get_single_excitation_descriptors()))
 
-        return double_excitations
+    def get_double_excitation_elements(self):
+        return list(ElementPool(self.get_double_excitation_descriptors()))
 
     def get_all_elements(self):
-        return self.get_single_excitation_elements() + self.get_double_excitation_elements()
+        return ElementPool(self.get_single_excitation_descriptors() + self.get_double_excitation_descriptors())
 
 
 # NOT USED. Does not work..
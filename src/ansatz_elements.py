@@ -2,23 +2,142 @@ from openfermion import QubitOperator, FermionOperator
 from openfermion.transforms import jordan_wigner, bravyi_kitaev
 from openfermion.utils import hermitian_conjugated
 
-from src.utils import QasmUtils, MatrixUtils
-
-import openfermion
-import itertools
-import numpy
+from src.utils import QasmUtils
 
 
 # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< individual ansatz elements >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+# The excitation generators of the elements are calculated on first access (pools of thousands of elements are mostly
+# screened without them), from generators memoized for each generator key (transform, qubits_1, qubits_2), where the
+# transform is 'jw', 'bk' (fermionic excitations) or 'q_exc' (qubit excitations). The memoized QubitOperators are shared
+# between elements and must not be modified in place.
 class AnsatzElement:
+    __slots__ = ('order', 'n_var_parameters', 'element', '_excitations_generators', 'system_n_qubits',
+                 'spin_complement', 'qubits', 'complement_qubits', 'sign', 'encoding')
+
+    excitation_generators_dict = {}
+
+    # the element classes by their type tag, registered when they are defined (see serialize)
+    element_types = {}
+    type_tag = None
+    serialization_version = 1
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.type_tag is not None:
+            assert cls.type_tag not in AnsatzElement.element_types
+            AnsatzElement.element_types[cls.type_tag] = cls
+
     def __init__(self, element, n_var_parameters=1, order=None, excitations_generators=None, system_n_qubits=None):
         self.order = order
         # self.qubits = qubits  # the qubits that define the ansatz element
         self.n_var_parameters = n_var_parameters
         self.element = element
-        self.excitations_generators = excitations_generators
+        self._excitations_generators = excitations_generators
         self.system_n_qubits = system_n_qubits
 
+    @property
+    def excitations_generators(self):
+        if self._excitations_generators is None:
+            self._excitations_generators = self.build_excitations_generators()
+        return self._excitations_generators
+
+    @excitations_generators.setter
+    def excitations_generators(self, excitations_generators):
+        self._excitations_generators = excitations_generators
+
+    # the circuit of the element as a list of Gates (see QasmUtils)
+    def get_gates(self, var_parameters):
+        raise NotImplementedError
+
+    def get_qasm(self, var_parameters):
+        return QasmUtils.gates_qasm(self.get_gates(var_parameters))
+
+    # the compact serialized form of the element: [version, type tag, qubits, sign, encoding], with sign and encoding
+    # None for the element types without them. It is JSON serializable
+    def serialize(self):
+        return [AnsatzElement.serialization_version, self.type_tag, self.qubits, getattr(self, 'sign', None),
+                getattr(self, 'encoding', None)]
+
+    # a hashable key identifying the element of a serialized form (regardless of system_n_qubits)
+    @staticmethod
+    def serialized_key(data):
+        version, type_tag, qubits, sign, encoding = data
+        if version != AnsatzElement.serialization_version:
+            raise Exception('Unsupported ansatz element serialization version {}'.format(version))
+        if type(qubits) != str:
+            qubits = tuple(tuple(qubits_part) for qubits_part in qubits)
+        return type_tag, qubits, sign, encoding
+
+    @staticmethod
+    def deserialize(data, system_n_qubits=None):
+        type_tag, qubits, sign, encoding = AnsatzElement.serialized_key(data)
+        if type_tag not in AnsatzElement.element_types:
+            raise Exception('Unrecognized ansatz element type {}'.format(type_tag))
+        return AnsatzElement.element_types[type_tag].from_serialized(qubits, sign, encoding, system_n_qubits)
+
+    # deserialize a list of elements, reusing the elements of a registry {serialized key: element} (e.g. the registry
+    # of the pool the elements were selected from, see ElementPool). Repeated elements are deserialized once
+    @staticmethod
+    def deserialize_all(data_list, system_n_qubits=None, registry=None):
+        registry = {} if registry is None else dict(registry)
+        elements = []
+        for data in data_list:
+            key = AnsatzElement.serialized_key(data)
+            if key not in registry:
+                registry[key] = AnsatzElement.deserialize(data, system_n_qubits=system_n_qubits)
+            elements.append(registry[key])
+        return elements
+
+    @classmethod
+    def from_serialized(cls, qubits, sign, encoding, system_n_qubits):
+        kwargs = {'system_n_qubits': system_n_qubits}
+        if sign is not None:
+            kwargs['sign'] = sign
+        if encoding is not None:
+            kwargs['encoding'] = encoding
+        if len(qubits[0]) == 1:
+            return cls(qubits[0][0], qubits[1][0], **kwargs)
+        else:
+            return cls(list(qubits[0]), list(qubits[1]), **kwargs)
+
+    # the generator keys of the excitation generators of the element
+    def generator_keys(self):
+        return []
+
+    def build_excitations_generators(self):
+        return [self.excitation_generator(key) for key in self.generator_keys()]
+
+    @staticmethod
+    def excitation_generator(key):
+        if key not in AnsatzElement.excitation_generators_dict:
+            AnsatzElement.excitation_generators_dict[key] = AnsatzElement.calculate_excitation_generator(key)
+        return AnsatzElement.excitation_generators_dict[key]
+
+    @staticmethod
+    def calculate_excitation_generator(key):
+        transform, qubits_1, qubits_2 = key
+        if transform == 'q_exc':
+            return AnsatzElement.get_qubit_excitation_generator(qubits_1, qubits_2)
+
+        fermi_operator = AnsatzElement.get_fermi_excitation_operator(qubits_1, qubits_2)
+        if transform == 'jw':
+            return jordan_wigner(fermi_operator)
+        else:
+            assert transform == 'bk'
+            return bravyi_kitaev(fermi_operator)
+
+    # the anti-Hermitian fermionic excitation from qubits_1 to qubits_2, e.g. [k^ l^ i j] - [i^ j^ k l] for
+    # qubits_1 = [i, j] and qubits_2 = [k, l] (the single fermionic excitations excite from their second qubit to the
+    # first one, so their generator keys have the qubits in reversed order)
+    @staticmethod
+    def get_fermi_excitation_operator(qubits_1, qubits_2):
+        assert len(qubits_2) == len(qubits_1)
+
+        excitation = ' '.join(['{}^'.format(qubit) for qubit in qubits_2] + [str(qubit) for qubit in qubits_1])
+        de_excitation = ' '.join(['{}^'.format(qubit) for qubit in qubits_1] + [str(qubit) for qubit in qubits_2])
+
+        return FermionOperator('[{}] - [{}]'.format(excitation, de_excitation))
+
     @staticmethod
     def get_qubit_excitation_generator(qubits_1, qubits_2):
 
@@ -50,6 +169,9 @@ class AnsatzElement:
 
 
 class PauliStringExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'pauli_str_exc'
+
     def __init__(self, excitation_generator, system_n_qubits=None):
         self.spin_complement = False
         self.qubits = []  # / dummy
@@ -63,6 +185,14 @@ class PauliStringExc(AnsatzElement):
                                              n_var_parameters=1, excitations_generators=[excitation_generator],
                                              system_n_qubits=system_n_qubits)
 
+    # the Pauli string is serialized in place of the qubits
+    def serialize(self):
+        return [AnsatzElement.serialization_version, self.type_tag, self.element, None, None]
+
+    @classmethod
+    def from_serialized(cls, qubits, sign, encoding, system_n_qubits):
+        return cls(QubitOperator(qubits), system_n_qubits=system_n_qubits)
+
     @staticmethod
     def pauli_string_order(excitation_generator):
 
@@ -76,44 +206,48 @@ class PauliStringExc(AnsatzElement):
 
         return order
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
-        qasm = ''
+        gates = []
         for excitation_generator in self.excitations_generators:
-            qasm += QasmUtils.excitation_qasm(excitation_generator, var_parameters[0])
-        return qasm
+            gates += QasmUtils.excitation_gates(excitation_generator, var_parameters[0])
+        return gates
 
 
 class SFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 's_f_exc'
+
     def __init__(self, qubit_1, qubit_2, system_n_qubits=None, encoding='jw'):
         self.spin_complement = False
 
         self.qubits = [[qubit_1], [qubit_2]]
-
-        fermi_operator = FermionOperator('[{1}^ {0}] - [{0}^ {1}]'.format(self.qubits[1][0], self.qubits[0][0]))
-        if encoding == 'jw':
-            excitation_generator = jordan_wigner(fermi_operator)
-        else:
-            assert encoding == 'bk'
-            excitation_generator = bravyi_kitaev(fermi_operator)
+        assert encoding in ['jw', 'bk']
+        self.encoding = encoding
 
         super(SFExc, self).\
             __init__(element='s_f_exc_{}_{}'.format(qubit_1, qubit_2), order=1, n_var_parameters=1,
-                     excitations_generators=[excitation_generator], system_n_qubits=system_n_qubits)
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        return [(self.encoding, tuple(self.qubits[1]), tuple(self.qubits[0]))]
 
     def get_spin_comp_exc(self):
         return SFExc(self.spin_complement_orbital(self.qubits[0][0]), self.spin_complement_orbital(self.qubits[1][0]),
                      system_n_qubits=self.system_n_qubits)
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
-        qasm = ''
+        gates = []
         for excitation_generator in self.excitations_generators:
-            qasm += QasmUtils.excitation_qasm(excitation_generator, var_parameters[0])
-        return qasm
+            gates += QasmUtils.excitation_gates(excitation_generator, var_parameters[0])
+        return gates
 
 
 class DFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'd_f_exc'
+
     def __init__(self, qubit_pair_1, qubit_pair_2, system_n_qubits=None, encoding='jw'):
         self.spin_complement = False
 
@@ -123,54 +257,58 @@ class DFExc(AnsatzElement):
         assert len(qubit_pair_1) == 2
         assert len(qubit_pair_2) == 2
         self.qubits = [qubit_pair_1, qubit_pair_2]
-
-        fermi_operator = FermionOperator('[{2}^ {3}^ {0} {1}] - [{0}^ {1}^ {2} {3}]'
-                                         .format(self.qubits[0][0], self.qubits[0][1],
-                                                 self.qubits[1][0], self.qubits[1][1]))
-        if encoding == 'jw':
-            excitation_generator = jordan_wigner(fermi_operator)
-        else:
-            assert encoding == 'bk'
-            excitation_generator = bravyi_kitaev(fermi_operator)
+        assert encoding in ['jw', 'bk']
+        self.encoding = encoding
 
         super(DFExc, self).\
             __init__(element='d_f_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
-                     excitations_generators=[excitation_generator], system_n_qubits=system_n_qubits)
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        return [(self.encoding, tuple(self.qubits[0]), tuple(self.qubits[1]))]
 
     def get_spin_comp_exc(self):
         return DFExc(self.spin_complement_orbitals(self.qubits[0]), self.spin_complement_orbitals(self.qubits[1]),
                      system_n_qubits=self.system_n_qubits)
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
 
-        qasm = ''
+        gates = []
         for excitation_generator in self.excitations_generators:
-            qasm += QasmUtils.excitation_qasm(excitation_generator, var_parameters[0])
-        return qasm
+            gates += QasmUtils.excitation_gates(excitation_generator, var_parameters[0])
+        return gates
 
 
 class SQExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 's_q_exc'
+
     def __init__(self, qubit_1, qubit_2, system_n_qubits=None):
         self.spin_complement = False
 
         self.qubits = [[qubit_1], [qubit_2]]
-        excitation_generator = self.get_qubit_excitation_generator([qubit_1], [qubit_2])
 
         super(SQExc, self).\
             __init__(element='s_q_exc_{}_{}'.format(qubit_1, qubit_2), order=1, n_var_parameters=1,
-                     excitations_generators=[excitation_generator], system_n_qubits=system_n_qubits)
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        return [('q_exc', tuple(self.qubits[0]), tuple(self.qubits[1]))]
 
     def get_spin_comp_exc(self):
         return SQExc(self.spin_complement_orbital(self.qubits[0][0]), self.spin_complement_orbital(self.qubits[1][0]),
                      system_n_qubits=self.system_n_qubits)
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
-        return QasmUtils.partial_exchange(-var_parameters[0], self.qubits[0][0], self.qubits[1][0])  # the minus sign is important for consistence with the d_q_exc, as well obtaining the correct sign for grads...
+        return QasmUtils.partial_exchange_gates(-var_parameters[0], self.qubits[0][0], self.qubits[1][0])  # the minus sign is important for consistence with the d_q_exc, as well obtaining the correct sign for grads...
 
 
 class DQExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'd_q_exc'
+
     def __init__(self, qubit_pair_1, qubit_pair_2, system_n_qubits=None):
         self.spin_complement = False
 
@@ -180,46 +318,54 @@ class DQExc(AnsatzElement):
         assert len(qubit_pair_1) == 2
         assert len(qubit_pair_2) == 2
         self.qubits = [qubit_pair_1, qubit_pair_2]
-        excitation_generator = self.get_qubit_excitation_generator(qubit_pair_1, qubit_pair_2)
 
         super(DQExc, self).\
             __init__(element='d_q_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
-                     excitations_generators=[excitation_generator], system_n_qubits=system_n_qubits)
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        return [('q_exc', tuple(self.qubits[0]), tuple(self.qubits[1]))]
 
     def get_spin_comp_exc(self):
         return DQExc(self.spin_complement_orbitals(self.qubits[0]), self.spin_complement_orbitals(self.qubits[1]),
                      system_n_qubits=self.system_n_qubits)
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
         parameter = var_parameters[0]
 
-        return QasmUtils.d_q_exc_qasm(parameter, self.qubits[0], self.qubits[1])
+        return QasmUtils.d_q_exc_gates(parameter, self.qubits[0], self.qubits[1])
 
 
 class EffSFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'eff_s_f_exc'
+
     def __init__(self, qubit_1, qubit_2, system_n_qubits=None):
         self.spin_complement = False
 
         self.qubits = [[qubit_1], [qubit_2]]
 
-        fermi_operator = FermionOperator('[{1}^ {0}] - [{0}^ {1}]'.format(self.qubits[1][0], self.qubits[0][0]))
-        excitation_generator = jordan_wigner(fermi_operator)
-
         super(EffSFExc, self).\
             __init__(element='eff_s_f_exc_{}_{}'.format(qubit_2, qubit_1), order=1, n_var_parameters=1,
-                     excitations_generators=[excitation_generator], system_n_qubits=system_n_qubits)
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        return [('jw', tuple(self.qubits[1]), tuple(self.qubits[0]))]
 
     def get_spin_comp_exc(self):
         return EffSFExc(self.spin_complement_orbital(self.qubits[0][0]), self.spin_complement_orbital(self.qubits[1][0]),
                         system_n_qubits=self.system_n_qubits)
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
-        return QasmUtils.eff_s_f_exc_qasm(var_parameters[0], self.qubits[0][0], self.qubits[1][0])
+        return QasmUtils.eff_s_f_exc_gates(var_parameters[0], self.qubits[0][0], self.qubits[1][0])
 
 
 class EffDFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'eff_d_f_exc'
+
     def __init__(self, qubit_pair_1, qubit_pair_2, system_n_qubits=None):
         self.spin_complement = False
 
@@ -230,66 +376,60 @@ class EffDFExc(AnsatzElement):
         assert len(qubit_pair_2) == 2
         self.qubits = [qubit_pair_1, qubit_pair_2]
 
-        fermi_operator = FermionOperator('[{2}^ {3}^ {0} {1}] - [{0}^ {1}^ {2} {3}]'
-                                         .format(self.qubits[0][0], self.qubits[0][1],
-                                                 self.qubits[1][0], self.qubits[1][1]))
-        excitation_generator = jordan_wigner(fermi_operator)
-
         super(EffDFExc, self).\
             __init__(element='eff_d_f_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
-                     system_n_qubits=system_n_qubits, excitations_generators=[excitation_generator])
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        return [('jw', tuple(self.qubits[0]), tuple(self.qubits[1]))]
 
     def get_spin_comp_exc(self):
         return EffDFExc(self.spin_complement_orbitals(self.qubits[0]), self.spin_complement_orbitals(self.qubits[1]),
                         system_n_qubits=self.system_n_qubits)
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
         parameter = var_parameters[0]
 
-        return QasmUtils.eff_d_f_exc_qasm(parameter, self.qubits[0], self.qubits[1])
+        return QasmUtils.eff_d_f_exc_gates(parameter, self.qubits[0], self.qubits[1])
 
 
 class SpinCompSFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'spin_s_f_exc'
+
     def __init__(self, qubit_1, qubit_2, system_n_qubits=None, encoding='jw'):
         self.spin_complement = True
 
         self.qubits = [[qubit_1], [qubit_2]]
         self.complement_qubits = [self.spin_complement_orbitals([qubit_1]), self.spin_complement_orbitals([qubit_2])]
+        assert encoding in ['jw', 'bk']
+        self.encoding = encoding
 
-        fermi_operator_1 = FermionOperator('[{1}^ {0}] - [{0}^ {1}]'.format(qubit_2, qubit_1))
-
-        if encoding == 'jw':
-            excitations_generators = [jordan_wigner(fermi_operator_1)]
-        else:
-            assert encoding == 'bk'
-            excitations_generators = [bravyi_kitaev(fermi_operator_1)]
+        super(SpinCompSFExc, self).\
+            __init__(element='spin_s_f_exc_{}_{}'.format(qubit_2, qubit_1), order=1, n_var_parameters=1,
+                     system_n_qubits=system_n_qubits)
 
+    def generator_keys(self):
         if {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[0], *self.complement_qubits[1]} and \
            {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[1], *self.complement_qubits[0]}:
+            return [(self.encoding, tuple(self.complement_qubits[1]), tuple(self.complement_qubits[0]))]
+        else:
+            return [(self.encoding, tuple(self.qubits[1]), tuple(self.qubits[0]))]
 
-            fermi_operator_2 = FermionOperator('[{1}^ {0}] - [{0}^ {1}]'.format(self.complement_qubits[1][0],
-                                                                                self.complement_qubits[0][0]))
-            if encoding == 'jw':
-                excitations_generators = [jordan_wigner(fermi_operator_2)]
-            else:
-                assert encoding == 'bk'
-                excitations_generators = [bravyi_kitaev(fermi_operator_2)]
-
-        super(SpinCompSFExc, self).\
-            __init__(element='spin_s_f_exc_{}_{}'.format(qubit_2, qubit_1), order=1, n_var_parameters=1,
-                     excitations_generators=excitations_generators, system_n_qubits=system_n_qubits)
-
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
 
-        qasm = ''
+        gates = []
         for excitation_generator in self.excitations_generators:
-            qasm += QasmUtils.excitation_qasm(excitation_generator, var_parameters[0])
-        return qasm
+            gates += QasmUtils.excitation_gates(excitation_generator, var_parameters[0])
+        return gates
 
 
 class SpinCompDFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'spin_d_f_exc'
+
     def __init__(self, qubit_pair_1, qubit_pair_2, system_n_qubits=None, encoding='jw'):
         self.spin_complement = True
 
@@ -297,41 +437,33 @@ class SpinCompDFExc(AnsatzElement):
         assert len(qubit_pair_2) == 2
         self.qubits = [qubit_pair_1, qubit_pair_2]
         self.complement_qubits = [self.spin_complement_orbitals(qubit_pair_1), self.spin_complement_orbitals(qubit_pair_2)]
+        assert encoding in ['jw', 'bk']
+        self.encoding = encoding
 
-        fermi_operator_1 = FermionOperator('[{2}^ {3}^ {0} {1}] - [{0}^ {1}^ {2} {3}]'.format(*self.qubits[0], *self.qubits[1]))
-
-        if encoding == 'jw':
-            excitations_generators = [jordan_wigner(fermi_operator_1)]
-        else:
-            assert encoding == 'bk'
-            excitations_generators = [bravyi_kitaev(fermi_operator_1)]
+        super(SpinCompDFExc, self).\
+            __init__(element='spin_d_f_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
+                     system_n_qubits=system_n_qubits)
 
+    def generator_keys(self):
         if [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[0]), set(self.complement_qubits[1])] and \
            [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[1]), set(self.complement_qubits[0])]:
+            return [(self.encoding, tuple(self.complement_qubits[0]), tuple(self.complement_qubits[1]))]
+        else:
+            return [(self.encoding, tuple(self.qubits[0]), tuple(self.qubits[1]))]
 
-            fermi_operator_2 = FermionOperator('[{2}^ {3}^ {0} {1}] - [{0}^ {1}^ {2} {3}]'
-                                               .format(*self.complement_qubits[0], *self.complement_qubits[1]))
-
-            if encoding == 'jw':
-                excitations_generators = [jordan_wigner(fermi_operator_2)]
-            else:
-                assert encoding == 'bk'
-                excitations_generators = [bravyi_kitaev(fermi_operator_2)]
-
-        super(SpinCompDFExc, self).\
-            __init__(element='spin_d_f_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
-                     system_n_qubits=system_n_qubits, excitations_generators=excitations_generators)
-
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
 
-        qasm = ''
+        gates = []
         for excitation_generator in self.excitations_generators:
-            qasm += QasmUtils.excitation_qasm(excitation_generator, var_parameters[0])
-        return qasm
+            gates += QasmUtils.excitation_gates(excitation_generator, var_parameters[0])
+        return gates
 
 
 class SpinCompSQExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'spin_s_q_exc'
+
     def __init__(self, qubit_1, qubit_2, sign=-1, system_n_qubits=None):
         self.spin_complement = True
 
@@ -339,32 +471,41 @@ class SpinCompSQExc(AnsatzElement):
         self.complement_qubits = [self.spin_complement_orbitals([qubit_1]), self.spin_complement_orbitals([qubit_2])]
         self.sign = sign
 
+        super(SpinCompSQExc, self).\
+            __init__(element='spin_s_q_exc_{}_{}'.format(qubit_2, qubit_1), order=1, n_var_parameters=1,
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
         if {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[0], *self.complement_qubits[1]} and \
            {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[1], *self.complement_qubits[0]}:
-            excitations_generators = [self.get_qubit_excitation_generator(self.qubits[0], self.qubits[1])]
+            return [('q_exc', tuple(self.qubits[0]), tuple(self.qubits[1]))]
         else:
-            excitations_generators = [self.get_qubit_excitation_generator(self.qubits[0], self.qubits[1]),
-                                      self.sign*self.get_qubit_excitation_generator(self.complement_qubits[0], self.complement_qubits[1])]
+            return [('q_exc', tuple(self.qubits[0]), tuple(self.qubits[1])),
+                    ('q_exc', tuple(self.complement_qubits[0]), tuple(self.complement_qubits[1]))]
 
-        super(SpinCompSQExc, self).\
-            __init__(element='spin_s_q_exc_{}_{}'.format(qubit_2, qubit_1), order=1, n_var_parameters=1,
-                     excitations_generators=excitations_generators, system_n_qubits=system_n_qubits)
+    # the generator of the spin complement is multiplied by the sign
+    def build_excitations_generators(self):
+        excitations_generators = super(SpinCompSQExc, self).build_excitations_generators()
+        return excitations_generators[:1] + [self.sign*generator for generator in excitations_generators[1:]]
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
 
-        qasm = QasmUtils.partial_exchange(-var_parameters[0], self.qubits[0][0], self.qubits[1][0])
+        gates = QasmUtils.partial_exchange_gates(-var_parameters[0], self.qubits[0][0], self.qubits[1][0])
 
         if {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[0], *self.complement_qubits[1]} and \
            {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[1], *self.complement_qubits[0]}:
 
-            qasm += QasmUtils.partial_exchange(-self.sign*var_parameters[0], self.complement_qubits[0][0],
+            gates += QasmUtils.partial_exchange_gates(-self.sign*var_parameters[0], self.complement_qubits[0][0],
                                                self.complement_qubits[1][0])
 
-        return qasm
+        return gates
 
 
 class SpinCompDQExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'spin_d_q_exc'
+
     def __init__(self, qubit_pair_1, qubit_pair_2, sign=-1, system_n_qubits=None):
         self.spin_complement = True
 
@@ -375,67 +516,77 @@ class SpinCompDQExc(AnsatzElement):
 
         self.sign = sign
 
+        super(SpinCompDQExc, self).\
+            __init__(element='spin_d_q_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
         if [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[0]), set(self.complement_qubits[1])] and \
            [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[1]), set(self.complement_qubits[0])]:
-
-            excitations_generators = [self.get_qubit_excitation_generator(self.qubits[0], self.qubits[1])]
+            return [('q_exc', tuple(self.qubits[0]), tuple(self.qubits[1]))]
         else:
-            excitations_generators = [self.get_qubit_excitation_generator(self.qubits[0], self.qubits[1]),
-                                      self.sign*self.get_qubit_excitation_generator(self.complement_qubits[0], self.complement_qubits[1])]
+            return [('q_exc', tuple(self.qubits[0]), tuple(self.qubits[1])),
+                    ('q_exc', tuple(self.complement_qubits[0]), tuple(self.complement_qubits[1]))]
 
-        super(SpinCompDQExc, self).\
-            __init__(element='spin_d_q_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
-                     system_n_qubits=system_n_qubits, excitations_generators=excitations_generators)
+    # the generator of the spin complement is multiplied by the sign
+    def build_excitations_generators(self):
+        excitations_generators = super(SpinCompDQExc, self).build_excitations_generators()
+        return excitations_generators[:1] + [self.sign*generator for generator in excitations_generators[1:]]
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
         parameter_1 = var_parameters[0]
 
-        qasm = QasmUtils.d_q_exc_qasm(parameter_1, self.qubits[0], self.qubits[1])
+        gates = QasmUtils.d_q_exc_gates(parameter_1, self.qubits[0], self.qubits[1])
 
         if [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[0]), set(self.complement_qubits[1])] and \
            [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[1]), set(self.complement_qubits[0])]:
 
-            qasm += QasmUtils.d_q_exc_qasm(self.sign*parameter_1, self.complement_qubits[0], self.complement_qubits[1])
+            gates += QasmUtils.d_q_exc_gates(self.sign*parameter_1, self.complement_qubits[0], self.complement_qubits[1])
 
-        return qasm
+        return gates
 
 
 class SpinCompEffSFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'spin_eff_s_f_exc'
+
     def __init__(self, qubit_1, qubit_2, system_n_qubits=None):
         self.spin_complement = True
 
         self.qubits = [[qubit_1], [qubit_2]]
         self.complement_qubits = [self.spin_complement_orbitals([qubit_1]), self.spin_complement_orbitals([qubit_2])]
 
-        fermi_operator_1 = FermionOperator('[{1}^ {0}] - [{0}^ {1}]'.format(qubit_2, qubit_1))
-        excitations_generators = [jordan_wigner(fermi_operator_1)]
+        super(SpinCompEffSFExc, self).\
+            __init__(element='spin_s_f_exc_{}_{}'.format(qubit_2, qubit_1), order=1, n_var_parameters=1,
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        generator_keys = [('jw', tuple(self.qubits[1]), tuple(self.qubits[0]))]
 
         if {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[0], *self.complement_qubits[1]} and \
            {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[1], *self.complement_qubits[0]}:
+            generator_keys.append(('jw', tuple(self.complement_qubits[1]), tuple(self.complement_qubits[0])))
 
-            fermi_operator_2 = FermionOperator('[{1}^ {0}] - [{0}^ {1}]'.format(self.complement_qubits[1][0],
-                                                                                self.complement_qubits[0][0]))
-            excitations_generators.append(jordan_wigner(fermi_operator_2))
-
-        super(SpinCompEffSFExc, self).\
-            __init__(element='spin_s_f_exc_{}_{}'.format(qubit_2, qubit_1), order=1, n_var_parameters=1,
-                     excitations_generators=excitations_generators, system_n_qubits=system_n_qubits)
+        return generator_keys
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
 
-        qasm = QasmUtils.eff_s_f_exc_qasm(var_parameters[0], self.qubits[0][0], self.qubits[1][0])
+        gates = QasmUtils.eff_s_f_exc_gates(var_parameters[0], self.qubits[0][0], self.qubits[1][0])
 
         if {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[0], *self.complement_qubits[1]} and \
            {*self.qubits[0], *self.qubits[1]} != {*self.complement_qubits[1], *self.complement_qubits[0]}:
 
-            qasm += QasmUtils.eff_s_f_exc_qasm(var_parameters[0], self.complement_qubits[0][0], self.complement_qubits[1][0])
+            gates += QasmUtils.eff_s_f_exc_gates(var_parameters[0], self.complement_qubits[0][0], self.complement_qubits[1][0])
 
-        return qasm
+        return gates
 
 
 class SpinCompEffDFExc(AnsatzElement):
+    __slots__ = ()
+    type_tag = 'spin_eff_d_f_exc'
+
     def __init__(self, qubit_pair_1, qubit_pair_2, system_n_qubits=None):
         self.spin_complement = True
         assert len(qubit_pair_1) == 2
@@ -443,30 +594,29 @@ class SpinCompEffDFExc(AnsatzElement):
         self.qubits = [qubit_pair_1, qubit_pair_2]
         self.complement_qubits = [self.spin_complement_orbitals(qubit_pair_1), self.spin_complement_orbitals(qubit_pair_2)]
 
-        fermi_operator_1 = FermionOperator('[{2}^ {3}^ {0} {1}] - [{0}^ {1}^ {2} {3}]'.format(*self.qubits[0], *self.qubits[1]))
-        excitations_generators = [jordan_wigner(fermi_operator_1)]
+        super(SpinCompEffDFExc, self).\
+            __init__(element='spin_d_f_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
+                     system_n_qubits=system_n_qubits)
+
+    def generator_keys(self):
+        generator_keys = [('jw', tuple(self.qubits[0]), tuple(self.qubits[1]))]
 
         if [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[0]), set(self.complement_qubits[1])] and \
            [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[1]), set(self.complement_qubits[0])]:
+            generator_keys.append(('jw', tuple(self.complement_qubits[0]), tuple(self.complement_qubits[1])))
 
-            fermi_operator_2 = FermionOperator('[{2}^ {3}^ {0} {1}] - [{0}^ {1}^ {2} {3}]'
-                                               .format(*self.complement_qubits[0], *self.complement_qubits[1]))
-            excitations_generators.append(jordan_wigner(fermi_operator_2))
-
-        super(SpinCompEffDFExc, self).\
-            __init__(element='spin_d_f_exc_{}_{}'.format(qubit_pair_1, qubit_pair_2), order=2, n_var_parameters=1,
-                     system_n_qubits=system_n_qubits, excitations_generators=excitations_generators)
+        return generator_keys
 
-    def get_qasm(self, var_parameters):
+    def get_gates(self, var_parameters):
         assert len(var_parameters) == 1
         parameter_1 = var_parameters[0]
 
-        qasm = QasmUtils.eff_d_f_exc_qasm(parameter_1, self.qubits[0], self.qubits[1])
+        gates = QasmUtils.eff_d_f_exc_gates(parameter_1, self.qubits[0], self.qubits[1])
 
-        # if the spin complement is different, add a qasm for it
+        # if the spin complement is different, add the gates for it
         if [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[0]), set(self.complement_qubits[1])] and \
            [set(self.qubits[0]), set(self.qubits[1])] != [set(self.complement_qubits[1]), set(self.complement_qubits[0])]:
 
-            qasm += QasmUtils.eff_d_f_exc_qasm(parameter_1, self.complement_qubits[0], self.complement_qubits[1])
+            gates += QasmUtils.eff_d_f_exc_gates(parameter_1, self.complement_qubits[0], self.complement_qubits[1])
 
-        return qasm
+        return gates
@@ -1,14 +1,19 @@
 # from openfermion.transforms import get_fermion_operator, jordan_wigner, get_sparse_operator
 from openfermion.linalg import get_sparse_operator
 
-from src.utils import QasmUtils, MatrixUtils
+from src.utils import QasmUtils
+from src.circuits import PeepholeOptimizer
+from src.instrumentation import Instrumentation
+from src.lazy_imports import LazyModule
 from src import config
 
-import qiskit.qasm
+import collections
 import scipy
 import numpy
 import logging
 
+qiskit = LazyModule('qiskit')
+
 
 class QiskitSimBackend:
 
@@ -16,6 +21,10 @@ class QiskitSimBackend:
     # get the qasm for an ansatz, defined by a list of ansatz elements (ansatz) and corresponding variational pars.
     @staticmethod
     def qasm_from_ansatz(ansatz, var_parameters):
+        if config.optimize_circuits:
+            gates = PeepholeOptimizer.optimized_ansatz_gates(ansatz)
+            return QasmUtils.gates_qasm(PeepholeOptimizer.bind(gates, var_parameters))
+
         qasm = ['']
         # perform ansatz operations
         n_used_var_pars = 0
@@ -28,61 +37,221 @@ class QiskitSimBackend:
 
         return ''.join(qasm)
 
+    # the Aer statevector simulator and its options, created once and reused for all circuit executions
+    aer_backend = None
+
+    @staticmethod
+    def get_aer_backend():
+        if QiskitSimBackend.aer_backend is None:
+            QiskitSimBackend.aer_backend = qiskit.Aer.get_backend('statevector_simulator')
+        return QiskitSimBackend.aer_backend
+
+    @staticmethod
+    def backend_options():
+        n_threads = config.qiskit_n_threads
+        return {"method": "statevector", "zero_threshold": config.floating_point_accuracy,
+                "max_parallel_threads": n_threads, "max_parallel_experiments": n_threads,
+                "max_parallel_shots": n_threads}
+
+    # return a statevector in the form of an array from a qiskit circuit
+    @staticmethod
+    def statevector_from_circuit(qiskit_circuit):
+        result = qiskit.execute(qiskit_circuit, QiskitSimBackend.get_aer_backend(),
+                                backend_options=QiskitSimBackend.backend_options()).result()
+        return result.get_statevector(qiskit_circuit)
+
+    @staticmethod
+    def batch_backend_options():
+        return {"method": "statevector", "zero_threshold": config.floating_point_accuracy,
+                "max_parallel_threads": config.qiskit_batch_n_threads,
+                "max_parallel_experiments": config.qiskit_max_parallel_experiments}
+
+    # return the statevectors of a list of qiskit circuits, executed as a single job
+    @staticmethod
+    def statevectors_from_circuits(qiskit_circuits):
+        result = qiskit.execute(qiskit_circuits, QiskitSimBackend.get_aer_backend(),
+                                backend_options=QiskitSimBackend.batch_backend_options()).result()
+        # the circuits are copies of the same circuit and can share a name, so the results are indexed by position
+        return [result.get_statevector(i) for i in range(len(qiskit_circuits))]
+
     # return a statevector in the form of an array from a qasm circuit
     @staticmethod
     def statevector_from_qasm(qasm_circuit):
-        n_threads = config.qiskit_n_threads
-        backend_options = {"method": "statevector", "zero_threshold": config.floating_point_accuracy,
-                           "max_parallel_threads": n_threads, "max_parallel_experiments": n_threads,
-                           "max_parallel_shots": n_threads}
-        backend = qiskit.Aer.get_backend('statevector_simulator')
         qiskit_circuit = qiskit.QuantumCircuit.from_qasm_str(qasm_circuit)
+        return QiskitSimBackend.statevector_from_circuit(qiskit_circuit)
 
-        result = qiskit.execute(qiskit_circuit, backend, backend_options=backend_options).result()
-        statevector = result.get_statevector(qiskit_circuit)
-        return statevector
+    # the gates of each ansatz element type, memoized as a list of (instruction, qubit indices, angles) where each
+    # angle of a parameterized gate is an affine function (offset, [coefficients]) of the element's var. parameters
+    element_gates_dict = {}
 
-    # return a statevector in the form of an array from a list of ansatz elements
+    # parameterized circuits, memoized for each ansatz structure. Least recently used circuits are discarded
+    parameterized_circuits = collections.OrderedDict()
+
+    # the element name does not distinguish the sign of the spin complement qubit excitations nor the encoding of the
+    # fermionic excitations, so they are part of the key. The excitation generators are not used, since they are built
+    # on first access
     @staticmethod
-    def statevector_from_ansatz(ansatz, var_parameters, n_qubits, n_electrons, init_state_qasm=None):
-        assert n_electrons < n_qubits
-        qasm = ['']
-        qasm.append(QasmUtils.qasm_header(n_qubits))
+    def element_key(ansatz_element):
+        return type(ansatz_element).__name__, ansatz_element.element, getattr(ansatz_element, 'sign', None), \
+            getattr(ansatz_element, 'encoding', None)
+
+    @staticmethod
+    def circuit_gates(qasm):
+        qiskit_circuit = qiskit.QuantumCircuit.from_qasm_str(qasm)
+        return [(instruction, [qubit.index for qubit in qargs]) for instruction, qargs, cargs in qiskit_circuit.data]
+
+    # The element circuit is parsed at zero var. parameters and at each unit var. parameter. The gate angles of the
+    # excitation circuits are linear in the var. parameters, so these evaluations define them completely.
+    @staticmethod
+    def element_gates(ansatz_element, n_qubits):
+        key = QiskitSimBackend.element_key(ansatz_element)
+        if key not in QiskitSimBackend.element_gates_dict:
+            n_var_parameters = ansatz_element.n_var_parameters
+            header = QasmUtils.qasm_header(n_qubits)
+            zero_gates = QiskitSimBackend.circuit_gates(header + ansatz_element.get_qasm([0] * n_var_parameters))
+            unit_gates = []
+            for i in range(n_var_parameters):
+                var_parameters = [0] * n_var_parameters
+                var_parameters[i] = 1
+                unit_gates.append(QiskitSimBackend.circuit_gates(header + ansatz_element.get_qasm(var_parameters)))
+
+            element_gates = []
+            for j, (instruction, qubits) in enumerate(zero_gates):
+                angles = []
+                for k, parameter in enumerate(instruction.params):
+                    offset = float(parameter)
+                    coefficients = [float(gates[j][0].params[k]) - offset for gates in unit_gates]
+                    angles.append((offset, coefficients))
+                for gates in unit_gates:
+                    assert gates[j][0].name == instruction.name and gates[j][1] == qubits
+                element_gates.append((instruction, qubits, angles))
+
+            QiskitSimBackend.element_gates_dict[key] = element_gates
+
+        return QiskitSimBackend.element_gates_dict[key]
+
+    # append the gates of an ansatz element to a circuit. The var. parameters can be numbers or qiskit Parameters
+    @staticmethod
+    def append_element(qiskit_circuit, ansatz_element, element_var_parameters, n_qubits):
+        for instruction, qubits, angles in QiskitSimBackend.element_gates(ansatz_element, n_qubits):
+            gate_parameters = []
+            for offset, coefficients in angles:
+                angle = offset
+                for coefficient, parameter in zip(coefficients, element_var_parameters):
+                    if coefficient != 0:
+                        angle = angle + coefficient * parameter
+                gate_parameters.append(angle)
+            if gate_parameters:
+                instruction = instruction.copy()
+                instruction.params = gate_parameters
+            qiskit_circuit.append(instruction, [qiskit_circuit.qubits[qubit] for qubit in qubits])
+
+    # append a list of Gates (see QasmUtils). The angles can be numbers or qiskit Parameter expressions
+    @staticmethod
+    def append_gates(qiskit_circuit, gates):
+        for gate in gates:
+            qubits = [qiskit_circuit.qubits[qubit] for qubit in gate.qubits]
+            if gate.angle is None:
+                getattr(qiskit_circuit, gate.name)(*qubits)
+            else:
+                getattr(qiskit_circuit, gate.name)(gate.angle, *qubits)
+
+    # SWAP gates to reverse the order of qubits. This is required in order the statevector to match the reversed
+    # order of qubits used by openfermion when obtaining the Hamiltonian Matrix.
+    @staticmethod
+    def append_reverse_qubits(qiskit_circuit, n_qubits):
+        for i in range(int(n_qubits/2)):
+            qiskit_circuit.swap(qiskit_circuit.qubits[i], qiskit_circuit.qubits[n_qubits - i - 1])
+
+    # return the circuit of the initial state followed by the ansatz, without the final qubit reversal
+    @staticmethod
+    def ansatz_circuit(ansatz, var_parameters, n_qubits, n_electrons, init_state_qasm=None):
+        qiskit_circuit = qiskit.QuantumCircuit(qiskit.QuantumRegister(n_qubits, 'q'),
+                                               qiskit.ClassicalRegister(n_qubits, 'c'))
 
         # initial state
         if init_state_qasm is None:
-            qasm.append(QasmUtils.hf_state(n_electrons))
-        else:
-            qasm.append(init_state_qasm)
+            init_state_qasm = QasmUtils.hf_state(n_electrons)
+        for instruction, qubits in QiskitSimBackend.circuit_gates(QasmUtils.qasm_header(n_qubits) + init_state_qasm):
+            qiskit_circuit.append(instruction, [qiskit_circuit.qubits[qubit] for qubit in qubits])
+
+        if config.optimize_circuits:
+            gates = PeepholeOptimizer.optimized_ansatz_gates(ansatz)
+            QiskitSimBackend.append_gates(qiskit_circuit, PeepholeOptimizer.bind(gates, var_parameters))
+            return qiskit_circuit
+
+        n_used_var_pars = 0
+        for element in ansatz:
+            element_var_pars = var_parameters[n_used_var_pars:(n_used_var_pars + element.n_var_parameters)]
+            n_used_var_pars += element.n_var_parameters
+            QiskitSimBackend.append_element(qiskit_circuit, element, element_var_pars, n_qubits)
+
+        return qiskit_circuit
+
+    # return a circuit with one qiskit Parameter per variational parameter, and the list of these Parameters
+    @staticmethod
+    def parameterized_circuit(ansatz, n_qubits, n_electrons, init_state_qasm=None):
+        key = (n_qubits, n_electrons, init_state_qasm, config.optimize_circuits,
+               tuple(QiskitSimBackend.element_key(element) for element in ansatz))
+        if key in QiskitSimBackend.parameterized_circuits:
+            QiskitSimBackend.parameterized_circuits.move_to_end(key)
+            return QiskitSimBackend.parameterized_circuits[key]
 
-        ansatz_qasm = QiskitSimBackend.qasm_from_ansatz(ansatz, var_parameters)
-        qasm += ansatz_qasm
+        n_var_parameters = sum([element.n_var_parameters for element in ansatz])
+        parameters = [qiskit.circuit.Parameter('p{}'.format(i)) for i in range(n_var_parameters)]
+        qiskit_circuit = QiskitSimBackend.ansatz_circuit(ansatz, parameters, n_qubits, n_electrons,
+                                                         init_state_qasm=init_state_qasm)
+        QiskitSimBackend.append_reverse_qubits(qiskit_circuit, n_qubits)
 
-        # Get a circuit of SWAP gates to reverse the order of qubits. This is required in order the statevector to
-        # match the reversed order of qubits used by openfermion when obtaining the Hamiltonian Matrix.
-        qasm.append(QasmUtils.reverse_qubits_qasm(n_qubits))
+        QiskitSimBackend.parameterized_circuits[key] = (qiskit_circuit, parameters)
+        if len(QiskitSimBackend.parameterized_circuits) > config.qiskit_circuit_cache_size:
+            QiskitSimBackend.parameterized_circuits.popitem(last=False)
 
-        qasm = ''.join(qasm)
-        statevector = QiskitSimBackend.statevector_from_qasm(qasm)
-        # print(qasm)
-        return statevector
+        return qiskit_circuit, parameters
 
+    # return a statevector in the form of an array from a list of ansatz elements
     @staticmethod
-    def ham_sparse_matrix(q_system, excited_state=0):
-        H_sparse_matrix = get_sparse_operator(q_system.qubit_ham)
-        if excited_state > 0:
-            H_lower_state_terms = q_system.H_lower_state_terms
-            assert H_lower_state_terms is not None
-            assert len(H_lower_state_terms) >= excited_state
-            for i in range(excited_state):
-                term = H_lower_state_terms[i]
-                state = term[1]
-                statevector = QiskitSimBackend.statevector_from_ansatz(state.ansatz_elements, state.parameters, state.n_qubits,
-                                                                       state.n_electrons, init_state_qasm=state.init_state_qasm)
-                # add the outer product of the lower lying state to the Hamiltonian
-                H_sparse_matrix += scipy.sparse.csr_matrix(term[0] * numpy.outer(statevector, statevector))
+    def statevector_from_ansatz(ansatz, var_parameters, n_qubits, n_electrons, init_state_qasm=None):
+        assert n_electrons < n_qubits
+        qiskit_circuit, parameters = QiskitSimBackend.parameterized_circuit(ansatz, n_qubits, n_electrons,
+                                                                            init_state_qasm)
+        assert len(parameters) == len(var_parameters)
+        bound_circuit = qiskit_circuit.bind_parameters(dict(zip(parameters, map(float, var_parameters))))
+        return QiskitSimBackend.statevector_from_circuit(bound_circuit)
+
+    # the excitation generators sparse matrices, memoized for each ansatz element and number of qubits (key =
+    # (str(excitations_generators), n_qubits)), since the same generators act on systems of different sizes
+    exc_gen_sparse_matrices_dict = {}
 
-        return H_sparse_matrix
+    # the Hamiltonian sparse matrix is memoized in the operator store of the q_system
+    @staticmethod
+    def ham_sparse_matrix(q_system):
+        return q_system.get_h_sparse_matrix()
+
+    # apply the (excited state) Hamiltonian to a statevector. The penalty terms factor*|phi><phi| of the lower states
+    # are applied as rank one updates, at O(2^n) cost each
+    @staticmethod
+    def ham_dot(q_system, statevector, excited_state=0):
+        ham_statevector = QiskitSimBackend.ham_sparse_matrix(q_system).dot(statevector)
+        for factor, lower_statevector in q_system.get_penalty_terms(excited_state):
+            ham_statevector = ham_statevector + factor * numpy.vdot(lower_statevector, statevector) * lower_statevector
+        return ham_statevector
+
+    @staticmethod
+    def exc_gen_sparse_matrices(ansatz_element, n_qubits):
+        key = str(ansatz_element.excitations_generators), n_qubits
+        if key not in QiskitSimBackend.exc_gen_sparse_matrices_dict:
+            QiskitSimBackend.exc_gen_sparse_matrices_dict[key] = \
+                [get_sparse_operator(term, n_qubits=n_qubits) for term in ansatz_element.excitations_generators]
+        return QiskitSimBackend.exc_gen_sparse_matrices_dict[key]
+
+    # apply exp(parameter*A) to a statevector, where A is an excitation generator sparse matrix. Uses that A^3 = -A for
+    # all excitation generators: exp(t*A) = I + sin(t)A + (1-cos(t))A^2
+    @staticmethod
+    def apply_excitation(exc_gen_sparse_matrix, parameter, statevector):
+        exc_gen_statevector = exc_gen_sparse_matrix.dot(statevector)
+        return statevector + numpy.sin(parameter) * exc_gen_statevector + \
+            (1 - numpy.cos(parameter)) * exc_gen_sparse_matrix.dot(exc_gen_statevector)
 
     # return the expectation value of a qubit_operator
     @staticmethod
@@ -90,85 +259,183 @@ class QiskitSimBackend:
 
         statevector = QiskitSimBackend.statevector_from_ansatz(ansatz, var_parameters, q_system.n_qubits,
                                                                q_system.n_electrons, init_state_qasm=init_state_qasm)
-        sparse_statevector = scipy.sparse.csr_matrix(statevector)
-        H_sparse_matrix = QiskitSimBackend.ham_sparse_matrix(q_system, excited_state=excited_state)
-
-        expectation_value = \
-            sparse_statevector.dot(H_sparse_matrix).dot(sparse_statevector.conj().transpose()).todense()[0, 0]
+        expectation_value = numpy.vdot(statevector, QiskitSimBackend.ham_dot(q_system, statevector, excited_state))
 
         return expectation_value.real
 
-    # TODO check for excited states
+    # <psi|[H, A]|psi> = 2Re(<H psi|A psi>), since the excitation generator A is anti-Hermitian
     @staticmethod
     def ansatz_element_gradient(ansatz_element, var_parameters, ansatz, q_system,  cache=None, init_state_qasm=None, excited_state=0):
 
-        excitations_generators = ansatz_element.excitations_generators
-        exc_gen_sparse_matrices = []
-        for exc_gen in excitations_generators:
-            exc_gen_sparse_matrices.append(get_sparse_operator(exc_gen, n_qubits=q_system.n_qubits))
-        exc_gen_sparse_matrix = sum(exc_gen_sparse_matrices)
-
-        H_sparse_matrix = QiskitSimBackend.ham_sparse_matrix(q_system, excited_state=excited_state)
-
-        commutator_sparse_matrix = H_sparse_matrix*exc_gen_sparse_matrix - exc_gen_sparse_matrix*H_sparse_matrix
+        exc_gen_sparse_matrix = sum(QiskitSimBackend.exc_gen_sparse_matrices(ansatz_element, q_system.n_qubits))
 
         statevector = QiskitSimBackend.statevector_from_ansatz(ansatz, var_parameters, q_system.n_qubits,
                                                                q_system.n_electrons, init_state_qasm=init_state_qasm)
-        sparse_statevector = scipy.sparse.csr_matrix(statevector)
 
-        grad = sparse_statevector.dot(commutator_sparse_matrix).dot(sparse_statevector.conj().transpose()).todense()[0,0]
+        grad = 2 * numpy.vdot(QiskitSimBackend.ham_dot(q_system, statevector, excited_state),
+                              exc_gen_sparse_matrix.dot(statevector))
 
-        assert grad.imag < config.floating_point_accuracy
         return grad.real
 
-    # TODO check for excited states
+    # adjoint (reverse mode) calculation of the gradient w.r.t. all the ansatz var. parameters
     @staticmethod
     def ansatz_gradient(var_parameters, ansatz, q_system, cache=None, init_state_qasm=None, excited_state=0):
 
         assert len(ansatz) == len(var_parameters)
-        ansatz_statevector = QiskitSimBackend.statevector_from_ansatz(ansatz, var_parameters, q_system.n_orbitals,
-                                                                      q_system.n_electrons, init_state_qasm=init_state_qasm)
-        ansatz_sparse_statevector = scipy.sparse.csr_matrix(ansatz_statevector)
-        H_sparse_matrix = QiskitSimBackend.ham_sparse_matrix(q_system, excited_state=excited_state)
-
-        phi = ansatz_sparse_statevector.transpose().conj()
-        psi = H_sparse_matrix.dot(phi)
+        phi = QiskitSimBackend.statevector_from_ansatz(ansatz, var_parameters, q_system.n_qubits, q_system.n_electrons,
+                                                       init_state_qasm=init_state_qasm)
+        psi = QiskitSimBackend.ham_dot(q_system, phi, excited_state)
 
         ansatz_grad = []
 
         for i in range(len(ansatz))[::-1]:
-            excitations_generators = ansatz[i].excitations_generators
-
-            excitations_generators_matrices = []
-            for term in excitations_generators:
-                excitations_generators_matrices.append(get_sparse_operator(term, n_qubits=q_system.n_qubits))
+            excitations_generators_matrices = QiskitSimBackend.exc_gen_sparse_matrices(ansatz[i], q_system.n_qubits)
 
             if len(excitations_generators_matrices) == 1:
-                grad_i = 2 * (psi.transpose().conj().dot(excitations_generators_matrices[0]).dot(phi)).todense()[0, 0]
+                grad_i = 2 * numpy.vdot(psi, excitations_generators_matrices[0].dot(phi))
 
                 ansatz_grad.append(grad_i.real)
 
-                psi = scipy.sparse.linalg.expm_multiply(-var_parameters[i]*excitations_generators_matrices[0], psi)
-                phi = scipy.sparse.linalg.expm_multiply(-var_parameters[i]*excitations_generators_matrices[0], phi)
+                psi = QiskitSimBackend.apply_excitation(excitations_generators_matrices[0], -var_parameters[i], psi)
+                phi = QiskitSimBackend.apply_excitation(excitations_generators_matrices[0], -var_parameters[i], phi)
 
             else:
-                # TODO test properly
                 assert len(excitations_generators_matrices) == 2
 
-                psi = scipy.sparse.linalg.expm_multiply(-var_parameters[i] * excitations_generators_matrices[1], psi)
-                phi = scipy.sparse.linalg.expm_multiply(-var_parameters[i] * excitations_generators_matrices[1], phi)
+                psi = QiskitSimBackend.apply_excitation(excitations_generators_matrices[1], -var_parameters[i], psi)
+                phi = QiskitSimBackend.apply_excitation(excitations_generators_matrices[1], -var_parameters[i], phi)
 
-                grad_i = 2 * (psi.transpose().conj().dot(excitations_generators_matrices[0]+excitations_generators_matrices[1]).dot(phi)).todense()[0, 0]
+                grad_i = 2 * numpy.vdot(psi, (excitations_generators_matrices[0] + excitations_generators_matrices[1]).dot(phi))
 
                 ansatz_grad.append(grad_i.real)
 
-                psi = scipy.sparse.linalg.expm_multiply(-var_parameters[i] * excitations_generators_matrices[0], psi)
-                phi = scipy.sparse.linalg.expm_multiply(-var_parameters[i] * excitations_generators_matrices[0], phi)
+                psi = QiskitSimBackend.apply_excitation(excitations_generators_matrices[0], -var_parameters[i], psi)
+                phi = QiskitSimBackend.apply_excitation(excitations_generators_matrices[0], -var_parameters[i], phi)
 
         ansatz_grad = ansatz_grad[::-1]
-        # print(ansatz_grad)
         return numpy.array(ansatz_grad)
 
+    # energies of a list of circuits, executed in batches of config.qiskit_batch_size circuits
+    @staticmethod
+    def ham_expectation_values_from_circuits(qiskit_circuits, q_system, excited_state=0):
+        batch_size = config.qiskit_batch_size
+        energies = []
+        for i in range(0, len(qiskit_circuits), batch_size):
+            for statevector in QiskitSimBackend.statevectors_from_circuits(qiskit_circuits[i:i + batch_size]):
+                statevector = numpy.array(statevector)
+                energies.append(numpy.vdot(statevector, QiskitSimBackend.ham_dot(q_system, statevector,
+                                                                                 excited_state)).real)
+        return energies
+
+    # circuits of the ansatz followed by a single element, for each pair of elements and element var. parameters
+    @staticmethod
+    def extended_ansatz_circuits(elements, elements_var_parameters, ansatz, var_parameters, n_qubits, n_electrons,
+                                 init_state_qasm=None):
+        assert n_electrons < n_qubits
+        ansatz_circuit = QiskitSimBackend.ansatz_circuit(ansatz, var_parameters, n_qubits, n_electrons,
+                                                         init_state_qasm=init_state_qasm)
+        qiskit_circuits = []
+        for element, element_var_parameters in zip(elements, elements_var_parameters):
+            qiskit_circuit = ansatz_circuit.copy()
+            QiskitSimBackend.append_element(qiskit_circuit, element, element_var_parameters, n_qubits)
+            QiskitSimBackend.append_reverse_qubits(qiskit_circuit, n_qubits)
+            qiskit_circuits.append(qiskit_circuit)
+        return qiskit_circuits
+
+    # The energy as a function of the var. parameter of an element with n excitation generators is a trigonometric
+    # polynomial of degree 2n (each exponentiated generator exp(tA) = I + sin(t)A + (1 - cos(t))A^2 is of degree 1).
+    @staticmethod
+    def element_energy_degree(ansatz_element):
+        assert ansatz_element.n_var_parameters == 1
+        return 2 * len(ansatz_element.excitations_generators)
+
+    # shifts and weights of the general parameter shift rule for a trigonometric polynomial E of degree R:
+    # E'(0) = sum_mu w_mu (E(x_mu) - E(-x_mu)), x_mu = (2mu - 1)pi/2R, w_mu = (-1)^(mu - 1) / (4R sin^2(x_mu/2))
+    @staticmethod
+    def parameter_shift_rule(degree):
+        shifts = [(2 * mu - 1) * numpy.pi / (2 * degree) for mu in range(1, degree + 1)]
+        weights = [(-1) ** mu / (4 * degree * numpy.sin(shift / 2) ** 2) for mu, shift in enumerate(shifts)]
+        return shifts, weights
+
+    # energy gradients w.r.t. the var. parameters of a set of elements appended to the ansatz, calculated with the
+    # parameter shift rule. All shifted circuits are executed together, in batches
+    @staticmethod
+    def ansatz_elements_gradients(ansatz_elements, var_parameters, ansatz, q_system, init_state_qasm=None,
+                                  excited_state=0):
+        circuits_elements = []
+        circuits_parameters = []
+        for element in ansatz_elements:
+            shifts, weights = QiskitSimBackend.parameter_shift_rule(QiskitSimBackend.element_energy_degree(element))
+            for shift in shifts:
+                circuits_elements += [element, element]
+                circuits_parameters += [[shift], [-shift]]
+
+        qiskit_circuits = QiskitSimBackend.extended_ansatz_circuits(circuits_elements, circuits_parameters, ansatz,
+                                                                    var_parameters, q_system.n_qubits,
+                                                                    q_system.n_electrons, init_state_qasm=init_state_qasm)
+        energies = QiskitSimBackend.ham_expectation_values_from_circuits(qiskit_circuits, q_system,
+                                                                         excited_state=excited_state)
+        gradients = []
+        n_used_energies = 0
+        for element in ansatz_elements:
+            shifts, weights = QiskitSimBackend.parameter_shift_rule(QiskitSimBackend.element_energy_degree(element))
+            grad = 0
+            for weight in weights:
+                grad += weight * (energies[n_used_energies] - energies[n_used_energies + 1])
+                n_used_energies += 2
+            gradients.append(grad)
+
+        return gradients
+
+    # minimum of a trigonometric polynomial of degree R, given its values at the 2R + 1 points 2pi*j/(2R + 1)
+    @staticmethod
+    def trigonometric_polynomial_minimum(values):
+        n_points = len(values)
+        coefficients = numpy.fft.rfft(values) / n_points
+        frequencies = numpy.arange(len(coefficients))
+
+        def polynomial(x):
+            return (coefficients[0] + 2 * (coefficients[1:] * numpy.exp(1j * frequencies[1:] * x)).sum()).real
+
+        # locate the global minimum on a grid, and refine it within the neighbouring grid cells
+        grid = numpy.linspace(-numpy.pi, numpy.pi, 20 * n_points, endpoint=False)
+        grid_values = (coefficients[0] + 2 * (coefficients[1:] *
+                                              numpy.exp(1j * numpy.outer(grid, frequencies[1:]))).sum(axis=1)).real
+        x_0 = grid[numpy.argmin(grid_values)]
+        step = grid[1] - grid[0]
+        result = scipy.optimize.minimize_scalar(polynomial, bounds=(x_0 - step, x_0 + step), method='bounded',
+                                                options={'xatol': config.optimizer_tol})
+        return result.x, result.fun
+
+    # individual VQEs (optimizing only the element var. parameter) for a set of elements appended to the ansatz. The
+    # energy of each element is reconstructed exactly from 2R + 1 evaluations (R = element_energy_degree) and its
+    # global minimum is returned, so all candidate circuits are executed together, in batches
+    @staticmethod
+    def ansatz_elements_individual_vqes(ansatz_elements, var_parameters, ansatz, q_system, init_state_qasm=None,
+                                        excited_state=0):
+        circuits_elements = []
+        circuits_parameters = []
+        for element in ansatz_elements:
+            n_points = 2 * QiskitSimBackend.element_energy_degree(element) + 1
+            circuits_elements += [element] * n_points
+            circuits_parameters += [[2 * numpy.pi * j / n_points] for j in range(n_points)]
+
+        qiskit_circuits = QiskitSimBackend.extended_ansatz_circuits(circuits_elements, circuits_parameters, ansatz,
+                                                                    var_parameters, q_system.n_qubits,
+                                                                    q_system.n_electrons, init_state_qasm=init_state_qasm)
+        energies = QiskitSimBackend.ham_expectation_values_from_circuits(qiskit_circuits, q_system,
+                                                                         excited_state=excited_state)
+        results = []
+        n_used_energies = 0
+        for element in ansatz_elements:
+            n_points = 2 * QiskitSimBackend.element_energy_degree(element) + 1
+            x, fun = QiskitSimBackend.trigonometric_polynomial_minimum(energies[n_used_energies:n_used_energies + n_points])
+            n_used_energies += n_points
+            results.append(scipy.optimize.OptimizeResult(x=numpy.array([x]), fun=fun, nfev=n_points, njev=0, n_iters=1,
+                                                         success=True, stop_reason='converged'))
+
+        return results
+
 
 class MatrixCacheBackend:
 
@@ -178,25 +445,29 @@ class MatrixCacheBackend:
 
         sparse_statevector = cache.get_statevector(ansatz, list(var_parameters), init_state_qasm=init_state_qasm)
         H_sparse_matrix = cache.get_h_sparse_matrix()
+        if config.instrumentation:
+            Instrumentation.count('spmv')
 
         expectation_value = sparse_statevector.dot(H_sparse_matrix).dot(sparse_statevector.conj().transpose()).todense()[0, 0]
+        # the excited state penalty terms of the cache, if any
+        expectation_value += cache.penalty_expectation_value(sparse_statevector)
 
         return expectation_value.real
 
-    # TODO check for excited states
     @staticmethod
     def ansatz_element_gradient(ansatz_element, var_parameters, ansatz, q_system, cache, init_state_qasm=None,
                                 excited_state=0):
 
         sparse_statevector = cache.get_statevector(ansatz, list(var_parameters), init_state_qasm=init_state_qasm)
         commutator_sparse_matrix = cache.get_commutator_matrix(ansatz_element)
+        if config.instrumentation:
+            Instrumentation.count('spmv')
 
         grad = sparse_statevector.dot(commutator_sparse_matrix).dot(sparse_statevector.conj().transpose()).todense()[0, 0]
 
         assert grad.imag < config.floating_point_accuracy
-        return grad.real
+        return grad.real + cache.penalty_gradient(ansatz_element, sparse_statevector)
 
-    # TODO check for excited states
     @staticmethod
     def ansatz_gradient(var_parameters, ansatz, q_system, cache, init_state_qasm=None, excited_state=0):
 
@@ -205,7 +476,11 @@ class MatrixCacheBackend:
         H_sparse_matrix = cache.H_sparse_matrix
 
         phi = ansatz_sparse_statevector.transpose().conj()
-        psi = H_sparse_matrix.dot(phi)
+        psi = H_sparse_matrix.dot(phi) + cache.penalty_dot(phi)
+        if config.instrumentation:
+            # H phi, then for each element the generator product and the excitation products of psi and phi
+            Instrumentation.count('spmv', 1 + sum([1 + 2 * len(cache.exc_gen_sparse_matrices_dict[str(element.excitations_generators)])
+                                                   for element in ansatz]))
 
         ansatz_grad = []
 
@@ -245,3 +520,210 @@ class MatrixCacheBackend:
 
         ansatz_grad = ansatz_grad[::-1]
         return numpy.array(ansatz_grad)
+
+
+class ShotSimBackend:
+    # Estimates the expectation value of the Hamiltonian from sampled measurements. The terms of the qubit Hamiltonian
+    # are partitioned in qubit-wise commuting groups, each measured with a single circuit in a common basis. The shots
+    # are sampled with numpy from the exact statevector (config.shot_sampler = 'numpy') or with the Aer qasm simulator
+    # (config.shot_sampler = 'aer').
+
+    # the 2x2 rotations to the measurement basis (applied to the statevector in the numpy sampler)
+    basis_rotations = {'X': numpy.array([[1, 1], [1, -1]]) / numpy.sqrt(2),
+                       'Y': numpy.array([[1, -1j], [1, 1j]]) / numpy.sqrt(2)}
+
+    # the measurement circuits (basis rotation and measurement of all qubits), memoized for each group
+    measurement_circuits = {}
+
+    # the generator of the numpy sampler, (re)created when config.shots_seed changes
+    random_generator = None
+    random_generator_seed = None
+
+    @staticmethod
+    def get_random_generator():
+        if ShotSimBackend.random_generator is None or ShotSimBackend.random_generator_seed != config.shots_seed:
+            ShotSimBackend.random_generator = numpy.random.default_rng(config.shots_seed)
+            ShotSimBackend.random_generator_seed = config.shots_seed
+        return ShotSimBackend.random_generator
+
+    # Partition the terms of the qubit Hamiltonian in qubit-wise commuting groups, by a greedy assignment of the terms
+    # sorted by decreasing coefficient magnitude. Each group is a dictionary with the measurement basis, a list of
+    # [qubit, pauli], and its terms: their coefficients and the masks of the measured qubits (in the openfermion
+    # ordering, where qubit q corresponds to the bit n_qubits - 1 - q of the basis state index).
+    @staticmethod
+    def measurement_groups(q_system):
+        key = 'measurement_groups'
+        if key in q_system.operator_store:
+            return q_system.operator_store[key]
+
+        n_qubits = q_system.n_qubits
+        terms = [[pauli_word, coefficient.real] for pauli_word, coefficient in q_system.qubit_ham.terms.items()
+                 if pauli_word != () and abs(coefficient) > config.floating_point_accuracy]
+        terms.sort(key=lambda x: -abs(x[1]))
+
+        groups_bases = []
+        groups_terms = []
+        for pauli_word, coefficient in terms:
+            for basis, group_terms in zip(groups_bases, groups_terms):
+                if all(basis.get(qubit, pauli) == pauli for qubit, pauli in pauli_word):
+                    basis.update(pauli_word)
+                    group_terms.append([pauli_word, coefficient])
+                    break
+            else:
+                groups_bases.append(dict(pauli_word))
+                groups_terms.append([[pauli_word, coefficient]])
+
+        groups = []
+        for basis, group_terms in zip(groups_bases, groups_terms):
+            masks = [sum([2 ** (n_qubits - 1 - qubit) for qubit, pauli in pauli_word]) for pauli_word, _ in group_terms]
+            coefficients = numpy.array([coefficient for _, coefficient in group_terms])
+            groups.append({'basis': sorted(basis.items()), 'coefficients': coefficients,
+                           'masks': numpy.array(masks, dtype=numpy.int64),
+                           'weight': abs(coefficients).sum(), 'variance': None})
+
+        q_system.operator_store[key] = groups
+        logging.info('{} Hamiltonian terms measured in {} qubit-wise commuting groups'.format(len(terms), len(groups)))
+        return groups
+
+    # Shots per group, proportional to the standard deviation of the group observable estimated at the previous
+    # evaluation (Neyman allocation), or to the sum of the coefficient magnitudes before the first evaluation
+    @staticmethod
+    def allocate_shots(groups, n_shots):
+        deviations = []
+        for group in groups:
+            if group['variance'] is None:
+                deviations.append(group['weight'])
+            else:
+                # avoid starving a group whose variance was underestimated from few shots
+                deviations.append(max(numpy.sqrt(group['variance']), config.shots_min_weight_fraction * group['weight']))
+        deviations = numpy.array(deviations)
+        return numpy.maximum(numpy.round(n_shots * deviations / deviations.sum()), config.shots_min_per_group).astype(int)
+
+    # parity (+1 or -1) of each term mask for each measured basis state index
+    @staticmethod
+    def parities(outcomes, masks, n_qubits):
+        bits = numpy.bitwise_and(outcomes[:, None], masks[None, :])
+        parity = numpy.zeros(bits.shape, dtype=numpy.int64)
+        for i in range(n_qubits):
+            parity ^= (bits >> i) & 1
+        return 1 - 2 * parity
+
+    # return the measured basis state indices (openfermion ordering) and their counts for each group
+    @staticmethod
+    def sample_numpy(groups, groups_shots, var_parameters, ansatz, q_system, init_state_qasm=None):
+        statevector = numpy.array(QiskitSimBackend.statevector_from_ansatz(ansatz, var_parameters, q_system.n_qubits,
+                                                                           q_system.n_electrons,
+                                                                           init_state_qasm=init_state_qasm))
+        return ShotSimBackend.sample_statevector(groups, groups_shots, statevector, q_system.n_qubits)
+
+    @staticmethod
+    def sample_statevector(groups, groups_shots, statevector, n_qubits):
+        random_generator = ShotSimBackend.get_random_generator()
+        samples = []
+        for group, shots in zip(groups, groups_shots):
+            rotated_statevector = statevector.reshape([2] * n_qubits)
+            for qubit, pauli in group['basis']:
+                if pauli != 'Z':
+                    rotated_statevector = numpy.moveaxis(
+                        numpy.tensordot(ShotSimBackend.basis_rotations[pauli], rotated_statevector, axes=([1], [qubit])),
+                        0, qubit)
+            probabilities = abs(rotated_statevector.reshape(-1)) ** 2
+            counts = random_generator.multinomial(shots, probabilities / probabilities.sum())
+            outcomes = numpy.nonzero(counts)[0]
+            samples.append([outcomes, counts[outcomes]])
+        return samples
+
+    @staticmethod
+    def measurement_circuit(group, n_qubits):
+        key = (n_qubits, tuple(group['basis']))
+        if key not in ShotSimBackend.measurement_circuits:
+            qiskit_circuit = qiskit.QuantumCircuit(qiskit.QuantumRegister(n_qubits, 'q'),
+                                                   qiskit.ClassicalRegister(n_qubits, 'c'))
+            for qubit, pauli in group['basis']:
+                if pauli == 'Y':
+                    qiskit_circuit.sdg(qubit)
+                if pauli != 'Z':
+                    qiskit_circuit.h(qubit)
+            qiskit_circuit.measure(range(n_qubits), range(n_qubits))
+            ShotSimBackend.measurement_circuits[key] = qiskit_circuit
+        return ShotSimBackend.measurement_circuits[key]
+
+    @staticmethod
+    def sample_aer(groups, groups_shots, var_parameters, ansatz, q_system, init_state_qasm=None):
+        n_qubits = q_system.n_qubits
+        ansatz_circuit = QiskitSimBackend.ansatz_circuit(ansatz, var_parameters, n_qubits, q_system.n_electrons,
+                                                         init_state_qasm=init_state_qasm)
+        backend = qiskit.Aer.get_backend('qasm_simulator')
+        samples = []
+        for group, shots in zip(groups, groups_shots):
+            qiskit_circuit = ansatz_circuit.compose(ShotSimBackend.measurement_circuit(group, n_qubits))
+            counts = qiskit.execute(qiskit_circuit, backend, shots=int(shots), seed_simulator=config.shots_seed,
+                                    backend_options={"max_parallel_threads": config.qiskit_n_threads})\
+                .result().get_counts(qiskit_circuit)
+            # qiskit bit strings are ordered c[n-1]...c[0], while in openfermion qubit 0 is the most significant bit
+            outcomes = numpy.array([int(bit_string[::-1], 2) for bit_string in counts.keys()], dtype=numpy.int64)
+            samples.append([outcomes, numpy.array(list(counts.values()))])
+        return samples
+
+    @staticmethod
+    def ham_expectation_value(var_parameters, ansatz, q_system, init_state_qasm=None, cache=None, excited_state=0):
+        # the overlaps with the lower states of the excited state Hamiltonian are not Pauli observables
+        assert excited_state == 0
+
+        groups = ShotSimBackend.measurement_groups(q_system)
+        groups_shots = ShotSimBackend.allocate_shots(groups, config.n_shots)
+        if config.shot_sampler == 'aer':
+            samples = ShotSimBackend.sample_aer(groups, groups_shots, var_parameters, ansatz, q_system,
+                                                init_state_qasm=init_state_qasm)
+        else:
+            assert config.shot_sampler == 'numpy'
+            samples = ShotSimBackend.sample_numpy(groups, groups_shots, var_parameters, ansatz, q_system,
+                                                  init_state_qasm=init_state_qasm)
+
+        return ShotSimBackend.estimate(groups, samples, q_system)
+
+    # the energy estimated from the samples of the groups. The variances of the group observables are updated for the
+    # allocation of the next evaluation
+    @staticmethod
+    def estimate(groups, samples, q_system):
+        expectation_value = q_system.qubit_ham.terms.get((), 0).real
+        for group, (outcomes, counts) in zip(groups, samples):
+            values = ShotSimBackend.parities(outcomes, group['masks'], q_system.n_qubits).dot(group['coefficients'])
+            mean = values.dot(counts) / counts.sum()
+            group['variance'] = ((values - mean) ** 2).dot(counts) / counts.sum()
+            expectation_value += mean
+
+        return expectation_value
+
+    # gradient w.r.t. the var. parameter of an element appended to the ansatz, using the parameter shift rule
+    @staticmethod
+    def ansatz_element_gradient(ansatz_element, var_parameters, ansatz, q_system, cache=None, init_state_qasm=None,
+                                excited_state=0):
+        shifts, weights = QiskitSimBackend.parameter_shift_rule(QiskitSimBackend.element_energy_degree(ansatz_element))
+        grad = 0
+        for shift, weight in zip(shifts, weights):
+            energy_plus, energy_minus = [
+                ShotSimBackend.ham_expectation_value(list(var_parameters) + [sign * shift], ansatz + [ansatz_element],
+                                                     q_system, init_state_qasm=init_state_qasm,
+                                                     excited_state=excited_state)
+                for sign in [1, -1]]
+            grad += weight * (energy_plus - energy_minus)
+        return grad
+
+    # gradient w.r.t. all the ansatz var. parameters, using the parameter shift rule
+    @staticmethod
+    def ansatz_gradient(var_parameters, ansatz, q_system, cache=None, init_state_qasm=None, excited_state=0):
+        assert len(ansatz) == len(var_parameters)
+        ansatz_grad = []
+        for i, element in enumerate(ansatz):
+            shifts, weights = QiskitSimBackend.parameter_shift_rule(QiskitSimBackend.element_energy_degree(element))
+            grad_i = 0
+            for shift, weight in zip(shifts, weights):
+                for sign in [1, -1]:
+                    shifted_var_parameters = list(var_parameters)
+                    shifted_var_parameters[i] += sign * shift
+                    grad_i += sign * weight * ShotSimBackend.ham_expectation_value(
+                        shifted_var_parameters, ansatz, q_system, init_state_qasm=init_state_qasm,
+                        excited_state=excited_state)
+            ansatz_grad.append(grad_i)
+        return numpy.array(ansatz_grad)
@@ -0,0 +1,105 @@
+import functools
+import scipy.sparse
+import numpy
+
+
+class BasisIndices:
+    # Precomputed tables over the 2^n computational basis state indices, in the openfermion (JW) ordering: qubit q
+    # corresponds to the bit n_qubits - 1 - q of the index, even qubits are spin up and odd qubits spin down orbitals.
+    # The tables are memoized for each n_qubits and are read only.
+
+    # number of set bits of each byte
+    byte_popcounts = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.uint8)
+
+    @staticmethod
+    def read_only(array):
+        array.flags.writeable = False
+        return array
+
+    # number of set bits of each element of an array of non negative integers
+    @staticmethod
+    def popcount(indices):
+        indices = numpy.ascontiguousarray(indices, dtype=numpy.int64)
+        byte_counts = BasisIndices.byte_popcounts[indices.view(numpy.uint8)].reshape(indices.shape + (8,))
+        return byte_counts.sum(axis=-1, dtype=numpy.int64)
+
+    # the integer mask of a list of qubits
+    @staticmethod
+    def qubits_mask(qubits, n_qubits):
+        return sum([1 << (n_qubits - 1 - qubit) for qubit in qubits])
+
+    # number of electrons (occupied qubits) of each basis state
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def electron_numbers(n_qubits):
+        return BasisIndices.read_only(BasisIndices.popcount(numpy.arange(2 ** n_qubits)).astype(numpy.int8))
+
+    # twice the spin projection, 2Sz = n_up - n_down, of each basis state
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def double_sz(n_qubits):
+        indices = numpy.arange(2 ** n_qubits)
+        up_mask = BasisIndices.qubits_mask(range(0, n_qubits, 2), n_qubits)
+        down_mask = BasisIndices.qubits_mask(range(1, n_qubits, 2), n_qubits)
+        double_sz = BasisIndices.popcount(indices & up_mask) - BasisIndices.popcount(indices & down_mask)
+        return BasisIndices.read_only(double_sz.astype(numpy.int8))
+
+    # indices of the basis states with n_electrons electrons (and spin projection sz, if given)
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sector_indices(n_qubits, n_electrons, sz=None):
+        mask = BasisIndices.electron_numbers(n_qubits) == n_electrons
+        if sz is not None:
+            mask &= BasisIndices.double_sz(n_qubits) == int(round(2 * sz))
+        return BasisIndices.read_only(numpy.nonzero(mask)[0])
+
+    # position of each basis state in its sector (-1 for the basis states outside the sector)
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sector_positions(n_qubits, n_electrons, sz=None):
+        indices = BasisIndices.sector_indices(n_qubits, n_electrons, sz)
+        positions = numpy.full(2 ** n_qubits, -1, dtype=numpy.int64)
+        positions[indices] = numpy.arange(len(indices))
+        return BasisIndices.read_only(positions)
+
+    # the block of a sparse matrix in the full space acting on a sector, selected in a single pass over its non zero
+    # elements
+    @staticmethod
+    def sector_matrix(sparse_matrix, n_qubits, n_electrons, sz=None):
+        positions = BasisIndices.sector_positions(n_qubits, n_electrons, sz)
+        sparse_matrix = scipy.sparse.coo_matrix(sparse_matrix)
+        rows = positions[sparse_matrix.row]
+        columns = positions[sparse_matrix.col]
+        in_sector = (rows >= 0) & (columns >= 0)
+        dimension = len(BasisIndices.sector_indices(n_qubits, n_electrons, sz))
+        return scipy.sparse.csr_matrix((sparse_matrix.data[in_sector], (rows[in_sector], columns[in_sector])),
+                                       shape=(dimension, dimension))
+
+    # embed sector vectors (or columns of a matrix) into the full space
+    @staticmethod
+    def from_sector(sector_vectors, n_qubits, n_electrons, sz=None):
+        full_vectors = numpy.zeros((2 ** n_qubits,) + sector_vectors.shape[1:], dtype=sector_vectors.dtype)
+        full_vectors[BasisIndices.sector_indices(n_qubits, n_electrons, sz)] = sector_vectors
+        return full_vectors
+
+    # the Hartree-Fock basis state, with the first n_electrons qubits occupied
+    @staticmethod
+    def hf_index(n_qubits, n_electrons):
+        return BasisIndices.qubits_mask(range(n_electrons), n_qubits)
+
+    @staticmethod
+    def hf_statevector(n_qubits, n_electrons):
+        statevector = numpy.zeros(2 ** n_qubits)
+        statevector[BasisIndices.hf_index(n_qubits, n_electrons)] = 1
+        return statevector
+
+    # the electron number of a statevector if all its non zero terms have the same one. Otherwise return False
+    @staticmethod
+    def statevector_electron_number(statevector):
+        n_qubits = int(numpy.log2(len(statevector)))
+        electron_numbers = numpy.unique(BasisIndices.electron_numbers(n_qubits)[numpy.nonzero(statevector)[0]])
+        if len(electron_numbers) == 0:
+            return None
+        if len(electron_numbers) > 1:
+            return False
+        return int(electron_numbers[0])
@@ -1,24 +1,29 @@
 from src.backends import QiskitSimBackend
 from src import config
-from src.utils import QasmUtils
+from src.utils import QasmUtils, RayUtils, MemoryUtils
+from src.ray_tasks import RayTasks
+from src.basis_indices import BasisIndices
+from src.instrumentation import Instrumentation
 
 from openfermion import get_sparse_operator
 
 import scipy
-import ray
 import numpy
 import logging
-import time
 
 
 # TODO variables names need some cosmetics
 class Cache:
     def __init__(self, H_sparse_matrix, n_qubits, n_electrons, exc_gen_sparse_matrices_dict=None,
                  commutators_sparse_matrices_dict=None, sparse_statevector=None, init_sparse_statevector=None,
-                 sqr_exc_gen_sparse_matrices_dict=None):
+                 sqr_exc_gen_sparse_matrices_dict=None, penalty_terms=None):
         self.n_qubits = n_qubits
         self.n_electrons = n_electrons
         self.H_sparse_matrix = H_sparse_matrix
+        # excited state penalty terms, list of [factor, lower state statevector]. See QSystem.get_penalty_terms
+        if penalty_terms is None:
+            penalty_terms = []
+        self.penalty_terms = penalty_terms
 
         # excitations generators sparse matrices dictionary; key = str(ansatz_element.excitation_generators)
         self.exc_gen_sparse_matrices_dict = exc_gen_sparse_matrices_dict
@@ -37,19 +42,18 @@ class Cache:
         self.identity = scipy.sparse.identity(2 ** self.n_qubits)  # the 2^n x 2^n identity matrix
 
     def hf_statevector(self):
-        statevector = numpy.zeros(2 ** self.n_qubits)
-        # MAGIC
-        hf_term = 0
-        for i in range(self.n_electrons):
-            hf_term += 2 ** (self.n_qubits - 1 - i)
-        statevector[hf_term] = 1
-        return statevector
+        return BasisIndices.hf_statevector(self.n_qubits, self.n_electrons)
 
     def get_statevector(self, ansatz, var_parameters, init_state_qasm=None):
         assert len(var_parameters) == len(ansatz)
         if self.var_parameters is not None and var_parameters == self.var_parameters:  # this condition is not neccessarily sufficient
             assert self.sparse_statevector is not None
+            if config.instrumentation:
+                Instrumentation.count('statevector_reuses')
         else:
+            if config.instrumentation:
+                Instrumentation.count('statevector_builds')
+                Instrumentation.count('spmv', len(ansatz))
             if self.init_sparse_statevector is not None:
                 sparse_statevector = self.init_sparse_statevector.transpose().conj()
             else:
@@ -86,9 +90,14 @@ class Cache:
             dict_term = self.excitations_sparse_matrices_dict[key]
             previous_parameter = dict_term['parameter']
             if previous_parameter == parameter:
+                if config.instrumentation:
+                    Instrumentation.count('excitation_matrices_hits')
                 # this can be a list of one or two matrices depending on if its a spin-complement pair
                 return self.excitations_sparse_matrices_dict[key]['matrices']
 
+        if config.instrumentation:
+            Instrumentation.count('excitation_matrices_misses')
+
         # otherwise update the excitations_sparse_matrices_dict
         try:
             excitations_generators_matrices = self.exc_gen_sparse_matrices_dict[key]
@@ -142,6 +151,35 @@ class Cache:
     def get_h_sparse_matrix(self):
         return self.H_sparse_matrix
 
+    # sum_i factor_i |<phi_i|psi>|^2. The sparse statevector is stored as the row vector <psi|
+    def penalty_expectation_value(self, sparse_statevector):
+        if not self.penalty_terms:
+            return 0
+        statevector = numpy.asarray(sparse_statevector.conj().todense()).ravel()
+        return sum([factor * abs(numpy.vdot(lower_statevector, statevector)) ** 2
+                    for factor, lower_statevector in self.penalty_terms])
+
+    # the penalty contribution to the gradient: sum_i 2 factor_i Re(<psi|phi_i><phi_i|A psi>)
+    def penalty_gradient(self, ansatz_element, sparse_statevector):
+        if not self.penalty_terms:
+            return 0
+        statevector = numpy.asarray(sparse_statevector.conj().todense()).ravel()
+        exc_gen_statevector = sum(self.get_excitations_generators_matrices(ansatz_element)).dot(statevector)
+        grad = 0
+        for factor, lower_statevector in self.penalty_terms:
+            grad += 2 * factor * (numpy.vdot(statevector, lower_statevector) *
+                                  numpy.vdot(lower_statevector, exc_gen_statevector)).real
+        return grad
+
+    # apply the penalty terms to a sparse column statevector, returns a sparse column
+    def penalty_dot(self, sparse_statevector):
+        penalty_statevector = numpy.zeros(2 ** self.n_qubits, dtype=complex)
+        if self.penalty_terms:
+            statevector = numpy.asarray(sparse_statevector.todense()).ravel()
+            for factor, lower_statevector in self.penalty_terms:
+                penalty_statevector += factor * numpy.vdot(lower_statevector, statevector) * lower_statevector
+        return scipy.sparse.csr_matrix(penalty_statevector).transpose()
+
     def get_exc_gen_sparse_matrices_dict_copy(self):
         exc_gen_matrices_list_copy = {}
         for exc_gen in self.exc_gen_sparse_matrices_dict.keys():
@@ -166,24 +204,32 @@ class Cache:
 
         return sparse_matrices_copy
 
+    # the bytes held by the matrices of the cache: H, the excitation generator, squared excitation generator, commutator
+    # and excitation (exponentiated generator) dictionaries, the statevectors and the penalty terms statevectors
+    def memory_report(self):
+        report = {'H': MemoryUtils.nbytes(self.H_sparse_matrix),
+                  'exc_gen': MemoryUtils.nbytes(self.exc_gen_sparse_matrices_dict),
+                  'sqr_exc_gen': MemoryUtils.nbytes(self.sqr_exc_gen_sparse_matrices_dict),
+                  'commutators': MemoryUtils.nbytes(self.commutators_sparse_matrices_dict),
+                  'excitations': MemoryUtils.nbytes([dict_term['matrices'] for dict_term in
+                                                     self.excitations_sparse_matrices_dict.values()]),
+                  'statevectors': MemoryUtils.nbytes([self.sparse_statevector, self.init_sparse_statevector]),
+                  'penalty_terms': MemoryUtils.nbytes([statevector for factor, statevector in self.penalty_terms])}
+        report['total'] = sum(report.values())
+        return report
+
+    def log_memory_report(self):
+        report = self.memory_report()
+        logging.info('Cache memory: {}'.format(', '.join(['{} {}'.format(name, MemoryUtils.format(n_bytes))
+                                                          for name, n_bytes in report.items()])))
+        return report
+
 
 class GlobalCache(Cache):
     def __init__(self, q_system, excited_state=0, init_sparse_statevector=None):
         self.q_system = q_system
 
-        # H_sparse_matrix = backend. ham_sparse_matrix(q_system, excited_state=excited_state)
-        H_sparse_matrix = get_sparse_operator(q_system.qubit_ham)
-        if excited_state > 0:
-            H_lower_state_terms = q_system.H_lower_state_terms
-            assert H_lower_state_terms is not None
-            assert len(H_lower_state_terms) >= excited_state
-            for i in range(excited_state):
-                term = H_lower_state_terms[i]
-                state = term[1]
-                statevector = QiskitSimBackend.statevector_from_ansatz(state.ansatz_elements, state.parameters, state.n_qubits,
-                                                                       state.n_electrons, init_state_qasm=state.init_state_qasm)
-                # add the outer product of the lower lying state to the Hamiltonian
-                H_sparse_matrix += scipy.sparse.csr_matrix(term[0] * numpy.outer(statevector, statevector.conj().transpose()))
+        H_sparse_matrix = q_system.get_h_sparse_matrix()
 
         if H_sparse_matrix.data.nbytes > config.matrix_size_threshold:
             # decrease the size of the matrix. Typically it will have a lot of insignificant very small (~1e-19)
@@ -193,24 +239,35 @@ class GlobalCache(Cache):
 
         super(GlobalCache, self).__init__(H_sparse_matrix=H_sparse_matrix, n_qubits=q_system.n_qubits,
                                           n_electrons=q_system.n_electrons, commutators_sparse_matrices_dict=None,
-                                          init_sparse_statevector=init_sparse_statevector)
+                                          init_sparse_statevector=init_sparse_statevector,
+                                          penalty_terms=q_system.get_penalty_terms(excited_state))
+        # numbers of non zero elements of the rows and columns of H, for the memory estimates of the commutators
+        self.H_counts = None
 
     def get_grad_thread_cache(self, ansatz_element, sparse_statevector):
         key = str(ansatz_element.excitations_generators)
         # commutator_sparse_matrix = self.commutators_sparse_matrices_dict[key].copy()
         # TODO not properly tested
         commutator_sparse_matrix = self.get_commutator_matrix(ansatz_element).copy()
+        # the excitation generators are needed only for the gradients of the excited state penalty terms
+        if self.penalty_terms:
+            exc_gen_sparse_matrices_dict = {key: self.get_sparse_matrices_list_copy(self.exc_gen_sparse_matrices_dict[key])}
+        else:
+            exc_gen_sparse_matrices_dict = None
 
         thread_cache = GradThreadCache(commutators_sparse_matrices_dict={key: commutator_sparse_matrix},
                                        sparse_statevector=sparse_statevector.copy(), n_qubits=self.q_system.n_qubits,
-                                       n_electrons=self.q_system.n_electrons)
+                                       n_electrons=self.q_system.n_electrons,
+                                       exc_gen_sparse_matrices_dict=exc_gen_sparse_matrices_dict,
+                                       penalty_terms=self.penalty_terms)
         return thread_cache
 
     def get_vqe_thread_cache(self):
         thread_cache = VQEThreadCache(H_sparse_matrix=self.H_sparse_matrix.copy(),
                                       exc_gen_sparse_matrices_dict=self.get_exc_gen_sparse_matrices_dict_copy(),
                                       sqr_exc_gen_sparse_matrices_dict=self.get_sqr_exc_gen_sparse_matrices_dict_copy(),
-                                      n_qubits=self.q_system.n_qubits, n_electrons=self.q_system.n_electrons)
+                                      n_qubits=self.q_system.n_qubits, n_electrons=self.q_system.n_electrons,
+                                      penalty_terms=self.penalty_terms)
         return thread_cache
 
     def single_par_vqe_thread_cache(self, ansatz_element, init_sparse_statevector):
@@ -227,45 +284,112 @@ class GlobalCache(Cache):
                                       init_sparse_statevector=init_sparse_statevector.copy(),
                                       n_qubits=self.q_system.n_qubits, n_electrons=self.q_system.n_electrons,
                                       exc_gen_sparse_matrices_dict={key: excitations_generators_matrices_copy},
-                                      sqr_exc_gen_sparse_matrices_dict={key: sqr_excitations_generators_matrices_copy}
-                                      )
+                                      sqr_exc_gen_sparse_matrices_dict={key: sqr_excitations_generators_matrices_copy},
+                                      penalty_terms=self.penalty_terms)
         return thread_cache
 
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< memory of the parallel stages >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    # estimated bytes of the copies sent with a task of each parallel stage (see the thread cache functions above)
+
+    # the bytes of the commutator of an element, or its upper bound (without cancellations) if not calculated yet
+    def commutator_nbytes(self, ansatz_element):
+        key = str(ansatz_element.excitations_generators)
+        if self.commutators_sparse_matrices_dict is not None and key in self.commutators_sparse_matrices_dict:
+            return MemoryUtils.nbytes(self.commutators_sparse_matrices_dict[key])
+        if self.H_counts is None:
+            self.H_counts = MemoryUtils.row_column_counts(self.H_sparse_matrix)
+        nnz = 0
+        for exc_gen_matrix in self.exc_gen_sparse_matrices_dict[key]:
+            exc_gen_counts = MemoryUtils.row_column_counts(exc_gen_matrix)
+            nnz += MemoryUtils.product_nnz(self.H_counts, exc_gen_counts) + \
+                MemoryUtils.product_nnz(exc_gen_counts, self.H_counts)
+        return MemoryUtils.csr_nbytes(min(nnz, 4 ** self.n_qubits), 2 ** self.n_qubits)
+
+    # the statevectors are sparse row vectors
+    def statevector_nbytes(self):
+        return MemoryUtils.csr_nbytes(2 ** self.n_qubits, 1)
+
+    # the commutator bytes can be passed if already calculated
+    def commutator_task_nbytes(self, ansatz_element, commutator_nbytes=None):
+        if commutator_nbytes is None:
+            commutator_nbytes = self.commutator_nbytes(ansatz_element)
+        return MemoryUtils.nbytes(self.H_sparse_matrix) + \
+            MemoryUtils.nbytes(self.exc_gen_sparse_matrices_dict[str(ansatz_element.excitations_generators)]) + \
+            commutator_nbytes
+
+    def grad_thread_cache_nbytes(self, ansatz_element):
+        n_bytes = self.commutator_nbytes(ansatz_element) + self.statevector_nbytes()
+        if self.penalty_terms:
+            n_bytes += MemoryUtils.nbytes(self.exc_gen_sparse_matrices_dict[str(ansatz_element.excitations_generators)])
+        return n_bytes
+
+    def vqe_thread_cache_nbytes(self):
+        return MemoryUtils.nbytes(self.H_sparse_matrix) + MemoryUtils.nbytes(self.exc_gen_sparse_matrices_dict) + \
+               MemoryUtils.nbytes(self.sqr_exc_gen_sparse_matrices_dict) + self.statevector_nbytes()
+
+    def single_par_vqe_thread_cache_nbytes(self, ansatz_element):
+        key = str(ansatz_element.excitations_generators)
+        return MemoryUtils.nbytes(self.H_sparse_matrix) + MemoryUtils.nbytes(self.exc_gen_sparse_matrices_dict[key]) + \
+            MemoryUtils.nbytes(self.sqr_exc_gen_sparse_matrices_dict[key]) + 2 * self.statevector_nbytes()
+
+    # the estimated peak memory of a planned parallel stage: the cache, the copies of the tasks running at the same
+    # time (workers x per task bytes) and the results collected by the driver. Logged, with a warning if it exceeds
+    # the available memory
+    def parallel_stage_memory(self, stage, per_task_nbytes, results_nbytes=0):
+        n_workers = MemoryUtils.n_workers() if config.multithread else 0
+        estimate = {'cache': self.memory_report()['total'], 'n_workers': n_workers, 'per_task': per_task_nbytes,
+                    'tasks': n_workers * per_task_nbytes, 'results': results_nbytes}
+        estimate['peak'] = estimate['cache'] + estimate['tasks'] + estimate['results']
+        available_memory = MemoryUtils.available_memory()
+
+        message = 'Estimated peak memory of {}: {} (cache {}, {} workers x {} per task, results {}). Available {}'\
+            .format(stage, MemoryUtils.format(estimate['peak']), MemoryUtils.format(estimate['cache']), n_workers,
+                    MemoryUtils.format(per_task_nbytes), MemoryUtils.format(results_nbytes),
+                    'unknown' if available_memory is None else MemoryUtils.format(available_memory))
+        if available_memory is not None and estimate['peak'] > config.memory_warning_fraction * available_memory:
+            logging.warning(message)
+        else:
+            logging.info(message)
+        return estimate
+
     def calculate_exc_gen_sparse_matrices_dict(self, ansatz_elements):
         logging.info('Calculating excitation generators')
-        exc_gen_sparse_matrices_dict = {}
-        sqr_exc_gen_sparse_matrices_dict = {}
-        if config.multithread:
-            ray.init(num_cpus=config.ray_options['n_cpus'], object_store_memory=config.ray_options['object_store_memory'])
-            elements_ray_ids = [
-                [
-                    element, GlobalCache.get_excitations_generators_matrices_multithread.remote(element, n_qubits=self.q_system.n_qubits)
+        with Instrumentation.phase('precompute'):
+            exc_gen_sparse_matrices_dict = {}
+            sqr_exc_gen_sparse_matrices_dict = {}
+            if config.multithread:
+                RayUtils.init(object_store_memory=config.ray_options['object_store_memory'])
+                elements_ray_ids = [
+                    [
+                        element, RayTasks.submit('generator_matrices',
+                                                 GlobalCache.get_excitations_generators_matrices_multithread, element,
+                                                 n_qubits=self.q_system.n_qubits)
+                    ]
+                    for element in ansatz_elements
                 ]
-                for element in ansatz_elements
-            ]
-            for element_ray_id in elements_ray_ids:
-                key = str(element_ray_id[0].excitations_generators)
-                exc_gen_sparse_matrices_dict[key] = ray.get(element_ray_id[1])[0]
-                sqr_exc_gen_sparse_matrices_dict[key] = ray.get(element_ray_id[1])[1]
-
-            del elements_ray_ids
-            ray.shutdown()
-        else:
-            for i, element in enumerate(ansatz_elements):
-                excitation_generators = element.excitations_generators
-                key = str(excitation_generators)
-                logging.info('Calculated excitation generator matrix {}'.format(key))
-                exc_gen_matrix_form = []
-                sqr_exc_gen_matrix_form = []
-                for term in excitation_generators:
-                    exc_gen_matrix_form.append(get_sparse_operator(term, n_qubits=self.q_system.n_qubits))
-                    sqr_exc_gen_matrix_form.append(exc_gen_matrix_form[-1]*exc_gen_matrix_form[-1])
-                exc_gen_sparse_matrices_dict[key] = exc_gen_matrix_form
-                sqr_exc_gen_sparse_matrices_dict[key] = sqr_exc_gen_matrix_form
+                for element_ray_id in elements_ray_ids:
+                    key = str(element_ray_id[0].excitations_generators)
+                    exc_gen_sparse_matrices_dict[key], sqr_exc_gen_sparse_matrices_dict[key] = \
+                        RayTasks.get(element_ray_id[1])
 
-        self.exc_gen_sparse_matrices_dict = exc_gen_sparse_matrices_dict
-        self.sqr_exc_gen_sparse_matrices_dict = sqr_exc_gen_sparse_matrices_dict
-        return exc_gen_sparse_matrices_dict
+                del elements_ray_ids
+                RayUtils.shutdown()
+            else:
+                for i, element in enumerate(ansatz_elements):
+                    excitation_generators = element.excitations_generators
+                    key = str(excitation_generators)
+                    logging.info('Calculated excitation generator matrix {}'.format(key))
+                    exc_gen_matrix_form = []
+                    sqr_exc_gen_matrix_form = []
+                    for term in excitation_generators:
+                        exc_gen_matrix_form.append(get_sparse_operator(term, n_qubits=self.q_system.n_qubits))
+                        sqr_exc_gen_matrix_form.append(exc_gen_matrix_form[-1]*exc_gen_matrix_form[-1])
+                    exc_gen_sparse_matrices_dict[key] = exc_gen_matrix_form
+                    sqr_exc_gen_sparse_matrices_dict[key] = sqr_exc_gen_matrix_form
+
+            self.exc_gen_sparse_matrices_dict = exc_gen_sparse_matrices_dict
+            self.sqr_exc_gen_sparse_matrices_dict = sqr_exc_gen_sparse_matrices_dict
+            return exc_gen_sparse_matrices_dict
 
     def calculate_commutators_sparse_matrices_dict(self, ansatz_elements):
         logging.info('Calculating commutators')
@@ -273,89 +397,93 @@ class GlobalCache(Cache):
         if self.exc_gen_sparse_matrices_dict is None:
             self.calculate_exc_gen_sparse_matrices_dict(ansatz_elements)
 
-        commutators = {}
-        if config.multithread:
-            chunk_size = config.multithread_chunk_size
-            if chunk_size is None:
-                chunk_size = len(ansatz_elements)
-            n_chunks = int(len(ansatz_elements) / chunk_size) + 1
-            for i in range(n_chunks):
-                logging.info('Calculating commutators, patch No: {}'.format(i))
-                ansatz_elements_chunk = ansatz_elements[i*chunk_size:][:chunk_size]
-
-                ray.init(num_cpus=config.ray_options['n_cpus'], object_store_memory=config.ray_options['object_store_memory'])
-                elements_ray_ids = [
-                    [
-                        element, GlobalCache.get_commutator_matrix_multithread.
-                        remote(self.get_sparse_matrices_list_copy(self.exc_gen_sparse_matrices_dict[str(element.excitations_generators)]),
-                               self.H_sparse_matrix.copy())
+        if len(ansatz_elements) > 0:
+            commutators_nbytes = [self.commutator_nbytes(element) for element in ansatz_elements]
+            task_nbytes = max([self.commutator_task_nbytes(element, commutator_nbytes) for element, commutator_nbytes
+                               in zip(ansatz_elements, commutators_nbytes)])
+            self.parallel_stage_memory('the commutators', task_nbytes, results_nbytes=sum(commutators_nbytes))
+
+        with Instrumentation.phase('precompute'):
+            commutators = {}
+            if config.multithread:
+                chunk_size = config.multithread_chunk_size
+                if chunk_size is None:
+                    chunk_size = len(ansatz_elements)
+                n_chunks = int(len(ansatz_elements) / chunk_size) + 1
+                for i in range(n_chunks):
+                    logging.info('Calculating commutators, patch No: {}'.format(i))
+                    ansatz_elements_chunk = ansatz_elements[i*chunk_size:][:chunk_size]
+
+                    RayUtils.init(object_store_memory=config.ray_options['object_store_memory'])
+                    elements_ray_ids = [
+                        [
+                            element, RayTasks.
+                            submit('commutators', GlobalCache.get_commutator_matrix_multithread,
+                                   self.get_sparse_matrices_list_copy(self.exc_gen_sparse_matrices_dict[str(element.excitations_generators)]),
+                                   self.H_sparse_matrix.copy())
+                        ]
+                        for element in ansatz_elements_chunk
                     ]
-                    for element in ansatz_elements_chunk
-                ]
-                for element_ray_id in elements_ray_ids:
-                    key = str(element_ray_id[0].excitations_generators)
-                    commutators[key] = ray.get(element_ray_id[1])
+                    for element_ray_id in elements_ray_ids:
+                        key = str(element_ray_id[0].excitations_generators)
+                        commutators[key] = RayTasks.get(element_ray_id[1])
 
-                del elements_ray_ids
-                ray.shutdown()
-        else:
-            for i, element in enumerate(ansatz_elements):
-                excitation_generator = element.excitations_generators
-                key = str(excitation_generator)
-                logging.info('Calculated commutator {}'.format(key))
-                exc_gen_sparse_matrix = sum(self.exc_gen_sparse_matrices_dict[key])
-                commutator_sparse_matrix = self.H_sparse_matrix * exc_gen_sparse_matrix - exc_gen_sparse_matrix * self.H_sparse_matrix
-                commutators[key] = commutator_sparse_matrix
+                    del elements_ray_ids
+                    RayUtils.shutdown()
+            else:
+                for i, element in enumerate(ansatz_elements):
+                    excitation_generator = element.excitations_generators
+                    key = str(excitation_generator)
+                    logging.info('Calculated commutator {}'.format(key))
+                    exc_gen_sparse_matrix = sum(self.exc_gen_sparse_matrices_dict[key])
+                    commutator_sparse_matrix = self.H_sparse_matrix * exc_gen_sparse_matrix - exc_gen_sparse_matrix * self.H_sparse_matrix
+                    commutators[key] = commutator_sparse_matrix
 
-        self.commutators_sparse_matrices_dict = commutators
-        return commutators
+            self.commutators_sparse_matrices_dict = commutators
+            return commutators
 
     @staticmethod
-    @ray.remote
     def get_commutator_matrix_multithread(excitations_generators_matrices, H_sparse_matrix):
-        t0 = time.time()
         exc_gen_matrices_sum = sum(excitations_generators_matrices)
         commutator_sparse_matrix = H_sparse_matrix * exc_gen_matrices_sum - exc_gen_matrices_sum * H_sparse_matrix
         del exc_gen_matrices_sum
         del H_sparse_matrix
         del excitations_generators_matrices
-        print('Calculated commutator time ', time.time() - t0)
         return commutator_sparse_matrix
 
     @staticmethod
-    @ray.remote
     def get_excitations_generators_matrices_multithread(ansatz_element, n_qubits):
-        t0 = time.time()
         # in the case of a spin complement pair, there are two generators for each excitation in the pair
         excitations_generators_matrices = []
         sqr_excitations_generators_matrices_form = []
         for term in ansatz_element.excitations_generators:
             excitations_generators_matrices.append(get_sparse_operator(term, n_qubits=n_qubits))
             sqr_excitations_generators_matrices_form.append(excitations_generators_matrices[-1]*excitations_generators_matrices[-1])
-
-        print('Calculated excitation matrix time ', time.time() - t0)
         return excitations_generators_matrices, sqr_excitations_generators_matrices_form
 
 
 class VQEThreadCache(Cache):
     def __init__(self, n_qubits, n_electrons, H_sparse_matrix=None, commutators_sparse_matrices_dict=None,
                  sparse_statevector=None, init_sparse_statevector=None, exc_gen_sparse_matrices_dict=None,
-                 sqr_exc_gen_sparse_matrices_dict=None):
+                 sqr_exc_gen_sparse_matrices_dict=None, penalty_terms=None):
 
         super(VQEThreadCache, self).__init__(H_sparse_matrix=H_sparse_matrix, n_qubits=n_qubits, n_electrons=n_electrons,
                                              exc_gen_sparse_matrices_dict=exc_gen_sparse_matrices_dict,
                                              sqr_exc_gen_sparse_matrices_dict=sqr_exc_gen_sparse_matrices_dict,
                                              commutators_sparse_matrices_dict=commutators_sparse_matrices_dict,
                                              sparse_statevector=sparse_statevector,
-                                             init_sparse_statevector=init_sparse_statevector)
+                                             init_sparse_statevector=init_sparse_statevector,
+                                             penalty_terms=penalty_terms)
 
 
 class GradThreadCache(Cache):
-    def __init__(self, n_qubits, n_electrons, commutators_sparse_matrices_dict, sparse_statevector, H_sparse_matrix=None):
+    def __init__(self, n_qubits, n_electrons, commutators_sparse_matrices_dict, sparse_statevector, H_sparse_matrix=None,
+                 exc_gen_sparse_matrices_dict=None, penalty_terms=None):
 
         super(GradThreadCache, self).__init__(H_sparse_matrix=H_sparse_matrix, n_qubits=n_qubits, n_electrons=n_electrons,
                                               commutators_sparse_matrices_dict=commutators_sparse_matrices_dict,
-                                              sparse_statevector=sparse_statevector)
+                                              exc_gen_sparse_matrices_dict=exc_gen_sparse_matrices_dict,
+                                              sparse_statevector=sparse_statevector, penalty_terms=penalty_terms)
 
     def get_statevector(self, ansatz, var_parameters, init_state_qasm=None):
         return self.sparse_statevector
@@ -0,0 +1,356 @@
+from src.utils import Gate
+
+import collections
+import logging
+import heapq
+import numpy
+
+
+class CircuitStats:
+    # Exact gate statistics of a circuit given as lists of Gates (see QasmUtils), updated incrementally as gates or
+    # ansatz elements are appended. The gate numbers of an element do not depend on its var. parameters.
+    # The depths are those of the ASAP layering of the circuit, tracked by the per-qubit frontiers: the layer of the
+    # last gate acting on each qubit. A gate is placed in the layer after the frontiers of its qubits, so appending a
+    # gate costs O(its number of qubits). The two-qubit (single-qubit) depth is the maximal number of two-qubit
+    # (single-qubit) gates along a path of the circuit.
+
+    two_qubit_gates = ['cx', 'swap']
+
+    def __init__(self, n_qubits):
+        self.n_qubits = n_qubits
+        self.elements = []  # the appended ansatz elements
+        self.gate_counts = collections.Counter()  # number of gates of each name
+        self.qubits_cnot_counts = [0] * n_qubits  # number of two-qubit gates acting on each qubit
+        self.qubits_u1_counts = [0] * n_qubits  # number of single-qubit gates acting on each qubit
+        self.cnot_count = 0
+        self.u1_count = 0
+        self.qubits_depth = [0] * n_qubits  # frontiers of the layering of all gates
+        self.qubits_cnot_depth = [0] * n_qubits  # frontiers of the layering of the two-qubit gates
+        self.qubits_u1_depth = [0] * n_qubits  # frontiers of the layering of the single-qubit gates
+
+    def append_gates(self, gates):
+        for gate in gates:
+            self.gate_counts[gate.name] += 1
+            if gate.name in self.two_qubit_gates:
+                self.cnot_count += 1
+                for qubit in gate.qubits:
+                    self.qubits_cnot_counts[qubit] += 1
+            else:
+                assert len(gate.qubits) == 1
+                self.u1_count += 1
+                self.qubits_u1_counts[gate.qubits[0]] += 1
+            self.update_depths(gate)
+
+    def update_depths(self, gate):
+        is_two_qubit_gate = gate.name in self.two_qubit_gates
+        depth = max([self.qubits_depth[qubit] for qubit in gate.qubits]) + 1
+        cnot_depth = max([self.qubits_cnot_depth[qubit] for qubit in gate.qubits]) + is_two_qubit_gate
+        u1_depth = max([self.qubits_u1_depth[qubit] for qubit in gate.qubits]) + (not is_two_qubit_gate)
+        for qubit in gate.qubits:
+            self.qubits_depth[qubit] = depth
+            self.qubits_cnot_depth[qubit] = cnot_depth
+            self.qubits_u1_depth[qubit] = u1_depth
+
+    @property
+    def depth(self):
+        return max(self.qubits_depth, default=0)
+
+    @property
+    def cnot_depth(self):
+        return max(self.qubits_cnot_depth, default=0)
+
+    @property
+    def u1_depth(self):
+        return max(self.qubits_u1_depth, default=0)
+
+    def append_element(self, ansatz_element):
+        self.append_gates(ansatz_element.get_gates([0] * ansatz_element.n_var_parameters))
+        self.elements.append(ansatz_element)
+
+    # the statistics in the format of QasmUtils.gate_count_from_qasm (which approximates the depths by the maximal
+    # per-qubit gate counts), and the total depth
+    def gate_count(self):
+        gate_counter = {}
+        for i in range(self.n_qubits):
+            gate_counter['q{}'.format(i)] = {'cx': self.qubits_cnot_counts[i], 'u1': self.qubits_u1_counts[i]}
+        return {'gate_count': gate_counter, 'u1_depth': self.u1_depth, 'cnot_depth': self.cnot_depth,
+                'cnot_count': self.cnot_count, 'u1_count': self.u1_count, 'depth': self.depth}
+
+    def copy(self):
+        circuit_stats = CircuitStats(self.n_qubits)
+        circuit_stats.elements = list(self.elements)
+        circuit_stats.gate_counts = collections.Counter(self.gate_counts)
+        circuit_stats.qubits_cnot_counts = list(self.qubits_cnot_counts)
+        circuit_stats.qubits_u1_counts = list(self.qubits_u1_counts)
+        circuit_stats.cnot_count = self.cnot_count
+        circuit_stats.u1_count = self.u1_count
+        circuit_stats.qubits_depth = list(self.qubits_depth)
+        circuit_stats.qubits_cnot_depth = list(self.qubits_cnot_depth)
+        circuit_stats.qubits_u1_depth = list(self.qubits_u1_depth)
+        return circuit_stats
+
+    # whether the elements are the first elements of the ansatz
+    @staticmethod
+    def is_prefix(elements, ansatz):
+        return len(elements) <= len(ansatz) and \
+            all(element is ansatz_element for element, ansatz_element in zip(elements, ansatz))
+
+    # the statistics of the ansatz of the last call to from_ansatz, and of that ansatz without its last element (the
+    # common part of the ansatz of the consecutive calls in iterative VQEs: the ansatz extended by each candidate
+    # element, then the ansatz extended by the selected one), for each number of qubits
+    ansatz_stats_dict = {}
+    base_stats_dict = {}
+
+    # statistics of an ansatz. Only the elements that are not in the base statistics are counted, in a copy of them
+    @staticmethod
+    def from_ansatz(ansatz, n_qubits):
+        circuit_stats = CircuitStats.ansatz_stats_dict.get(n_qubits)
+        if circuit_stats is not None and len(circuit_stats.elements) == len(ansatz) and \
+                CircuitStats.is_prefix(circuit_stats.elements, ansatz):
+            return circuit_stats
+
+        base_stats = CircuitStats.base_stats_dict.get(n_qubits)
+        if base_stats is None or not CircuitStats.is_prefix(base_stats.elements, ansatz):
+            base_stats = CircuitStats(n_qubits)
+        for ansatz_element in ansatz[len(base_stats.elements):-1]:
+            base_stats.append_element(ansatz_element)
+
+        circuit_stats = base_stats.copy()
+        for ansatz_element in ansatz[len(circuit_stats.elements):]:
+            circuit_stats.append_element(ansatz_element)
+
+        CircuitStats.base_stats_dict[n_qubits] = base_stats
+        CircuitStats.ansatz_stats_dict[n_qubits] = circuit_stats
+        return circuit_stats
+
+
+class PeepholeOptimizer:
+    # Peephole optimization of ansatz circuits, across the boundaries of the ansatz elements. The circuit is built with
+    # affine angles (offset, ((var. parameter index, coefficient), ...)), so the optimized circuit is valid for all
+    # var. parameters and its gate numbers do not depend on them. Each appended gate is moved back through the gates
+    # it commutes with, and then
+    #  - cancels with an equal self-inverse gate,
+    #  - or merges with a rotation of the same type on the same qubit (the rotation is dropped if its angle is a
+    #    constant multiple of 4pi),
+    #  - or is placed after the first gate it does not commute with.
+    # Diagonal gates (rz, z) commute through the controls of CNOTs, X type gates (rx, x) through their targets, and
+    # CNOTs sharing only their control or only their target commute.
+    # The gates are optimized in a single pass in the order they are appended, so the state of the optimizer after the
+    # gates of an ansatz is the state of any ansatz extending it, and the elements can be appended incrementally (see
+    # from_ansatz).
+
+    self_inverse_gates = ['cx', 'swap', 'h', 'x', 'y', 'z']
+    rotation_gates = ['rx', 'ry', 'rz']
+    diagonal_gates = ['rz', 'z']
+    x_type_gates = ['rx', 'x']
+
+    angle_tolerance = 1e-10
+
+    def __init__(self):
+        self.elements = []  # the appended ansatz elements
+        self.n_var_parameters = 0  # the number of var. parameters of the appended elements
+        self.n_gates = 0  # the number of appended (unoptimized) gates
+        self.n_cnots = 0
+        self.optimized_gates = []  # the optimized gates, with None in place of the removed ones
+        self.qubits_gates = collections.defaultdict(list)  # indices of the optimized gates acting on each qubit
+        self.optimized_circuit_stats = None
+
+    def copy(self):
+        optimizer = PeepholeOptimizer()
+        optimizer.elements = list(self.elements)
+        optimizer.n_var_parameters = self.n_var_parameters
+        optimizer.n_gates = self.n_gates
+        optimizer.n_cnots = self.n_cnots
+        optimizer.optimized_gates = list(self.optimized_gates)
+        for qubit, indices in self.qubits_gates.items():
+            optimizer.qubits_gates[qubit] = list(indices)
+        return optimizer
+
+    # the gates of an ansatz element, with the angles as affine functions of the var. parameters of the ansatz, where
+    # the parameters of the element start at the index first_var_parameter
+    @staticmethod
+    def element_affine_gates(element, first_var_parameter):
+        gates = []
+        n_var_parameters = element.n_var_parameters
+        zero_gates = element.get_gates([0] * n_var_parameters)
+        unit_gates = []
+        for i in range(n_var_parameters):
+            var_parameters = [0] * n_var_parameters
+            var_parameters[i] = 1
+            unit_gates.append(element.get_gates(var_parameters))
+
+        for j, gate in enumerate(zero_gates):
+            for element_gates in unit_gates:
+                assert element_gates[j].name == gate.name and element_gates[j].qubits == gate.qubits
+            if gate.angle is None:
+                gates.append(gate)
+            else:
+                offset = float(gate.angle)
+                coefficients = tuple((first_var_parameter + i, float(element_gates[j].angle) - offset)
+                                     for i, element_gates in enumerate(unit_gates)
+                                     if float(element_gates[j].angle) != offset)
+                gates.append(Gate(gate.name, tuple(gate.qubits), (offset, coefficients)))
+
+        return gates
+
+    # the gates of an ansatz, with the angles as affine functions of the var. parameters of the ansatz
+    @staticmethod
+    def affine_gates(ansatz):
+        gates = []
+        n_used_var_pars = 0
+        for element in ansatz:
+            gates += PeepholeOptimizer.element_affine_gates(element, n_used_var_pars)
+            n_used_var_pars += element.n_var_parameters
+        return gates
+
+    @staticmethod
+    def add_angles(angle_1, angle_2):
+        coefficients = collections.OrderedDict(angle_1[1])
+        for index, coefficient in angle_2[1]:
+            coefficients[index] = coefficients.get(index, 0) + coefficient
+        coefficients = tuple((index, coefficient) for index, coefficient in coefficients.items()
+                             if abs(coefficient) > PeepholeOptimizer.angle_tolerance)
+        return angle_1[0] + angle_2[0], coefficients
+
+    @staticmethod
+    def is_identity_angle(angle):
+        offset, coefficients = angle
+        remainder = numpy.remainder(offset, 4 * numpy.pi)
+        return len(coefficients) == 0 and min(remainder, 4 * numpy.pi - remainder) < PeepholeOptimizer.angle_tolerance
+
+    # whether two gates acting on common qubits commute (conservatively)
+    @staticmethod
+    def commute(gate_1, gate_2):
+        if len(gate_1.qubits) == 1 and len(gate_2.qubits) == 1:
+            return (gate_1.name in PeepholeOptimizer.diagonal_gates and gate_2.name in PeepholeOptimizer.diagonal_gates)\
+                or (gate_1.name in PeepholeOptimizer.x_type_gates and gate_2.name in PeepholeOptimizer.x_type_gates)
+
+        if len(gate_1.qubits) == 1:
+            gate_1, gate_2 = gate_2, gate_1
+        if gate_1.name != 'cx':
+            return False
+        control, target = gate_1.qubits
+
+        if len(gate_2.qubits) == 1:
+            if gate_2.qubits[0] == control:
+                return gate_2.name in PeepholeOptimizer.diagonal_gates
+            else:
+                return gate_2.name in PeepholeOptimizer.x_type_gates
+
+        if gate_2.name != 'cx':
+            return False
+        return gate_2.qubits[0] != target and gate_2.qubits[1] != control
+
+    def append_gates(self, gates):
+        optimized_gates = self.optimized_gates
+        qubits_gates = self.qubits_gates
+
+        for gate in gates:
+            self.n_gates += 1
+            self.n_cnots += gate.name == 'cx'
+            placed = False
+            previous_indices = heapq.merge(*[reversed(qubits_gates[qubit]) for qubit in gate.qubits], reverse=True)
+            last_index = None
+            for index in previous_indices:
+                previous_gate = optimized_gates[index]
+                if index == last_index or previous_gate is None:
+                    continue
+                last_index = index
+
+                if previous_gate.name == gate.name and previous_gate.qubits == gate.qubits:
+                    if gate.name in PeepholeOptimizer.self_inverse_gates:
+                        optimized_gates[index] = None
+                        placed = True
+                        break
+                    if gate.name in PeepholeOptimizer.rotation_gates:
+                        angle = PeepholeOptimizer.add_angles(previous_gate.angle, gate.angle)
+                        if PeepholeOptimizer.is_identity_angle(angle):
+                            optimized_gates[index] = None
+                        else:
+                            optimized_gates[index] = Gate(gate.name, gate.qubits, angle)
+                        placed = True
+                        break
+
+                if not PeepholeOptimizer.commute(gate, previous_gate):
+                    break
+
+            if not placed:
+                if gate.name in PeepholeOptimizer.rotation_gates and PeepholeOptimizer.is_identity_angle(gate.angle):
+                    continue
+                for qubit in gate.qubits:
+                    qubits_gates[qubit].append(len(optimized_gates))
+                optimized_gates.append(gate)
+
+    def append_element(self, ansatz_element):
+        self.append_gates(PeepholeOptimizer.element_affine_gates(ansatz_element, self.n_var_parameters))
+        self.n_var_parameters += ansatz_element.n_var_parameters
+        self.elements.append(ansatz_element)
+
+    def gates(self):
+        return [gate for gate in self.optimized_gates if gate is not None]
+
+    @staticmethod
+    def optimize(gates):
+        optimizer = PeepholeOptimizer()
+        optimizer.append_gates(gates)
+        return optimizer.gates()
+
+    # the gates with the angles evaluated at the var. parameters (numbers or qiskit Parameters)
+    @staticmethod
+    def bind(gates, var_parameters):
+        bound_gates = []
+        for gate in gates:
+            if gate.angle is None:
+                bound_gates.append(gate)
+            else:
+                offset, coefficients = gate.angle
+                angle = offset
+                for index, coefficient in coefficients:
+                    angle = angle + coefficient * var_parameters[index]
+                bound_gates.append(Gate(gate.name, gate.qubits, angle))
+        return bound_gates
+
+    # the statistics of the optimized gates, memoized (the optimizers returned by from_ansatz are not modified)
+    def circuit_stats(self, n_qubits):
+        if self.optimized_circuit_stats is None or self.optimized_circuit_stats.n_qubits != n_qubits:
+            self.optimized_circuit_stats = CircuitStats(n_qubits)
+            self.optimized_circuit_stats.append_gates(self.gates())
+        return self.optimized_circuit_stats
+
+    # the optimizer of the ansatz of the last call to from_ansatz, and the optimizer of that ansatz without its last
+    # element: the common part of the ansatz of the consecutive calls in iterative VQEs (the ansatz extended by each
+    # candidate element, then the ansatz extended by the selected one)
+    last_optimizer = None
+    base_optimizer = None
+
+    # the optimizer of an ansatz. Only the elements that are not in the base optimizer are optimized, in a copy of it
+    @staticmethod
+    def from_ansatz(ansatz):
+        last_optimizer = PeepholeOptimizer.last_optimizer
+        if last_optimizer is not None and len(last_optimizer.elements) == len(ansatz) and \
+                CircuitStats.is_prefix(last_optimizer.elements, ansatz):
+            return last_optimizer
+
+        base_optimizer = PeepholeOptimizer.base_optimizer
+        if base_optimizer is None or not CircuitStats.is_prefix(base_optimizer.elements, ansatz):
+            base_optimizer = PeepholeOptimizer()
+        for ansatz_element in ansatz[len(base_optimizer.elements):-1]:
+            base_optimizer.append_element(ansatz_element)
+
+        optimizer = base_optimizer.copy()
+        for ansatz_element in ansatz[len(optimizer.elements):]:
+            optimizer.append_element(ansatz_element)
+
+        PeepholeOptimizer.base_optimizer = base_optimizer
+        PeepholeOptimizer.last_optimizer = optimizer
+        return optimizer
+
+    # the optimized gates of an ansatz. The CNOT counts before and after the optimization are logged
+    @staticmethod
+    def optimized_ansatz_gates(ansatz):
+        optimizer = PeepholeOptimizer.from_ansatz(ansatz)
+        optimized_gates = optimizer.gates()
+        logging.debug('Peephole optimization: {} -> {} CNOTs, {} -> {} gates'
+                      .format(optimizer.n_cnots, sum([gate.name == 'cx' for gate in optimized_gates]),
+                              optimizer.n_gates, len(optimized_gates)))
+        return optimized_gates
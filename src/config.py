@@ -3,15 +3,59 @@ multithread = True
 ray_options = {'n_cpus': 3, 'object_store_memory': None}
 multithread_chunk_size = 1000  # number of objects (e.g. commutators) to simultaneously calculate with ray
 qiskit_n_threads = 1
+qiskit_circuit_cache_size = 200  # number of parameterized ansatz circuits kept by the qiskit backend
+qiskit_batch_circuits = True  # screen the ansatz elements by executing all their circuits in batched qiskit jobs
+qiskit_batch_size = 256  # number of circuits per batched job
+qiskit_batch_n_threads = 0  # threads of a batched job (0 = all available)
+qiskit_max_parallel_experiments = 0  # circuits of a batched job executed in parallel (0 = as many as the threads)
+optimize_circuits = True  # peephole optimization of the simulated ansatz circuits (see PeepholeOptimizer)
+
+# shot sampling backend
+n_shots = 10000  # shots per energy estimate, distributed over the measurement groups
+shot_sampler = 'numpy'  # 'numpy' (sample the exact statevector) or 'aer' (qasm simulator)
+shots_seed = None
+shots_min_per_group = 10
+shots_min_weight_fraction = 1e-2  # lower bound of the standard deviation used for allocation, relative to the group weight
+
+# count hot path events and time the phases of the runs (see Instrumentation)
+instrumentation = False
+# record the payload sizes and the timings of the ray tasks (see RayTasks)
+task_telemetry = False
+task_telemetry_trace = None  # Chrome trace file of the ray tasks, written when an AdaptSession is closed
 
 # numerical accuracy
 floating_point_accuracy = 10e-15
 floating_point_accuracy_digits = 15
 matrix_size_threshold = 1e7  # in bytes
+memory_warning_fraction = 0.9  # warn if a parallel stage is estimated to use more of the available memory
+
+# directory of the cached molecular data (integrals, energies). None = molecular_data in the repository root
+molecular_data_directory = None
+
+# run logs of iterative VQEs (see RunLog). None = results/run_logs in the repository root
+run_log_directory = None
+checkpoint_interval = 10  # number of iteration records between checkpoints of the full run state
+
+# screening of the element pools of iterative VQEs against the Hamiltonian, before the precompute (see PoolScreening)
+pool_screening = True
+group_spin_complements = True  # evaluate one element of each spin complement pair, if the ansatz keeps the pairs
+
+# sector eigensolver
+eigensolver_dense_dimension = 1000  # sectors up to this dimension are diagonalized densely
+eigensolver_tol = 1e-7  # residual norm tolerance of LOBPCG
+eigensolver_max_iterations = 200
 
 # optimizer options
 default_optimizer = 'BFGS'
 default_optimizer_options = {'gtol': 10e-8}
 optimizer_tol = 1e-10
 optimizer_bounds = None
+vqe_stall_n_iterations = 10  # number of optimizer iterations without energy decrease after which a VQE run is stalled
+
+# precision schedule for iterative VQEs (see PrecisionSchedule). The final VQE uses the default optimizer tolerances
+screening_optimizer_tol = 1e-6  # candidate VQEs, used only to rank ansatz elements
+screening_optimizer_gtol = 1e-4
+iteration_optimizer_tol = 1e-8  # intermediate iteration VQEs
+iteration_optimizer_gtol = 1e-6
+precision_tightening_factor = 1e-2  # the tolerances are tightened to this fraction of the last energy change
 
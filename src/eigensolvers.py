@@ -0,0 +1,92 @@
+from src import config
+from src.basis_indices import BasisIndices
+
+import hashlib
+import scipy
+import scipy.sparse.linalg
+import numpy
+import logging
+import time
+
+
+class SectorEigensolver:
+    # Lowest eigenpairs of a sparse Hamiltonian, restricted to the basis states with a fixed number of electrons (and
+    # optionally fixed Sz). The JW encoding is assumed (see BasisIndices).
+
+    # eigenpairs memoized for each (Hamiltonian fingerprint, n_electrons, sz): [eigenvalues, sector eigenvectors]
+    eigenpairs = {}
+
+    # the last eigenvectors calculated for each (n_qubits, n_electrons, sz), used as warm starts for other
+    # Hamiltonians in the same sector (e.g. the next point of a dissociation curve)
+    warm_starts = {}
+
+    @staticmethod
+    def fingerprint(H_sparse_matrix):
+        H_sparse_matrix = H_sparse_matrix.tocsr()
+        H_sparse_matrix.sum_duplicates()
+        fingerprint = hashlib.sha1()
+        for array in [H_sparse_matrix.data, H_sparse_matrix.indices, H_sparse_matrix.indptr]:
+            fingerprint.update(numpy.ascontiguousarray(array).tobytes())
+        return fingerprint.hexdigest()
+
+    # return the k lowest eigenvalues and the corresponding eigenvectors (as columns, in the full space)
+    @staticmethod
+    def lowest_eigenpairs(H_sparse_matrix, n_qubits, n_electrons, k, sz=None):
+        t0 = time.time()
+        indices = BasisIndices.sector_indices(n_qubits, n_electrons, sz)
+        key = (SectorEigensolver.fingerprint(H_sparse_matrix), n_electrons, sz)
+
+        if key in SectorEigensolver.eigenpairs and len(SectorEigensolver.eigenpairs[key][0]) >= k:
+            eigenvalues, eigenvectors = SectorEigensolver.eigenpairs[key]
+        else:
+            H_sector = BasisIndices.sector_matrix(H_sparse_matrix, n_qubits, n_electrons, sz)
+            dimension = len(indices)
+            k = min(k, dimension)
+
+            # previous eigenvectors of the same system or sector
+            warm_start = SectorEigensolver.warm_starts.get((n_qubits, n_electrons, sz))
+            if key in SectorEigensolver.eigenpairs:
+                warm_start = SectorEigensolver.eigenpairs[key][1]
+
+            if dimension <= config.eigensolver_dense_dimension or k >= dimension - 1:
+                eigenvalues, eigenvectors = numpy.linalg.eigh(H_sector.toarray())
+                eigenvalues, eigenvectors = eigenvalues[:k], eigenvectors[:, :k]
+            else:
+                eigenvalues, eigenvectors = SectorEigensolver.sparse_eigenpairs(H_sector, k, warm_start)
+
+            SectorEigensolver.eigenpairs[key] = [eigenvalues, eigenvectors]
+            SectorEigensolver.warm_starts[(n_qubits, n_electrons, sz)] = eigenvectors
+            logging.info('Sector eigensolver: dimension {}, {} eigenpairs. Time {}'
+                         .format(dimension, k, time.time() - t0))
+
+        return eigenvalues[:k], BasisIndices.from_sector(eigenvectors[:, :k], n_qubits, n_electrons, sz)
+
+    # LOBPCG starting from the warm start block if available, completed with random vectors (if the block is small
+    # compared to the dimension). A block method finds all the degenerate eigenvectors (e.g. of spin multiplets), which
+    # single vector Lanczos can miss. Otherwise, or if LOBPCG does not converge, Lanczos (eigsh) starting from the
+    # lowest warm start vector
+    @staticmethod
+    def sparse_eigenpairs(H_sector, k, warm_start=None):
+        dimension = H_sector.shape[0]
+        if warm_start is not None and warm_start.shape[0] != dimension:
+            warm_start = None
+        if 5 * k < dimension:
+            dtype = H_sector.dtype if warm_start is None else numpy.result_type(H_sector.dtype, warm_start.dtype)
+            block = numpy.random.default_rng(0).normal(size=(dimension, k)).astype(dtype)
+            if warm_start is not None:
+                n_warm = min(k, warm_start.shape[1])
+                block[:, :n_warm] = warm_start[:, :n_warm]
+            eigenvalues, eigenvectors, residuals = \
+                scipy.sparse.linalg.lobpcg(H_sector, block, largest=False, tol=config.eigensolver_tol,
+                                           maxiter=config.eigensolver_max_iterations, retResidualNormsHistory=True)
+            if max(residuals[-1]) < config.eigensolver_tol:
+                order = numpy.argsort(eigenvalues)
+                return eigenvalues[order], eigenvectors[:, order]
+            logging.info('LOBPCG did not converge, using eigsh')
+
+        v0 = None
+        if warm_start is not None:
+            v0 = warm_start[:, 0]
+        eigenvalues, eigenvectors = scipy.sparse.linalg.eigsh(H_sector, k=k, which='SA', v0=v0)
+        order = numpy.argsort(eigenvalues)
+        return eigenvalues[order], eigenvectors[:, order]
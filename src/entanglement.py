@@ -0,0 +1,43 @@
+import numpy
+
+
+class EntanglementUtils:
+    # Reduced density matrices and entanglement entropies of statevectors in the openfermion qubit ordering (qubit q
+    # corresponds to the bit n_qubits - 1 - q of the basis state index). All functions accept a single statevector, or
+    # a batch of statevectors as the rows of a 2D array.
+
+    # return the statevectors as an array of shape (n_states, 2^n_A, 2^n_B), where A are qubits_A (in the given order)
+    # and B are the remaining qubits
+    @staticmethod
+    def bipartition(statevectors, qubits_A):
+        statevectors = numpy.atleast_2d(statevectors)
+        n_states = statevectors.shape[0]
+        n_qubits = int(numpy.log2(statevectors.shape[1]))
+        assert 2 ** n_qubits == statevectors.shape[1]
+
+        qubits_A = list(qubits_A)
+        assert len(set(qubits_A)) == len(qubits_A) and len(qubits_A) < n_qubits
+        qubits_B = [qubit for qubit in range(n_qubits) if qubit not in qubits_A]
+
+        tensor = statevectors.reshape((n_states,) + (2,) * n_qubits)
+        tensor = tensor.transpose([0] + [1 + qubit for qubit in qubits_A + qubits_B])
+        return tensor.reshape(n_states, 2 ** len(qubits_A), 2 ** len(qubits_B))
+
+    # reduced density matrices rho_A = Tr_B |psi><psi|, of shape (n_states, 2^n_A, 2^n_A)
+    @staticmethod
+    def reduced_density_matrices(statevectors, qubits_A):
+        psi = EntanglementUtils.bipartition(statevectors, qubits_A)
+        return numpy.matmul(psi, psi.conj().transpose(0, 2, 1))
+
+    # von Neumann entropies -Tr(rho_A ln rho_A), from the eigenvalues of the smaller of the reduced density matrices of
+    # A and B (they have the same non zero spectrum)
+    @staticmethod
+    def entanglement_entropies(statevectors, qubits_A):
+        psi = EntanglementUtils.bipartition(statevectors, qubits_A)
+        if psi.shape[1] > psi.shape[2]:
+            psi = psi.transpose(0, 2, 1)
+        rho = numpy.matmul(psi, psi.conj().transpose(0, 2, 1))
+
+        eigenvalues = numpy.linalg.eigvalsh(rho)
+        eigenvalues = numpy.where(eigenvalues > 0, eigenvalues, 1)  # 0 ln 0 = 0 (also drops round-off negatives)
+        return -(eigenvalues * numpy.log(eigenvalues)).sum(axis=1)
@@ -0,0 +1,57 @@
+from src import config
+
+import collections
+import contextlib
+import time
+
+
+class Instrumentation:
+    # Counters of hot path events (statevector builds, cache hits and misses, sparse matrix-vector products, optimizer
+    # evaluations) and timers of named phases (precompute, gradient screening, candidate VQEs, iteration and final
+    # VQEs), enabled by config.instrumentation. The hot paths check config.instrumentation before counting, so disabled
+    # instrumentation costs one attribute lookup per event. The counters are kept per process: the events of ray workers
+    # are summarized with the results of the worker tasks (see VQERunner.vqe_run_multithread), not added here.
+
+    counters = collections.Counter()
+    phase_times = collections.Counter()
+    phase_counts = collections.Counter()
+
+    @staticmethod
+    def count(name, n=1):
+        Instrumentation.counters[name] += n
+
+    # time the enclosed code as an occurrence of the named phase
+    @staticmethod
+    @contextlib.contextmanager
+    def phase(name):
+        if not config.instrumentation:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            Instrumentation.phase_times[name] += time.perf_counter() - t0
+            Instrumentation.phase_counts[name] += 1
+
+    @staticmethod
+    def reset():
+        Instrumentation.counters.clear()
+        Instrumentation.phase_times.clear()
+        Instrumentation.phase_counts.clear()
+
+    # a copy of the current counts, to summarize the events after it (see summary)
+    @staticmethod
+    def snapshot():
+        return [collections.Counter(Instrumentation.counters), collections.Counter(Instrumentation.phase_times),
+                collections.Counter(Instrumentation.phase_counts)]
+
+    # the counts and the phase times (in seconds) since a snapshot (or in total), as a JSON serializable dictionary
+    @staticmethod
+    def summary(snapshot=None):
+        if snapshot is None:
+            snapshot = [collections.Counter(), collections.Counter(), collections.Counter()]
+        counters, phase_times, phase_counts = snapshot
+        return {'counts': dict(Instrumentation.counters - counters),
+                'phase_times': dict(Instrumentation.phase_times - phase_times),
+                'phase_counts': dict(Instrumentation.phase_counts - phase_counts)}
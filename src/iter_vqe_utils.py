@@ -1,15 +1,18 @@
-from openfermion import get_sparse_operator, QubitOperator
 from src import config
 from src import backends
 from src.ansatz_elements import *
-from src.utils import QasmUtils
+from src.utils import QasmUtils, RayUtils
+from src.circuits import CircuitStats, PeepholeOptimizer
+from src.instrumentation import Instrumentation
+from src.ray_tasks import RayTasks
 from src.state import State
 
 import time
-import ray
+import json
 import ast
+import copy
 import numpy
-import scipy
+import logging
 
 
 class IterVQEQasmUtils:
@@ -20,8 +23,13 @@ class IterVQEQasmUtils:
             var_parameters = numpy.zeros(n_var_parameters)
         else:
             assert n_var_parameters == len(var_parameters)
-        qasm = backends.QiskitSimBackend.qasm_from_ansatz(ansatz, var_parameters)
-        return QasmUtils.gate_count_from_qasm(qasm, n_qubits)
+        # the gate numbers do not depend on the var. parameters
+        gate_count = CircuitStats.from_ansatz(ansatz, n_qubits).gate_count()
+        if config.optimize_circuits:
+            optimized_circuit_stats = PeepholeOptimizer.from_ansatz(ansatz).circuit_stats(n_qubits)
+            gate_count['optimized_cnot_count'] = optimized_circuit_stats.cnot_count
+            gate_count['optimized_cnot_depth'] = optimized_circuit_stats.cnot_depth
+        return gate_count
 
 
 class EnergyUtils:
@@ -45,24 +53,28 @@ class EnergyUtils:
             else:
                 return None
 
-        if config.multithread:
-            ray.init(num_cpus=config.ray_options['n_cpus'])
-            elements_ray_ids = [
-                [element,
-                 vqe_runner.vqe_run_multithread.remote(self=vqe_runner, ansatz=ansatz + [element],
-                                                       init_guess_parameters=ansatz_parameters + [elements_parameters[i]],
-                                                       cache=get_thread_cache(), excited_state=excited_state)]
-                for i, element in enumerate(ansatz_elements)
-            ]
-            elements_results = [[element_ray_id[0], ray.get(element_ray_id[1])] for element_ray_id in elements_ray_ids]
-            ray.shutdown()
-        else:
-            elements_results = [
-                [element, vqe_runner.vqe_run(ansatz=ansatz + [element], excited_state=excited_state,
-                                             init_guess_parameters=ansatz_parameters + [elements_parameters[i]],
-                                             cache=global_cache)]
-                for i, element in enumerate(ansatz_elements)
-            ]
+        with Instrumentation.phase('candidate_vqes'):
+            if config.multithread:
+                if global_cache is not None:
+                    global_cache.parallel_stage_memory('the candidate VQEs', global_cache.vqe_thread_cache_nbytes())
+                RayUtils.init()
+                elements_ray_ids = [
+                    [element,
+                     RayTasks.submit('candidate_vqes', vqe_runner.vqe_run_multithread, ansatz=ansatz + [element],
+                                     init_guess_parameters=ansatz_parameters + [elements_parameters[i]],
+                                     cache=get_thread_cache(), excited_state=excited_state)]
+                    for i, element in enumerate(ansatz_elements)
+                ]
+                elements_results = [[element_ray_id[0], RayTasks.get(element_ray_id[1])]
+                                    for element_ray_id in elements_ray_ids]
+                RayUtils.shutdown()
+            else:
+                elements_results = [
+                    [element, vqe_runner.vqe_run(ansatz=ansatz + [element], excited_state=excited_state,
+                                                 init_guess_parameters=ansatz_parameters + [elements_parameters[i]],
+                                                 cache=global_cache)]
+                    for i, element in enumerate(ansatz_elements)
+                ]
 
         return elements_results
 
@@ -93,6 +105,14 @@ class EnergyUtils:
         if elements_parameters is None:
             elements_parameters = list(numpy.zeros(len(ansatz_elements)))
 
+        # the energy of each element is reconstructed from a fixed set of circuits and minimized globally, so the
+        # elements_parameters initial guesses are not needed
+        if vqe_runner.backend == backends.QiskitSimBackend and config.qiskit_batch_circuits:
+            elements_results = vqe_runner.backend.\
+                ansatz_elements_individual_vqes(ansatz_elements, ansatz_parameters, ansatz, vqe_runner.q_system,
+                                                excited_state=excited_state)
+            return [[element, result] for element, result in zip(ansatz_elements, elements_results)]
+
         if vqe_runner.backend == backends.QiskitSimBackend:
             ansatz_qasm = QasmUtils.hf_state(vqe_runner.q_system.n_electrons)
             ansatz_qasm += vqe_runner.backend.qasm_from_ansatz(ansatz, ansatz_parameters)
@@ -107,6 +127,10 @@ class EnergyUtils:
                 return None
 
         if config.multithread:
+            if global_cache is not None and len(ansatz_elements) > 0:
+                global_cache.parallel_stage_memory('the candidate VQEs',
+                                                   max([global_cache.single_par_vqe_thread_cache_nbytes(element)
+                                                        for element in ansatz_elements]))
             elements_results = []
             chunk_size = config.multithread_chunk_size
             if chunk_size is None:
@@ -116,19 +140,19 @@ class EnergyUtils:
                 # logging.info('Calculating commutators, patch No: {}'.format(i))
                 ansatz_elements_chunk = ansatz_elements[i * chunk_size:][:chunk_size]
 
-                ray.init(num_cpus=config.ray_options['n_cpus'], object_store_memory=config.ray_options['object_store_memory'])
+                RayUtils.init(object_store_memory=config.ray_options['object_store_memory'])
                 elements_ray_ids = [
                     [element,
-                     vqe_runner.vqe_run_multithread.remote(self=vqe_runner, ansatz=[element], init_state_qasm=ansatz_qasm,
-                                                           init_guess_parameters=[elements_parameters[i]],
-                                                           excited_state=excited_state, cache=get_thread_cache(element))
+                     RayTasks.submit('candidate_vqes', vqe_runner.vqe_run_multithread, ansatz=[element],
+                                     init_state_qasm=ansatz_qasm, init_guess_parameters=[elements_parameters[i]],
+                                     excited_state=excited_state, cache=get_thread_cache(element))
                      ]
                     # TODO this will work only if the ansatz element has 1 var. par.
                     for i, element in enumerate(ansatz_elements_chunk)
                 ]
-                elements_results += [[element_ray_id[0], ray.get(element_ray_id[1])] for element_ray_id in
+                elements_results += [[element_ray_id[0], RayTasks.get(element_ray_id[1])] for element_ray_id in
                                      elements_ray_ids]
-                ray.shutdown()
+                RayUtils.shutdown()
         else:
             # use thread cache even if not multithreading since it contains the precalculated init_sparse_statevector
             elements_results = [
@@ -146,12 +170,11 @@ class EnergyUtils:
     def largest_individual_vqe_energy_reduction_elements(vqe_runner, elements, elements_parameters=None, ansatz=None,
                                                          ansatz_parameters=None, global_cache=None, n=1, excited_state=0):
 
-        elements_results = EnergyUtils.elements_individual_vqe_energy_reductions(vqe_runner, elements,
-                                                                                 elements_parameters=elements_parameters,
-                                                                                 ansatz=ansatz,
-                                                                                 ansatz_parameters=ansatz_parameters,
-                                                                                 excited_state=excited_state,
-                                                                                 global_cache=global_cache)
+        with Instrumentation.phase('candidate_vqes'):
+            elements_results = EnergyUtils.\
+                elements_individual_vqe_energy_reductions(vqe_runner, elements, elements_parameters=elements_parameters,
+                                                          ansatz=ansatz, ansatz_parameters=ansatz_parameters,
+                                                          excited_state=excited_state, global_cache=global_cache)
         elements_results.sort(key=lambda x: x[1].fun)
         if n == 1:
             return [min(elements_results, key=lambda x: x[1].fun)]
@@ -162,7 +185,6 @@ class EnergyUtils:
 class GradientUtils:
 
     @staticmethod
-    @ray.remote
     def get_excitation_gradient_multithread(excitation, ansatz, ansatz_parameters, q_system, backend, thread_cache=None,
                                             excited_state=0):
         t0 = time.time()
@@ -191,18 +213,29 @@ class GradientUtils:
             else:
                 return None
 
+        # all parameter shifted circuits are executed together, using the parallelism of the simulator
+        if backend == backends.QiskitSimBackend and config.qiskit_batch_circuits:
+            gradients = backend.ansatz_elements_gradients(elements, ansatz_parameters, ansatz, q_system,
+                                                          excited_state=excited_state)
+            return [[element, gradient] for element, gradient in zip(elements, gradients)]
+
         if config.multithread:
-            ray.init(num_cpus=config.ray_options['n_cpus'])
+            if global_cache is not None and len(elements) > 0:
+                global_cache.parallel_stage_memory('the gradients', max([global_cache.grad_thread_cache_nbytes(element)
+                                                                         for element in elements]))
+            RayUtils.init()
             elements_ray_ids = [
                 [
-                    element, GradientUtils.get_excitation_gradient_multithread.
-                    remote(element, ansatz, ansatz_parameters, q_system, backend, thread_cache=get_thread_cache(element),
+                    element, RayTasks.
+                    submit('gradients', GradientUtils.get_excitation_gradient_multithread, element, ansatz,
+                           ansatz_parameters, q_system, backend, thread_cache=get_thread_cache(element),
                            excited_state=excited_state)
                  ]
                 for element in elements
             ]
-            elements_results = [[element_ray_id[0], ray.get(element_ray_id[1])] for element_ray_id in elements_ray_ids]
-            ray.shutdown()
+            elements_results = [[element_ray_id[0], RayTasks.get(element_ray_id[1])]
+                                for element_ray_id in elements_ray_ids]
+            RayUtils.shutdown()
         else:
             elements_results = [
                 [
@@ -218,14 +251,80 @@ class GradientUtils:
     def get_largest_gradient_elements(elements, q_system, backend=backends.QiskitSimBackend, ansatz_parameters=None,
                                       ansatz=None, n=1, global_cache=None, excited_state=0):
 
-        elements_results = GradientUtils.get_ansatz_elements_gradients(elements, q_system,
-                                                                       ansatz_parameters=ansatz_parameters,
-                                                                       ansatz=ansatz, global_cache=global_cache,
-                                                                       backend=backend, excited_state=excited_state)
+        with Instrumentation.phase('gradient_screening'):
+            elements_results = GradientUtils.get_ansatz_elements_gradients(elements, q_system,
+                                                                           ansatz_parameters=ansatz_parameters,
+                                                                           ansatz=ansatz, global_cache=global_cache,
+                                                                           backend=backend, excited_state=excited_state)
         elements_results.sort(key=lambda x: abs(x[1]))
         return elements_results[-n:]
 
 
+class PrecisionSchedule:
+    # Optimizer tolerances for the different stages of an iterative VQE. The candidate VQEs ('screening') are only used
+    # to rank the ansatz elements and are run with loose tolerances, the intermediate iteration VQEs ('iteration') with
+    # medium tolerances and the final VQE ('final') with the full precision. As the energy change of the iterations
+    # approaches delta_e_threshold the screening and iteration tolerances are tightened, so that the energy reductions
+    # of the candidates can still be resolved.
+    stages = ['screening', 'iteration', 'final']
+
+    # the final tolerances default to the config values at the time of the construction
+    def __init__(self, delta_e_threshold, final_tol=None, final_gtol=None):
+        if final_tol is None:
+            final_tol = config.optimizer_tol
+        if final_gtol is None:
+            final_gtol = config.default_optimizer_options['gtol']
+        self.delta_e_threshold = delta_e_threshold
+        self.tolerances = {'screening': [config.screening_optimizer_tol, config.screening_optimizer_gtol],
+                           'iteration': [config.iteration_optimizer_tol, config.iteration_optimizer_gtol],
+                           'final': [final_tol, final_gtol]}
+
+        # per stage counters: number of VQE runs, energy evaluations and gradient evaluations
+        self.counters = {stage: {'n_runs': 0, 'n_fev': 0, 'n_jev': 0} for stage in self.stages}
+
+    def get_tolerances(self, stage, delta_e=None):
+        tol, gtol = self.tolerances[stage]
+        final_tol, final_gtol = self.tolerances['final']
+
+        if stage != 'final' and delta_e is not None:
+            # the energy error of a VQE scales as gtol^2, hence the square root for the gradient tolerance
+            target_tol = max(abs(delta_e), self.delta_e_threshold) * config.precision_tightening_factor
+            tol = min(tol, target_tol)
+            gtol = min(gtol, numpy.sqrt(target_tol))
+
+        return max(tol, final_tol), max(gtol, final_gtol)
+
+    # return a copy of vqe_runner, using the optimizer tolerances of the given stage
+    def get_vqe_runner(self, vqe_runner, stage, delta_e=None):
+        tol, gtol = self.get_tolerances(stage, delta_e=delta_e)
+
+        stage_vqe_runner = copy.copy(vqe_runner)
+        stage_vqe_runner.optimizer_tol = tol
+        # gtol is not a valid option for all optimizers (e.g. Nelder-Mead), so only overwrite it if already specified
+        if vqe_runner.optimizer_options is not None and 'gtol' in vqe_runner.optimizer_options:
+            stage_vqe_runner.optimizer_options = {**vqe_runner.optimizer_options, 'gtol': gtol}
+
+        logging.info('Precision schedule. Stage: {}. tol: {}, gtol: {}'.format(stage, tol, gtol))
+        return stage_vqe_runner
+
+    # record the number of evaluations for a list of optimization results (or a single result)
+    def record(self, stage, results):
+        if not isinstance(results, list):
+            results = [results]
+
+        counter = self.counters[stage]
+        for result in results:
+            counter['n_runs'] += 1
+            counter['n_fev'] += result.get('nfev', 0)
+            counter['n_jev'] += result.get('njev', 0)
+
+    def log_summary(self):
+        for stage in self.stages:
+            counter = self.counters[stage]
+            logging.info('Precision schedule. Stage: {}. VQE runs: {}. Energy evaluations: {}. Gradient evaluations: {}'
+                         .format(stage, counter['n_runs'], counter['n_fev'], counter['n_jev']))
+
+
 class DataUtils:
     @staticmethod
     def save_data(data_frame, molecule, time_stamp, ansatz_element_type=None, frozen_els=None, iter_vqe_type='iqeb'):
@@ -238,50 +337,50 @@ class DataUtils:
             except FileNotFoundError as fnf:
                 print(fnf)
 
-    # TODO: make this less ugly and more general
+    # type tags of the elements of data saved before the serialized elements (the 'element_data' column), by the
+    # prefixes of their names (the first matching prefix is used)
+    legacy_element_types = [('eff_s_f', 'eff_s_f_exc'), ('eff_d_f', 'eff_d_f_exc'), ('s_f', 's_f_exc'),
+                            ('d_f', 'd_f_exc'), ('s_q', 's_q_exc'), ('d_q', 'd_q_exc'), ('1j', 'pauli_str_exc'),
+                            ('-1j', 'pauli_str_exc'), ('spin_s_f', 'spin_eff_s_f_exc'),
+                            ('spin_d_f', 'spin_eff_d_f_exc'), ('spin_s_q', 'spin_s_q_exc'),
+                            ('spin_d_q', 'spin_d_q_exc')]
+
+    # the serialized form (see AnsatzElement.serialize) of an element saved as its name and qubits. The single
+    # excitation qubits were saved either as [q_1, q_2] or [[q_1], [q_2]]
     @staticmethod
-    def ansatz_from_data_frame(data_frame, q_system):
-        ansatz_elements = []
-        for i in range(len(data_frame)):
-            element = data_frame.loc[i]['element']
-            element_qubits = data_frame.loc[i]['element_qubits']
-            if element[0] == 'e' and element[4] == 's':
-                try:
-                    ansatz_elements.append(EffSFExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-                except Exception:
-                    ansatz_elements.append(EffSFExc(ast.literal_eval(element_qubits)[0][0], ast.literal_eval(element_qubits)[1][0],system_n_qubits=q_system.n_qubits))
-            elif element[0] == 'e' and element[4] == 'd':
-                ansatz_elements.append(EffDFExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-            elif element[0:3] == 's_f':
-                ansatz_elements.append(SFExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-            elif element[0:3] == 'd_f':
-                ansatz_elements.append(DFExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-            elif element[0] == 's' and element[2] == 'q':
-                try:
-                    ansatz_elements.append(SQExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-                except Exception:
-                    ansatz_elements.append(SQExc(ast.literal_eval(element_qubits)[0][0], ast.literal_eval(element_qubits)[1][0], system_n_qubits=q_system.n_qubits))
-            elif element[0] == 'd' and element[2] == 'q':
-                ansatz_elements.append(DQExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-            elif element[:2] == '1j':
-                ansatz_elements.append(PauliStringExc(QubitOperator(element), system_n_qubits=q_system.n_qubits))
-            elif element[:8] == 'spin_s_f':
-                try:
-                    ansatz_elements.append(SpinCompEffSFExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-                except TypeError:
-                    # new format
-                    ansatz_elements.append(SpinCompEffSFExc(ast.literal_eval(element_qubits)[0][0],
-                                                            ast.literal_eval(element_qubits)[1][0],
-                                                            system_n_qubits=q_system.n_qubits))
-            elif element[:8] == 'spin_d_f':
-                ansatz_elements.append(SpinCompEffDFExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-            elif element[:8] == 'spin_s_q':
-                ansatz_elements.append(SpinCompSQExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-            elif element[:8] == 'spin_d_q':
-                ansatz_elements.append(SpinCompDQExc(*ast.literal_eval(element_qubits), system_n_qubits=q_system.n_qubits))
-            else:
-                print(element, element_qubits)
-                raise Exception('Unrecognized ansatz element.')
+    def legacy_serialized_element(element, element_qubits):
+        for prefix, type_tag in DataUtils.legacy_element_types:
+            if element.startswith(prefix):
+                break
+        else:
+            print(element, element_qubits)
+            raise Exception('Unrecognized ansatz element.')
+
+        if type_tag == 'pauli_str_exc':
+            return [AnsatzElement.serialization_version, type_tag, element, None, None]
+
+        if type(element_qubits) == str:
+            element_qubits = ast.literal_eval(element_qubits)
+        qubits = [[qubits_part] if type(qubits_part) == int else list(qubits_part) for qubits_part in element_qubits]
+        sign = -1 if type_tag in ['spin_s_q_exc', 'spin_d_q_exc'] else None
+        encoding = 'jw' if type_tag in ['s_f_exc', 'd_f_exc'] else None
+        return [AnsatzElement.serialization_version, type_tag, qubits, sign, encoding]
+
+    # restore the ansatz of a data frame saved by an iterative VQE, from its serialized elements or, for older data,
+    # from the element names and qubits. The elements of a pool are reused if given
+    @staticmethod
+    def ansatz_from_data_frame(data_frame, q_system, pool=None):
+        if 'element_data' in data_frame.columns:
+            serialized_elements = [json.loads(data) if type(data) == str else data
+                                   for data in data_frame['element_data']]
+        else:
+            serialized_elements = [DataUtils.legacy_serialized_element(element, element_qubits) for
+                                   element, element_qubits in zip(data_frame['element'], data_frame['element_qubits'])]
+
+        if pool is None:
+            ansatz_elements = AnsatzElement.deserialize_all(serialized_elements, system_n_qubits=q_system.n_qubits)
+        else:
+            ansatz_elements = pool.deserialize_all(serialized_elements, system_n_qubits=q_system.n_qubits)
 
         var_pars = list(data_frame['var_parameters'])
 
@@ -0,0 +1,40 @@
+import importlib
+
+
+class LazyModule:
+    # A module imported on the first access to one of its attributes. The heavy dependencies (qiskit, ray) are needed
+    # only by the qiskit backends and the parallel stages, so importing the src modules (and starting a ray worker) does
+    # not import them
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        # the special attributes looked up by pickle, copy etc. are not forwarded
+        if attribute.startswith('__'):
+            raise AttributeError(attribute)
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        return '<lazy module {} ({})>'.format(self._name, 'loaded' if self._module is not None else 'not loaded')
+
+
+ray = LazyModule('ray')
+
+
+class LazyRemote:
+    # Decorator of a ray task function (in place of ray.remote). The remote function is created on the first
+    # submission, so defining the task does not import ray
+    def __init__(self, function):
+        self.function = function
+        self.remote_function = None
+
+    def remote(self, *args, **kwargs):
+        if self.remote_function is None:
+            self.remote_function = ray.remote(self.function)
+        return self.remote_function.remote(*args, **kwargs)
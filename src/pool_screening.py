@@ -0,0 +1,183 @@
+from src import config
+from src.ansatz_elements import AnsatzElement
+from src.basis_indices import BasisIndices
+
+import scipy.sparse.csgraph
+import numpy
+import logging
+import time
+
+
+class PoolScreening:
+    # Screening of an element pool against the Hamiltonian, before the precompute of the excitation generator matrices.
+    # The reachable basis states are the connected components of the Hamiltonian (its non zero matrix elements) that
+    # contain the reference (Hartree-Fock) state, extended with the components the kept elements excite into. An
+    # iterative VQE from the reference with the kept elements stays in the span of the reachable states, so:
+    # - elements that excite the reachable states only outside of them (breaking the point group or spin symmetries of
+    #   the reference) have zero gradients, and are dropped as symmetry forbidden;
+    # - elements that annihilate all the reachable states are flagged as structurally zero gradient, and dropped;
+    # - for closed shell references and fermionic elements, an element and its spin complement (see get_spin_comp_exc)
+    #   have equal absolute gradients as long as the ansatz is spin flip symmetric, i.e. the elements are added together
+    #   with their complements. With group_spin_complements, only one element of each class is kept.
+    # The structure of the excitations is derived from their generator keys, without the generator matrices.
+
+    def __init__(self, pool, H_sparse_matrix, n_qubits, n_electrons, ansatz=None, spin_complements=False,
+                 group_spin_complements=False):
+        self.n_qubits = n_qubits
+        self.n_electrons = n_electrons
+        self.ansatz = [] if ansatz is None else list(ansatz)
+        # the complements of the kept elements are added to the ansatz too
+        self.spin_complements = spin_complements
+
+        # the evaluated elements (one per spin flip class), the dropped elements, and the spin flip classes by their
+        # evaluated element
+        self.elements = []
+        self.symmetry_forbidden_elements = []
+        self.zero_gradient_elements = []
+        self.spin_classes = {}
+
+        t0 = time.time()
+        self.pool_size = len(pool)
+        self.labels = PoolScreening.component_labels(H_sparse_matrix)
+        self.reachable = numpy.zeros(2 ** n_qubits, dtype=bool)
+        self.add_components([BasisIndices.hf_index(n_qubits, n_electrons)])
+        self.screen(list(pool))
+        if group_spin_complements:
+            self.group_spin_complements()
+
+        logging.info('Pool screening: {} of {} elements evaluated, {} symmetry forbidden, {} zero gradient, {} spin '
+                     'complements grouped, {} reachable basis states. Time {}'
+                     .format(len(self.elements), len(pool), len(self.symmetry_forbidden_elements),
+                             len(self.zero_gradient_elements), self.n_grouped(), self.reachable.sum(),
+                             time.time() - t0))
+
+    # the connected component of each basis state, in the graph of the non zero matrix elements of H (the graph of the
+    # real absolute values, since csgraph discards the imaginary parts of complex matrices)
+    @staticmethod
+    def component_labels(H_sparse_matrix):
+        adjacency_matrix = abs(scipy.sparse.csr_matrix(H_sparse_matrix))
+        adjacency_matrix.data[adjacency_matrix.data < config.floating_point_accuracy] = 0
+        adjacency_matrix.eliminate_zeros()
+        n_components, labels = scipy.sparse.csgraph.connected_components(adjacency_matrix, directed=False)
+        return labels
+
+    # make the components of the basis states reachable
+    def add_components(self, indices):
+        components = numpy.unique(self.labels[numpy.asarray(indices, dtype=numpy.int64)])
+        self.reachable |= numpy.isin(self.labels, components)
+
+    # the basis states to which an excitation generator maps the indices. For JW fermionic and qubit excitations
+    # between distinct qubits, a state is mapped if qubits_1 are occupied and qubits_2 empty, or vice versa. Otherwise
+    # (Bravyi-Kitaev, Pauli strings) every Pauli term maps every state, which overestimates the mapped states
+    @staticmethod
+    def generator_images(generator_key, indices, n_qubits):
+        transform, qubits_1, qubits_2 = generator_key
+        assert transform in ['jw', 'q_exc']
+        mask_1 = BasisIndices.qubits_mask(qubits_1, n_qubits)
+        mask_2 = BasisIndices.qubits_mask(qubits_2, n_qubits)
+        forward = indices[(indices & mask_1 == mask_1) & (indices & mask_2 == 0)]
+        backward = indices[(indices & mask_2 == mask_2) & (indices & mask_1 == 0)]
+        return numpy.concatenate([forward, backward]) ^ (mask_1 | mask_2)
+
+    @staticmethod
+    def pauli_images(excitation_generator, indices, n_qubits):
+        images = []
+        for term in excitation_generator.terms:
+            flipped_qubits = [qubit for qubit, pauli in term if pauli != 'Z']
+            images.append(indices ^ BasisIndices.qubits_mask(flipped_qubits, n_qubits))
+        return numpy.concatenate(images)
+
+    def element_images(self, element, indices):
+        generator_keys = element.generator_keys()
+        if len(generator_keys) > 0 and all([key[0] in ['jw', 'q_exc'] and not set(key[1]) & set(key[2])
+                                            for key in generator_keys]):
+            return numpy.concatenate([self.generator_images(key, indices, self.n_qubits) for key in generator_keys])
+        return numpy.concatenate([self.pauli_images(generator, indices, self.n_qubits)
+                                  for generator in element.excitations_generators])
+
+    # the elements that are added to the ansatz when an element is selected
+    def added_elements(self, element):
+        if self.spin_complements and hasattr(element, 'get_spin_comp_exc'):
+            return [element, element.get_spin_comp_exc()]
+        return [element]
+
+    # classify the pool elements, extending the reachable states until they are closed under the ansatz and the kept
+    # elements
+    def screen(self, pool):
+        while True:
+            indices = numpy.nonzero(self.reachable)[0]
+            kept_elements, forbidden_elements, zero_gradient_elements = [], [], []
+            leaked_indices = []
+            for element in self.ansatz:
+                images = self.element_images(element, indices)
+                leaked_indices.append(images[~self.reachable[images]])
+            for element in pool:
+                images = self.element_images(element, indices)
+                if len(images) == 0:
+                    zero_gradient_elements.append(element)
+                elif not self.reachable[images].any():
+                    forbidden_elements.append(element)
+                else:
+                    kept_elements.append(element)
+                    for added_element in self.added_elements(element):
+                        images = self.element_images(added_element, indices)
+                        leaked_indices.append(images[~self.reachable[images]])
+
+            leaked_indices = numpy.concatenate(leaked_indices + [numpy.zeros(0, dtype=numpy.int64)])
+            if len(leaked_indices) == 0:
+                break
+            self.add_components(leaked_indices)
+
+        self.elements = kept_elements
+        self.symmetry_forbidden_elements = forbidden_elements
+        self.zero_gradient_elements = zero_gradient_elements
+
+    # whether the spin complements of the elements have equal absolute gradients: the reference is closed shell, and
+    # the pool and the ansatz consist of fermionic excitations, with the ansatz closed under the spin complements
+    def spin_flip_symmetric(self):
+        if self.n_electrons % 2 != 0:
+            return False
+        for element in self.elements + self.ansatz:
+            if not hasattr(element, 'get_spin_comp_exc') or \
+                    not all([key[0] in ['jw', 'bk'] for key in element.generator_keys()]):
+                return False
+
+        ansatz_keys = set([AnsatzElement.serialized_key(element.serialize()) for element in self.ansatz])
+        for element in self.ansatz:
+            complement_key = AnsatzElement.serialized_key(element.get_spin_comp_exc().serialize())
+            if complement_key not in ansatz_keys:
+                return False
+        return True
+
+    # keep one element of each pair of spin complements in the pool
+    def group_spin_complements(self):
+        if not self.spin_flip_symmetric():
+            logging.info('Pool screening: the spin complements are not grouped (no spin flip symmetry)')
+            return
+
+        elements = {AnsatzElement.serialized_key(element.serialize()): element for element in self.elements}
+        grouped_keys = set()
+        representatives = []
+        for key, element in elements.items():
+            if key in grouped_keys:
+                continue
+            spin_class = [element]
+            complement_key = AnsatzElement.serialized_key(element.get_spin_comp_exc().serialize())
+            if complement_key != key and complement_key in elements:
+                spin_class.append(elements[complement_key])
+                grouped_keys.add(complement_key)
+            grouped_keys.add(key)
+            representatives.append(element)
+            self.spin_classes[element] = spin_class
+
+        self.elements = representatives
+
+    # the number of elements represented by the evaluated element of their spin flip class
+    def n_grouped(self):
+        return sum([len(spin_class) - 1 for spin_class in self.spin_classes.values()])
+
+    # the fraction of the pool that is not evaluated
+    def pruned_fraction(self):
+        if self.pool_size == 0:
+            return 0
+        return 1 - len(self.elements) / self.pool_size
@@ -1,22 +1,98 @@
 # from openfermion.hamiltonians import MolecularData
 from openfermion.chem import MolecularData
 from openfermion import get_fermion_operator, freeze_orbitals, jordan_wigner, get_sparse_operator, bravyi_kitaev
-from openfermionpsi4 import run_psi4
 
 import numpy
-import scipy
 import logging
-import time
+import hashlib
+import os
 
-from src.utils import MatrixUtils
+from src import config
+from src.backends import QiskitSimBackend
+from src.eigensolvers import SectorEigensolver
+from src.basis_indices import BasisIndices
 
 
 class QSystem:
-    pass
+    # Operators of the system (sparse Hamiltonian, lower state statevectors, reference states), calculated lazily and
+    # memoized in self.operator_store. The store is invalidated when H_lower_state_terms is set. If the terms are
+    # modified in place, invalidate_operator_store should be called.
+    def __init__(self):
+        self.operator_store = {}
+        self._H_lower_state_terms = None
+
+    @property
+    def H_lower_state_terms(self):
+        return self._H_lower_state_terms
+
+    # list of [factor, State] used only for calculating excited states
+    @H_lower_state_terms.setter
+    def H_lower_state_terms(self, H_lower_state_terms):
+        self._H_lower_state_terms = H_lower_state_terms
+        self.invalidate_operator_store()
+
+    # drop the operators that depend on the lower states. The ground state Hamiltonian does not change
+    def invalidate_operator_store(self):
+        self.operator_store = {key: value for key, value in self.operator_store.items()
+                               if key in ['H_sparse_matrix', 'hf_statevector', 'measurement_groups']}
+
+    # the store is not sent with the q_system to other processes (e.g. ray workers), where it is recalculated if needed
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['operator_store'] = {}
+        return state
+
+    def get_h_sparse_matrix(self):
+        key = 'H_sparse_matrix'
+        if key not in self.operator_store:
+            self.operator_store[key] = get_sparse_operator(self.qubit_ham, n_qubits=self.n_qubits).tocsr()
+        return self.operator_store[key]
+
+    # The excited state Hamiltonian is H + sum_i factor_i |phi_i><phi_i| over the lower states phi_i. The penalty is
+    # kept as a list of [factor_i, phi_i] instead of adding the dense outer products to the sparse H
+    def get_penalty_terms(self, excited_state):
+        if excited_state == 0:
+            return []
+
+        H_lower_state_terms = self.H_lower_state_terms
+        assert H_lower_state_terms is not None
+        assert len(H_lower_state_terms) >= excited_state
+        return [[H_lower_state_terms[i][0], self.get_lower_state_statevector(i)] for i in range(excited_state)]
+
+    # the statevector of the i-th lower state in H_lower_state_terms
+    def get_lower_state_statevector(self, i):
+        key = ('lower_state_statevector', i)
+        if key not in self.operator_store:
+            state = self.H_lower_state_terms[i][1]
+            self.operator_store[key] = numpy.array(
+                QiskitSimBackend.statevector_from_ansatz(state.ansatz_elements, state.parameters, state.n_qubits,
+                                                         state.n_electrons, init_state_qasm=state.init_state_qasm))
+        return self.operator_store[key]
+
+    # calculate the k smallest energy eigenvalues in the sector of n_electrons electrons (and spin projection sz, if
+    # given). The eigenvalues are memoized by the SectorEigensolver
+    def calculate_energy_eigenvalues(self, k, sz=None):
+        logging.info('Calculating excited states exact eigenvalues.')
+        eigenvalues, _ = SectorEigensolver.lowest_eigenpairs(self.get_h_sparse_matrix(), self.n_qubits,
+                                                             self.n_electrons, k, sz=sz)
+        if len(eigenvalues) < k:
+            logging.warning('WARNING: Only {} eigenvalues found corresponding to the n_electrons'
+                            .format(len(eigenvalues)))
+
+        self.energy_eigenvalues = list(eigenvalues.real)
+        return self.energy_eigenvalues
+
+    # the Hartree-Fock statevector, in the qubit order of openfermion
+    def get_hf_statevector(self):
+        key = 'hf_statevector'
+        if key not in self.operator_store:
+            self.operator_store[key] = BasisIndices.hf_statevector(self.n_qubits, self.n_electrons)
+        return self.operator_store[key]
 
 
 class ElectronicSystem(QSystem):
     def __init__(self, fermion_ham, n_orbitals, n_electrons):
+        super(ElectronicSystem, self).__init__()
         self.name = '{}_e_{}_orb'.format(n_electrons, n_orbitals)
         self.n_electrons = n_electrons
 
@@ -27,28 +103,35 @@ class ElectronicSystem(QSystem):
 
         self.hf_energy = 0  # wild guess
 
-        self.H_lower_state_terms = None
-
 
 class MolecularSystem(QSystem):
 
     def __init__(self, name, geometry, multiplicity, charge, n_orbitals, n_electrons, basis='sto-3g', frozen_els=None,
                  encoding='jw'):
+        super(MolecularSystem, self).__init__()
         self.name = name
         self.multiplicity = multiplicity
         self.charge = charge
         self.basis = basis
         self.geometry = geometry
 
+        # the integrals are cached on disk, keyed by the geometry, basis, multiplicity and charge
         self.molecule_data = MolecularData(geometry=self.geometry, basis=basis, multiplicity=self.multiplicity,
-                                           charge=self.charge)
-
-        self.molecule_psi4 = run_psi4(self.molecule_data, run_fci=True)  # old version of openfermion
+                                           charge=self.charge, filename=self.data_filename())
+        if os.path.exists(self.molecule_data.filename + '.hdf5'):
+            self.molecule_data.load()
+            logging.info('Loaded molecular data from {}'.format(self.molecule_data.filename))
+        else:
+            # psi4 is imported only if the integrals are not cached
+            from openfermionpsi4 import run_psi4
+            # the FCI energy is calculated lazily (see fci_energy)
+            self.molecule_data = run_psi4(self.molecule_data, run_scf=True, run_fci=False)  # old version of openfermion
+        self.molecule_psi4 = self.molecule_data
 
         # Hamiltonian transforms
         self.molecule_ham = self.molecule_psi4.get_molecular_hamiltonian()
-        self.hf_energy = self.molecule_psi4.hf_energy.item()  # old version of openfermion
-        self.fci_energy = self.molecule_psi4.fci_energy.item()  # old version of openfermion
+        self.hf_energy = float(self.molecule_psi4.hf_energy)
+        self._fci_energy = None
 
         # TODO: the code below corresponds to the most recent version in the opefermion documentation.
         #  However it has problems with ray???
@@ -78,45 +161,38 @@ class MolecularSystem(QSystem):
             assert encoding == 'bk'
             self.qubit_ham = bravyi_kitaev(self.fermion_ham)
 
-        # this is used only for calculating excited states. list of [term_index, term_state]
-        self.H_lower_state_terms = None
-
-    # calculate the k smallest energy eigenvalues. For BeH2/H20 keep k<10 (too much memory)
-    def calculate_energy_eigenvalues(self, k):
-        logging.info('Calculating excited states exact eigenvalues.')
-        t0 = time.time()
-        H_sparse_matrix = get_sparse_operator(self.qubit_ham)
-
-        # do not calculate all eigenvectors of H, since this is very slow
-        calculate_first_n = k + 1
-        # use sigma to ensure we get the smallest eigenvalues
-        eigvv = scipy.sparse.linalg.eigsh(H_sparse_matrix.todense(), k=calculate_first_n, which='SR')
-        eigenvalues = list(eigvv[0])
-        eigenvectors = list(eigvv[1].T)
-        eigenvalues, eigenvectors = [*zip(*sorted([*zip(eigenvalues, eigenvectors)], key=lambda x:x[0]))]  # sort w.r.t. eigenvalues
-
-        self.energy_eigenvalues = []
-
-        i = 0
-        while len(self.energy_eigenvalues) < k:
-
-            if i >= len(eigenvalues):
-                calculate_first_n += k
-                eigvv = scipy.sparse.linalg.eigs(H_sparse_matrix.todense(), k=calculate_first_n, which='SR')
-                eigenvalues = list(eigvv[0])
-                eigenvectors = list(eigvv[1].T)
-                eigenvalues, eigenvectors = [*zip(*sorted([*zip(eigenvalues, eigenvectors)], key=lambda x: x[0]))]
-
-            if MatrixUtils.statevector_hamming_weight(eigenvectors[i].round(10)) == self.n_electrons:  # rounding set at random
-                self.energy_eigenvalues.append(eigenvalues[i].real)
-
-            i += 1
-            if i == self.n_qubits**2:
-                logging.warning('WARNING: Only {} eigenvalues found corresponding to the n_electrons'
-                                .format(len(self.energy_eigenvalues)))
-                break
-        logging.info('Time: {}'.format(time.time() - t0))
-        return self.energy_eigenvalues
+        self.frozen_els = frozen_els
+        self.encoding = encoding
+
+    def data_filename(self):
+        geometry = [[atom, [round(float(x), 10) for x in coordinates]] for atom, coordinates in self.geometry]
+        key = str([geometry, self.basis, self.multiplicity, self.charge])
+        directory = config.molecular_data_directory
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'molecular_data')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, '{}_{}'.format(self.name, hashlib.sha1(key.encode()).hexdigest()[:16]))
+
+    # The FCI energy of the molecule (without frozen orbitals), calculated on first access with the sector eigensolver
+    # in the sector of the molecule's electron number and Sz = (multiplicity - 1)/2, and saved to the molecular data
+    @property
+    def fci_energy(self):
+        if self._fci_energy is None:
+            if self.molecule_data.fci_energy is not None:
+                self._fci_energy = float(self.molecule_data.fci_energy)
+            else:
+                if self.frozen_els is None and self.encoding == 'jw':
+                    H_sparse_matrix = self.get_h_sparse_matrix()
+                else:
+                    H_sparse_matrix = get_sparse_operator(jordan_wigner(get_fermion_operator(self.molecule_ham)),
+                                                          n_qubits=self.molecule_ham.n_qubits)
+                eigenvalues, _ = SectorEigensolver.lowest_eigenpairs(H_sparse_matrix, self.molecule_ham.n_qubits,
+                                                                     self.molecule_data.n_electrons, 1,
+                                                                     sz=(self.multiplicity - 1) / 2)
+                self._fci_energy = float(eigenvalues[0].real)
+                self.molecule_data.fci_energy = self._fci_energy
+                self.molecule_data.save()
+        return self._fci_energy
 
     def set_h_lower_state_terms(self, states, factors=None):
         if factors is None:
@@ -0,0 +1,177 @@
+from src.lazy_imports import LazyModule, LazyRemote, ray
+from src import config
+
+import collections
+import resource
+import logging
+import json
+import time
+import os
+
+cloudpickle = LazyModule('ray.cloudpickle')
+
+
+class RayTask:
+    # a submitted task: the ray id of its result, its stage, and its telemetry record (None without telemetry)
+    def __init__(self, ray_id, stage, record=None):
+        self.ray_id = ray_id
+        self.stage = stage
+        self.record = record
+
+
+class RayTasks:
+    # Submission of the ray tasks of the parallel stages (excitation generators, generator matrices, commutators,
+    # gradients, candidate VQEs). The task functions are plain functions, executed by a generic remote function.
+    # With config.task_telemetry the function and its arguments are pickled by the driver before the submission, and
+    # the result by the worker, so that the sizes and the (de)serialization times of the payloads are measured. Each
+    # task then returns a telemetry record with:
+    # - the payload sizes (args_bytes, result_bytes) and the serialization times of the driver and the worker;
+    # - the queue wait (submission to worker start, including the transfer of the payload), the deserialization time and
+    #   the compute time of the worker;
+    # - the worker process and its peak resident memory. This is the peak over the lifetime of the worker process
+    #   (ru_maxrss), not over the task: the workers are reused between tasks and stages, so it only increases.
+    # The records are collected by the driver (see get) into a timeline, summarized per stage and exportable as a Chrome
+    # trace (chrome://tracing, Perfetto). The records are kept by the process until reset, which an AdaptSession does
+    # when it starts (and after each iteration, unless a trace is exported). The timestamps of the driver and the
+    # workers are compared directly, which assumes the workers run on the same machine (or synchronized clocks).
+
+    records = []
+
+    @staticmethod
+    @LazyRemote
+    def execute(function, args, kwargs):
+        return function(*args, **kwargs)
+
+    @staticmethod
+    @LazyRemote
+    def execute_with_telemetry(payload):
+        start_time = time.time()
+        function, args, kwargs = cloudpickle.loads(payload)
+        deserialized_time = time.time()
+        result = function(*args, **kwargs)
+        computed_time = time.time()
+        result_payload = cloudpickle.dumps(result)
+        end_time = time.time()
+
+        # ru_maxrss is the peak of the worker process since it started, in kilobytes on linux
+        telemetry = {'pid': os.getpid(), 'start_time': start_time, 'deserialize_time': deserialized_time - start_time,
+                     'compute_time': computed_time - deserialized_time, 'result_serialize_time': end_time - computed_time,
+                     'end_time': end_time, 'result_bytes': len(result_payload),
+                     'worker_max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+        return result_payload, telemetry
+
+    # submit function(*args, **kwargs) as a task of the stage
+    @staticmethod
+    def submit(stage, function, *args, **kwargs):
+        if not config.task_telemetry:
+            return RayTask(RayTasks.execute.remote(function, args, kwargs), stage)
+
+        t0 = time.time()
+        payload = cloudpickle.dumps([function, args, kwargs])
+        submit_time = time.time()
+        record = {'stage': stage, 'function': getattr(function, '__qualname__', str(function)),
+                  'args_bytes': len(payload), 'args_serialize_time': submit_time - t0, 'submit_time': submit_time}
+        return RayTask(RayTasks.execute_with_telemetry.remote(payload), stage, record)
+
+    # the result of a task. With telemetry, its record is completed and added to the timeline
+    @staticmethod
+    def get(task):
+        if task.record is None:
+            return ray.get(task.ray_id)
+
+        result_payload, telemetry = ray.get(task.ray_id)
+        t0 = time.time()
+        result = cloudpickle.loads(result_payload)
+        record = task.record
+        record.update(telemetry)
+        record['queue_wait'] = record['start_time'] - record['submit_time']
+        record['result_deserialize_time'] = time.time() - t0
+        record['get_time'] = time.time()
+        RayTasks.records.append(record)
+        return result
+
+    @staticmethod
+    def reset():
+        RayTasks.records = []
+
+    # the totals of the records of each stage (optionally only of the records from the index first_record on)
+    @staticmethod
+    def stage_summary(first_record=0):
+        summary = collections.OrderedDict()
+        for record in RayTasks.records[first_record:]:
+            if record['stage'] not in summary:
+                summary[record['stage']] = {'n_tasks': 0, 'args_bytes': 0, 'result_bytes': 0, 'serialize_time': 0,
+                                            'queue_wait': 0, 'deserialize_time': 0, 'compute_time': 0,
+                                            'start_time': record['submit_time'], 'end_time': record['get_time'],
+                                            'worker_max_rss': 0, 'n_workers': set()}
+            stage = summary[record['stage']]
+            stage['n_tasks'] += 1
+            stage['args_bytes'] += record['args_bytes']
+            stage['result_bytes'] += record['result_bytes']
+            stage['serialize_time'] += record['args_serialize_time'] + record['result_serialize_time']
+            stage['queue_wait'] += record['queue_wait']
+            stage['deserialize_time'] += record['deserialize_time'] + record['result_deserialize_time']
+            stage['compute_time'] += record['compute_time']
+            stage['start_time'] = min(stage['start_time'], record['submit_time'])
+            stage['end_time'] = max(stage['end_time'], record['get_time'])
+            stage['worker_max_rss'] = max(stage['worker_max_rss'], record['worker_max_rss'])
+            stage['n_workers'].add(record['pid'])
+
+        for stage in summary.values():
+            stage['wall_time'] = stage.pop('end_time') - stage.pop('start_time')
+            stage['n_workers'] = len(stage['n_workers'])
+        return dict(summary)
+
+    @staticmethod
+    def log_summary(first_record=0):
+        for stage, totals in RayTasks.stage_summary(first_record).items():
+            logging.info('Ray tasks {}: {} tasks on {} workers. Wall time {:.3f} s, compute {:.3f} s, queue wait '
+                         '{:.3f} s, (de)serialization {:.3f} s. Arguments {} B, results {} B. Worker lifetime peak '
+                         'memory {} B'
+                         .format(stage, totals['n_tasks'], totals['n_workers'], totals['wall_time'],
+                                 totals['compute_time'], totals['queue_wait'],
+                                 totals['serialize_time'] + totals['deserialize_time'], totals['args_bytes'],
+                                 totals['result_bytes'], totals['worker_max_rss']))
+
+    # the timeline as Chrome trace events: the serialization of each task on the driver, its queue wait (as an async
+    # span), and its deserialization, compute and result serialization on its worker
+    @staticmethod
+    def chrome_trace_events():
+        driver_pid = os.getpid()
+
+        def microseconds(seconds):
+            return int(seconds * 1e6)
+
+        def span(name, record, pid, start, duration, args=None):
+            return {'name': name, 'cat': record['stage'], 'ph': 'X', 'pid': pid, 'tid': 0, 'ts': microseconds(start),
+                    'dur': microseconds(duration), 'args': args or {}}
+
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': driver_pid, 'args': {'name': 'driver'}}]
+        worker_pids = set()
+        for i, record in enumerate(RayTasks.records):
+            args = {'function': record['function'], 'args_bytes': record['args_bytes'],
+                    'result_bytes': record['result_bytes'], 'worker_max_rss': record['worker_max_rss']}
+            if record['pid'] not in worker_pids and record['pid'] != driver_pid:
+                worker_pids.add(record['pid'])
+                events.append({'name': 'process_name', 'ph': 'M', 'pid': record['pid'],
+                               'args': {'name': 'worker {}'.format(record['pid'])}})
+            events.append(span('serialize', record, driver_pid, record['submit_time'] - record['args_serialize_time'],
+                               record['args_serialize_time'], args))
+            events.append({'name': 'queue', 'cat': record['stage'], 'ph': 'b', 'id': i, 'pid': driver_pid, 'tid': 1,
+                           'ts': microseconds(record['submit_time'])})
+            events.append({'name': 'queue', 'cat': record['stage'], 'ph': 'e', 'id': i, 'pid': driver_pid, 'tid': 1,
+                           'ts': microseconds(record['start_time'])})
+            events.append(span('deserialize', record, record['pid'], record['start_time'],
+                               record['deserialize_time']))
+            events.append(span(record['stage'], record, record['pid'],
+                               record['start_time'] + record['deserialize_time'], record['compute_time'], args))
+            events.append(span('serialize result', record, record['pid'], record['end_time'] -
+                               record['result_serialize_time'], record['result_serialize_time']))
+        return events
+
+    @staticmethod
+    def export_chrome_trace(filename):
+        with open(filename, 'w') as trace_file:
+            json.dump({'traceEvents': RayTasks.chrome_trace_events(), 'displayTimeUnit': 'ms'}, trace_file)
+        logging.info('Saved the trace of {} ray tasks to {}'.format(len(RayTasks.records), filename))
+        return filename
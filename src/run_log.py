@@ -0,0 +1,219 @@
+from src import config
+
+import threading
+import datetime
+import logging
+import pickle
+import numpy
+import json
+import time
+import os
+
+
+class RunLog:
+    # The record of an iterative VQE run: an append-only stream of iteration records (one JSON object per line,
+    # flushed and fsync'd after each record, so appending a record does not depend on the length of the run), and
+    # periodic checkpoints of the full run state. The checkpoints are pickled by the caller and written by a background
+    # thread to a temporary file that replaces the previous checkpoint, so a crash leaves either the old or the new one.
+    # A run is resumed from its last checkpoint and the records appended after it (see load).
+    # The run config (the parameters of the run) and the completion of the run are stored in a separate info file. A
+    # run is only resumed explicitly (resume=True or from_path), with the same run config, and if it is not completed.
+    # The driver scripts open their run logs with open.
+
+    def __init__(self, name, directory=None, checkpoint_interval=None, run_config=None, resume=False):
+        if directory is None:
+            directory = config.run_log_directory
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'results', 'run_logs')
+        os.makedirs(directory, exist_ok=True)
+        if checkpoint_interval is None:
+            checkpoint_interval = config.checkpoint_interval
+
+        self.name = name
+        self.records_path = os.path.join(directory, '{}.jsonl'.format(name))
+        self.checkpoint_path = os.path.join(directory, '{}.checkpoint'.format(name))
+        self.info_path = os.path.join(directory, '{}.info.json'.format(name))
+        self.checkpoint_interval = checkpoint_interval
+
+        self.run_config = RunLog.json_normalize(run_config)
+        if resume:
+            self.check_resume()
+        elif os.path.exists(self.records_path) or os.path.exists(self.info_path):
+            raise Exception('Run log {} exists. Resume it explicitly or use a new name'.format(name))
+        else:
+            self.write_info({'config': self.run_config, 'start_time': time.time(), 'completed': None})
+
+        self.n_records = len(RunLog.read_records(self.records_path))
+        RunLog.truncate_incomplete_record(self.records_path)
+        self.records_file = open(self.records_path, 'a')
+        self.t0 = time.time()
+
+        # the latest checkpoint waiting to be written (older pending checkpoints are superseded)
+        self.pending_checkpoint = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.writer = threading.Thread(target=self.write_checkpoints, daemon=True)
+        self.writer.start()
+
+    # the run log of the records file (.jsonl) of a paused run
+    @staticmethod
+    def from_path(path, run_config=None, checkpoint_interval=None):
+        directory, filename = os.path.split(os.path.abspath(path))
+        if filename.endswith('.jsonl'):
+            filename = filename[:-len('.jsonl')]
+        return RunLog(filename, directory=directory, checkpoint_interval=checkpoint_interval, run_config=run_config,
+                      resume=True)
+
+    # a unique name of a new run, from its parameters (the run config keys r, delta_e_threshold, max_ansatz_size and
+    # frozen_els) and its start time
+    @staticmethod
+    def run_name(prefix, run_config):
+        frozen_els = run_config['frozen_els']
+        frozen = 'o{}u{}'.format('-'.join(str(orbital) for orbital in frozen_els['occupied']),
+                                 '-'.join(str(orbital) for orbital in frozen_els['unoccupied']))
+        time_stamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S-%f')
+        return '{}_r={}_dE={}_max={}_frozen={}_{}'.format(prefix, run_config['r'], run_config['delta_e_threshold'],
+                                                          run_config['max_ansatz_size'], frozen, time_stamp)
+
+    # the run log of a driver script: a new run log named by run_name, or the run log of the records file of a paused
+    # run to resume (the --resume argument of the scripts)
+    @staticmethod
+    def open(prefix, run_config, resume_path=None):
+        if resume_path is not None:
+            return RunLog.from_path(resume_path, run_config=run_config)
+        return RunLog(RunLog.run_name(prefix, run_config), run_config=run_config)
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< run info >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    def read_info(self):
+        if not os.path.exists(self.info_path):
+            return None
+        with open(self.info_path) as info_file:
+            return json.load(info_file)
+
+    def write_info(self, info):
+        temporary_path = self.info_path + '.tmp'
+        with open(temporary_path, 'w') as info_file:
+            json.dump(info, info_file, default=RunLog.json_default, indent=1)
+            info_file.flush()
+            os.fsync(info_file.fileno())
+        os.replace(temporary_path, self.info_path)
+
+    # a paused run can be resumed with the same run config (if given), if it is not completed
+    def check_resume(self):
+        info = self.read_info()
+        if info is None:
+            raise Exception('No run log {} to resume'.format(self.info_path))
+        if info['completed'] is not None:
+            raise Exception('Run {} is completed'.format(self.name))
+        if self.run_config is not None and info['config'] != self.run_config:
+            keys = sorted(set(self.run_config) | set(info['config']))
+            mismatches = ['{}: {} != {}'.format(key, self.run_config.get(key), info['config'].get(key)) for key in keys
+                          if self.run_config.get(key) != info['config'].get(key)]
+            raise Exception('The config of run {} does not match the logged config ({})'
+                            .format(self.name, ', '.join(mismatches)))
+        self.run_config = info['config']
+
+    # mark the run completed, with a summary of its result
+    def mark_completed(self, summary=None):
+        info = self.read_info()
+        info['completed'] = {'time': time.time(), **(summary or {})}
+        self.write_info(info)
+
+    def is_completed(self):
+        info = self.read_info()
+        return info is not None and info['completed'] is not None
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< records >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+    # convert numpy scalars and arrays (e.g. energies and var. parameters) to JSON types
+    @staticmethod
+    def json_default(obj):
+        if isinstance(obj, numpy.ndarray):
+            return obj.tolist()
+        if isinstance(obj, numpy.generic):
+            return obj.item()
+        return str(obj)
+
+    # the JSON form of a run config (e.g. tuples as lists), so that it can be compared with the logged one
+    @staticmethod
+    def json_normalize(obj):
+        if obj is None:
+            return None
+        return json.loads(json.dumps(obj, default=RunLog.json_default))
+
+    def append(self, record):
+        record = dict(record)
+        record.setdefault('time', time.time() - self.t0)
+        self.records_file.write(json.dumps(record, default=RunLog.json_default) + '\n')
+        self.records_file.flush()
+        os.fsync(self.records_file.fileno())
+        self.n_records += 1
+
+    # the records of a records file. An incomplete last line (interrupted write) is ignored
+    @staticmethod
+    def read_records(records_path):
+        records = []
+        if not os.path.exists(records_path):
+            return records
+        with open(records_path) as records_file:
+            lines = records_file.readlines()
+        for i, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                if i < len(lines) - 1:
+                    raise
+                logging.warning('Ignored incomplete last record of {}'.format(records_path))
+        return records
+
+    # drop an incomplete last line, so that the next record starts on a new line
+    @staticmethod
+    def truncate_incomplete_record(records_path):
+        if not os.path.exists(records_path):
+            return
+        with open(records_path, 'rb+') as records_file:
+            data = records_file.read()
+            if len(data) > 0 and not data.endswith(b'\n'):
+                records_file.truncate(data.rfind(b'\n') + 1)
+
+    # checkpoint the run state every checkpoint_interval records (or always, if forced)
+    def checkpoint(self, state, force=False):
+        if not force and (self.checkpoint_interval is None or self.n_records % self.checkpoint_interval != 0):
+            return
+        data = pickle.dumps({'n_records': self.n_records, 'state': state})
+        with self.condition:
+            self.pending_checkpoint = data
+            self.condition.notify()
+
+    def write_checkpoints(self):
+        while True:
+            with self.condition:
+                while self.pending_checkpoint is None and not self.closed:
+                    self.condition.wait()
+                if self.pending_checkpoint is None:
+                    return
+                data = self.pending_checkpoint
+                self.pending_checkpoint = None
+
+            temporary_path = self.checkpoint_path + '.tmp'
+            with open(temporary_path, 'wb') as checkpoint_file:
+                checkpoint_file.write(data)
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+            os.replace(temporary_path, self.checkpoint_path)
+
+    # return the last checkpointed state (None if there is no checkpoint) and the records appended after it
+    def load(self):
+        checkpoint = {'n_records': 0, 'state': None}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'rb') as checkpoint_file:
+                checkpoint = pickle.load(checkpoint_file)
+        records = RunLog.read_records(self.records_path)
+        return checkpoint['state'], records[checkpoint['n_records']:]
+
+    # write the pending checkpoint and close the records file
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.writer.join()
+        self.records_file.close()
@@ -1,15 +1,22 @@
 # from openfermion.transforms import get_sparse_operator
 from openfermion.linalg import get_sparse_operator
 
-from openfermion import QubitOperator, FermionOperator, bravyi_kitaev
+from openfermion import QubitOperator
 
 import sys
-import qiskit
+import os
+import collections
 import scipy
 import numpy
 import logging
 import datetime
 
+from src.basis_indices import BasisIndices
+from src.lazy_imports import LazyModule, ray
+from src import config
+
+qiskit = LazyModule('qiskit')
+
 
 class MatrixUtils:
     # NOT USED
@@ -34,16 +41,7 @@ class MatrixUtils:
     # return the hamming weight of a statevector if all its non zero terms have the same H.w. Otherwise return False
     @staticmethod
     def statevector_hamming_weight(statevector):
-        hw = None
-        for i, term in enumerate(statevector):
-            if term != 0:
-                hw_i = bin(i).count('1')
-                if hw is None:
-                    hw = hw_i
-                elif hw != hw_i:
-                    return False
-
-        return hw
+        return BasisIndices.statevector_electron_number(statevector)
 
     # @staticmethod
     # def hf_sparse_statevector_bk_encoding(n_orbitals, n_electrons):
@@ -100,6 +98,107 @@ class LogUtils:
         logging.info(message)
 
 
+# a gate of a circuit: the gate name, the tuple of qubits it acts on and its angle (None for gates without angle)
+Gate = collections.namedtuple('Gate', ['name', 'qubits', 'angle'])
+
+
+class RayUtils:
+    # The ray runtime used by the parallel sections (excitation generators, commutators, gradients, VQEs). Each section
+    # starts the runtime before submitting its tasks and shuts it down after collecting the results. While the runtime
+    # is held (e.g. by an AdaptSession for a whole run), the sections reuse it and it is not shut down.
+    held = False
+
+    @staticmethod
+    def init(**kwargs):
+        if not ray.is_initialized():
+            ray.init(num_cpus=config.ray_options['n_cpus'], **kwargs)
+
+    @staticmethod
+    def shutdown():
+        if not RayUtils.held:
+            ray.shutdown()
+
+    @staticmethod
+    def hold():
+        RayUtils.held = True
+        RayUtils.init(object_store_memory=config.ray_options['object_store_memory'])
+
+    @staticmethod
+    def release():
+        RayUtils.held = False
+        ray.shutdown()
+
+
+class MemoryUtils:
+    # Byte counts of the matrices held by the caches and the copies sent to the ray tasks, and the memory available to
+    # them (see Cache.memory_report and GlobalCache.parallel_stage_memory)
+
+    # the bytes of the arrays of sparse matrices, numpy arrays, and lists, tuples and dictionaries of them
+    @staticmethod
+    def nbytes(value):
+        if value is None:
+            return 0
+        if scipy.sparse.issparse(value):
+            if hasattr(value, 'indptr'):  # csr, csc
+                return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+            if hasattr(value, 'row'):  # coo
+                return value.data.nbytes + value.row.nbytes + value.col.nbytes
+            return value.nnz * value.dtype.itemsize
+        if isinstance(value, numpy.ndarray):
+            return value.nbytes
+        if isinstance(value, dict):
+            return sum([MemoryUtils.nbytes(item) for item in value.values()])
+        if isinstance(value, (list, tuple)):
+            return sum([MemoryUtils.nbytes(item) for item in value])
+        return 0
+
+    # the bytes of a complex csr matrix with nnz non zero elements
+    @staticmethod
+    def csr_nbytes(nnz, n_rows, itemsize=16, index_itemsize=4):
+        return int(nnz * (itemsize + index_itemsize) + (n_rows + 1) * index_itemsize)
+
+    # the numbers of non zero elements of the rows and the columns of a sparse matrix
+    @staticmethod
+    def row_column_counts(matrix):
+        matrix = scipy.sparse.csr_matrix(matrix)
+        return [numpy.diff(matrix.indptr).astype(numpy.int64),
+                numpy.bincount(matrix.indices, minlength=matrix.shape[1]).astype(numpy.int64)]
+
+    # the upper bound of the number of non zero elements of the product of two matrices: the sum over k of the non zero
+    # elements of column k of the first matrix times those of row k of the second (see row_column_counts)
+    @staticmethod
+    def product_nnz(counts_1, counts_2):
+        return int(numpy.dot(counts_1[1], counts_2[0]))
+
+    # the memory available to new allocations (MemAvailable on linux), None if unknown
+    @staticmethod
+    def available_memory():
+        try:
+            with open('/proc/meminfo') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        try:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            return None
+
+    # the number of ray workers running tasks simultaneously
+    @staticmethod
+    def n_workers():
+        n_cpus = config.ray_options['n_cpus']
+        if n_cpus is None:
+            n_cpus = os.cpu_count()
+        return n_cpus
+
+    @staticmethod
+    def format(n_bytes):
+        return '{:.1f} MB'.format(n_bytes / 2**20)
+
+
+# The circuits are built as lists of Gates (the methods with the _gates suffix) and rendered to qasm by gates_qasm
 class QasmUtils:
 
     @staticmethod
@@ -110,7 +209,8 @@ class QasmUtils:
         total_cnot_count = 0
         total_u1_count = 0
         for i in range(n_qubits):
-            # count all occurrences of a qubit (can get a few more because of the header)
+            # count all occurrences of a qubit (can get a few more because of the header). The "depths" are the
+            # maximal per-qubit gate counts (see CircuitStats for the exact depths)
             cnot_count = qasm.count('q[{}],'.format(i))
             cnot_count += qasm.count(',q[{}]'.format(i))
             cnot_count += qasm.count('q[{}] ,'.format(i))
@@ -140,98 +240,119 @@ class QasmUtils:
         return 'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg q[{0}];\ncreg c[{0}];\n'.format(n_qubits)
 
     @staticmethod
-    def pauli_word_qasm(operator):
+    def gate_qasm(gate):
+        qubits = ', '.join(['q[{}]'.format(qubit) for qubit in gate.qubits])
+        if gate.angle is None:
+            return '{} {};\n'.format(gate.name, qubits)
+        else:
+            return '{}({}) {};\n'.format(gate.name, gate.angle, qubits)
+
+    @staticmethod
+    def gates_qasm(gates):
+        return ''.join([QasmUtils.gate_qasm(gate) for gate in gates])
+
+    @staticmethod
+    def pauli_word_gates(operator):
         assert type(operator) == QubitOperator
         assert len(operator.terms) == 1
         assert next(iter(operator.terms.values())) == 1
 
         pauli_word = next(iter(operator.terms.keys()))
 
-        qasm = ['']
+        gates = []
 
         for gate in pauli_word:
             qubit = gate[0]
-            if gate[1] == 'X':
-                qasm.append('x q[{0}];\n'.format(qubit))
-            elif gate[1] == 'Y':
-                qasm.append('y q[{0}];\n'.format(qubit))
-            elif gate[1] == 'Z':
-                qasm.append('z q[{0}];\n'.format(qubit))
+            if gate[1] in ['X', 'Y', 'Z']:
+                gates.append(Gate(gate[1].lower(), (qubit,), None))
             else:
                 raise ValueError('Invalid Pauli-word operator. {} is not a Pauli operator'.format(gate[1]))
 
-        return ''.join(qasm)
+        return gates
 
     @staticmethod
-    def controlled_y_rotation(angle, control, target):
-        qasm = ['']
-        qasm.append('ry({}) q[{}];\n'.format(angle/2, target))
-        qasm.append('cx q[{}], q[{}];\n'.format(control, target))
-        qasm.append('ry({}) q[{}];\n'.format(-angle/2, target))
-        qasm.append('cx q[{}], q[{}];\n'.format(control, target))
+    def pauli_word_qasm(operator):
+        return QasmUtils.gates_qasm(QasmUtils.pauli_word_gates(operator))
 
-        return ''.join(qasm)
+    @staticmethod
+    def controlled_y_rotation_gates(angle, control, target):
+        return [Gate('ry', (target,), angle/2), Gate('cx', (control, target), None),
+                Gate('ry', (target,), -angle/2), Gate('cx', (control, target), None)]
+
+    @staticmethod
+    def controlled_y_rotation(angle, control, target):
+        return QasmUtils.gates_qasm(QasmUtils.controlled_y_rotation_gates(angle, control, target))
 
     # equivalent single qubit excitation
     @staticmethod
-    def partial_exchange(angle, qubit_1, qubit_2):
+    def partial_exchange_gates(angle, qubit_1, qubit_2):
         theta = numpy.pi / 2 + angle
-        qasm = ['']
-        qasm.append(QasmUtils.controlled_xz(qubit_2, qubit_1))
+        gates = QasmUtils.controlled_xz_gates(qubit_2, qubit_1)
 
-        qasm.append('ry({}) q[{}];\n'.format(theta, qubit_2))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_1, qubit_2))
-        qasm.append('ry({}) q[{}];\n'.format(-theta, qubit_2))
+        gates.append(Gate('ry', (qubit_2,), theta))
+        gates.append(Gate('cx', (qubit_1, qubit_2), None))
+        gates.append(Gate('ry', (qubit_2,), -theta))
 
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_2, qubit_1))
+        gates.append(Gate('cx', (qubit_2, qubit_1), None))
 
-        return ''.join(qasm)
+        return gates
 
     @staticmethod
-    def n_controlled_y_rotation(angle, controls, target):
+    def partial_exchange(angle, qubit_1, qubit_2):
+        return QasmUtils.gates_qasm(QasmUtils.partial_exchange_gates(angle, qubit_1, qubit_2))
+
+    @staticmethod
+    def n_controlled_y_rotation_gates(angle, controls, target):
         if not controls:
-            return 'ry({}) q[{}];\n'.format(angle, target)
+            return [Gate('ry', (target,), angle)]
         else:
-            qasm = ['']
+            gates = []
 
-            qasm.append(QasmUtils.n_controlled_y_rotation(angle / 2, controls[:-1], target))
-            qasm.append('cx q[{}], q[{}];\n'.format(controls[-1], target))
-            qasm.append(QasmUtils.n_controlled_y_rotation(-angle / 2, controls[:-1], target))
-            qasm.append('cx q[{}], q[{}];\n'.format(controls[-1], target))
+            gates += QasmUtils.n_controlled_y_rotation_gates(angle / 2, controls[:-1], target)
+            gates.append(Gate('cx', (controls[-1], target), None))
+            gates += QasmUtils.n_controlled_y_rotation_gates(-angle / 2, controls[:-1], target)
+            gates.append(Gate('cx', (controls[-1], target), None))
 
-            return ''.join(qasm)
+            return gates
 
     @staticmethod
-    def controlled_xz(qubit_1, qubit_2, reverse=False):
-        qasm = ['']
-        qasm.append('h q[{}];\n'.format(qubit_2))
+    def n_controlled_y_rotation(angle, controls, target):
+        return QasmUtils.gates_qasm(QasmUtils.n_controlled_y_rotation_gates(angle, controls, target))
+
+    @staticmethod
+    def controlled_xz_gates(qubit_1, qubit_2, reverse=False):
+        gates = [Gate('h', (qubit_2,), None)]
         if reverse:
-            qasm.append('rz({}) q[{}];\n'.format(numpy.pi/2, qubit_2))
-            qasm.append('rz({}) q[{}];\n'.format(-numpy.pi / 2, qubit_1))
-            qasm.append('cx q[{}], q[{}];\n'.format(qubit_1, qubit_2))
-            qasm.append('rz({}) q[{}];\n'.format(-numpy.pi/2, qubit_2))
+            gates.append(Gate('rz', (qubit_2,), numpy.pi/2))
+            gates.append(Gate('rz', (qubit_1,), -numpy.pi / 2))
+            gates.append(Gate('cx', (qubit_1, qubit_2), None))
+            gates.append(Gate('rz', (qubit_2,), -numpy.pi/2))
         else:
-            qasm.append('rz({}) q[{}];\n'.format(numpy.pi / 2, qubit_2))
-            qasm.append('cx q[{}], q[{}];\n'.format(qubit_1, qubit_2))
-            qasm.append('rz({}) q[{}];\n'.format(-numpy.pi / 2, qubit_2))
-            qasm.append('rz({}) q[{}];\n'.format(numpy.pi / 2, qubit_1))
-        qasm.append('h q[{}];\n'.format(qubit_2))
+            gates.append(Gate('rz', (qubit_2,), numpy.pi / 2))
+            gates.append(Gate('cx', (qubit_1, qubit_2), None))
+            gates.append(Gate('rz', (qubit_2,), -numpy.pi / 2))
+            gates.append(Gate('rz', (qubit_1,), numpy.pi / 2))
+        gates.append(Gate('h', (qubit_2,), None))
 
-        return ''.join(qasm)
+        return gates
 
-    # return a qasm circuit for preparing the HF state
     @staticmethod
-    def hf_state(n_electrons):
-        qasm = ['']
-        for i in range(n_electrons):
-            qasm.append('x q[{0}];\n'.format(i))
+    def controlled_xz(qubit_1, qubit_2, reverse=False):
+        return QasmUtils.gates_qasm(QasmUtils.controlled_xz_gates(qubit_1, qubit_2, reverse=reverse))
 
-        return ''.join(qasm)
+    # return a circuit for preparing the HF state
+    @staticmethod
+    def hf_state_gates(n_electrons):
+        return [Gate('x', (i,), None) for i in range(n_electrons)]
 
-    # get the qasm circuit of an excitation
     @staticmethod
-    def excitation_qasm(excitation_generator, var_parameter):
-        qasm = ['']
+    def hf_state(n_electrons):
+        return QasmUtils.gates_qasm(QasmUtils.hf_state_gates(n_electrons))
+
+    # get the circuit of an excitation
+    @staticmethod
+    def excitation_gates(excitation_generator, var_parameter):
+        gates = []
         # # if type(excitations_generators) == list:
         # excitation_generator = 0*QubitOperator('')
         # for generator in excitations_generators:
@@ -243,23 +364,27 @@ class QasmUtils:
             exponent_angle = var_parameter * excitation_generator.terms[exponent_term]
             assert exponent_angle.real == 0
             exponent_angle = exponent_angle.imag
-            qasm.append(QasmUtils.exponent_qasm(exponent_term, exponent_angle))
+            gates += QasmUtils.exponent_gates(exponent_term, exponent_angle)
 
-        return ''.join(qasm)
+        return gates
 
-    # returns a qasm circuit for an exponent of pauli operators
     @staticmethod
-    def exponent_qasm(exponent_term, exponent_parameter):
+    def excitation_qasm(excitation_generator, var_parameter):
+        return QasmUtils.gates_qasm(QasmUtils.excitation_gates(excitation_generator, var_parameter))
+
+    # returns a circuit for an exponent of pauli operators
+    @staticmethod
+    def exponent_gates(exponent_term, exponent_parameter):
         assert type(exponent_term) == tuple  # TODO remove?
         assert exponent_parameter.imag == 0
 
         # gates for X and Y basis correction (Z by default)
-        x_basis_correction = ['']
-        y_basis_correction_front = ['']
-        y_basis_correction_back = ['']
+        x_basis_correction = []
+        y_basis_correction_front = []
+        y_basis_correction_back = []
 
         # CNOT ladder
-        cnots = ['']
+        cnots = []
 
         for i, operator in enumerate(exponent_term):
             qubit = operator[0]
@@ -267,42 +392,63 @@ class QasmUtils:
 
             # add basis rotations for X and Y
             if pauli_operator == 'X':
-                x_basis_correction.append('h q[{}];\n'.format(qubit))
+                x_basis_correction.append(Gate('h', (qubit,), None))
 
             if pauli_operator == 'Y':
-                y_basis_correction_front.append('rx({}) q[{}];\n'.format(numpy.pi / 2, qubit))
-                y_basis_correction_back.append('rx({}) q[{}];\n'.format(- numpy.pi / 2, qubit))
+                y_basis_correction_front.append(Gate('rx', (qubit,), numpy.pi / 2))
+                y_basis_correction_back.append(Gate('rx', (qubit,), - numpy.pi / 2))
 
             # add the core cnot gates
             if i > 0:
                 previous_qubit = exponent_term[i - 1][0]
-                cnots.append('cx q[{}],q[{}];\n'.format(previous_qubit, qubit))
+                cnots.append(Gate('cx', (previous_qubit, qubit), None))
 
         front_basis_correction = x_basis_correction + y_basis_correction_front
         back_basis_correction = x_basis_correction + y_basis_correction_back
 
-        # TODO make this more readable
         # add a Z-rotation between the two CNOT ladders at the last qubit
         last_qubit = exponent_term[-1][0]
-        z_rotation = 'rz({}) q[{}];\n'.format(-2 * exponent_parameter, last_qubit)  # exp(i*theta*Z) ~ Rz(-2*theta)
+        z_rotation = Gate('rz', (last_qubit,), -2 * exponent_parameter)  # exp(i*theta*Z) ~ Rz(-2*theta)
 
         # create the cnot module simulating a single Trotter step
         cnots_module = cnots + [z_rotation] + cnots[::-1]
 
-        return ''.join(front_basis_correction + cnots_module + back_basis_correction)
+        return front_basis_correction + cnots_module + back_basis_correction
+
+    @staticmethod
+    def exponent_qasm(exponent_term, exponent_parameter):
+        return QasmUtils.gates_qasm(QasmUtils.exponent_gates(exponent_term, exponent_parameter))
 
     # get a circuit of SWAPs to reverse the order of qubits
     @staticmethod
-    def reverse_qubits_qasm(n_qubits):
-        qasm = ['']
-        for i in range(int(n_qubits/2)):
-            qasm.append('swap q[{}], q[{}];\n'.format(i, n_qubits - i - 1))
+    def reverse_qubits_gates(n_qubits):
+        return [Gate('swap', (i, n_qubits - i - 1), None) for i in range(int(n_qubits/2))]
 
-        return ''.join(qasm)
+    @staticmethod
+    def reverse_qubits_qasm(n_qubits):
+        return QasmUtils.gates_qasm(QasmUtils.reverse_qubits_gates(n_qubits))
 
-    # qasm for a double qubit excitation circuit
+    # the partial ccc_y operation of the double excitation circuits (a partial swap of qubits qubit_pair_1[0] and
+    # qubit_pair_2[0], controlled by the parity qubits qubit_pair_1[1] and qubit_pair_2[1])
     @staticmethod
-    def d_q_exc_qasm(parameter, qubit_pair_1_ref, qubit_pair_2_ref):
+    def partial_ccc_y_gates(theta, qubit_pair_1, qubit_pair_2):
+        gates = [Gate('rz', (qubit_pair_1[0],), numpy.pi / 2)]
+
+        for sign, qubit in zip([1, -1, 1, -1, 1, -1, 1, -1],
+                               [qubit_pair_1[1], qubit_pair_2[1], qubit_pair_1[1], qubit_pair_2[0],
+                                qubit_pair_1[1], qubit_pair_2[1], qubit_pair_1[1], None]):
+            gates.append(Gate('rx', (qubit_pair_1[0],), sign * theta))
+            if qubit is not None:
+                gates.append(Gate('h', (qubit,), None))
+                gates.append(Gate('cx', (qubit_pair_1[0], qubit), None))
+                gates.append(Gate('h', (qubit,), None))
+
+        gates.append(Gate('rz', (qubit_pair_1[0],), -numpy.pi / 2))
+        return gates
+
+    # circuit for a double qubit excitation
+    @staticmethod
+    def d_q_exc_gates(parameter, qubit_pair_1_ref, qubit_pair_2_ref):
         # This is not required since the qubits are not ordered as for the fermi excitation
         qubit_pair_1 = qubit_pair_1_ref.copy()
         qubit_pair_2 = qubit_pair_2_ref.copy()
@@ -310,83 +456,38 @@ class QasmUtils:
         parameter = parameter * 2  # for consistency with the conventional fermi excitation
         theta = parameter / 8
 
-        qasm = ['']
+        gates = []
 
         # determine the parity of the two pairs
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_1))
-        qasm.append('x q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_2))
-        qasm.append('x q[{}];\n'.format(qubit_pair_2[1]))
+        gates.append(Gate('cx', tuple(qubit_pair_1), None))
+        gates.append(Gate('x', (qubit_pair_1[1],), None))
+        gates.append(Gate('cx', tuple(qubit_pair_2), None))
+        gates.append(Gate('x', (qubit_pair_2[1],), None))
 
         # apply a partial swap of qubits 0 and 2, controlled by 1 and 3 ##
 
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[0]))
-        # # partial ccc_y operation
-        qasm.append('rz({}) q[{}];\n'.format(numpy.pi / 2, qubit_pair_1[0]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[1]))  # 0 3
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[0]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[0]))  # 0 2
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[0]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[1]))  # 0 3
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('rz({}) q[{}];\n'.format(-numpy.pi / 2, qubit_pair_1[0]))
+        gates.append(Gate('cx', (qubit_pair_1[0], qubit_pair_2[0]), None))
+        gates += QasmUtils.partial_ccc_y_gates(theta, qubit_pair_1, qubit_pair_2)
 
-        # ############################## partial ccc_y operation  ############ to here
-
-        qasm.append(QasmUtils.controlled_xz(qubit_pair_1[0], qubit_pair_2[0], reverse=True))
+        gates += QasmUtils.controlled_xz_gates(qubit_pair_1[0], qubit_pair_2[0], reverse=True)
 
         # correct for parity determination
-        qasm.append('x q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_1))
-        qasm.append('x q[{}];\n'.format(qubit_pair_2[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_2))
+        gates.append(Gate('x', (qubit_pair_1[1],), None))
+        gates.append(Gate('cx', tuple(qubit_pair_1), None))
+        gates.append(Gate('x', (qubit_pair_2[1],), None))
+        gates.append(Gate('cx', tuple(qubit_pair_2), None))
 
-        return ''.join(qasm)
+        return gates
 
-    # qasm for efficient single fermionic excitation circuit
     @staticmethod
-    def eff_s_f_exc_qasm(parameter, qubit_1, qubit_2):
+    def d_q_exc_qasm(parameter, qubit_pair_1_ref, qubit_pair_2_ref):
+        return QasmUtils.gates_qasm(QasmUtils.d_q_exc_gates(parameter, qubit_pair_1_ref, qubit_pair_2_ref))
+
+    # circuit for an efficient single fermionic excitation
+    @staticmethod
+    def eff_s_f_exc_gates(parameter, qubit_1, qubit_2):
         theta = numpy.pi / 2 + parameter
-        qasm = ['']
+        gates = []
         if qubit_2 < qubit_1:
             x = qubit_1
             qubit_1 = qubit_2
@@ -394,37 +495,41 @@ class QasmUtils:
 
         parity_qubits = list(range(qubit_1 + 1, qubit_2))
 
-        parity_cnot_ladder = ['']
+        parity_cnot_ladder = []
         if len(parity_qubits) > 0:
             for i in range(len(parity_qubits) - 1):
-                parity_cnot_ladder.append('cx q[{}], q[{}];\n'.format(parity_qubits[i], parity_qubits[i + 1]))
+                parity_cnot_ladder.append(Gate('cx', (parity_qubits[i], parity_qubits[i + 1]), None))
 
-            qasm += parity_cnot_ladder
+            gates += parity_cnot_ladder
             # parity dependence
-            qasm.append('h q[{}];\n'.format(qubit_1))
-            qasm.append('cx q[{}], q[{}];\n'.format(parity_qubits[-1], qubit_1))
-            qasm.append('h q[{}];\n'.format(qubit_1))
+            gates.append(Gate('h', (qubit_1,), None))
+            gates.append(Gate('cx', (parity_qubits[-1], qubit_1), None))
+            gates.append(Gate('h', (qubit_1,), None))
 
-        qasm.append(QasmUtils.controlled_xz(qubit_2, qubit_1))
+        gates += QasmUtils.controlled_xz_gates(qubit_2, qubit_1)
 
-        qasm.append('ry({}) q[{}];\n'.format(theta, qubit_2))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_1, qubit_2))
-        qasm.append('ry({}) q[{}];\n'.format(-theta, qubit_2))
+        gates.append(Gate('ry', (qubit_2,), theta))
+        gates.append(Gate('cx', (qubit_1, qubit_2), None))
+        gates.append(Gate('ry', (qubit_2,), -theta))
 
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_2, qubit_1))
+        gates.append(Gate('cx', (qubit_2, qubit_1), None))
 
         if len(parity_qubits) > 0:
-            qasm.append('h q[{}];\n'.format(qubit_1))
-            qasm.append('cx q[{}], q[{}];\n'.format(parity_qubits[-1], qubit_1))
-            qasm.append('h q[{}];\n'.format(qubit_1))
+            gates.append(Gate('h', (qubit_1,), None))
+            gates.append(Gate('cx', (parity_qubits[-1], qubit_1), None))
+            gates.append(Gate('h', (qubit_1,), None))
 
-            qasm += parity_cnot_ladder[::-1]
+            gates += parity_cnot_ladder[::-1]
 
-        return ''.join(qasm)
+        return gates
 
-    # qasm for efficient double fermionic excitation circuit
     @staticmethod
-    def eff_d_f_exc_qasm(parameter, qubit_pair_1_ref, qubit_pair_2_ref):
+    def eff_s_f_exc_qasm(parameter, qubit_1, qubit_2):
+        return QasmUtils.gates_qasm(QasmUtils.eff_s_f_exc_gates(parameter, qubit_1, qubit_2))
+
+    # circuit for an efficient double fermionic excitation
+    @staticmethod
+    def eff_d_f_exc_gates(parameter, qubit_pair_1_ref, qubit_pair_2_ref):
 
         # TODO: use proper get set functions
         # use copies of the qubit pairs, in order to change the original pairs
@@ -440,7 +545,7 @@ class QasmUtils:
         parameter = - parameter * 2  # the factor of -2 is for consistency with the conventional fermi excitation
         theta = parameter / 8
 
-        qasm = ['']
+        gates = []
 
         qubit_pair_1.sort()
         qubit_pair_2.sort()
@@ -452,91 +557,45 @@ class QasmUtils:
         parity_qubits = list(range(all_qubits[0]+1, all_qubits[1])) + list(range(all_qubits[2]+1, all_qubits[3]))
 
         # ladder of CNOT used to determine the parity
-        parity_cnot_ladder = ['']
+        parity_cnot_ladder = []
         if len(parity_qubits) > 0:
             for i in range(len(parity_qubits) - 1):
-                parity_cnot_ladder.append('cx q[{}], q[{}];\n'.format(parity_qubits[i], parity_qubits[i + 1]))
-            # parity_cnot_ladder.append('x q[{}];\n'.format(parity_qubits[-1]))
+                parity_cnot_ladder.append(Gate('cx', (parity_qubits[i], parity_qubits[i + 1]), None))
 
         # determine the parity of the two pairs
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_1))
-        qasm.append('x q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_2))
-        qasm.append('x q[{}];\n'.format(qubit_pair_2[1]))
+        gates.append(Gate('cx', tuple(qubit_pair_1), None))
+        gates.append(Gate('x', (qubit_pair_1[1],), None))
+        gates.append(Gate('cx', tuple(qubit_pair_2), None))
+        gates.append(Gate('x', (qubit_pair_2[1],), None))
 
         # apply a partial swap of qubits 0 and 2, controlled by 1 and 3 ##
 
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[0]))
+        gates.append(Gate('cx', (qubit_pair_1[0], qubit_pair_2[0]), None))
 
         # apply parity sign correction 1
         if len(parity_qubits) > 0:
-            qasm += parity_cnot_ladder
-            qasm.append('h q[{}];\n'.format(parity_qubits[-1]))
-            qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], parity_qubits[-1]))
-
-        # # partial ccc_y operation
-        qasm.append('rz({}) q[{}];\n'.format(numpy.pi / 2, qubit_pair_1[0]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[1]))  # 0 3
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
+            gates += parity_cnot_ladder
+            gates.append(Gate('h', (parity_qubits[-1],), None))
+            gates.append(Gate('cx', (qubit_pair_1[0], parity_qubits[-1]), None))
 
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[0]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[0]))  # 0 2
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[0]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_2[1]))  # 0 3
-        qasm.append('h q[{}];\n'.format(qubit_pair_2[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(theta, qubit_pair_1[0]))  # +
-
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], qubit_pair_1[1]))  # 0 1
-        qasm.append('h q[{}];\n'.format(qubit_pair_1[1]))
-
-        qasm.append('rx({}) q[{}];\n'.format(-theta, qubit_pair_1[0]))  # -
-
-        qasm.append('rz({}) q[{}];\n'.format(-numpy.pi / 2, qubit_pair_1[0]))
-
-        # ############################## partial ccc_y operation  ############ until here
+        gates += QasmUtils.partial_ccc_y_gates(theta, qubit_pair_1, qubit_pair_2)
 
         # apply parity sign correction 2
         if len(parity_qubits) > 0:
-            qasm.append('cx q[{}], q[{}];\n'.format(qubit_pair_1[0], parity_qubits[-1]))
-            qasm.append('h q[{}];\n'.format(parity_qubits[-1]))
-            qasm += parity_cnot_ladder[::-1]
+            gates.append(Gate('cx', (qubit_pair_1[0], parity_qubits[-1]), None))
+            gates.append(Gate('h', (parity_qubits[-1],), None))
+            gates += parity_cnot_ladder[::-1]
 
-        qasm.append(QasmUtils.controlled_xz(qubit_pair_1[0], qubit_pair_2[0], reverse=True))
+        gates += QasmUtils.controlled_xz_gates(qubit_pair_1[0], qubit_pair_2[0], reverse=True)
 
         # correct for parity determination
-        qasm.append('x q[{}];\n'.format(qubit_pair_1[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_1))
-        qasm.append('x q[{}];\n'.format(qubit_pair_2[1]))
-        qasm.append('cx q[{}], q[{}];\n'.format(*qubit_pair_2))
+        gates.append(Gate('x', (qubit_pair_1[1],), None))
+        gates.append(Gate('cx', tuple(qubit_pair_1), None))
+        gates.append(Gate('x', (qubit_pair_2[1],), None))
+        gates.append(Gate('cx', tuple(qubit_pair_2), None))
 
-        return ''.join(qasm)
+        return gates
+
+    @staticmethod
+    def eff_d_f_exc_qasm(parameter, qubit_pair_1_ref, qubit_pair_2_ref):
+        return QasmUtils.gates_qasm(QasmUtils.eff_d_f_exc_gates(parameter, qubit_pair_1_ref, qubit_pair_2_ref))
@@ -1,29 +1,51 @@
 from src.backends import QiskitSimBackend
 from src.utils import LogUtils
+from src.instrumentation import Instrumentation
 from src import config
 
-from openfermion import get_sparse_operator
-
 import scipy
 import numpy
 import time
 from functools import partial
 import logging
-import ray
+
+
+# raised from the energy callback to stop the optimizer before it converges
+class VQEEarlyStop(Exception):
+    def __init__(self, stop_reason):
+        super(VQEEarlyStop, self).__init__(stop_reason)
+        self.stop_reason = stop_reason
 
 
 # TODO make this class entirely static?
 class VQERunner:
     # Works for a single geometry
     def __init__(self, q_system, backend=QiskitSimBackend, optimizer=config.default_optimizer,
-                 optimizer_options=config.default_optimizer_options, print_var_parameters=False, use_ansatz_gradient=False):
+                 optimizer_options=config.default_optimizer_options, print_var_parameters=False, use_ansatz_gradient=False,
+                 optimizer_tol=config.optimizer_tol, max_evaluations=None, max_time=None, stall_delta_e=None,
+                 stall_n_iterations=config.vqe_stall_n_iterations, callbacks=None):
 
         self.backend = backend
         self.optimizer = optimizer
         self.optimizer_options = optimizer_options
+        self.optimizer_tol = optimizer_tol
         self.use_ansatz_gradient = use_ansatz_gradient
         self.print_var_parameters = print_var_parameters
 
+        # budgets of a single VQE run. None means no limit
+        self.max_evaluations = max_evaluations  # maximum number of energy evaluations
+        self.max_time = max_time  # maximum wall time in seconds
+        # the run is stalled if the lowest energy does not decrease by more than stall_delta_e for stall_n_iterations
+        # optimizer iterations. The iterations are counted instead of the energy evaluations, which include the probes
+        # of the line searches and of the finite difference gradients
+        self.stall_delta_e = stall_delta_e
+        self.stall_n_iterations = stall_n_iterations
+        # functions called after each energy evaluation as callback(iteration, energy, var_parameters, timing), where
+        # timing is a dictionary of durations in seconds. If a callback returns True the run is stopped
+        if callbacks is None:
+            callbacks = []
+        self.callbacks = callbacks
+
         self.q_system = q_system
 
         self.previous_energy = self.q_system.hf_energy
@@ -32,17 +54,43 @@ class VQERunner:
         self.iteration = 0
         self.time_previous_iter = 0
 
-    # TODO split this into a proper callback function!!!!!!
+        # state of the current run, reset by init_run
+        self.n_evaluations = 0
+        self.time_run_start = 0
+        self.best_energy = None
+        self.best_var_parameters = None
+        self.stall_energy = None
+        self.n_stalled_iterations = 0
+
+    def init_run(self):
+        self.iteration = 1
+        self.time_previous_iter = time.time()
+        self.time_run_start = self.time_previous_iter
+        self.n_evaluations = 0
+        self.best_energy = None
+        self.best_var_parameters = None
+        self.stall_energy = None
+        self.n_stalled_iterations = 0
+
     def get_energy(self, var_parameters, ansatz, backend, multithread=False, multithread_iteration=None,
                    init_state_qasm=None, cache=None, excited_state=0):
 
-        if multithread is False:
-            iteration_duration = time.time() - self.time_previous_iter
-            self.time_previous_iter = time.time()
-
+        t0 = time.time()
         energy = backend.ham_expectation_value(var_parameters, ansatz, self.q_system, cache=cache,
                                                init_state_qasm=init_state_qasm, excited_state=excited_state)
 
+        self.energy_callback(var_parameters, energy, evaluation_duration=time.time() - t0, multithread=multithread,
+                             multithread_iteration=multithread_iteration)
+
+        return energy
+
+    # called after each energy evaluation: logging, iteration counting, user callbacks and budget checks
+    def energy_callback(self, var_parameters, energy, evaluation_duration=0, multithread=False,
+                        multithread_iteration=None):
+
+        iteration_duration = time.time() - self.time_previous_iter
+        self.time_previous_iter = time.time()
+
         if multithread:
             if multithread_iteration is not None:
                 try:
@@ -62,7 +110,67 @@ class VQERunner:
 
             self.iteration += 1
 
-        return energy
+        self.n_evaluations += 1
+        if config.instrumentation:
+            Instrumentation.count('energy_evaluations')
+        if self.best_energy is None or energy < self.best_energy:
+            self.best_energy = energy
+            self.best_var_parameters = numpy.array(var_parameters, copy=True)
+
+        timing = {'evaluation_duration': evaluation_duration, 'iteration_duration': iteration_duration,
+                  'run_time': time.time() - self.time_run_start}
+        stop_requested = False
+        for callback in self.callbacks:
+            stop_requested = callback(self.n_evaluations, energy, var_parameters, timing) or stop_requested
+
+        if stop_requested:
+            raise VQEEarlyStop('callback')
+        if self.max_evaluations is not None and self.n_evaluations >= self.max_evaluations:
+            raise VQEEarlyStop('max_evaluations')
+        if self.max_time is not None and timing['run_time'] >= self.max_time:
+            raise VQEEarlyStop('max_time')
+
+    # called by the optimizer after each iteration: stall check
+    def iteration_callback(self, var_parameters):
+        if self.stall_delta_e is None:
+            return
+        if self.stall_energy is None or self.best_energy < self.stall_energy - self.stall_delta_e:
+            self.stall_energy = self.best_energy
+            self.n_stalled_iterations = 0
+        else:
+            self.n_stalled_iterations += 1
+            if self.n_stalled_iterations >= self.stall_n_iterations:
+                raise VQEEarlyStop('stalled')
+
+    # run the optimizer. The returned result has a stop_reason field: 'converged', 'optimizer' (the optimizer stopped
+    # without success), 'callback', 'max_evaluations', 'max_time' or 'stalled'. If the run is stopped early, the result
+    # contains the lowest energy found and the corresponding parameters
+    def minimize(self, get_energy, get_gradient, var_parameters):
+        if self.use_ansatz_gradient and config.instrumentation:
+            def jac(var_parameters):
+                Instrumentation.count('gradient_evaluations')
+                return get_gradient(var_parameters)
+        elif self.use_ansatz_gradient:
+            jac = get_gradient
+        else:
+            jac = None
+
+        try:
+            result = scipy.optimize.minimize(get_energy, var_parameters, jac=jac, method=self.optimizer,
+                                             options=self.optimizer_options, tol=self.optimizer_tol,
+                                             bounds=config.optimizer_bounds, callback=self.iteration_callback)
+            if result.success:
+                result['stop_reason'] = 'converged'
+            else:
+                result['stop_reason'] = 'optimizer'
+        except VQEEarlyStop as early_stop:
+            result = scipy.optimize.OptimizeResult(x=self.best_var_parameters, fun=self.best_energy, success=False,
+                                                   message='Stopped early: {}'.format(early_stop.stop_reason),
+                                                   nfev=self.n_evaluations, stop_reason=early_stop.stop_reason)
+            logging.info('VQE stopped early: {}. Energy {}. Evaluations {}'
+                         .format(early_stop.stop_reason, self.best_energy, self.n_evaluations))
+
+        return result
 
     def vqe_run(self, ansatz, init_guess_parameters=None, init_state_qasm=None, excited_state=0, cache=None):
 
@@ -75,8 +183,8 @@ class VQERunner:
 
         LogUtils.vqe_info(self.q_system, self.backend, self.optimizer, ansatz)
 
-        self.iteration = 1
-        self.time_previous_iter = time.time()
+        self.init_run()
+        instrumentation_snapshot = Instrumentation.snapshot()
 
         # functions to be called by the optimizer
         get_energy = partial(self.get_energy, ansatz=ansatz, backend=self.backend, init_state_qasm=init_state_qasm,
@@ -85,21 +193,15 @@ class VQERunner:
         get_gradient = partial(self.backend.ansatz_gradient, ansatz=ansatz, q_system=self.q_system,
                                init_state_qasm=init_state_qasm, cache=cache, excited_state=excited_state)
 
-        if self.use_ansatz_gradient:
-            result = scipy.optimize.minimize(get_energy, var_parameters, jac=get_gradient, method=self.optimizer,
-                                             options=self.optimizer_options, tol=config.optimizer_tol,
-                                             bounds=config.optimizer_bounds)
-        else:
-
-            result = scipy.optimize.minimize(get_energy, var_parameters, method=self.optimizer,
-                                             options=self.optimizer_options, tol=config.optimizer_tol,
-                                             bounds=config.optimizer_bounds)
+        result = self.minimize(get_energy, get_gradient, var_parameters)
 
         result['n_iters'] = self.iteration  # cheating
+        if config.instrumentation:
+            result['instrumentation'] = Instrumentation.summary(instrumentation_snapshot)
 
         return result
 
-    @ray.remote
+    # a VQE run as a ray task (see RayTasks)
     def vqe_run_multithread(self, ansatz, init_guess_parameters=None, init_state_qasm=None, excited_state=0, cache=None):
 
         assert len(ansatz) > 0
@@ -110,6 +212,10 @@ class VQERunner:
             assert len(init_guess_parameters) == sum([element.n_var_parameters for element in ansatz])
             var_parameters = init_guess_parameters
 
+        self.init_run()
+        # the counts of the worker process, summarized with the result
+        instrumentation_snapshot = Instrumentation.snapshot()
+
         # create it as a list so we can pass it by reference
         local_thread_iteration = [0]
 
@@ -120,18 +226,11 @@ class VQERunner:
         get_gradient = partial(self.backend.ansatz_gradient, ansatz=ansatz, init_state_qasm=init_state_qasm,
                                excited_state=excited_state, cache=cache, q_system=self.q_system)
 
-        if self.use_ansatz_gradient:
-            result = scipy.optimize.minimize(get_energy, var_parameters, method=self.optimizer, jac=get_gradient,
-                                             options=self.optimizer_options, tol=config.optimizer_tol,
-                                             bounds=config.optimizer_bounds)
-        else:
-            result = scipy.optimize.minimize(get_energy, var_parameters, method=self.optimizer,
-                                             options=self.optimizer_options, tol=config.optimizer_tol,
-                                             bounds=config.optimizer_bounds)
+        result = self.minimize(get_energy, get_gradient, var_parameters)
 
         # Logging does not work properly with ray multithreading. So use this printings. TODO: fix this. ..
-        print('Ran VQE for last element {}. Energy {}. Iterations {}'.
-              format(ansatz[-1].element, result.fun, local_thread_iteration[0]))
+        print('Ran VQE for last element {}. Energy {}. Iterations {}. Stop reason {}'.
+              format(ansatz[-1].element, result.fun, local_thread_iteration[0], result['stop_reason']))
 
         # Not sure if needed
         del cache
@@ -142,6 +241,7 @@ class VQERunner:
         #     del cache
 
         result['n_iters'] = local_thread_iteration[0]  # cheating
+        if config.instrumentation:
+            result['instrumentation'] = Instrumentation.summary(instrumentation_snapshot)
 
         return result
-
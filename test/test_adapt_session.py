@@ -0,0 +1,156 @@
+import unittest
+import tempfile
+
+from src.adapt_session import AdaptSession, GradientSelection, FullEnergySelection, SpinComplementPairSelection, \
+    IndividualEnergySelection
+from src.ansatz_element_sets import GSDExcitations
+from src.cache import GlobalCache
+from src.iter_vqe_utils import GradientUtils, EnergyUtils, PrecisionSchedule
+from src.run_log import RunLog
+from src.vqe_runner import VQERunner
+from src import backends
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import numpy
+
+
+class AdaptSessionTest(unittest.TestCase):
+
+    delta_e_threshold = 1e-10
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+        cls.q_system = BenchmarkSystems.get_system('H4')
+        cls.pool = GSDExcitations(cls.q_system.n_orbitals, cls.q_system.n_electrons, 'q_exc').get_all_elements()
+        cls.vqe_runner = VQERunner(cls.q_system, backend=backends.MatrixCacheBackend, optimizer='BFGS',
+                                   optimizer_options={'gtol': 1e-8}, use_ansatz_gradient=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    def session(self, strategy, run_log=None):
+        return AdaptSession(self.q_system, self.pool, self.vqe_runner, strategy, self.delta_e_threshold,
+                            run_log=run_log)
+
+    # the gradients from psi and H psi are the gradients from the commutator matrices
+    def test_gradients(self):
+        session = self.session(GradientSelection())
+        for i in range(2):
+            self.assertTrue(session.step())
+
+        elements = list(session.active_pool)
+        global_cache = session.global_cache
+        global_cache.calculate_commutators_sparse_matrices_dict(elements)
+        elements_gradients = GradientUtils.\
+            get_ansatz_elements_gradients(elements, self.q_system, ansatz_parameters=session.ansatz_parameters,
+                                          ansatz=session.ansatz, global_cache=global_cache,
+                                          backend=backends.MatrixCacheBackend)
+        gradients = [gradient for element, gradient in elements_gradients]
+        self.assertGreater(max(numpy.abs(gradients)), 1e-3)
+        numpy.testing.assert_allclose(session.gradients(elements), gradients, rtol=0, atol=1e-12)
+
+    # one iteration of the QEB-ADAPT-VQE driver before the AdaptSession: the element with the largest full energy
+    # reduction among the n largest gradients elements, added with its spin complement
+    def baseline_qeb_iteration(self, n_largest_grads):
+        global_cache = GlobalCache(self.q_system)
+        global_cache.calculate_exc_gen_sparse_matrices_dict(self.pool)
+        global_cache.calculate_commutators_sparse_matrices_dict(self.pool)
+        precision_schedule = PrecisionSchedule(self.delta_e_threshold)
+
+        elements_grads = GradientUtils.\
+            get_largest_gradient_elements(self.pool, self.q_system, backend=backends.MatrixCacheBackend,
+                                          n=n_largest_grads, ansatz_parameters=[], ansatz=[], global_cache=global_cache)
+        elements = [element for element, gradient in elements_grads]
+        screening_vqe_runner = precision_schedule.get_vqe_runner(self.vqe_runner, 'screening')
+        elements_results = EnergyUtils.\
+            elements_full_vqe_energy_reductions(screening_vqe_runner, elements, ansatz_parameters=[], ansatz=[],
+                                                global_cache=global_cache)
+        element, result = min(elements_results, key=lambda x: x[1].fun)
+
+        new_elements = [element]
+        complement_element = element.get_spin_comp_exc()
+        if not SpinComplementPairSelection.same_qubits(element, complement_element):
+            new_elements.append(complement_element)
+        iteration_vqe_runner = precision_schedule.get_vqe_runner(self.vqe_runner, 'iteration')
+        result = iteration_vqe_runner.vqe_run(ansatz=new_elements, init_guess_parameters=[0] * len(new_elements),
+                                              cache=global_cache)
+        return new_elements, result.fun
+
+    def test_qeb_iteration(self):
+        elements, energy = self.baseline_qeb_iteration(5)
+        self.assertEqual(len(elements), 2)
+
+        session = self.session(SpinComplementPairSelection(FullEnergySelection(n_candidates=5)))
+        self.assertTrue(session.step())
+        # an element and its spin complement have equal gradients, so the pair can be selected in either order
+        self.assertEqual(sorted([str(element.element) for element in session.ansatz]),
+                         sorted([str(element.element) for element in elements]))
+        self.assertAlmostEqual(session.current_energy, energy, places=8)
+        self.assertLess(session.current_energy, self.q_system.hf_energy - 1e-3)
+
+    def check_equal_sessions(self, session, resumed_session):
+        self.assertEqual([element.element for element in resumed_session.ansatz],
+                         [element.element for element in session.ansatz])
+        numpy.testing.assert_allclose(resumed_session.ansatz_parameters, session.ansatz_parameters, rtol=0, atol=1e-12)
+        self.assertEqual([record['n'] for record in resumed_session.records],
+                         [record['n'] for record in session.records])
+        numpy.testing.assert_allclose([record['E'] for record in resumed_session.records],
+                                      [record['E'] for record in session.records], rtol=0, atol=1e-12)
+
+    # a run interrupted after 3 iterations (checkpointed after the 2nd) and resumed gives the same result as an
+    # uninterrupted run. The runs are started with the same random seed, and the resumed run with another one
+    def check_resume(self, strategy):
+        n_iterations = 5
+        with tempfile.TemporaryDirectory() as directory:
+            numpy.random.seed(0)
+            session = self.session(strategy,
+                                   run_log=RunLog('uninterrupted', directory=directory, checkpoint_interval=2))
+            for i in range(n_iterations):
+                self.assertTrue(session.step())
+            final_result = session.final_vqe()
+            session.close()
+
+            numpy.random.seed(0)
+            interrupted_session = self.session(strategy,
+                                               run_log=RunLog('interrupted', directory=directory,
+                                                              checkpoint_interval=2))
+            for i in range(3):
+                self.assertTrue(interrupted_session.step())
+            interrupted_session.close()
+
+            numpy.random.seed(1)
+            resumed_session = self.session(strategy,
+                                           run_log=RunLog.from_path(interrupted_session.run_log.records_path,
+                                                                    checkpoint_interval=2))
+            self.assertEqual(resumed_session.iter_count, 3)
+            self.check_equal_sessions(interrupted_session, resumed_session)
+            while resumed_session.iter_count < n_iterations:
+                self.assertTrue(resumed_session.step())
+            resumed_final_result = resumed_session.final_vqe()
+            resumed_session.close()
+
+            self.check_equal_sessions(session, resumed_session)
+            self.assertAlmostEqual(resumed_final_result.fun, final_result.fun, places=10)
+            self.assertTrue(resumed_session.run_log.is_completed())
+
+    def test_resume(self):
+        self.check_resume(GradientSelection())
+
+    # the random state is restored from the record of the 3rd iteration, which is replayed after the checkpoint
+    def test_resume_random_init_parameters(self):
+        self.check_resume(IndividualEnergySelection(n_screened=5, random_init_parameters=True))
+
+    def test_max_iterations(self):
+        session = self.session(GradientSelection())
+        session.run(2)
+        # the bound of the original drivers: iterations while iter_count <= max_iterations
+        self.assertEqual(session.iter_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+
+from src.ansatz_element_sets import GSDExcitations, SpinCompGSDExcitations
+from src.backends import QiskitSimBackend, ShotSimBackend
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import numpy
+
+
+class ElementKeyTest(unittest.TestCase):
+
+    def test_element_keys(self):
+        pool = []
+        for element_type in ['q_exc', 'f_exc', 'eff_f_exc']:
+            pool += list(GSDExcitations(6, 2, element_type).get_all_elements())
+            pool += list(SpinCompGSDExcitations(6, 2, element_type).get_all_elements())
+
+        keys = [QiskitSimBackend.element_key(element) for element in pool]
+
+        # the keys do not build the excitation generators
+        self.assertTrue(all(element._excitations_generators is None for element in pool))
+        # elements with equal keys have equal excitation generators
+        generators = {}
+        for key, element in zip(keys, pool):
+            generators.setdefault(key, str(element.excitations_generators))
+            self.assertEqual(generators[key], str(element.excitations_generators))
+
+
+class ShotSimBackendTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.q_system = BenchmarkSystems.get_system('LiH')
+        cls.n_qubits = cls.q_system.n_qubits
+
+        statevector = numpy.random.default_rng(1).normal(size=(2, 2 ** cls.n_qubits))
+        cls.statevector = statevector[0] + 1j * statevector[1]
+        cls.statevector /= numpy.linalg.norm(cls.statevector)
+
+    def setUp(self):
+        self.shots_seed = config.shots_seed
+        config.shots_seed = 7
+        self.groups = ShotSimBackend.measurement_groups(self.q_system)
+        for group in self.groups:
+            group['variance'] = None
+
+    def tearDown(self):
+        config.shots_seed = self.shots_seed
+
+    def test_measurement_groups(self):
+        terms = {pauli_word: coefficient.real for pauli_word, coefficient in self.q_system.qubit_ham.terms.items()
+                 if pauli_word != () and abs(coefficient) > config.floating_point_accuracy}
+
+        grouped_terms = []
+        for group in self.groups:
+            basis = dict(group['basis'])
+            self.assertEqual(len(basis), len(group['basis']))
+            for mask, coefficient in zip(group['masks'], group['coefficients']):
+                # the measured qubits of the term, measured in the basis of the group
+                pauli_words = [pauli_word for pauli_word in terms
+                               if sum([2 ** (self.n_qubits - 1 - qubit) for qubit, _ in pauli_word]) == mask
+                               and all(basis.get(qubit) == pauli for qubit, pauli in pauli_word)]
+                self.assertEqual(len(pauli_words), 1)
+                self.assertAlmostEqual(terms[pauli_words[0]], coefficient)
+                grouped_terms.append(pauli_words[0])
+            self.assertAlmostEqual(group['weight'], abs(group['coefficients']).sum())
+
+        # each term is in exactly one group
+        self.assertEqual(len(grouped_terms), len(terms))
+        self.assertEqual(set(grouped_terms), set(terms))
+
+    def test_allocate_shots(self):
+        n_shots = 10000
+        weights = numpy.array([group['weight'] for group in self.groups])
+
+        groups_shots = ShotSimBackend.allocate_shots(self.groups, n_shots)
+        self.assertTrue(all(groups_shots >= config.shots_min_per_group))
+        self.assertTrue(abs(groups_shots.sum() - n_shots) <= len(self.groups) * config.shots_min_per_group)
+        # proportional to the weights before the first evaluation
+        largest = numpy.argmax(weights)
+        self.assertEqual(groups_shots[largest], round(n_shots * weights[largest] / weights.sum()))
+
+        # proportional to the standard deviations after an evaluation
+        for i, group in enumerate(self.groups):
+            group['variance'] = (group['weight'] if i == 0 else config.floating_point_accuracy) ** 2
+        groups_shots = ShotSimBackend.allocate_shots(self.groups, n_shots)
+        minimum_weights = numpy.array([config.shots_min_weight_fraction * group['weight'] for group in self.groups])
+        deviations = numpy.concatenate([[self.groups[0]['weight']], minimum_weights[1:]])
+        expected_shots = numpy.maximum(numpy.round(n_shots * deviations / deviations.sum()),
+                                       config.shots_min_per_group)
+        numpy.testing.assert_array_equal(groups_shots, expected_shots)
+
+    def test_estimate_converges(self):
+        exact_energy = numpy.vdot(self.statevector, self.q_system.get_h_sparse_matrix().dot(self.statevector)).real
+
+        errors = []
+        for n_shots in [10 ** 3, 10 ** 5, 10 ** 7]:
+            groups_shots = ShotSimBackend.allocate_shots(self.groups, n_shots)
+            samples = ShotSimBackend.sample_statevector(self.groups, groups_shots, self.statevector, self.n_qubits)
+            for (outcomes, counts), shots in zip(samples, groups_shots):
+                self.assertEqual(counts.sum(), shots)
+            energy = ShotSimBackend.estimate(self.groups, samples, self.q_system)
+
+            standard_error = numpy.sqrt(sum([group['variance'] / shots
+                                             for group, shots in zip(self.groups, groups_shots)]))
+            self.assertLess(abs(energy - exact_energy), 5 * standard_error)
+            errors.append(standard_error)
+
+        self.assertLess(errors[-1], 1e-3)
+        self.assertLess(errors[-1], errors[0] / 10)
+
+    def test_random_generator_seed(self):
+        groups_shots = ShotSimBackend.allocate_shots(self.groups, 1000)
+
+        def samples():
+            return [counts.tolist() for outcomes, counts in
+                    ShotSimBackend.sample_statevector(self.groups, groups_shots, self.statevector, self.n_qubits)]
+
+        # the generator is reseeded when the seed changes
+        seeds_samples = []
+        for seed in [8, 7, 8, 7]:
+            config.shots_seed = seed
+            seeds_samples.append(samples())
+        self.assertEqual(seeds_samples[0], seeds_samples[2])
+        self.assertEqual(seeds_samples[1], seeds_samples[3])
+        self.assertNotEqual(seeds_samples[0], seeds_samples[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
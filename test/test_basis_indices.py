@@ -0,0 +1,83 @@
+import unittest
+
+from src.basis_indices import BasisIndices
+
+import scipy.sparse
+import numpy
+
+
+class BasisIndicesTest(unittest.TestCase):
+
+    n_qubits = 6
+
+    # the occupations of the qubits of a basis state, in the openfermion ordering
+    def occupations(self, index):
+        return [(index >> (self.n_qubits - 1 - qubit)) & 1 for qubit in range(self.n_qubits)]
+
+    def test_popcount(self):
+        indices = numpy.array([0, 1, 2 ** 40 + 3, 2 ** 62 - 1, 255, 256])
+        self.assertEqual(list(BasisIndices.popcount(indices)), [bin(index).count('1') for index in indices])
+        self.assertEqual(BasisIndices.popcount(indices.reshape(2, 3)).shape, (2, 3))
+
+    def test_electron_numbers_and_sz(self):
+        electron_numbers = BasisIndices.electron_numbers(self.n_qubits)
+        double_sz = BasisIndices.double_sz(self.n_qubits)
+        for index in range(2 ** self.n_qubits):
+            occupations = self.occupations(index)
+            self.assertEqual(electron_numbers[index], sum(occupations))
+            self.assertEqual(double_sz[index], sum(occupations[0::2]) - sum(occupations[1::2]))
+
+        # the tables are memoized and read only
+        self.assertIs(BasisIndices.electron_numbers(self.n_qubits), electron_numbers)
+        with self.assertRaises(ValueError):
+            electron_numbers[0] = 1
+
+    def test_sector_indices_and_positions(self):
+        for n_electrons, sz in [(2, None), (3, 0.5), (4, 0)]:
+            indices = BasisIndices.sector_indices(self.n_qubits, n_electrons, sz)
+            expected_indices = [index for index in range(2 ** self.n_qubits)
+                                if sum(self.occupations(index)) == n_electrons and
+                                (sz is None or sum(self.occupations(index)[0::2]) -
+                                 sum(self.occupations(index)[1::2]) == 2 * sz)]
+            self.assertEqual(list(indices), expected_indices)
+
+            positions = BasisIndices.sector_positions(self.n_qubits, n_electrons, sz)
+            self.assertEqual(list(positions[indices]), list(range(len(indices))))
+            self.assertEqual((positions >= 0).sum(), len(indices))
+
+    def test_sector_matrix(self):
+        n_electrons = 3
+        rng = numpy.random.default_rng(0)
+        matrix = scipy.sparse.random(2 ** self.n_qubits, 2 ** self.n_qubits, density=0.2, random_state=1) + \
+            1j * scipy.sparse.random(2 ** self.n_qubits, 2 ** self.n_qubits, density=0.2, random_state=2)
+        indices = BasisIndices.sector_indices(self.n_qubits, n_electrons)
+
+        sector_matrix = BasisIndices.sector_matrix(matrix, self.n_qubits, n_electrons)
+        numpy.testing.assert_array_equal(sector_matrix.toarray(), matrix.toarray()[indices][:, indices])
+
+        # the sector vectors embedded in the full space
+        sector_vectors = rng.normal(size=(len(indices), 2))
+        full_vectors = BasisIndices.from_sector(sector_vectors, self.n_qubits, n_electrons)
+        numpy.testing.assert_array_equal(full_vectors[indices], sector_vectors)
+        self.assertEqual(numpy.count_nonzero(full_vectors), numpy.count_nonzero(sector_vectors))
+        numpy.testing.assert_allclose(matrix.dot(full_vectors)[indices], sector_matrix.dot(sector_vectors))
+
+    def test_hf_statevector(self):
+        for n_electrons in range(self.n_qubits + 1):
+            statevector = BasisIndices.hf_statevector(self.n_qubits, n_electrons)
+            self.assertEqual(statevector.sum(), 1)
+            self.assertEqual(self.occupations(int(numpy.argmax(statevector))),
+                             [1] * n_electrons + [0] * (self.n_qubits - n_electrons))
+
+    def test_statevector_electron_number(self):
+        statevector = numpy.zeros(2 ** self.n_qubits)
+        self.assertIsNone(BasisIndices.statevector_electron_number(statevector))
+        statevector[int('110000', 2)] = 0.6
+        statevector[int('000101', 2)] = 0.8
+        self.assertEqual(BasisIndices.statevector_electron_number(statevector), 2)
+        statevector[int('000111', 2)] = 0.1
+        self.assertIs(BasisIndices.statevector_electron_number(statevector), False)
+
+
+if __name__ == '__main__':
+    unittest.main()
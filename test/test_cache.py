@@ -0,0 +1,41 @@
+import unittest
+
+from src.ansatz_element_sets import GSDExcitations
+from src.cache import GlobalCache
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+
+class CacheMemoryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+        cls.q_system = BenchmarkSystems.get_system('H4')
+        pool = GSDExcitations(cls.q_system.n_orbitals, cls.q_system.n_electrons, 'q_exc').get_all_elements()
+        cls.elements = [pool[i] for i in [3, 5, 16, 55, 88, 237]]
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    # the bytes of a commutator are estimated from the sparsity of H and the excitation generators before it is
+    # calculated (an upper bound), and are the bytes of its arrays after
+    def test_commutator_nbytes(self):
+        global_cache = GlobalCache(self.q_system)
+        global_cache.calculate_exc_gen_sparse_matrices_dict(self.elements)
+        estimated_nbytes = [global_cache.commutator_nbytes(element) for element in self.elements]
+
+        global_cache.calculate_commutators_sparse_matrices_dict(self.elements)
+        for element, element_estimated_nbytes in zip(self.elements, estimated_nbytes):
+            commutator_matrix = global_cache.get_commutator_matrix(element)
+            nbytes = commutator_matrix.data.nbytes + commutator_matrix.indices.nbytes + commutator_matrix.indptr.nbytes
+            self.assertGreater(nbytes, 0)
+            self.assertEqual(global_cache.commutator_nbytes(element), nbytes)
+            self.assertGreaterEqual(element_estimated_nbytes, nbytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import unittest
+import random
+
+from src.ansatz_element_sets import GSDExcitations, SpinCompGSDExcitations
+from src.circuits import CircuitStats, PeepholeOptimizer
+from src.iter_vqe_utils import IterVQEQasmUtils
+from src.utils import Gate
+from src import config
+
+import numpy
+
+
+class CircuitStatsTest(unittest.TestCase):
+
+    # the depths of the longest paths through the gates (all gates, two-qubit gates and single-qubit gates), by a
+    # quadratic scan over the preceding gates
+    @staticmethod
+    def reference_depths(gates):
+        depths = []
+        for i, gate in enumerate(gates):
+            is_two_qubit_gate = gate.name in CircuitStats.two_qubit_gates
+            previous_depths = [depths[j] for j in range(i) if set(gates[j].qubits) & set(gate.qubits)]
+            depths.append([max([depth[0] for depth in previous_depths], default=0) + 1,
+                           max([depth[1] for depth in previous_depths], default=0) + is_two_qubit_gate,
+                           max([depth[2] for depth in previous_depths], default=0) + (not is_two_qubit_gate)])
+        return [max([depth[k] for depth in depths], default=0) for k in range(3)]
+
+    def test_hand_built_circuit(self):
+        gates = [Gate('h', (0,), None), Gate('rz', (2,), 0.1), Gate('cx', (0, 1), None), Gate('cx', (1, 2), None),
+                 Gate('x', (0,), None), Gate('ry', (2,), 0.2)]
+        circuit_stats = CircuitStats(3)
+        circuit_stats.append_gates(gates)
+
+        # layers: h(0) rz(2) | cx(0, 1) | cx(1, 2) x(0) | ry(2)
+        self.assertEqual(circuit_stats.depth, 4)
+        self.assertEqual(circuit_stats.cnot_depth, 2)
+        # h(0), x(0) and rz(2), ry(2) are the single-qubit gates on the paths through the CNOTs
+        self.assertEqual(circuit_stats.u1_depth, 2)
+
+        gate_count = circuit_stats.gate_count()
+        self.assertEqual(gate_count['depth'], 4)
+        self.assertEqual(gate_count['cnot_depth'], 2)
+        self.assertEqual(gate_count['u1_depth'], 2)
+        self.assertEqual(gate_count['cnot_count'], 2)
+        self.assertEqual(gate_count['u1_count'], 4)
+        self.assertEqual(gate_count['gate_count'], {'q0': {'cx': 1, 'u1': 2}, 'q1': {'cx': 2, 'u1': 0},
+                                                    'q2': {'cx': 1, 'u1': 2}})
+        self.assertEqual(CircuitStats(3).gate_count()['depth'], 0)
+
+    def test_ansatz_depths(self):
+        random.seed(0)
+        n_qubits = 8
+        pool = list(GSDExcitations(n_qubits, 4, 'eff_f_exc').get_all_elements()) + \
+            list(SpinCompGSDExcitations(n_qubits, 4, 'q_exc').get_all_elements())
+        ansatz = random.sample(pool, 12)
+
+        gates = []
+        for n_elements, element in enumerate(ansatz, 1):
+            gates += element.get_gates([0.1] * element.n_var_parameters)
+            # the statistics of the ansatz are extended incrementally
+            circuit_stats = CircuitStats.from_ansatz(ansatz[:n_elements], n_qubits)
+            self.assertEqual([circuit_stats.depth, circuit_stats.cnot_depth, circuit_stats.u1_depth],
+                             self.reference_depths(gates))
+            self.assertEqual(circuit_stats.cnot_count, sum([gate.name in CircuitStats.two_qubit_gates
+                                                            for gate in gates]))
+
+        optimize_circuits = config.optimize_circuits
+        config.optimize_circuits = False
+        try:
+            gate_count = IterVQEQasmUtils.gate_count_from_ansatz(ansatz, n_qubits)
+        finally:
+            config.optimize_circuits = optimize_circuits
+        self.assertEqual([gate_count['depth'], gate_count['cnot_depth'], gate_count['u1_depth']],
+                         self.reference_depths(gates))
+
+
+class PeepholeOptimizerTest(unittest.TestCase):
+
+    n_qubits = 6
+
+    single_qubit_gates = {'h': numpy.array([[1, 1], [1, -1]]) / numpy.sqrt(2), 'x': numpy.array([[0, 1], [1, 0]]),
+                          'y': numpy.array([[0, -1j], [1j, 0]]), 'z': numpy.diag([1, -1])}
+
+    @staticmethod
+    def rotation(name, angle):
+        c, s = numpy.cos(angle / 2), numpy.sin(angle / 2)
+        if name == 'rx':
+            return numpy.array([[c, -1j * s], [-1j * s, c]])
+        if name == 'ry':
+            return numpy.array([[c, -s], [s, c]])
+        assert name == 'rz'
+        return numpy.diag([numpy.exp(-0.5j * angle), numpy.exp(0.5j * angle)])
+
+    # the unitary of a list of gates, applied to the columns of the identity (the qubit q is the axis q)
+    def circuit_unitary(self, gates):
+        n_qubits = self.n_qubits
+        unitary = numpy.eye(2 ** n_qubits, dtype=complex).reshape((2,) * n_qubits + (2 ** n_qubits,))
+        for gate in gates:
+            if gate.name in ['cx', 'swap']:
+                qubit_1, qubit_2 = gate.qubits
+                if gate.name == 'swap':
+                    unitary = numpy.swapaxes(unitary, qubit_1, qubit_2)
+                else:
+                    index = [slice(None)] * (n_qubits + 1)
+                    index[qubit_1] = 1
+                    controlled = unitary[tuple(index)]
+                    # the target axis of the controlled block, after removing the control axis
+                    target = qubit_2 - (qubit_2 > qubit_1)
+                    unitary[tuple(index)] = numpy.flip(controlled, axis=target)
+            else:
+                if gate.name in self.single_qubit_gates:
+                    matrix = self.single_qubit_gates[gate.name]
+                else:
+                    matrix = self.rotation(gate.name, gate.angle)
+                qubit = gate.qubits[0]
+                unitary = numpy.moveaxis(numpy.tensordot(matrix, unitary, axes=([1], [qubit])), 0, qubit)
+        return unitary.reshape(2 ** n_qubits, 2 ** n_qubits)
+
+    def assert_equal_up_to_phase(self, unitary_1, unitary_2):
+        overlap = numpy.vdot(unitary_1, unitary_2)
+        phase = overlap / abs(overlap)
+        numpy.testing.assert_allclose(unitary_1 * phase, unitary_2, atol=1e-9)
+
+    def random_ansatz(self, seed, n_elements=10):
+        random.seed(seed)
+        pool = []
+        for element_type in ['q_exc', 'f_exc', 'eff_f_exc']:
+            pool += list(GSDExcitations(self.n_qubits, 2, element_type).get_all_elements())
+            pool += list(SpinCompGSDExcitations(self.n_qubits, 2, element_type).get_all_elements())
+        return random.sample(pool, n_elements)
+
+    def test_circuit_unitary(self):
+        # CNOT(0, 1) = H(1) CZ(0, 1) H(1), and CZ is diagonal with -1 on the states with both qubits set
+        gates = [Gate('h', (1,), None), Gate('cx', (0, 1), None), Gate('h', (1,), None)]
+        cz = numpy.diag([-1 if (index >> (self.n_qubits - 1)) & 1 and (index >> (self.n_qubits - 2)) & 1 else 1
+                         for index in range(2 ** self.n_qubits)])
+        numpy.testing.assert_allclose(self.circuit_unitary(gates), cz, atol=1e-12)
+
+    def test_optimized_unitaries(self):
+        for seed in range(4):
+            ansatz = self.random_ansatz(seed)
+            var_parameters = numpy.random.default_rng(seed).uniform(-numpy.pi, numpy.pi,
+                                                                     sum([element.n_var_parameters
+                                                                          for element in ansatz]))
+            gates = []
+            n_used_var_pars = 0
+            for element in ansatz:
+                gates += element.get_gates(list(var_parameters[n_used_var_pars:][:element.n_var_parameters]))
+                n_used_var_pars += element.n_var_parameters
+
+            optimized_gates = PeepholeOptimizer.optimized_ansatz_gates(ansatz)
+            self.assertLess(len(optimized_gates), len(gates))
+            self.assert_equal_up_to_phase(self.circuit_unitary(PeepholeOptimizer.bind(optimized_gates, var_parameters)),
+                                          self.circuit_unitary(gates))
+
+    # the optimizer (and the statistics) of an ansatz extended incrementally (by a candidate element, or by the
+    # selected one) equals the optimizer of the whole ansatz
+    def test_incremental_optimizer(self):
+        ansatz = self.random_ansatz(0, n_elements=16)
+        for n_elements in range(len(ansatz) - 1):
+            for candidate in ansatz[n_elements + 1:][:3]:
+                candidate_ansatz = ansatz[:n_elements] + [candidate]
+                self.assertEqual(PeepholeOptimizer.optimized_ansatz_gates(candidate_ansatz),
+                                 PeepholeOptimizer.optimize(PeepholeOptimizer.affine_gates(candidate_ansatz)))
+                circuit_stats = CircuitStats(self.n_qubits)
+                for element in candidate_ansatz:
+                    circuit_stats.append_element(element)
+                self.assertEqual(CircuitStats.from_ansatz(candidate_ansatz, self.n_qubits).gate_count(),
+                                 circuit_stats.gate_count())
+            self.assertEqual(PeepholeOptimizer.optimized_ansatz_gates(ansatz[:n_elements + 1]),
+                             PeepholeOptimizer.optimize(PeepholeOptimizer.affine_gates(ansatz[:n_elements + 1])))
+
+        # repeated calls return the same optimizer, with the statistics calculated once
+        optimizer = PeepholeOptimizer.from_ansatz(ansatz)
+        self.assertIs(PeepholeOptimizer.from_ansatz(list(ansatz)), optimizer)
+        self.assertIs(optimizer.circuit_stats(self.n_qubits), optimizer.circuit_stats(self.n_qubits))
+        # a shorter ansatz is optimized again
+        self.assertEqual(PeepholeOptimizer.optimized_ansatz_gates(ansatz[2:5]),
+                         PeepholeOptimizer.optimize(PeepholeOptimizer.affine_gates(ansatz[2:5])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from src.eigensolvers import SectorEigensolver
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import numpy
+
+
+class SectorEigensolverTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.q_system = BenchmarkSystems.get_system('H4')
+        cls.n_qubits = cls.q_system.n_qubits
+        cls.n_electrons = cls.q_system.n_electrons
+        cls.H_sparse_matrix = cls.q_system.get_h_sparse_matrix()
+
+    def setUp(self):
+        self.dense_dimension = config.eigensolver_dense_dimension
+        SectorEigensolver.eigenpairs = {}
+        SectorEigensolver.warm_starts = {}
+
+    def tearDown(self):
+        config.eigensolver_dense_dimension = self.dense_dimension
+
+    # the lowest eigenvalues of the sector, from a dense diagonalization of the full space Hamiltonian with penalties
+    # for the basis states outside the sector
+    def reference_eigenvalues(self, k, sz=None):
+        penalty = numpy.zeros(2 ** self.n_qubits)
+        for index in range(2 ** self.n_qubits):
+            occupations = [(index >> (self.n_qubits - 1 - qubit)) & 1 for qubit in range(self.n_qubits)]
+            double_sz = sum(occupations[0::2]) - sum(occupations[1::2])
+            penalty[index] = (sum(occupations) - self.n_electrons) ** 2
+            if sz is not None:
+                penalty[index] += (double_sz - 2 * sz) ** 2
+        H = self.H_sparse_matrix.toarray() + 1e3 * numpy.diag(penalty)
+        return numpy.linalg.eigvalsh(H)[:k]
+
+    def check_eigenpairs(self, eigenvalues, eigenvectors, k, sz=None):
+        numpy.testing.assert_allclose(eigenvalues, self.reference_eigenvalues(k, sz), atol=1e-8)
+
+        self.assertEqual(eigenvectors.shape, (2 ** self.n_qubits, k))
+        residuals = self.H_sparse_matrix.dot(eigenvectors) - eigenvectors * eigenvalues
+        self.assertLess(abs(residuals).max(), 1e-6)
+        for i in range(k):
+            self.assertEqual(self.electron_number(eigenvectors[:, i]), self.n_electrons)
+
+    def electron_number(self, statevector):
+        electron_numbers = set([bin(index).count('1') for index in numpy.nonzero(abs(statevector) > 1e-12)[0]])
+        self.assertEqual(len(electron_numbers), 1)
+        return electron_numbers.pop()
+
+    def test_dense_sector(self):
+        eigenvalues, eigenvectors = SectorEigensolver.lowest_eigenpairs(self.H_sparse_matrix, self.n_qubits,
+                                                                        self.n_electrons, 6)
+        self.check_eigenpairs(eigenvalues, eigenvectors, 6)
+
+    def test_sparse_sector(self):
+        config.eigensolver_dense_dimension = 10
+        eigenvalues, eigenvectors = SectorEigensolver.lowest_eigenpairs(self.H_sparse_matrix, self.n_qubits,
+                                                                        self.n_electrons, 4)
+        self.check_eigenpairs(eigenvalues, eigenvectors, 4)
+
+        # warm started from the memoized eigenvectors
+        eigenvalues, eigenvectors = SectorEigensolver.lowest_eigenpairs(self.H_sparse_matrix, self.n_qubits,
+                                                                        self.n_electrons, 6)
+        self.check_eigenpairs(eigenvalues, eigenvectors, 6)
+
+    def test_sz_sector(self):
+        config.eigensolver_dense_dimension = 10
+        eigenvalues, eigenvectors = SectorEigensolver.lowest_eigenpairs(self.H_sparse_matrix, self.n_qubits,
+                                                                        self.n_electrons, 3, sz=0)
+        self.check_eigenpairs(eigenvalues, eigenvectors, 3, sz=0)
+
+    # Lanczos, for the blocks that are not small compared to the dimension
+    def test_lanczos_sector(self):
+        config.eigensolver_dense_dimension = 10
+        eigenvalues, eigenvectors = SectorEigensolver.lowest_eigenpairs(self.H_sparse_matrix, self.n_qubits,
+                                                                        self.n_electrons, 8, sz=0)
+        self.check_eigenpairs(eigenvalues, eigenvectors, 8, sz=0)
+
+    def test_memoized_eigenpairs(self):
+        eigenvalues, _ = SectorEigensolver.lowest_eigenpairs(self.H_sparse_matrix, self.n_qubits, self.n_electrons, 4)
+        self.assertEqual(len(SectorEigensolver.eigenpairs), 1)
+        memoized_eigenvalues, _ = SectorEigensolver.lowest_eigenpairs(self.H_sparse_matrix.copy(), self.n_qubits,
+                                                                      self.n_electrons, 2)
+        self.assertEqual(len(SectorEigensolver.eigenpairs), 1)
+        numpy.testing.assert_array_equal(memoized_eigenvalues, eigenvalues[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+from src.entanglement import EntanglementUtils
+
+import numpy
+
+
+class EntanglementUtilsTest(unittest.TestCase):
+
+    n_qubits = 5
+
+    @classmethod
+    def setUpClass(cls):
+        rng = numpy.random.default_rng(0)
+        statevectors = rng.normal(size=(3, 2 ** cls.n_qubits)) + 1j * rng.normal(size=(3, 2 ** cls.n_qubits))
+        cls.statevectors = statevectors / numpy.linalg.norm(statevectors, axis=1)[:, None]
+
+    # rho_A[a, a'] = sum_b psi[a, b] psi*[a', b], by a loop over the basis states (qubit q is the bit n_qubits - 1 - q)
+    def reference_density_matrix(self, statevector, qubits_A):
+        qubits_B = [qubit for qubit in range(self.n_qubits) if qubit not in qubits_A]
+        rho = numpy.zeros((2 ** len(qubits_A), 2 ** len(qubits_A)), dtype=complex)
+        for index_1 in range(2 ** self.n_qubits):
+            for index_2 in range(2 ** self.n_qubits):
+                bits_1 = [(index_1 >> (self.n_qubits - 1 - qubit)) & 1 for qubit in range(self.n_qubits)]
+                bits_2 = [(index_2 >> (self.n_qubits - 1 - qubit)) & 1 for qubit in range(self.n_qubits)]
+                if any(bits_1[qubit] != bits_2[qubit] for qubit in qubits_B):
+                    continue
+                a_1 = int(''.join(str(bits_1[qubit]) for qubit in qubits_A), 2)
+                a_2 = int(''.join(str(bits_2[qubit]) for qubit in qubits_A), 2)
+                rho[a_1, a_2] += statevector[index_1] * statevector[index_2].conjugate()
+        return rho
+
+    def test_reduced_density_matrices(self):
+        for qubits_A in [[0], [1, 3], [4, 0, 2]]:
+            rhos = EntanglementUtils.reduced_density_matrices(self.statevectors, qubits_A)
+            self.assertEqual(rhos.shape, (3, 2 ** len(qubits_A), 2 ** len(qubits_A)))
+            for statevector, rho in zip(self.statevectors, rhos):
+                numpy.testing.assert_allclose(rho, self.reference_density_matrix(statevector, qubits_A), atol=1e-12)
+                self.assertAlmostEqual(numpy.trace(rho).real, 1)
+
+        # a single statevector is a batch of one
+        numpy.testing.assert_allclose(EntanglementUtils.reduced_density_matrices(self.statevectors[1], [4, 0, 2])[0],
+                                      rhos[1])
+
+    def test_entanglement_entropies(self):
+        for qubits_A in [[0], [1, 3], [4, 0, 2]]:
+            entropies = EntanglementUtils.entanglement_entropies(self.statevectors, qubits_A)
+            for statevector, entropy in zip(self.statevectors, entropies):
+                eigenvalues = numpy.linalg.eigvalsh(self.reference_density_matrix(statevector, qubits_A))
+                eigenvalues = eigenvalues[eigenvalues > 1e-15]
+                self.assertAlmostEqual(entropy, -(eigenvalues * numpy.log(eigenvalues)).sum())
+
+            # the entropies of a subsystem and of its complement are equal
+            qubits_B = [qubit for qubit in range(self.n_qubits) if qubit not in qubits_A]
+            numpy.testing.assert_allclose(EntanglementUtils.entanglement_entropies(self.statevectors, qubits_B),
+                                          entropies)
+
+    def test_product_and_bell_states(self):
+        # |0> (|00> + |11>)/sqrt(2) |1> on qubits 0, (1, 2), 3
+        statevector = numpy.zeros(2 ** 4)
+        statevector[int('0001', 2)] = statevector[int('0111', 2)] = 1 / numpy.sqrt(2)
+
+        self.assertAlmostEqual(EntanglementUtils.entanglement_entropies(statevector, [0])[0], 0)
+        self.assertAlmostEqual(EntanglementUtils.entanglement_entropies(statevector, [0, 3])[0], 0)
+        self.assertAlmostEqual(EntanglementUtils.entanglement_entropies(statevector, [1])[0], numpy.log(2))
+        self.assertAlmostEqual(EntanglementUtils.entanglement_entropies(statevector, [0, 2])[0], numpy.log(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import importlib.util
+
+from src.ansatz_element_sets import GSDExcitations
+from src.backends import QiskitSimBackend, MatrixCacheBackend
+from src.cache import GlobalCache
+from src.state import State
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import numpy
+
+qiskit_available = importlib.util.find_spec('qiskit') is not None
+
+
+class PenaltyTermsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+        cls.q_system = BenchmarkSystems.get_system('H4')
+        n_qubits = cls.q_system.n_qubits
+        n_electrons = cls.q_system.n_electrons
+        pool = GSDExcitations(cls.q_system.n_orbitals, n_electrons, 'q_exc').get_all_elements()
+        cls.ansatz = [pool[3], pool[5], pool[16]]
+        cls.var_parameters = [0.2, 0.05, -0.1]
+        cls.element = pool[5]
+        lower_ansatz = [pool[3], pool[16]]
+        lower_parameters = [0.1, -0.2]
+
+        # the ground state cache, without penalty terms
+        cls.ground_cache = GlobalCache(cls.q_system)
+        cls.ground_cache.calculate_exc_gen_sparse_matrices_dict(cls.ansatz + [cls.element])
+        cls.lower_statevector = cls.statevector(lower_ansatz, lower_parameters)
+
+        cls.factor = 2 * abs(cls.q_system.hf_energy)
+        cls.q_system.H_lower_state_terms = [[cls.factor, State(lower_ansatz, lower_parameters, n_qubits, n_electrons)]]
+        if not qiskit_available:
+            # the lower state statevectors are calculated with qiskit. Without it, the matrix cache statevector is used
+            cls.q_system.operator_store[('lower_state_statevector', 0)] = cls.lower_statevector
+
+        # H + c|phi_0><phi_0|
+        cls.H_dense = cls.q_system.get_h_sparse_matrix().toarray() + \
+            cls.factor * numpy.outer(cls.lower_statevector, cls.lower_statevector.conj())
+
+        cls.excited_cache = GlobalCache(cls.q_system, excited_state=1)
+        cls.excited_cache.calculate_exc_gen_sparse_matrices_dict(cls.ansatz + [cls.element])
+        cls.excited_cache.calculate_commutators_sparse_matrices_dict([cls.element])
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    # the dense statevector of an ansatz (the cache statevectors are conjugated rows)
+    @classmethod
+    def statevector(cls, ansatz, var_parameters):
+        sparse_statevector = cls.ground_cache.get_statevector(ansatz, list(var_parameters))
+        return numpy.asarray(sparse_statevector.conj().todense()).ravel()
+
+    def reference_energy(self, var_parameters):
+        statevector = self.statevector(self.ansatz, var_parameters)
+        return numpy.vdot(statevector, self.H_dense.dot(statevector)).real
+
+    def reference_gradient(self, step=1e-5):
+        gradient = []
+        for i in range(len(self.var_parameters)):
+            var_parameters_plus = list(self.var_parameters)
+            var_parameters_minus = list(self.var_parameters)
+            var_parameters_plus[i] += step
+            var_parameters_minus[i] -= step
+            gradient.append((self.reference_energy(var_parameters_plus) -
+                             self.reference_energy(var_parameters_minus)) / (2 * step))
+        return numpy.array(gradient)
+
+    # the gradient of the element appended to the ansatz: 2 Re <H psi|A|psi>
+    def reference_element_gradient(self):
+        statevector = self.statevector(self.ansatz, self.var_parameters)
+        generator_matrix = sum(self.ground_cache.exc_gen_sparse_matrices_dict[
+                                   str(self.element.excitations_generators)])
+        return 2 * numpy.vdot(self.H_dense.dot(statevector), generator_matrix.dot(statevector)).real
+
+    def test_penalty_terms(self):
+        self.assertTrue(self.q_system.get_penalty_terms(0) == [])
+        [[factor, lower_statevector]] = self.q_system.get_penalty_terms(1)
+        self.assertEqual(factor, self.factor)
+        numpy.testing.assert_allclose(lower_statevector, self.lower_statevector, atol=1e-10)
+        self.assertGreater(abs(numpy.vdot(lower_statevector, self.statevector(self.ansatz, self.var_parameters))),
+                           0.1)
+
+    def test_ham_dot(self):
+        statevector = self.statevector(self.ansatz, self.var_parameters)
+        numpy.testing.assert_allclose(QiskitSimBackend.ham_dot(self.q_system, statevector, excited_state=1),
+                                      self.H_dense.dot(statevector), atol=1e-12)
+        numpy.testing.assert_allclose(QiskitSimBackend.ham_dot(self.q_system, statevector),
+                                      self.q_system.get_h_sparse_matrix().dot(statevector), atol=1e-12)
+
+    def test_matrix_cache_backend(self):
+        energy = MatrixCacheBackend.ham_expectation_value(self.var_parameters, self.ansatz, self.q_system,
+                                                          cache=self.excited_cache, excited_state=1)
+        self.assertAlmostEqual(energy, self.reference_energy(self.var_parameters), places=10)
+        # the penalty is not included in the ground state energy
+        ground_energy = MatrixCacheBackend.ham_expectation_value(self.var_parameters, self.ansatz, self.q_system,
+                                                                 cache=self.ground_cache)
+        self.assertGreater(energy - ground_energy, 1e-3)
+
+        gradient = MatrixCacheBackend.ansatz_gradient(self.var_parameters, self.ansatz, self.q_system,
+                                                      cache=self.excited_cache, excited_state=1)
+        numpy.testing.assert_allclose(gradient, self.reference_gradient(), atol=1e-7)
+
+        element_gradient = MatrixCacheBackend.ansatz_element_gradient(self.element, self.var_parameters, self.ansatz,
+                                                                      self.q_system, cache=self.excited_cache,
+                                                                      excited_state=1)
+        self.assertAlmostEqual(element_gradient, self.reference_element_gradient(), places=10)
+
+    @unittest.skipUnless(qiskit_available, 'qiskit is not installed')
+    def test_qiskit_sim_backend(self):
+        energy = QiskitSimBackend.ham_expectation_value(self.var_parameters, self.ansatz, self.q_system,
+                                                        excited_state=1)
+        self.assertAlmostEqual(energy, self.reference_energy(self.var_parameters), places=10)
+
+        gradient = QiskitSimBackend.ansatz_gradient(self.var_parameters, self.ansatz, self.q_system, excited_state=1)
+        numpy.testing.assert_allclose(gradient, self.reference_gradient(), atol=1e-7)
+
+        element_gradient = QiskitSimBackend.ansatz_element_gradient(self.element, self.var_parameters, self.ansatz,
+                                                                    self.q_system, excited_state=1)
+        self.assertAlmostEqual(element_gradient, self.reference_element_gradient(), places=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import unittest
+import importlib.util
+
+from scipy.sparse.linalg import expm
+
+from src.ansatz_element_sets import GSDExcitations, SpinCompGSDExcitations
+from src.backends import QiskitSimBackend, MatrixCacheBackend
+from src.cache import GlobalCache
+from src.iter_vqe_utils import GradientUtils, EnergyUtils
+from src.vqe_runner import VQERunner
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import numpy
+
+qiskit_available = importlib.util.find_spec('qiskit') is not None
+
+
+class AnsatzGradientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+        cls.q_system = BenchmarkSystems.get_system('H2')
+        n_orbitals = cls.q_system.n_orbitals
+        n_electrons = cls.q_system.n_electrons
+        # elements with one excitation generator and spin complement pairs (with two generators)
+        cls.ansatz = list(GSDExcitations(n_orbitals, n_electrons, 'q_exc').get_all_elements())[-3:] + \
+            list(SpinCompGSDExcitations(n_orbitals, n_electrons, 'eff_f_exc').get_all_elements())[-2:]
+        cls.var_parameters = [0.11, -0.23, 0.05, 0.17, -0.08]
+
+        cls.global_cache = GlobalCache(cls.q_system)
+        cls.global_cache.calculate_exc_gen_sparse_matrices_dict(cls.ansatz)
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    def finite_difference_gradient(self, energy, step=1e-5):
+        gradient = []
+        for i in range(len(self.var_parameters)):
+            var_parameters_plus = list(self.var_parameters)
+            var_parameters_minus = list(self.var_parameters)
+            var_parameters_plus[i] += step
+            var_parameters_minus[i] -= step
+            gradient.append((energy(var_parameters_plus) - energy(var_parameters_minus)) / (2 * step))
+        return numpy.array(gradient)
+
+    def test_matrix_cache_ansatz_gradient(self):
+        def energy(var_parameters):
+            return MatrixCacheBackend.ham_expectation_value(var_parameters, self.ansatz, self.q_system,
+                                                            cache=self.global_cache)
+
+        gradient = MatrixCacheBackend.ansatz_gradient(self.var_parameters, self.ansatz, self.q_system,
+                                                      cache=self.global_cache)
+
+        self.assertEqual(len(gradient), len(self.ansatz))
+        self.assertTrue(max(abs(gradient)) > 1e-3)
+        numpy.testing.assert_allclose(gradient, self.finite_difference_gradient(energy), atol=1e-8)
+
+    def test_apply_excitation(self):
+        n_qubits = self.q_system.n_qubits
+        statevector = numpy.random.default_rng(0).normal(size=2 ** n_qubits) + 0j
+        statevector /= numpy.linalg.norm(statevector)
+
+        for element in self.ansatz:
+            for exc_gen_sparse_matrix in QiskitSimBackend.exc_gen_sparse_matrices(element, n_qubits):
+                for parameter in [0.3, -1.2]:
+                    expected_statevector = expm(parameter * exc_gen_sparse_matrix.tocsc()).dot(statevector)
+                    numpy.testing.assert_allclose(
+                        QiskitSimBackend.apply_excitation(exc_gen_sparse_matrix, parameter, statevector),
+                        expected_statevector, atol=1e-12)
+
+    @unittest.skipUnless(qiskit_available, 'qiskit is not installed')
+    def test_qiskit_ansatz_gradient(self):
+        def energy(var_parameters):
+            return QiskitSimBackend.ham_expectation_value(var_parameters, self.ansatz, self.q_system)
+
+        gradient = QiskitSimBackend.ansatz_gradient(self.var_parameters, self.ansatz, self.q_system)
+
+        numpy.testing.assert_allclose(gradient, self.finite_difference_gradient(energy), atol=1e-7)
+        numpy.testing.assert_allclose(gradient, MatrixCacheBackend.ansatz_gradient(
+            self.var_parameters, self.ansatz, self.q_system, cache=self.global_cache), atol=1e-10)
+
+    # the gradient of the last element equals the commutator gradient of the element appended to the rest of the ansatz
+    def test_ansatz_gradient_last_element(self):
+        ansatz = self.ansatz[:-1]
+        element = self.ansatz[-1]
+        self.global_cache.calculate_commutators_sparse_matrices_dict([element])
+
+        gradient = MatrixCacheBackend.ansatz_gradient(self.var_parameters[:-1] + [0], self.ansatz, self.q_system,
+                                                      cache=self.global_cache)
+        element_gradient = MatrixCacheBackend.ansatz_element_gradient(element, self.var_parameters[:-1], ansatz,
+                                                                      self.q_system, cache=self.global_cache)
+
+        self.assertAlmostEqual(gradient[-1], element_gradient, delta=config.floating_point_accuracy)
+
+    # the memoized generator matrices of an element depend on the number of qubits of the system
+    def test_exc_gen_sparse_matrices_n_qubits(self):
+        element = self.ansatz[0]
+        n_qubits = self.q_system.n_qubits
+        for system_n_qubits in [n_qubits, n_qubits + 2, n_qubits]:
+            matrices = QiskitSimBackend.exc_gen_sparse_matrices(element, system_n_qubits)
+            self.assertEqual([matrix.shape for matrix in matrices], [(2 ** system_n_qubits, 2 ** system_n_qubits)])
+
+
+class ParameterShiftRuleTest(unittest.TestCase):
+
+    # a random trigonometric polynomial of degree R, as a function of x
+    @staticmethod
+    def trigonometric_polynomial(degree, seed):
+        rng = numpy.random.default_rng(seed)
+        a, b = rng.normal(size=(2, degree + 1))
+
+        def polynomial(x):
+            return sum([a[k] * numpy.cos(k * x) + b[k] * numpy.sin(k * x) for k in range(degree + 1)])
+
+        def derivative(x):
+            return sum([k * (b[k] * numpy.cos(k * x) - a[k] * numpy.sin(k * x)) for k in range(degree + 1)])
+        return polynomial, derivative
+
+    def test_parameter_shift_rule(self):
+        for degree in [2, 4]:
+            polynomial, derivative = self.trigonometric_polynomial(degree, degree)
+            shifts, weights = QiskitSimBackend.parameter_shift_rule(degree)
+            gradient = sum([weight * (polynomial(shift) - polynomial(-shift)) for shift, weight in zip(shifts, weights)])
+            self.assertAlmostEqual(gradient, derivative(0), places=12)
+
+    def test_trigonometric_polynomial_minimum(self):
+        for degree in [2, 4]:
+            polynomial, derivative = self.trigonometric_polynomial(degree, 10 + degree)
+            n_points = 2 * degree + 1
+            x, fun = QiskitSimBackend.trigonometric_polynomial_minimum(
+                [polynomial(2 * numpy.pi * j / n_points) for j in range(n_points)])
+            grid = numpy.linspace(-numpy.pi, numpy.pi, 100001)
+            self.assertAlmostEqual(fun, polynomial(x), places=10)
+            self.assertLessEqual(fun, polynomial(grid).min() + 1e-9)
+
+
+# the batched circuits of the QiskitSimBackend (config.qiskit_batch_circuits) against the per element calculations
+@unittest.skipUnless(qiskit_available, 'qiskit is not installed')
+class BatchedCircuitsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+        cls.q_system = BenchmarkSystems.get_system('H2')
+        n_orbitals = cls.q_system.n_orbitals
+        n_electrons = cls.q_system.n_electrons
+        cls.ansatz = list(GSDExcitations(n_orbitals, n_electrons, 'q_exc').get_all_elements())[-1:]
+        cls.var_parameters = [0.1]
+        # elements with one and two excitation generators (energy polynomials of degree 2 and 4)
+        cls.elements = list(GSDExcitations(n_orbitals, n_electrons, 'q_exc').get_all_elements()) + \
+            list(SpinCompGSDExcitations(n_orbitals, n_electrons, 'eff_f_exc').get_all_elements())
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    def setUp(self):
+        self.qiskit_batch_circuits = config.qiskit_batch_circuits
+
+    def tearDown(self):
+        config.qiskit_batch_circuits = self.qiskit_batch_circuits
+
+    def elements_gradients(self, qiskit_batch_circuits):
+        config.qiskit_batch_circuits = qiskit_batch_circuits
+        return [gradient for element, gradient in GradientUtils.
+                get_ansatz_elements_gradients(self.elements, self.q_system, ansatz_parameters=self.var_parameters,
+                                              ansatz=self.ansatz, backend=QiskitSimBackend)]
+
+    def test_batched_gradients(self):
+        gradients = self.elements_gradients(True)
+        self.assertGreater(max(numpy.abs(gradients)), 1e-3)
+        numpy.testing.assert_allclose(gradients, self.elements_gradients(False), atol=1e-8)
+
+    def individual_vqes(self, qiskit_batch_circuits, elements_parameters=None):
+        config.qiskit_batch_circuits = qiskit_batch_circuits
+        vqe_runner = VQERunner(self.q_system, backend=QiskitSimBackend, optimizer='BFGS',
+                               optimizer_options={'gtol': 1e-8}, use_ansatz_gradient=True)
+        return [result for element, result in EnergyUtils.
+                elements_individual_vqe_energy_reductions(vqe_runner, self.elements,
+                                                          elements_parameters=elements_parameters, ansatz=self.ansatz,
+                                                          ansatz_parameters=self.var_parameters)]
+
+    def test_batched_individual_vqes(self):
+        results = self.individual_vqes(True)
+        parameters = [result.x[0] for result in results]
+        for element, parameter, result in zip(self.elements, parameters, results):
+            energy = QiskitSimBackend.ham_expectation_value(self.var_parameters + [parameter],
+                                                            self.ansatz + [element], self.q_system)
+            self.assertAlmostEqual(result.fun, energy, places=8)
+
+        # the global minima are not above the minima of the per element VQEs from zero, and are minima of the VQEs
+        energies = numpy.array([result.fun for result in results])
+        vqe_energies = numpy.array([result.fun for result in self.individual_vqes(False)])
+        self.assertTrue((energies <= vqe_energies + 1e-8).all())
+        vqe_energies = numpy.array([result.fun for result in self.individual_vqes(False, parameters)])
+        numpy.testing.assert_allclose(energies, vqe_energies, atol=1e-7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import time
+
+from src.instrumentation import Instrumentation
+from src import config
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.instrumentation = config.instrumentation
+        config.instrumentation = True
+        Instrumentation.reset()
+
+    def tearDown(self):
+        config.instrumentation = self.instrumentation
+        Instrumentation.reset()
+
+    def test_counters(self):
+        Instrumentation.count('spmv')
+        Instrumentation.count('spmv', 3)
+        Instrumentation.count('statevector')
+        self.assertEqual(Instrumentation.summary()['counts'], {'spmv': 4, 'statevector': 1})
+
+        # the counts after a snapshot
+        snapshot = Instrumentation.snapshot()
+        Instrumentation.count('spmv', 2)
+        Instrumentation.count('cache_miss')
+        self.assertEqual(Instrumentation.summary(snapshot)['counts'], {'spmv': 2, 'cache_miss': 1})
+        self.assertEqual(Instrumentation.summary()['counts'], {'spmv': 6, 'statevector': 1, 'cache_miss': 1})
+
+        Instrumentation.reset()
+        self.assertEqual(Instrumentation.summary(), {'counts': {}, 'phase_times': {}, 'phase_counts': {}})
+
+    # the time of a phase includes the time of the phases nested in it
+    def test_phase_nesting(self):
+        with Instrumentation.phase('outer'):
+            for i in range(2):
+                with Instrumentation.phase('inner'):
+                    time.sleep(0.01)
+            time.sleep(0.01)
+        snapshot = Instrumentation.snapshot()
+        with Instrumentation.phase('outer'):
+            pass
+
+        summary = Instrumentation.summary()
+        self.assertEqual(summary['phase_counts'], {'outer': 2, 'inner': 2})
+        self.assertGreaterEqual(summary['phase_times']['inner'], 0.02)
+        self.assertGreaterEqual(summary['phase_times']['outer'], summary['phase_times']['inner'] + 0.01)
+        self.assertEqual(Instrumentation.summary(snapshot)['phase_counts'], {'outer': 1})
+
+    # a phase is recorded if the enclosed code raises
+    def test_phase_exception(self):
+        with self.assertRaises(ValueError):
+            with Instrumentation.phase('failed'):
+                raise ValueError
+        self.assertEqual(Instrumentation.summary()['phase_counts'], {'failed': 1})
+
+    def test_disabled_phase(self):
+        config.instrumentation = False
+        with Instrumentation.phase('outer'):
+            with Instrumentation.phase('inner'):
+                pass
+        self.assertEqual(Instrumentation.summary(), {'counts': {}, 'phase_times': {}, 'phase_counts': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import subprocess
+import json
+import sys
+import os
+
+
+class LazyImportsTest(unittest.TestCase):
+
+    heavy_modules = ['qiskit', 'ray', 'psi4', 'openfermionpsi4']
+
+    # the top level modules imported by importing the modules, in a new interpreter
+    @staticmethod
+    def imported_modules(modules):
+        code = 'import sys, json\n' + ''.join('import {}\n'.format(module) for module in modules) + \
+               'print(json.dumps(sorted(set(name.split(".")[0] for name in sys.modules))))'
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        return json.loads(output.splitlines()[-1])
+
+    def test_heavy_modules_not_imported(self):
+        imported_modules = self.imported_modules(['src.backends', 'src.q_systems'])
+        self.assertIn('src', imported_modules)
+        self.assertIn('openfermion', imported_modules)
+        for module in self.heavy_modules:
+            self.assertNotIn(module, imported_modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
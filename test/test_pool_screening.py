@@ -0,0 +1,67 @@
+import unittest
+import warnings
+
+from src.adapt_session import AdaptSession, GradientSelection
+from src.ansatz_element_sets import GSDExcitations
+from src.pool_screening import PoolScreening
+from src.vqe_runner import VQERunner
+from src import backends
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import numpy
+
+
+class PoolScreeningTest(unittest.TestCase):
+
+    n_iterations = 5
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    def session(self, q_system, pool, pool_screening):
+        vqe_runner = VQERunner(q_system, backend=backends.MatrixCacheBackend, optimizer='BFGS',
+                               optimizer_options={'gtol': 1e-8}, use_ansatz_gradient=True)
+        return AdaptSession(q_system, pool, vqe_runner, GradientSelection(), 1e-10, pool_screening=pool_screening)
+
+    # the screened elements have zero gradients, so the screening does not change the energies of the iterations
+    def check_screening(self, system_name):
+        q_system = BenchmarkSystems.get_system(system_name)
+        pool = GSDExcitations(q_system.n_orbitals, q_system.n_electrons, 'q_exc').get_all_elements()
+
+        screened_session = self.session(q_system, pool, True)
+        unscreened_session = self.session(q_system, pool, False)
+        self.assertLessEqual(len(screened_session.active_pool), len(unscreened_session.active_pool))
+
+        for i in range(self.n_iterations):
+            self.assertTrue(screened_session.step())
+            self.assertTrue(unscreened_session.step())
+        numpy.testing.assert_allclose([record['E'] for record in screened_session.records],
+                                      [record['E'] for record in unscreened_session.records], atol=1e-6)
+
+    def test_h4(self):
+        self.check_screening('H4')
+
+    def test_lih(self):
+        self.check_screening('LiH')
+
+    def test_complex_hamiltonian(self):
+        q_system = BenchmarkSystems.get_system('H4')
+        H_sparse_matrix = q_system.get_h_sparse_matrix().astype(complex)
+        H_sparse_matrix.data *= numpy.exp(1j * numpy.linspace(0, numpy.pi, H_sparse_matrix.nnz))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            labels = PoolScreening.component_labels(H_sparse_matrix)
+        # purely imaginary matrix elements connect the basis states too
+        numpy.testing.assert_array_equal(labels, PoolScreening.component_labels(abs(H_sparse_matrix)))
+
+
+if __name__ == '__main__':
+    unittest.main()
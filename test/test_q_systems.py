@@ -0,0 +1,182 @@
+import unittest
+import importlib.util
+
+from openfermion.chem import MolecularData
+
+from src.ansatz_element_sets import GSDExcitations
+from src.backends import QiskitSimBackend
+from src.cache import GlobalCache
+from src.state import State
+from src.molecules.molecules import H2, LiH
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import openfermion
+import tempfile
+import numpy
+import copy
+import sys
+import os
+
+qiskit_available = importlib.util.find_spec('qiskit') is not None
+
+
+class OperatorStoreTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    def setUp(self):
+        self.q_system = BenchmarkSystems.get_system('H4')
+        n_qubits = self.q_system.n_qubits
+        n_electrons = self.q_system.n_electrons
+        pool = GSDExcitations(self.q_system.n_orbitals, n_electrons, 'q_exc').get_all_elements()
+        self.states = [State([pool[3], pool[16]], [0.1, -0.2], n_qubits, n_electrons),
+                       State([pool[5]], [0.3], n_qubits, n_electrons)]
+
+        # the statevectors of the states and of a test state, from the matrix cache
+        global_cache = GlobalCache(self.q_system)
+        global_cache.calculate_exc_gen_sparse_matrices_dict([pool[3], pool[5], pool[16]])
+        self.lower_statevectors = [self.dense_statevector(global_cache, state.ansatz_elements, state.parameters)
+                                   for state in self.states]
+        self.statevector = self.dense_statevector(global_cache, [pool[3], pool[5]], [0.2, 0.05])
+
+    @staticmethod
+    def dense_statevector(global_cache, ansatz, var_parameters):
+        return numpy.asarray(global_cache.get_statevector(ansatz, var_parameters).conj().todense()).ravel()
+
+    def set_lower_state_terms(self, H_lower_state_terms, lower_statevectors):
+        self.q_system.H_lower_state_terms = H_lower_state_terms
+        self.assertNotIn(('lower_state_statevector', 0), self.q_system.operator_store)
+        if not qiskit_available:
+            # the lower state statevectors are calculated with qiskit. Without it, the matrix cache statevectors are
+            # stored
+            for i, lower_statevector in enumerate(lower_statevectors):
+                self.q_system.operator_store[('lower_state_statevector', i)] = lower_statevector
+
+    def check_penalty_terms(self, factors, lower_statevectors):
+        penalty_terms = self.q_system.get_penalty_terms(len(factors))
+        self.assertEqual([factor for factor, lower_statevector in penalty_terms], factors)
+        for (factor, lower_statevector), expected_statevector in zip(penalty_terms, lower_statevectors):
+            numpy.testing.assert_allclose(lower_statevector, expected_statevector, atol=1e-10)
+
+        expected_ham_statevector = self.q_system.get_h_sparse_matrix().dot(self.statevector)
+        for factor, lower_statevector in zip(factors, lower_statevectors):
+            expected_ham_statevector += factor * numpy.vdot(lower_statevector, self.statevector) * lower_statevector
+        numpy.testing.assert_allclose(QiskitSimBackend.ham_dot(self.q_system, self.statevector, len(factors)),
+                                      expected_ham_statevector, atol=1e-12)
+
+    def test_set_lower_state_terms(self):
+        H_sparse_matrix = self.q_system.get_h_sparse_matrix()
+        self.set_lower_state_terms([[1.0, self.states[0]]], self.lower_statevectors[:1])
+        self.check_penalty_terms([1.0], self.lower_statevectors[:1])
+
+        self.set_lower_state_terms([[2.0, self.states[1]], [3.0, self.states[0]]], self.lower_statevectors[::-1])
+        self.check_penalty_terms([2.0, 3.0], self.lower_statevectors[::-1])
+        # the ground state Hamiltonian is kept
+        self.assertIs(self.q_system.get_h_sparse_matrix(), H_sparse_matrix)
+
+    def test_modified_lower_state_terms(self):
+        self.set_lower_state_terms([[1.0, self.states[0]]], self.lower_statevectors[:1])
+        self.check_penalty_terms([1.0], self.lower_statevectors[:1])
+
+        # terms modified in place are applied after invalidate_operator_store
+        self.q_system.H_lower_state_terms[0] = [4.0, self.states[1]]
+        self.q_system.invalidate_operator_store()
+        self.assertNotIn(('lower_state_statevector', 0), self.q_system.operator_store)
+        if not qiskit_available:
+            self.q_system.operator_store[('lower_state_statevector', 0)] = self.lower_statevectors[1]
+        self.check_penalty_terms([4.0], self.lower_statevectors[1:])
+
+
+class MolecularDataCacheTest(unittest.TestCase):
+
+    # the molecular data files bundled with openfermion, calculated with psi4 (including the FCI energies)
+    openfermion_data = {H2: ['H2_sto-3g_singlet_0.7414', 0.7414], LiH: ['H1-Li1_sto-3g_singlet_1.45', 1.45]}
+
+    def setUp(self):
+        self.molecular_data_directory = config.molecular_data_directory
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        config.molecular_data_directory = self.temporary_directory.name
+
+    def tearDown(self):
+        config.molecular_data_directory = self.molecular_data_directory
+        self.temporary_directory.cleanup()
+
+    @staticmethod
+    def openfermion_molecule_data(molecule_class):
+        data_directory = os.path.join(os.path.dirname(openfermion.__file__), 'testing', 'data')
+        molecule_data = MolecularData(
+            filename=os.path.join(data_directory, MolecularDataCacheTest.openfermion_data[molecule_class][0]))
+        molecule_data.load()
+        return molecule_data
+
+    # stores the openfermion data as the cache of the molecule, without the FCI energy, so that it is not calculated
+    # with psi4 on construction
+    def cache_molecule_data(self, molecule_class):
+        molecule_data = self.openfermion_molecule_data(molecule_class)
+        r = self.openfermion_data[molecule_class][1]
+        # the file name of the cache depends only on the geometry, basis, multiplicity and charge
+        q_system = molecule_class.__new__(molecule_class)
+        q_system.name, q_system.geometry = molecule_class.__name__, molecule_class.get_geometry(r)
+        q_system.basis, q_system.multiplicity, q_system.charge = 'sto-3g', 1, 0
+        # the integrals are read from the file on first access, and saved only if they have been read
+        molecule_data.one_body_integrals, molecule_data.two_body_integrals = \
+            molecule_data.one_body_integrals, molecule_data.two_body_integrals
+        molecule_data.filename = q_system.data_filename()
+        molecule_data.fci_energy = None
+        molecule_data.save()
+        return r
+
+    def test_cache_hit(self):
+        r = self.cache_molecule_data(H2)
+        for i in range(2):
+            q_system = H2(r=r)
+            self.assertNotIn('openfermionpsi4', sys.modules)
+            self.assertEqual(q_system.hf_energy, float(self.openfermion_molecule_data(H2).hf_energy))
+            self.assertTrue(os.path.exists(q_system.molecule_data.filename + '.hdf5'))
+            self.assertEqual(os.path.dirname(q_system.molecule_data.filename), self.temporary_directory.name)
+
+    def test_cache_miss(self):
+        r = self.cache_molecule_data(H2)
+        q_system = H2(r=r)
+        data_filename = q_system.data_filename()
+
+        changed_q_systems = [copy.copy(q_system) for _ in range(3)]
+        changed_q_systems[0].geometry = H2.get_geometry(r + 0.01)
+        changed_q_systems[1].basis = '6-31g'
+        changed_q_systems[2].charge = 1
+        changed_data_filenames = [changed_q_system.data_filename() for changed_q_system in changed_q_systems]
+        self.assertEqual(len(set(changed_data_filenames + [data_filename])), 4)
+        for changed_data_filename in changed_data_filenames:
+            self.assertFalse(os.path.exists(changed_data_filename + '.hdf5'))
+
+        # the same geometry with a different representation of the coordinates hits the cache
+        q_system.geometry = [['H', [0.0, 0.0, 0.0]], ['H', [0.0, 0.0, numpy.float64(r)]]]
+        self.assertEqual(q_system.data_filename(), data_filename)
+
+    def test_lazy_fci_energy(self):
+        for molecule_class in self.openfermion_data:
+            r = self.cache_molecule_data(molecule_class)
+            q_system = molecule_class(r=r)
+            self.assertIsNone(q_system._fci_energy)
+
+            # the FCI energy calculated with the sector eigensolver equals the FCI energy calculated with psi4
+            fci_energy = float(self.openfermion_molecule_data(molecule_class).fci_energy)
+            self.assertAlmostEqual(q_system.fci_energy, fci_energy, places=8)
+
+            # and is saved to the cache
+            q_system = molecule_class(r=r)
+            self.assertEqual(q_system.molecule_data.fci_energy, q_system.fci_energy)
+            self.assertAlmostEqual(q_system.fci_energy, fci_energy, places=8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import tempfile
+import json
+import os
+
+from src.ray_tasks import RayTasks
+from src import config
+
+
+class RayTasksTelemetryTest(unittest.TestCase):
+    # the summaries and the trace of task records, without ray: the records of a stage of two tasks on two workers and
+    # of a stage of one task are added directly to the timeline
+
+    def setUp(self):
+        self.multithread = config.multithread
+        config.multithread = False
+        self.records = RayTasks.records
+        RayTasks.reset()
+        RayTasks.records.append(self.record('gradients', 101, 10.0, 10.5, 12.0))
+        RayTasks.records.append(self.record('gradients', 102, 10.1, 10.2, 11.5))
+        RayTasks.records.append(self.record('vqes', 101, 13.0, 13.1, 15.0))
+
+    def tearDown(self):
+        config.multithread = self.multithread
+        RayTasks.records = self.records
+
+    # a record of a task submitted at submit_time, started by worker pid at start_time, with its result collected at
+    # get_time
+    @staticmethod
+    def record(stage, pid, submit_time, start_time, get_time):
+        return {'stage': stage, 'function': 'function_{}'.format(stage), 'args_bytes': 1000, 'args_serialize_time': 0.1,
+                'submit_time': submit_time, 'pid': pid, 'start_time': start_time, 'deserialize_time': 0.05,
+                'compute_time': 0.5, 'result_serialize_time': 0.02, 'end_time': start_time + 0.57,
+                'result_bytes': 200, 'worker_max_rss': pid * 2**20, 'queue_wait': start_time - submit_time,
+                'result_deserialize_time': 0.01, 'get_time': get_time}
+
+    def test_stage_summary(self):
+        summary = RayTasks.stage_summary()
+        self.assertEqual(list(summary), ['gradients', 'vqes'])
+
+        gradients = summary['gradients']
+        self.assertEqual(gradients['n_tasks'], 2)
+        self.assertEqual(gradients['n_workers'], 2)
+        self.assertEqual(gradients['args_bytes'], 2000)
+        self.assertEqual(gradients['result_bytes'], 400)
+        self.assertAlmostEqual(gradients['serialize_time'], 2 * 0.12)
+        self.assertAlmostEqual(gradients['deserialize_time'], 2 * 0.06)
+        self.assertAlmostEqual(gradients['queue_wait'], 0.5 + 0.1)
+        self.assertAlmostEqual(gradients['compute_time'], 1.0)
+        # from the first submission to the last result
+        self.assertAlmostEqual(gradients['wall_time'], 2.0)
+        self.assertEqual(gradients['worker_max_rss'], 102 * 2**20)
+        self.assertNotIn('start_time', gradients)
+
+        # the summary of the records from an index on
+        summary = RayTasks.stage_summary(2)
+        self.assertEqual(list(summary), ['vqes'])
+        self.assertEqual(summary['vqes']['n_tasks'], 1)
+        self.assertAlmostEqual(summary['vqes']['wall_time'], 2.0)
+
+        # the summary is JSON serializable (it is saved with the iteration records)
+        json.dumps(RayTasks.stage_summary())
+
+    def test_chrome_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = RayTasks.export_chrome_trace(os.path.join(directory, 'trace.json'))
+            with open(filename) as trace_file:
+                trace = json.load(trace_file)
+
+        self.assertEqual(trace['displayTimeUnit'], 'ms')
+        events = trace['traceEvents']
+        driver_pid = os.getpid()
+
+        # a process name for the driver and for each worker
+        metadata_events = [event for event in events if event['ph'] == 'M']
+        self.assertEqual([event['pid'] for event in metadata_events], [driver_pid, 101, 102])
+        self.assertTrue(all(event['name'] == 'process_name' for event in metadata_events))
+
+        # the serialization on the driver and the deserialization, compute and result serialization on the worker of
+        # each task, with timestamps and durations in microseconds
+        spans = [event for event in events if event['ph'] == 'X']
+        self.assertEqual(len(spans), 4 * 3)
+        for event in spans:
+            self.assertEqual(set(event), {'name', 'cat', 'ph', 'pid', 'tid', 'ts', 'dur', 'args'})
+            self.assertIsInstance(event['ts'], int)
+            self.assertGreaterEqual(event['dur'], 0)
+        compute_spans = [event for event in spans if event['name'] == event['cat']]
+        self.assertEqual([[event['cat'], event['pid'], event['ts'], event['dur']] for event in compute_spans],
+                         [['gradients', 101, 10550000, 500000], ['gradients', 102, 10250000, 500000],
+                          ['vqes', 101, 13150000, 500000]])
+        self.assertEqual(compute_spans[0]['args']['function'], 'function_gradients')
+        self.assertTrue(all(event['pid'] == driver_pid for event in spans if event['name'] == 'serialize'))
+
+        # the queue wait of each task, as a pair of async events with the task index as id
+        queue_events = [event for event in events if event['name'] == 'queue']
+        self.assertEqual([[event['ph'], event['id'], event['ts']] for event in queue_events],
+                         [['b', 0, 10000000], ['e', 0, 10500000], ['b', 1, 10100000], ['e', 1, 10200000],
+                          ['b', 2, 13000000], ['e', 2, 13100000]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import tempfile
+import os
+
+from src.run_log import RunLog
+
+import numpy
+
+
+class RunLogTest(unittest.TestCase):
+
+    run_config = {'molecule': 'H4', 'r': 1.0, 'frozen_els': {'occupied': [0], 'unoccupied': []},
+                  'delta_e_threshold': 1e-12, 'max_ansatz_size': 5, 'optimizer_options': {'gtol': 1e-8}}
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = self.temporary_directory.name
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def new_run_log(self, name='run', checkpoint_interval=2):
+        return RunLog(name, directory=self.directory, checkpoint_interval=checkpoint_interval,
+                      run_config=self.run_config)
+
+    @staticmethod
+    def record(n):
+        return {'n': n, 'E': numpy.float64(-n), 'var_parameters': numpy.arange(n) * 0.1}
+
+    def test_checkpoint_round_trip(self):
+        run_log = self.new_run_log()
+        for n in range(1, 6):
+            run_log.append(self.record(n))
+            run_log.checkpoint({'iter_count': n, 'ansatz_parameters': list(numpy.arange(n) * 0.1)})
+        run_log.close()
+
+        # the last checkpoint is at the 4th record, the 5th record is replayed
+        resumed_run_log = RunLog.from_path(run_log.records_path, run_config=self.run_config)
+        state, new_records = resumed_run_log.load()
+        self.assertEqual(state, {'iter_count': 4, 'ansatz_parameters': list(numpy.arange(4) * 0.1)})
+        self.assertEqual([record['n'] for record in new_records], [5])
+        numpy.testing.assert_allclose(new_records[0]['var_parameters'], numpy.arange(5) * 0.1)
+        self.assertEqual(resumed_run_log.n_records, 5)
+        self.assertEqual(resumed_run_log.run_config, RunLog.json_normalize(self.run_config))
+
+        # the resumed run log appends after the previous records
+        resumed_run_log.append(self.record(6))
+        resumed_run_log.checkpoint({'iter_count': 6}, force=True)
+        resumed_run_log.close()
+        state, new_records = RunLog.from_path(run_log.records_path).load()
+        self.assertEqual(state, {'iter_count': 6})
+        self.assertEqual(new_records, [])
+        self.assertEqual([record['n'] for record in RunLog.read_records(run_log.records_path)], list(range(1, 7)))
+
+    def test_incomplete_record(self):
+        run_log = self.new_run_log()
+        run_log.append(self.record(1))
+        run_log.close()
+        with open(run_log.records_path, 'a') as records_file:
+            records_file.write('{"n": 2, "E"')
+
+        resumed_run_log = RunLog.from_path(run_log.records_path)
+        self.assertEqual(resumed_run_log.n_records, 1)
+        resumed_run_log.append(self.record(2))
+        resumed_run_log.close()
+        self.assertEqual([record['n'] for record in RunLog.read_records(run_log.records_path)], [1, 2])
+
+    def test_explicit_resume(self):
+        self.new_run_log().close()
+        # an existing run is not resumed or overwritten implicitly
+        with self.assertRaises(Exception):
+            self.new_run_log()
+        with self.assertRaises(Exception):
+            RunLog.from_path(os.path.join(self.directory, 'other_run.jsonl'))
+
+        # the run config must match
+        run_config = dict(self.run_config, delta_e_threshold=1e-10)
+        with self.assertRaises(Exception):
+            RunLog.from_path(os.path.join(self.directory, 'run.jsonl'), run_config=run_config)
+        RunLog.from_path(os.path.join(self.directory, 'run'), run_config=dict(self.run_config)).close()
+
+    def test_completed_run(self):
+        run_log = self.new_run_log()
+        run_log.append(self.record(1))
+        self.assertFalse(run_log.is_completed())
+        run_log.mark_completed({'E': numpy.float64(-1)})
+        run_log.close()
+        self.assertTrue(run_log.is_completed())
+        self.assertEqual(run_log.read_info()['completed']['E'], -1)
+        with self.assertRaises(Exception):
+            RunLog.from_path(run_log.records_path, run_config=self.run_config)
+
+    def test_run_name(self):
+        name = RunLog.run_name('H4_iqeb_q_exc', self.run_config)
+        self.assertTrue(name.startswith('H4_iqeb_q_exc_r=1.0_dE=1e-12_max=5_frozen=o0u_'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import tempfile
+import json
+import os
+
+from src.ansatz_elements import AnsatzElement
+from src.ansatz_element_sets import UCCSDExcitations, SDExcitations, GSDExcitations, SpinCompGSDExcitations, \
+    MinPSExcPool
+from src.iter_vqe_utils import DataUtils
+from src.q_systems import ElectronicSystem
+
+from openfermion import FermionOperator
+
+import pandas
+import numpy
+
+
+class SerializationTest(unittest.TestCase):
+
+    n_orbitals = 6
+    n_electrons = 2
+
+    @classmethod
+    def pools(cls):
+        pools = []
+        for element_type in ['f_exc', 'q_exc', 'eff_f_exc', 'pauli_str_exc']:
+            pools.append(UCCSDExcitations(cls.n_orbitals, cls.n_electrons, element_type).get_all_elements())
+            pools.append(SDExcitations(cls.n_orbitals, cls.n_electrons, element_type).get_all_elements())
+            pools.append(GSDExcitations(cls.n_orbitals, cls.n_electrons, element_type).get_all_elements())
+        pools.append(SDExcitations(cls.n_orbitals, cls.n_electrons, 'f_exc', encoding='bk').get_all_elements())
+        for element_type in ['f_exc', 'q_exc', 'eff_f_exc']:
+            pools.append(SpinCompGSDExcitations(cls.n_orbitals, cls.n_electrons, element_type).get_all_elements())
+        pools.append(SpinCompGSDExcitations(cls.n_orbitals, cls.n_electrons, 'f_exc', encoding='bk').get_all_elements())
+        pools.append(MinPSExcPool(cls.n_orbitals, cls.n_electrons).get_all_elements())
+        return pools
+
+    def assert_equal_elements(self, element, restored_element):
+        self.assertIs(type(restored_element), type(element))
+        self.assertEqual(restored_element.element, element.element)
+        self.assertEqual(restored_element.n_var_parameters, element.n_var_parameters)
+        self.assertEqual(restored_element.system_n_qubits, self.n_orbitals)
+        self.assertEqual(getattr(restored_element, 'sign', None), getattr(element, 'sign', None))
+        self.assertEqual(getattr(restored_element, 'encoding', None), getattr(element, 'encoding', None))
+        self.assertEqual(str(restored_element.excitations_generators), str(element.excitations_generators))
+        var_parameters = [0.3] * element.n_var_parameters
+        self.assertEqual(restored_element.get_qasm(var_parameters), element.get_qasm(var_parameters))
+
+    def test_round_trip(self):
+        for pool in self.pools():
+            elements = list(pool)
+            self.assertGreater(len(elements), 0)
+            # the serialized forms are JSON serializable
+            data_list = json.loads(json.dumps([element.serialize() for element in elements]))
+            # the keys identify the elements
+            self.assertEqual(len(set([AnsatzElement.serialized_key(data) for data in data_list])), len(elements))
+
+            restored_elements = AnsatzElement.deserialize_all(data_list, system_n_qubits=self.n_orbitals)
+            for element, restored_element in zip(elements, restored_elements):
+                self.assertIsNot(restored_element, element)
+                self.assert_equal_elements(element, restored_element)
+
+    def test_pool_registry(self):
+        pool = SpinCompGSDExcitations(self.n_orbitals, self.n_electrons, 'q_exc').get_all_elements()
+        ansatz = [pool[5], pool[2], pool[5]]
+        restored_ansatz = pool.deserialize_all([element.serialize() for element in ansatz])
+        self.assertEqual([id(element) for element in restored_ansatz], [id(element) for element in ansatz])
+
+        # repeated elements are deserialized once
+        restored_ansatz = AnsatzElement.deserialize_all([element.serialize() for element in ansatz])
+        self.assertIs(restored_ansatz[0], restored_ansatz[2])
+
+    def test_unsupported_data(self):
+        data = GSDExcitations(self.n_orbitals, self.n_electrons, 'q_exc').get_all_elements()[0].serialize()
+        with self.assertRaises(Exception):
+            AnsatzElement.deserialize([AnsatzElement.serialization_version + 1] + data[1:])
+        with self.assertRaises(Exception):
+            AnsatzElement.deserialize(data[:1] + ['unknown_exc'] + data[2:])
+
+    # data saved before the serialized elements, with the element names and qubits only
+    def test_legacy_data_frame(self):
+        q_system = ElectronicSystem(FermionOperator('0^ 0', 1.0), self.n_orbitals, self.n_electrons)
+        ansatz = []
+        for pool in [GSDExcitations(self.n_orbitals, self.n_electrons, 'q_exc').get_all_elements(),
+                     GSDExcitations(self.n_orbitals, self.n_electrons, 'eff_f_exc').get_all_elements(),
+                     GSDExcitations(self.n_orbitals, self.n_electrons, 'f_exc').get_all_elements(),
+                     GSDExcitations(self.n_orbitals, self.n_electrons, 'pauli_str_exc').get_all_elements(),
+                     SpinCompGSDExcitations(self.n_orbitals, self.n_electrons, 'eff_f_exc').get_all_elements()]:
+            ansatz += [pool[1], pool[len(pool) - 1]]
+        ansatz += [element for element in
+                   SpinCompGSDExcitations(self.n_orbitals, self.n_electrons, 'q_exc').get_all_elements()
+                   if element.sign == -1][-2:]
+
+        data_frame = pandas.DataFrame({'n': range(len(ansatz)), 'element': [element.element for element in ansatz],
+                                       'element_qubits': [element.qubits for element in ansatz],
+                                       'var_parameters': [0.1 * i for i in range(len(ansatz))]})
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'legacy.csv')
+            data_frame.to_csv(filename)
+            data_frame = pandas.read_csv(filename)
+
+        state = DataUtils.ansatz_from_data_frame(data_frame, q_system)
+        self.assertEqual(len(state.ansatz_elements), len(ansatz))
+        for element, restored_element in zip(ansatz, state.ansatz_elements):
+            self.assert_equal_elements(element, restored_element)
+        numpy.testing.assert_allclose(state.parameters, [0.1 * i for i in range(len(ansatz))])
+
+
+if __name__ == '__main__':
+    unittest.main()
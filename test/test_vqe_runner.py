@@ -0,0 +1,92 @@
+import unittest
+
+from src.ansatz_element_sets import GSDExcitations
+from src.backends import MatrixCacheBackend
+from src.cache import GlobalCache
+from src.vqe_runner import VQERunner
+from src import config
+
+from benchmarks.benchmark_systems import BenchmarkSystems
+
+import numpy
+
+
+class VQEEarlyStopTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.multithread = config.multithread
+        config.multithread = False
+        cls.q_system = BenchmarkSystems.get_system('H4')
+        pool = GSDExcitations(cls.q_system.n_orbitals, cls.q_system.n_electrons, 'q_exc').get_all_elements()
+        # elements with non zero gradients at the Hartree-Fock state
+        cls.ansatz = [pool[i] for i in [3, 5, 16, 55, 88]]
+        cls.global_cache = GlobalCache(cls.q_system)
+        cls.global_cache.calculate_exc_gen_sparse_matrices_dict(cls.ansatz)
+
+    @classmethod
+    def tearDownClass(cls):
+        config.multithread = cls.multithread
+
+    def vqe_run(self, **kwargs):
+        # the energies evaluated by the run
+        self.energies = []
+
+        def record_energy(n_evaluations, energy, var_parameters, timing):
+            self.energies.append(energy)
+            self.assertEqual(n_evaluations, len(self.energies))
+            self.assertEqual(set(timing), {'evaluation_duration', 'iteration_duration', 'run_time'})
+
+        callbacks = [record_energy] + kwargs.pop('callbacks', [])
+        vqe_runner = VQERunner(self.q_system, backend=MatrixCacheBackend, optimizer='BFGS',
+                               optimizer_options={'gtol': 1e-8}, callbacks=callbacks, **kwargs)
+        return vqe_runner.vqe_run(self.ansatz, init_guess_parameters=[0.01] * len(self.ansatz),
+                                  cache=self.global_cache)
+
+    # an early stopped result has the lowest evaluated energy and its parameters
+    def check_early_stop(self, result, stop_reason):
+        self.assertEqual(result.stop_reason, stop_reason)
+        self.assertFalse(result.success)
+        self.assertEqual(result.nfev, len(self.energies))
+        self.assertEqual(result.fun, min(self.energies))
+        self.assertAlmostEqual(MatrixCacheBackend.ham_expectation_value(result.x, self.ansatz, self.q_system,
+                                                                        cache=self.global_cache), result.fun)
+
+    def test_converged(self):
+        result = self.vqe_run(use_ansatz_gradient=True)
+        self.assertEqual(result.stop_reason, 'converged')
+        self.assertTrue(result.success)
+        self.assertLess(result.fun, self.q_system.hf_energy - 1e-3)
+
+    def test_max_evaluations(self):
+        result = self.vqe_run(use_ansatz_gradient=True, max_evaluations=3)
+        self.check_early_stop(result, 'max_evaluations')
+        self.assertEqual(result.nfev, 3)
+
+    def test_max_time(self):
+        result = self.vqe_run(use_ansatz_gradient=True, max_time=0)
+        self.check_early_stop(result, 'max_time')
+        self.assertEqual(result.nfev, 1)
+
+    def test_callback(self):
+        result = self.vqe_run(use_ansatz_gradient=True,
+                              callbacks=[lambda n_evaluations, energy, var_parameters, timing: n_evaluations >= 4])
+        self.check_early_stop(result, 'callback')
+        self.assertEqual(result.nfev, 4)
+
+    def test_stalled(self):
+        # no iteration decreases the energy by more than stall_delta_e
+        result = self.vqe_run(use_ansatz_gradient=True, stall_delta_e=1, stall_n_iterations=2)
+        self.check_early_stop(result, 'stalled')
+
+    # the finite difference gradients evaluate the energy at each parameter without decreasing it, which does not stall
+    # the run
+    def test_finite_difference_gradient_not_stalled(self):
+        converged_energy = self.vqe_run(use_ansatz_gradient=True).fun
+        result = self.vqe_run(use_ansatz_gradient=False, stall_delta_e=1e-8, stall_n_iterations=2)
+        self.assertGreater(len(self.energies), 2 * (len(self.ansatz) + 1))
+        self.assertAlmostEqual(result.fun, converged_energy, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()